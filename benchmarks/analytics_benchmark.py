@@ -0,0 +1,58 @@
+import os
+import sys
+import time
+import random
+import argparse
+import statistics
+from datetime import date, timedelta
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cashflows import PaymentSchedule, analyze
+
+
+def synthetic_schedules(count, seed=1):
+    """Графики платежей: купоны 4 или 12 раз в год, часть облигаций с амортизацией и неизвестными суммами купонов"""
+    rng = random.Random(seed)
+    start = date.today() - timedelta(days=rng.randint(0, 365))
+    schedules = []
+    for _ in range(count):
+        frequency = rng.choice([4, 12])
+        payments = rng.randint(4, 10) * frequency
+        rate = rng.uniform(5, 25)
+        dates = [(start + timedelta(days=round(365 / frequency * (i + 1)))).isoformat() for i in range(payments)]
+        coupons = [rate * 10 / frequency if rng.random() > 0.3 or i < 2 else None for i in range(payments)]
+        redemptions = [None] * payments
+        if rng.random() < 0.2:
+            # Амортизация: номинал гасится четырьмя частями в последние периоды
+            for i in range(payments - 4, payments):
+                redemptions[i] = 250.0
+        else:
+            redemptions[-1] = 1000.0
+        schedules.append(PaymentSchedule(dates, coupons, [rate] * payments, redemptions, start.isoformat()))
+    return schedules
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Скорость расчета доходности и ранжирования облигаций")
+    parser.add_argument('--bonds', type=int, default=500, help="Количество облигаций")
+    parser.add_argument('--repeat', type=int, default=20, help="Количество повторов расчета")
+    args = parser.parse_args()
+
+    rng = random.Random(2)
+    schedules = synthetic_schedules(args.bonds)
+    prices = [rng.uniform(85, 105) for _ in schedules]
+
+    timings = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        results = analyze(schedules, prices)
+        ranking = np.argsort(-results['ytm'])
+        timings.append((time.perf_counter() - start) * 1000)
+
+    print(f"Облигаций: {args.bonds}, платежей в графике: до {max(len(schedule) for schedule in schedules)}")
+    print(f"Расчет и ранжирование по доходности: медиана {statistics.median(timings):.2f} мс, "
+          f"минимум {min(timings):.2f} мс")
+    print(f"Доходность к погашению: от {np.nanmin(results['ytm']):.2f}% до {np.nanmax(results['ytm']):.2f}%, "
+          f"лучшая - облигация №{ranking[0]}")
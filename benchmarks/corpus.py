@@ -0,0 +1,164 @@
+import os
+import json
+import random
+import hashlib
+from urllib.parse import urlsplit, parse_qsl
+
+# Корпус страниц для бенчмарков: ключ страницы -> (тип страницы, HTML).
+# Ключ не зависит от параметров поиска, кроме номера страницы списка, поэтому корпус подходит для любых правил отбора
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+MANIFEST_FILE = 'manifest.json'
+FINAM_HOST = 'bonds.finam.ru'
+SMART_LAB_HOST = 'smart-lab.ru'
+
+
+def page_key(url):
+    """Ключ страницы: хост и путь, для страниц списка - еще и номер страницы"""
+    parts = urlsplit(url)
+    params = dict(parse_qsl(parts.query, keep_blank_values=True))
+    key = f"{parts.netloc}{parts.path}"
+    if 'page' in params:
+        key += f"?page={params['page']}"
+    return key
+
+
+def noise(blocks):
+    """Меню, скрипты и служебные таблицы, которые окружают полезные данные на реальных страницах"""
+    parts = ['<script>var counters = {"ym": 1, "ga": 2}; function track(e) { return e; }</script>']
+    for i in range(blocks):
+        links = ''.join(f'<li><a href="/section/{i}/{j}/">Раздел {i}.{j}</a></li>' for j in range(10))
+        cells = ''.join(f'<tr><th>Показатель {j}</th><td>{j * 1.5:.2f}</td></tr>' for j in range(5))
+        parts.append(f'<div class="menu block-{i}"><ul>{links}</ul><table class="aside">{cells}</table></div>')
+    return ''.join(parts)
+
+
+def listing_page(bonds, total, page_count=5):
+    """Страница списка облигаций finam: bonds - список (номер, путь страницы облигации)"""
+    body = ''.join(
+        f'<tr><td>{i + 1}</td><td><a href="{path}">Облигация {i} <b>БО-0{i % 9}</b></a></td>'
+        f'<td>Эмитент {i}</td><td>{i % 28 + 1:02d}.03.2025</td><td>{i % 28 + 1:02d}.03.2030</td>'
+        f'<td>{10 + i % 15},5%</td></tr>'
+        for i, path in bonds
+    )
+    pages = ''.join(f'<a href="default.asp?page={i}&status=4">{i + 1}</a>' for i in range(page_count))
+    return (f'<html><head><title>Поиск облигаций</title></head><body>{noise(30)}'
+            f'<p>Найдено облигаций: <b>{total}</b></p>'
+            f'<table class="grid"><tr><th>№</th><th>Облигация</th><th>Эмитент</th><th>Размещение</th>'
+            f'<th>Погашение</th><th>Купон</th></tr>{body}</table><div class="pager">{pages}</div>{noise(10)}</body></html>')
+
+
+def payments_table(rate='21,5%', rows=40, first_year=2026):
+    """Таблица платежей с ежеквартальными купонами и погашением номинала 1000 руб. в дату последнего купона"""
+    amount = f"{float(rate.replace('%', '').replace(',', '.')) * 10 / 4:.2f}".replace('.', ',')
+    dates = [f'15.{i % 4 * 3 + 1:02d}.{first_year + i // 4}' for i in range(rows)]
+    coupons = ''.join(
+        f'<tr><td>{i + 1}</td><td>{dates[i]}</td><td>{amount}</td><td>{rate}</td>'
+        + (f'<td>{dates[i]}</td><td>1 000,00</td></tr>' if i == rows - 1 else '<td>-</td><td>-</td></tr>')
+        for i in range(rows)
+    )
+    return ('<table class="payments"><tr><th colspan="4">Купоны</th><th colspan="2">Погашение</th></tr>'
+            '<tr><th>№</th><th>Дата</th><th>Сумма</th><th>Ставка</th><th>Дата</th><th>Сумма</th></tr>'
+            f'{coupons}</table>')
+
+
+def detail_page(isin='RU000A10BHX3', has_offer=False):
+    """Страница облигации finam со ссылкой на вкладку 'Платежи'"""
+    info = ''.join(f'<tr><td>Параметр {i}: <span>{i}</span></td></tr>' for i in range(30))
+    offer = '<a href="offers.asp">Оферты</a>' if has_offer else ''
+    return (f'<html><head><title>Облигация</title></head><body>{noise(30)}'
+            f'<div class="info"><table>{info}<tr><td>ISIN код: <span>{isin}</span></td></tr></table></div>'
+            f'<div class="tabs"><a href="default.asp">Описание</a><a href="payments.asp">Платежи</a>{offer}</div>'
+            f'{noise(10)}</body></html>')
+
+
+def payments_page(rate='21,5%'):
+    """Вкладка 'Платежи' страницы облигации finam"""
+    return f'<html><body>{noise(30)}{payments_table(rate)}{noise(10)}</body></html>'
+
+
+def rating_page(rating='ruA+', color='green'):
+    """Страница облигации smart-lab с прогресс-баром рейтинга"""
+    quotes = ''.join(f'<tr><td>{i}</td><td>{100 - i * 0.1:.2f}</td><td>{i * 1000}</td></tr>' for i in range(100))
+    return (f'<html><head><title>Облигация</title></head><body>{noise(40)}'
+            f'<table class="quotes">{quotes}</table>'
+            '<div class="bond-rating"><span>Кредитный рейтинг</span>'
+            f'<div class="linear-progress-bar"><div class="linear-progress-bar__filed linear-progress-bar__filed--{color}">'
+            f'<div class="linear-progress-bar__text">{rating}</div></div></div></div>'
+            f'{noise(20)}</body></html>')
+
+
+def rating_list_page(bonds, page_count=5):
+    """Страница списка облигаций smart-lab: bonds - список (ISIN, рейтинг, цвет); рейтинг может быть пустым"""
+    body = ''.join(
+        f'<tr><td>{i + 1}</td><td><a href="/q/bonds/{isin}/">Облигация {i}</a></td><td>{isin}</td>'
+        f'<td>{100 - i % 7 * 0.35:.2f}</td><td>{10 + i % 15},5%</td>'
+        + (f'<td><div class="linear-progress-bar__filed linear-progress-bar__filed--{color}">{rating}</div></td></tr>'
+           if rating else '<td></td></tr>')
+        for i, (isin, rating, color) in enumerate(bonds)
+    )
+    pages = ''.join(f'<a href="/q/bonds/page{i}/">{i}</a>' for i in range(1, page_count + 1))
+    return (f'<html><head><title>Облигации</title></head><body>{noise(30)}'
+            '<table class="simple-little-table bonds"><tr><th>№</th><th>Имя</th><th>ISIN</th><th>Цена</th>'
+            f'<th>Купон</th><th>Кредитный рейтинг</th></tr>{body}</table>'
+            f'<div class="pages">{pages}</div>{noise(10)}</body></html>')
+
+
+def synthetic_corpus(listing_pages=4, page_size=50, offer_share=0.1, seed=1):
+    """Воспроизводимый корпус страниц finam и smart-lab для полного прогона пайплайна"""
+    rng = random.Random(seed)
+    pages = {}
+    total = listing_pages * page_size
+    list_rng = random.Random(seed + 1)
+    rated = []
+    for page_number in range(listing_pages + 1):
+        # Последняя страница пустая: на ней сборщик определяет конец списка
+        numbers = range(page_number * page_size, min(total, (page_number + 1) * page_size))
+        bonds = [(i, f"/issue/bonds{i}/default.asp") for i in numbers]
+        pages[f"{FINAM_HOST}/issue/search/default.asp?page={page_number}"] = \
+            ('listing', listing_page(bonds, total, listing_pages))
+        for i, path in bonds:
+            isin = f"RU000A1{i:05d}"
+            pages[f"{FINAM_HOST}{path}"] = ('detail', detail_page(isin, rng.random() < offer_share))
+            pages[f"{FINAM_HOST}{path.replace('default.asp', 'payments.asp')}"] = \
+                ('payments', payments_page(f"{rng.choice([4, 9, 12, 18, 21])},{rng.randint(0, 9)}%"))
+            rating, color = rng.choice(['ruAAA', 'ruA+', 'ruBBB-', 'ruBB']), rng.choice(['green', 'yellow', 'red'])
+            pages[f"{SMART_LAB_HOST}/q/bonds/{isin}/"] = ('rating', rating_page(rating, color))
+            # В списке smart-lab нет части облигаций и части рейтингов: их рейтинг берется со страницы облигации.
+            # Отдельный генератор не меняет страницы finam и smart-lab корпусов прошлых версий
+            if list_rng.random() < 0.9:
+                rated.append((isin, rating if list_rng.random() < 0.95 else '', color))
+    # Список smart-lab разбит на страницы по 100 облигаций
+    list_pages = max(1, (len(rated) + 99) // 100)
+    for page_number in range(1, list_pages + 1):
+        pages[f"{SMART_LAB_HOST}/q/bonds/page{page_number}/"] = \
+            ('rating_list', rating_list_page(rated[(page_number - 1) * 100:page_number * 100], list_pages))
+    return pages
+
+
+def load_fixtures(directory=FIXTURES_DIR):
+    """Записанные страницы: manifest.json (ключ -> тип и файл) и HTML-файлы рядом с ним"""
+    with open(os.path.join(directory, MANIFEST_FILE), 'r', encoding='utf-8') as manifest_file:
+        manifest = json.load(manifest_file)
+    pages = {}
+    for key, entry in manifest.items():
+        with open(os.path.join(directory, entry['file']), 'r', encoding='utf-8') as page_file:
+            pages[key] = (entry['type'], page_file.read())
+    return pages
+
+
+def save_fixture(directory, manifest, url, page_type, html):
+    """Сохранение страницы в каталог корпуса (manifest записывается вызывающим кодом)"""
+    key = page_key(url)
+    file_name = f"{page_type}_{hashlib.sha1(key.encode('utf-8')).hexdigest()[:12]}.html"
+    with open(os.path.join(directory, file_name), 'w', encoding='utf-8') as page_file:
+        page_file.write(html)
+    manifest[key] = {'type': page_type, 'file': file_name, 'url': url}
+
+
+def pages_by_type(pages):
+    """Группировка HTML корпуса по типам страниц"""
+    grouped = {}
+    for page_type, html in pages.values():
+        grouped.setdefault(page_type, []).append(html)
+    return grouped
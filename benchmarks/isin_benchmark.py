@@ -0,0 +1,79 @@
+import os
+import sys
+import time
+import random
+import logging
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from isin_resolver import IsinResolver
+
+SYLLABLES = ['ал', 'ро', 'са', 'ме', 'тек', 'газ', 'строй', 'лиз', 'фин', 'нова', 'банк', 'инвест', 'пром',
+             'энер', 'го', 'хим', 'агро', 'ком', 'сер', 'вис']
+
+
+def synthetic_reference(path, issuers, issues, seed=1):
+    """CSV-справочник в формате выгрузки ISS: issuers эмитентов по issues выпусков.
+    Возвращает список (ISIN, эмитент, программа, выпуск)"""
+    rng = random.Random(seed)
+    names = set()
+    while len(names) < issuers:
+        names.add(''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))).capitalize())
+    securities = []
+    with open(path, 'w', encoding='utf-8') as outfile:
+        outfile.write("securities\n\nSECID;SHORTNAME;SECNAME;LATNAME;ISIN;REGNUMBER\n")
+        for number, issuer in enumerate(sorted(names)):
+            program = rng.randint(1, 3)
+            for series in range(1, issues + 1):
+                isin = f"RU000A{number:04d}{series:02d}"
+                regnumber = f"4B02-{series:02d}-{number:05d}-B-{program:03d}P"
+                outfile.write(f"{isin};{issuer[:8]} {program:03d}Р-{series:02d};"
+                              f"ПАО \"{issuer}\" БО-{program:03d}Р-{series:02d};;{isin};{regnumber}\n")
+                securities.append((isin, issuer, program, series))
+    return securities
+
+
+def finam_name(issuer, program, series, rng):
+    """Название выпуска в записи finam: другие разделители, латинская P, без ведущих нулей или с опечаткой"""
+    variant = rng.randint(0, 3)
+    if variant == 0:
+        return f"Банк {issuer}-{program:03d}Р-{series:02d}"
+    if variant == 1:
+        return f"{issuer} БО-{program}P-{series}"
+    if variant == 2:
+        typo = rng.randint(1, len(issuer) - 2)
+        return f"{issuer[:typo] + issuer[typo + 1:]} {program:03d}Р-{series:02d}"
+    return f"{issuer} ПАО БО {program:03d}Р {series:02d}"
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Скорость и точность поиска ISIN по названию в справочнике бумаг")
+    parser.add_argument('--issuers', type=int, default=500, help="Эмитентов в синтетическом справочнике")
+    parser.add_argument('--issues', type=int, default=8, help="Выпусков каждого эмитента")
+    parser.add_argument('--names', type=int, default=100, help="Названий без ISIN в одном проходе")
+    parser.add_argument('--seed', type=int, default=1, help="Начальное значение генератора случайных чисел")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as work_dir:
+        path = os.path.join(work_dir, 'securities.csv')
+        securities = synthetic_reference(path, args.issuers, args.issues, args.seed)
+        start = time.perf_counter()
+        resolver = IsinResolver.load(path)
+        load_ms = (time.perf_counter() - start) * 1000
+
+    sample = rng.sample(securities, min(args.names, len(securities)))
+    names = {finam_name(issuer, program, series, rng): isin for isin, issuer, program, series in sample}
+    start = time.perf_counter()
+    results = resolver.resolve_many(list(names))
+    resolve_ms = (time.perf_counter() - start) * 1000
+
+    correct = sum(1 for name, isin in names.items() if results[name] and results[name][0] == isin)
+    wrong = sum(1 for name, isin in names.items() if results[name] and results[name][0] != isin)
+    print(f"Справочник: {len(resolver.isins)} бумаг, {len(resolver.entries)} названий, "
+          f"{len(resolver.ngrams)} триграмм, загрузка и индекс {load_ms:.0f} мс")
+    print(f"Поиск {len(names)} названий: {resolve_ms:.1f} мс ({resolve_ms / len(names):.2f} мс на название)")
+    print(f"Верно: {correct}, ошибочно: {wrong}, не найдено: {len(names) - correct - wrong}")
@@ -0,0 +1,118 @@
+import io
+import os
+import sys
+import time
+import logging
+import argparse
+import tempfile
+import tracemalloc
+from contextlib import redirect_stdout
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARKS_DIR)
+sys.path.insert(0, REPO_DIR)
+
+from corpus import synthetic_corpus
+from stub_server import StubServer, StubFetcher
+
+
+def measure(function):
+    """Пик памяти Python (tracemalloc, МБ) и длительность вызова function()"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        function()
+    finally:
+        wall = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return peak / (1024 * 1024), wall
+
+
+def run_size(pages, args):
+    """Этапы сбора, фильтрации и рейтингов в потоковом режиме и с накоплением всех записей в памяти
+    (как до перехода на потоки). Возвращает список (этап, режим, пик памяти, первый результат, всего)"""
+    # Модули пайплайна импортируются после перехода во временный каталог, где пишутся база и CSV
+    from bonds_scraper import BondsScraper
+    from bonds_filter import BondsFilter
+    from bonds_rating import process_bonds
+    from bonds_store import BondsStore
+    from screening import ScreeningRules
+    from metrics import METRICS, label_key
+    logging.basicConfig(level=logging.ERROR if not args.verbose else logging.INFO)
+
+    stub = StubServer(pages, args.latency_ms, args.jitter_ms, seed=args.seed).start()
+    rules = ScreeningRules.load(os.path.join(REPO_DIR, 'screening_rules.json'))
+
+    def create_fetcher(pool_size):
+        return StubFetcher(stub.url, pool_size=pool_size, requests_per_second=0)
+
+    def first_output(stage, wall):
+        # В режиме накопления результат появляется только в конце этапа
+        return METRICS.gauges.get('first_output_seconds', {}).get(label_key({'stage': stage}), wall)
+
+    def scrape_in_memory():
+        scraper = BondsScraper(fetcher=create_fetcher(args.workers), max_workers=args.workers, rules=rules)
+        listing = scraper.collect()
+        store = BondsStore()
+        store.replace_listing(listing)
+        store.close()
+        scraper.save_to_csv(listing)
+        scraper.fetcher.close()
+
+    def filter_in_memory():
+        bonds_filter = BondsFilter(fetcher=create_fetcher(args.workers), max_workers=args.workers, rules=rules)
+        store = BondsStore()
+        filtered_bonds = bonds_filter.add_analytics(list(bonds_filter.iter_filtered(store.listing())))
+        store.save_filtered(filtered_bonds)
+        store.close()
+        bonds_filter.save_results(filtered_bonds)
+        bonds_filter.close()
+
+    runs = [
+        ('scrape', 'в памяти', scrape_in_memory),
+        ('scrape', 'поток', lambda: BondsScraper(fetcher=create_fetcher(args.workers), max_workers=args.workers,
+                                                 rules=rules).run()),
+        ('filter', 'в памяти', filter_in_memory),
+        ('filter', 'поток', lambda: BondsFilter(fetcher=create_fetcher(args.workers), max_workers=args.workers,
+                                                rules=rules).run()),
+        ('rating', 'поток', lambda: process_bonds(concurrency=args.workers,
+                                                  fetcher=create_fetcher(args.workers)))
+    ]
+    results = []
+    try:
+        for stage, mode, function in runs:
+            METRICS.reset()
+            # process_bonds печатает каждую облигацию; в бенчмарке этот вывод скрывается
+            with redirect_stdout(sys.stdout if args.verbose else io.StringIO()):
+                peak, wall = measure(function)
+            first = first_output(stage, wall) if mode == 'поток' else wall
+            results.append((stage, mode, peak, first, wall))
+    finally:
+        stub.stop()
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Пик памяти и время до первого результата этапов при разном "
+                                                 "размере списка облигаций (локальная заглушка сайтов)")
+    parser.add_argument('--bonds', type=int, nargs='+', default=[600, 3000],
+                        help="Размеры списка облигаций синтетического корпуса")
+    parser.add_argument('--page-size', type=int, default=50, help="Облигаций на странице синтетического корпуса")
+    parser.add_argument('--latency-ms', type=float, default=2.0, help="Задержка ответа заглушки")
+    parser.add_argument('--jitter-ms', type=float, default=1.0, help="Случайная добавка к задержке")
+    parser.add_argument('--seed', type=int, default=1, help="Начальное значение генератора случайных чисел")
+    parser.add_argument('--workers', type=int, default=4, help="Потоков загрузки каждого этапа")
+    parser.add_argument('--verbose', action='store_true', help="Выводить логи и ход обработки")
+    args = parser.parse_args()
+
+    print(f"{'Облигаций':>9} {'Этап':<7} {'Режим':<9} {'Пик, МБ':>8} {'Первый результат, с':>20} {'Всего, с':>9}")
+    for bonds in args.bonds:
+        pages = synthetic_corpus(max(1, bonds // args.page_size), args.page_size, seed=args.seed)
+        with tempfile.TemporaryDirectory() as work_dir:
+            # База, CSV, журналы и логи этапов пишутся во временный каталог
+            os.chdir(work_dir)
+            results = run_size(pages, args)
+            os.chdir(REPO_DIR)
+        for stage, mode, peak, first, wall in results:
+            print(f"{bonds:>9} {stage:<7} {mode:<9} {peak:>8.1f} {first:>20.2f} {wall:>9.2f}")
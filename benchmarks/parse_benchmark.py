@@ -0,0 +1,91 @@
+import os
+import sys
+import glob
+import time
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from html_parsers import create_parser, PARSER_BACKENDS, SoupParser
+from corpus import (listing_page, detail_page, payments_page, rating_page, rating_list_page, load_fixtures,
+                    pages_by_type, MANIFEST_FILE)
+
+# Типы страниц и метод парсера, который их разбирает
+PAGE_TYPES = {
+    'listing': 'parse_listing',
+    'detail': 'parse_detail',
+    'payments': 'parse_payments',
+    'rating': 'parse_rating',
+    'rating_list': 'parse_rating_list'
+}
+
+
+def synthetic_pages():
+    return {
+        'listing': [listing_page([(i, f"/issue/bonds{i}/default.asp") for i in range(50)], 250)],
+        'detail': [detail_page()],
+        'payments': [payments_page()],
+        'rating': [rating_page()],
+        'rating_list': [rating_list_page([(f"RU000A1{i:05d}", 'ruAA-', 'green') for i in range(100)])]
+    }
+
+
+def load_pages(directory):
+    """Сохраненные страницы: корпус с manifest.json или файлы <тип>*.html (например, listing_0.html)"""
+    if os.path.exists(os.path.join(directory, MANIFEST_FILE)):
+        return pages_by_type(load_fixtures(directory))
+    pages = {}
+    for path in sorted(glob.glob(os.path.join(directory, '*.html'))):
+        # Файл относится к самому длинному подходящему типу: rating_list*.html - не страницы rating
+        page_types = [page_type for page_type in PAGE_TYPES if os.path.basename(path).startswith(page_type)]
+        if not page_types:
+            continue
+        with open(path, 'r', encoding='utf-8') as page_file:
+            pages.setdefault(max(page_types, key=len), []).append(page_file.read())
+    return pages
+
+
+def measure(parse, documents, repeat):
+    """Медианное время разбора одной страницы в миллисекундах"""
+    timings = []
+    for _ in range(repeat):
+        for html in documents:
+            start = time.perf_counter()
+            parse(html)
+            timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def run(pages, parsers, repeat):
+    reference = create_parser(SoupParser.name)
+    print(f"{'Страница':<12} {'Парсер':<12} {'мс/стр':>9} {'Ускорение':>10}  Результат")
+    for page_type, documents in pages.items():
+        method = PAGE_TYPES[page_type]
+        expected = [getattr(reference, method)(html) for html in documents]
+        baseline = measure(getattr(reference, method), documents, repeat)
+        for name in parsers:
+            parser = create_parser(name)
+            if parser.name != name:
+                print(f"{page_type:<12} {name:<12} {'-':>9} {'-':>10}  библиотека не установлена")
+                continue
+            parse = getattr(parser, method)
+            elapsed = baseline if parser is reference else measure(parse, documents, repeat)
+            matches = [parse(html) for html in documents] == expected
+            print(f"{page_type:<12} {name:<12} {elapsed:>9.3f} {baseline / elapsed:>9.1f}x  "
+                  f"{'совпадает с bs4' if matches else 'ОТЛИЧАЕТСЯ от bs4'}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Сравнение скорости разбора страниц разными парсерами")
+    parser.add_argument('--pages', help="Каталог с сохраненными страницами (корпус с manifest.json или файлы "
+                                        "listing*.html, detail*.html, payments*.html, rating*.html, "
+                                        "rating_list*.html); "
+                                        "по умолчанию - синтетические страницы")
+    parser.add_argument('--repeat', type=int, default=50, help="Количество повторов разбора каждой страницы")
+    parser.add_argument('--parsers', nargs='+', choices=list(PARSER_BACKENDS), default=list(PARSER_BACKENDS),
+                        help="Сравниваемые парсеры")
+    args = parser.parse_args()
+
+    pages = load_pages(args.pages) if args.pages else synthetic_pages()
+    run(pages, [SoupParser.name] + [name for name in args.parsers if name != SoupParser.name], args.repeat)
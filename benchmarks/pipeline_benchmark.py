@@ -0,0 +1,258 @@
+import io
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+from contextlib import redirect_stdout
+from datetime import datetime
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARKS_DIR)
+sys.path.insert(0, REPO_DIR)
+
+from corpus import synthetic_corpus, load_fixtures
+from stub_server import StubServer, StubFetcher
+
+RESULTS_DIR = os.path.join(BENCHMARKS_DIR, 'results')
+STAGES = ['scrape', 'filter', 'rating']
+
+
+def percentile(values, q):
+    """Перцентиль q (0-100) по методу ближайшего ранга"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(q / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def peak_rss_mb():
+    """Пиковое потребление памяти процессом в МБ (None, если недоступно на платформе)"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux возвращает килобайты, macOS - байты
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class TimedFetcher:
+    """Обертка загрузчика с замером времени каждой загрузки"""
+
+    def __init__(self, fetcher):
+        self.fetcher = fetcher
+        self.timings = []
+        self.errors = 0
+        self.lock = threading.Lock()
+
+    def __getattr__(self, name):
+        return getattr(self.fetcher, name)
+
+    def fetch(self, url, ready=None):
+        start = time.perf_counter()
+        try:
+            return self.fetcher.fetch(url, ready)
+        except Exception:
+            with self.lock:
+                self.errors += 1
+            raise
+        finally:
+            with self.lock:
+                self.timings.append((time.perf_counter() - start) * 1000)
+
+
+class TimedParser:
+    """Обертка парсера с замером времени разбора каждой страницы"""
+
+    def __init__(self, parser):
+        self.parser = parser
+        self.timings = []
+        self.lock = threading.Lock()
+
+    def __getattr__(self, name):
+        method = getattr(self.parser, name)
+        if not name.startswith('parse_'):
+            return method
+
+        def timed(html):
+            start = time.perf_counter()
+            try:
+                return method(html)
+            finally:
+                with self.lock:
+                    self.timings.append((time.perf_counter() - start) * 1000)
+        return timed
+
+
+def stage_metrics(wall, fetcher, parser, items):
+    pages = len(fetcher.timings)
+    return {
+        'wall_s': round(wall, 4),
+        'pages': pages,
+        'pages_per_s': round(pages / wall, 2) if wall else None,
+        'fetch_errors': fetcher.errors,
+        'fetch_ms_p50': percentile(fetcher.timings, 50),
+        'fetch_ms_p95': percentile(fetcher.timings, 95),
+        'parse_ms_p50': percentile(parser.timings, 50),
+        'parse_ms_p95': percentile(parser.timings, 95),
+        'peak_rss_mb': peak_rss_mb(),
+        'items': items
+    }
+
+
+def run_benchmark(pages, args):
+    """Прогон этапов сбора, фильтрации и рейтингов на заглушке. Возвращает метрики этапов"""
+    # Модули пайплайна импортируются после перехода во временный каталог, где пишутся база и CSV
+    from bonds_scraper import BondsScraper
+    from bonds_filter import BondsFilter
+    from bonds_rating import rate_rows, load_rating_index
+    from html_parsers import create_parser
+    from rating_engine import AsyncRatingEngine
+    from screening import ScreeningRules
+    from records import FILTER_COLUMNS
+    logging.basicConfig(level=logging.ERROR if not args.verbose else logging.INFO)
+
+    stub = StubServer(pages, args.latency_ms, args.jitter_ms, args.error_rate, seed=args.seed).start()
+    rules = ScreeningRules.load(args.rules)
+
+    def create_stage_fetcher(pool_size):
+        return TimedFetcher(StubFetcher(stub.url, pool_size=pool_size, requests_per_second=args.rps))
+
+    stages = {}
+    try:
+        # Сбор списка облигаций
+        fetcher, parser = create_stage_fetcher(args.workers), TimedParser(create_parser(args.parser))
+        scraper = BondsScraper(fetcher=fetcher, max_workers=args.workers, rules=rules)
+        scraper.parser = parser
+        scraper.retry_delay = 0.1
+        start = time.perf_counter()
+        listing = scraper.collect()
+        stages['scrape'] = stage_metrics(time.perf_counter() - start, fetcher, parser, len(listing))
+        fetcher.close()
+        if args.max_bonds:
+            listing = listing[:args.max_bonds]
+
+        # Фильтрация по страницам облигаций
+        fetcher, parser = create_stage_fetcher(args.workers), TimedParser(create_parser(args.parser))
+        bonds_filter = BondsFilter(fetcher=fetcher, max_workers=args.workers, rules=rules)
+        bonds_filter.parser = parser
+        start = time.perf_counter()
+        filtered = list(bonds_filter.iter_filtered(listing))
+        stages['filter'] = stage_metrics(time.perf_counter() - start, fetcher, parser, len(filtered))
+        bonds_filter.close()
+
+        # Рейтинги smart-lab
+        fetcher, parser = create_stage_fetcher(args.rating_concurrency), TimedParser(create_parser(args.parser))
+        engine = AsyncRatingEngine(fetcher, parser.parse_rating, concurrency=args.rating_concurrency,
+                                   backoff_base=0.05)
+        rows = [[bond[column] for column in FILTER_COLUMNS] for bond in filtered]
+        rated = []
+        start = time.perf_counter()
+        # rate_rows печатает каждую облигацию; в бенчмарке этот вывод скрывается
+        with redirect_stdout(sys.stdout if args.verbose else io.StringIO()):
+            index = load_rating_index(fetcher, args.parser, args.rating_concurrency) if args.bulk_ratings else None
+            rate_rows(rows, engine, FILTER_COLUMNS.index('Ссылка'), rated.append, index=index)
+        stages['rating'] = stage_metrics(time.perf_counter() - start, fetcher, parser, len(rated))
+        fetcher.close()
+    finally:
+        stub.stop()
+    stages['stub'] = dict(stub.stats)
+    return stages
+
+
+def compare(results, baseline):
+    """Изменение ключевых метрик относительно результатов другого коммита"""
+    print(f"Сравнение с {baseline.get('commit')} ({baseline.get('timestamp')})")
+    for stage in STAGES:
+        current, previous = results['stages'].get(stage), baseline['stages'].get(stage)
+        if not current or not previous:
+            continue
+        for metric in ('wall_s', 'pages_per_s', 'fetch_ms_p95', 'parse_ms_p95', 'peak_rss_mb'):
+            if current.get(metric) is None or not previous.get(metric):
+                continue
+            change = (current[metric] - previous[metric]) / previous[metric] * 100
+            print(f"  {stage:<8} {metric:<14} {previous[metric]:>10.3f} -> {current[metric]:>10.3f} ({change:+.1f}%)")
+
+
+def print_results(results):
+    print(f"{'Этап':<8} {'с':>8} {'стр.':>6} {'стр./с':>8} {'загр. p50/p95, мс':>20} "
+          f"{'разбор p50/p95, мс':>20} {'RSS, МБ':>8} {'ошибок':>7}")
+    for stage in STAGES:
+        m = results['stages'][stage]
+        fetch = f"{m['fetch_ms_p50'] or 0:.1f}/{m['fetch_ms_p95'] or 0:.1f}"
+        parse = f"{m['parse_ms_p50'] or 0:.2f}/{m['parse_ms_p95'] or 0:.2f}"
+        print(f"{stage:<8} {m['wall_s']:>8.2f} {m['pages']:>6} {m['pages_per_s'] or 0:>8.1f} {fetch:>20} "
+              f"{parse:>20} {m['peak_rss_mb'] or 0:>8.1f} {m['fetch_errors']:>7}")
+    print(f"Всего: {results['total_wall_s']:.2f} с")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Бенчмарк пайплайна на локальной заглушке сайтов без обращения к сети")
+    parser.add_argument('--fixtures', help="Каталог с записанным корпусом страниц (manifest.json); "
+                                           "по умолчанию - синтетический корпус")
+    parser.add_argument('--listing-pages', type=int, default=4, help="Страниц списка в синтетическом корпусе")
+    parser.add_argument('--page-size', type=int, default=50, help="Облигаций на странице синтетического корпуса")
+    parser.add_argument('--max-bonds', type=int, help="Ограничение количества облигаций для этапов фильтрации и рейтингов")
+    parser.add_argument('--latency-ms', type=float, default=50.0, help="Задержка ответа заглушки")
+    parser.add_argument('--jitter-ms', type=float, default=20.0, help="Случайная добавка к задержке")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Доля ответов заглушки с ошибкой 503")
+    parser.add_argument('--seed', type=int, default=1, help="Начальное значение генератора случайных чисел")
+    parser.add_argument('--workers', type=int, default=4, help="Потоков сбора и фильтрации")
+    parser.add_argument('--rating-concurrency', type=int, default=4, help="Одновременных запросов рейтингов")
+    parser.add_argument('--bulk-ratings', action='store_true',
+                        help="Рейтинги из страниц списка smart-lab, страницы облигаций - только для отсутствующих")
+    parser.add_argument('--rps', type=float, default=0.0, help="Ограничение запросов в секунду (0 - без ограничения)")
+    parser.add_argument('--parser', default='lxml', help="Библиотека разбора HTML")
+    parser.add_argument('--rules', default=os.path.join(REPO_DIR, 'screening_rules.json'),
+                        help="Файл с критериями отбора облигаций")
+    parser.add_argument('--output', help="Файл результатов (JSON); по умолчанию benchmarks/results/<время>-<коммит>.json")
+    parser.add_argument('--compare', help="Файл результатов другого запуска для сравнения")
+    parser.add_argument('--verbose', action='store_true', help="Выводить логи пайплайна")
+    args = parser.parse_args()
+
+    pages = load_fixtures(args.fixtures) if args.fixtures else synthetic_corpus(args.listing_pages, args.page_size,
+                                                                                seed=args.seed)
+    started = time.perf_counter()
+    with tempfile.TemporaryDirectory() as work_dir:
+        # Выходные файлы, журналы и логи этапов пишутся во временный каталог
+        os.chdir(work_dir)
+        stages = run_benchmark(pages, args)
+        os.chdir(REPO_DIR)
+
+    results = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'config': {key: value for key, value in vars(args).items() if key not in ('output', 'compare', 'verbose')},
+        'corpus_pages': len(pages),
+        'stages': stages,
+        'total_wall_s': round(time.perf_counter() - started, 4)
+    }
+    print_results(results)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{datetime.now():%Y%m%d-%H%M%S}-{results['commit'] or 'local'}.json")
+    output_dir = os.path.dirname(output)
+    if output_dir and not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    with open(output, 'w', encoding='utf-8') as output_file:
+        json.dump(results, output_file, ensure_ascii=False, indent=2)
+    print(f"Результаты сохранены в {output}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as baseline_file:
+            compare(results, json.load(baseline_file))
@@ -0,0 +1,203 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import statistics
+from datetime import date, timedelta
+from urllib.request import urlopen
+from urllib.parse import urlencode
+import pandas as pd
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARKS_DIR)
+sys.path.insert(0, REPO_DIR)
+
+from bond_query import BondIndex, QueryServer, rating_rank, parse_float
+from records import RATING_COLUMNS
+from sort_bonds import RATING_ORDER
+
+# Запросы бенчмарка: название и аргументы BondIndex.search
+QUERIES = [
+    ("AA- и выше, купон от 17%, погашение 2028-2030",
+     dict(min_rating='AA-', min_coupon=17, maturity_from='2028', maturity_to='2030', order_by='coupon',
+          descending=True, limit=20)),
+    ("топ-10 по купону", dict(order_by='coupon', descending=True, limit=10)),
+    ("A и выше, погашение в 2027, по доходности", dict(min_rating='A', maturity_from='2027', maturity_to='2027',
+                                                       order_by='ytm', descending=True, limit=50)),
+    ("купон 20-20.5%, все", dict(min_coupon=20, max_coupon=20.5, order_by='maturity', limit=None)),
+    ("BBB- и выше, доходность от 25%", dict(min_rating='BBB-', min_ytm=25, order_by='ytm', descending=True,
+                                            limit=100)),
+]
+
+
+def synthetic_rows(count, seed=1):
+    """Строки bonds_with_ratings.csv: рейтинги в записи агентств и шкалы sort_bonds, часть без данных"""
+    rng = random.Random(seed)
+    grades = [grade for grade in RATING_ORDER if RATING_ORDER[grade] < RATING_ORDER['Нет данных']]
+    today = date.today()
+    rows = []
+    for number in range(count):
+        grade = rng.choice(grades)
+        rating = rng.choice([grade, f"ru{grade}"]) if rng.random() > 0.05 else 'Нет данных'
+        placement = today - timedelta(days=rng.randint(0, 1500))
+        maturity = today + timedelta(days=rng.randint(30, 3650))
+        coupon = f"{rng.uniform(5, 30):.1f}%" if rng.random() > 0.02 else ''
+        ytm = round(rng.uniform(8, 35), 2) if rng.random() > 0.1 else None
+        rows.append([f"Эмитент-{number // 10}-БО-{number % 10:02d}", f"RU000A{number:06d}", placement.isoformat(),
+                     maturity.isoformat(), coupon, ytm, None, None, None, None, rating, 'Зеленый',
+                     f"https://bonds.finam.ru/issue/details{number:05X}/default.asp"])
+    return rows
+
+
+def scan(rows, order_by='rating', descending=False, limit=None, min_rating=None, max_rating=None,
+         min_coupon=None, max_coupon=None, maturity_from=None, maturity_to=None, min_ytm=None, max_ytm=None):
+    """Тот же запрос полным перебором строк (без индекса)"""
+    positions = {column: number for number, column in enumerate(RATING_COLUMNS)}
+    high_rank = rating_rank(min_rating) if min_rating else None
+    low_rank = rating_rank(max_rating) if max_rating else None
+    date_from = f"{maturity_from}-01-01" if maturity_from and len(maturity_from) == 4 else maturity_from
+    date_to = f"{maturity_to}-12-31" if maturity_to and len(maturity_to) == 4 else maturity_to
+    fields = {
+        'rating': lambda row: rating_rank(row[positions['Рейтинг']]),
+        'coupon': lambda row: parse_float(row[positions['Ставка купона']]),
+        'maturity': lambda row: row[positions['Дата погашения']],
+        'ytm': lambda row: parse_float(row[positions['Доходность к погашению, %']])
+    }
+    found = []
+    for number, row in enumerate(rows):
+        rank, coupon = fields['rating'](row), fields['coupon'](row)
+        maturity, ytm = fields['maturity'](row), fields['ytm'](row)
+        if high_rank is not None and rank > high_rank or low_rank is not None and rank < low_rank:
+            continue
+        if (min_coupon is not None or max_coupon is not None) and coupon != coupon:
+            continue
+        if min_coupon is not None and coupon < min_coupon or max_coupon is not None and coupon > max_coupon:
+            continue
+        if date_from and maturity < date_from or date_to and maturity > date_to:
+            continue
+        if (min_ytm is not None or max_ytm is not None) and ytm != ytm:
+            continue
+        if min_ytm is not None and ytm < min_ytm or max_ytm is not None and ytm > max_ytm:
+            continue
+        found.append(number)
+    key = fields[order_by]
+    known = [number for number in found if key(rows[number]) == key(rows[number])]
+    known.sort(key=lambda number: key(rows[number]), reverse=descending)
+    total = len(found)
+    ordered = known + [number for number in found if key(rows[number]) != key(rows[number])]
+    return ordered[:limit] if limit is not None else ordered, total
+
+
+def pandas_frame(rows):
+    frame = pd.DataFrame(rows, columns=RATING_COLUMNS)
+    return pd.DataFrame({
+        'rating': frame['Рейтинг'].map(rating_rank).astype(float),
+        'coupon': frame['Ставка купона'].map(parse_float),
+        'maturity': pd.to_datetime(frame['Дата погашения']),
+        'ytm': frame['Доходность к погашению, %'].map(parse_float)
+    })
+
+
+def pandas_query(frame, order_by='rating', descending=False, limit=None, min_rating=None, max_rating=None,
+                 min_coupon=None, max_coupon=None, maturity_from=None, maturity_to=None, min_ytm=None, max_ytm=None):
+    """Тот же запрос маской по столбцам DataFrame"""
+    mask = pd.Series(True, index=frame.index)
+    if min_rating:
+        mask &= frame['rating'] <= rating_rank(min_rating)
+    if max_rating:
+        mask &= frame['rating'] >= rating_rank(max_rating)
+    if min_coupon is not None:
+        mask &= frame['coupon'] >= min_coupon
+    if max_coupon is not None:
+        mask &= frame['coupon'] <= max_coupon
+    if maturity_from:
+        mask &= frame['maturity'] >= pd.Timestamp(f"{maturity_from}-01-01" if len(maturity_from) == 4
+                                                  else maturity_from)
+    if maturity_to:
+        mask &= frame['maturity'] <= pd.Timestamp(f"{maturity_to}-12-31" if len(maturity_to) == 4 else maturity_to)
+    if min_ytm is not None:
+        mask &= frame['ytm'] >= min_ytm
+    if max_ytm is not None:
+        mask &= frame['ytm'] <= max_ytm
+    found = frame[mask]
+    ordered = found.sort_values(order_by, ascending=not descending, kind='stable', na_position='last')
+    return ordered.index[:limit] if limit is not None else ordered.index, len(found)
+
+
+def timings(call, repeats):
+    """Медиана и p95 длительности вызова, мс"""
+    samples = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        call()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+
+
+def same_result(index, order_by, ids, expected):
+    """Совпадение результата индекса с перебором: одинаковые значения поля сортировки в том же порядке
+    (при равных значениях порядок облигаций может различаться) и одинаковый набор, если выбраны все"""
+    values = index.values[order_by]
+    ours = [values[number] for number in ids.tolist()]
+    theirs = [values[number] for number in expected]
+    return len(ours) == len(theirs) and all(a == b or a != a and b != b for a, b in zip(ours, theirs))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Запросы к облигациям: индексы в памяти против перебора строк "
+                                                 "и маски pandas")
+    parser.add_argument('--bonds', type=int, default=50000, help="Облигаций в синтетическом наборе")
+    parser.add_argument('--repeats', type=int, default=200, help="Повторов каждого запроса к индексу")
+    parser.add_argument('--scan-repeats', type=int, default=3, help="Повторов полного перебора")
+    parser.add_argument('--http-requests', type=int, default=200, help="Запросов к HTTP-серверу (0 - без сервера)")
+    parser.add_argument('--seed', type=int, default=1, help="Начальное значение генератора случайных чисел")
+    args = parser.parse_args()
+
+    rows = synthetic_rows(args.bonds, seed=args.seed)
+    started = time.perf_counter()
+    index = BondIndex(rows)
+    build = time.perf_counter() - started
+    frame = pandas_frame(rows)
+    print(f"Облигаций: {index.size}, построение индекса: {build:.2f} с")
+    print(f"\n{'Запрос':<46} {'Найдено':>8} {'Индекс, мс':>11} {'p95, мс':>8} {'pandas, мс':>11} "
+          f"{'Перебор, мс':>12} {'Совпадает':>10}")
+    problems = []
+    for name, query in QUERIES:
+        ids, total = index.search(**query)
+        expected, expected_total = scan(rows, **query)
+        ok = total == expected_total and same_result(index, query['order_by'], ids, expected)
+        if query['limit'] is None:
+            ok = ok and set(ids.tolist()) == set(expected)
+        if not ok:
+            problems.append(name)
+        median, p95 = timings(lambda: index.search(**query), args.repeats)
+        pandas_median, _ = timings(lambda: pandas_query(frame, **query), max(3, args.repeats // 20))
+        scan_median, _ = timings(lambda: scan(rows, **query), args.scan_repeats)
+        print(f"{name:<46} {total:>8} {median:>11.3f} {p95:>8.3f} {pandas_median:>11.2f} {scan_median:>12.1f} "
+              f"{'да' if ok else 'НЕТ':>10}")
+
+    if args.http_requests:
+        server = QueryServer(lambda: index, port=0, reload_seconds=0).start()
+        try:
+            name, query = QUERIES[0]
+            params = {key: value for key, value in query.items() if key not in ('descending', 'limit')}
+            url = f"{server.url}/bonds?{urlencode(params)}&desc=1&limit={query['limit']}"
+
+            def request():
+                with urlopen(url) as response:
+                    return json.loads(response.read().decode('utf-8'))
+
+            payload = request()
+            median, p95 = timings(request, args.http_requests)
+            print(f"\nHTTP GET /bonds ({name}): найдено {payload['total']}, возвращено {payload['returned']}, "
+                  f"запрос к индексу {payload['query_ms']} мс, ответ целиком: медиана {median:.2f} мс, "
+                  f"p95 {p95:.2f} мс")
+        finally:
+            server.stop()
+
+    if problems:
+        print("Результаты индекса отличаются от перебора: " + "; ".join(problems))
+        sys.exit(1)
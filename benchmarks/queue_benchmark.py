@@ -0,0 +1,157 @@
+import os
+import sys
+import time
+import logging
+import argparse
+import tempfile
+from functools import partial
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARKS_DIR)
+sys.path.insert(0, REPO_DIR)
+
+from corpus import synthetic_corpus
+from stub_server import StubServer, StubFetcher
+
+
+def run_stage(workers_module, queue, stage, options, processes, fetcher_factory, kill_after=None):
+    """Обработка очереди этапа processes процессами; kill_after - через сколько секунд аварийно
+    завершить первый обработчик. Возвращает длительность в секундах"""
+    start = time.perf_counter()
+    workers = workers_module.start_workers(stage, options, processes, fetcher_factory)
+    if kill_after is not None:
+        time.sleep(kill_after)
+        workers[0].kill()
+    workers_module.wait_workers(workers)
+    return time.perf_counter() - start
+
+
+def check_results(queue, stage, expected):
+    """Сравнение результатов очереди с однопроцессным запуском: ни одна облигация не потеряна и не повторяется.
+    Возвращает список найденных расхождений"""
+    jobs = queue.results(stage)
+    keys = [key for key, _, _, _, _ in jobs]
+    results = {key: result for key, _, result, status, _ in jobs if status == 'done'}
+    problems = []
+    if len(keys) != len(set(keys)):
+        problems.append(f"повторяющихся заданий: {len(keys) - len(set(keys))}")
+    unfinished = [key for key, _, _, status, _ in jobs if status not in ('done', 'failed')]
+    if unfinished:
+        problems.append(f"невыполненных заданий: {len(unfinished)}")
+    # Отклоненные облигации могут остаться заданиями с отказом (например, без ставки купона)
+    missing = [key for key in expected if key not in results and expected[key] is not None]
+    if missing:
+        problems.append(f"потеряно результатов: {len(missing)}")
+    different = [key for key in expected if key in results and results[key] != expected[key]]
+    if different:
+        problems.append(f"отличается от однопроцессного запуска: {len(different)}")
+    return problems
+
+
+def run_benchmark(pages, args):
+    """Однопроцессный эталон и обработка очередей отбора и рейтингов несколькими процессами"""
+    # Модули пайплайна импортируются после перехода во временный каталог, где пишутся база и CSV
+    import bonds_workers
+    from bonds_filter import BondsFilter
+    from bonds_store import BondsStore
+    from rating_engine import AsyncRatingEngine
+    from html_parsers import create_parser
+    from screening import ScreeningRules
+    from work_queue import WorkQueue
+    logging.basicConfig(level=logging.ERROR if not args.verbose else logging.INFO)
+
+    stub = StubServer(pages, args.latency_ms, args.jitter_ms, seed=args.seed).start()
+    fetcher_factory = partial(StubFetcher, stub.url, requests_per_second=0)
+    rules = ScreeningRules.load(os.path.join(REPO_DIR, 'screening_rules.json'))
+    options = {
+        'queue_path': './output/work_queue.sqlite', 'visibility_timeout': args.visibility_timeout,
+        'max_attempts': 5, 'log_level': 'INFO' if args.verbose else 'ERROR', 'backend': 'http',
+        'threads': args.threads, 'rps': 0.0, 'use_cache': False, 'incremental': False, 'parser': args.parser,
+        'rules_file': os.path.join(REPO_DIR, 'screening_rules.json')
+    }
+    listing = [{'bond_name': f"Облигация {i}", 'placement_date': '2025-03-01', 'maturity_date': '2030-03-01',
+                'bond_link': f"https://bonds.finam.ru/issue/bonds{i}/default.asp"}
+               for i in range(args.listing_pages * args.page_size)]
+    store = BondsStore()
+    store.replace_listing(listing)
+    queue = WorkQueue(options['queue_path'], args.visibility_timeout)
+    timings = {}
+    failures = []
+    try:
+        # Эталон: один процесс в args.threads потоков без очереди
+        start = time.perf_counter()
+        bonds_filter = BondsFilter(fetcher=fetcher_factory(pool_size=args.threads), max_workers=args.threads,
+                                   rules=rules)
+        expected_filter = {bond['Ссылка']: bond for bond in bonds_filter.iter_filtered(listing)}
+        bonds_filter.close()
+        timings[('filter', 'без очереди')] = time.perf_counter() - start
+
+        fetcher = fetcher_factory(pool_size=args.threads)
+        engine = AsyncRatingEngine(fetcher, create_parser(args.parser).parse_rating, concurrency=args.threads)
+        rated = [bond for bond in expected_filter.values() if bond['ISIN']]
+        start = time.perf_counter()
+        expected_rating = {bond['Ссылка']: list(result)
+                           for bond, result in zip(rated, engine.run([bond['ISIN'] for bond in rated]))}
+        fetcher.close()
+        timings[('rating', 'без очереди')] = time.perf_counter() - start
+
+        # Отклоненные облигации - задания с пустым результатом
+        expected_filter = {bond_data['bond_link']: expected_filter.get(bond_data['bond_link'])
+                           for bond_data in rules.prefilter(listing)}
+        for processes in args.processes:
+            for kill in (False, True) if processes > 1 else (False,):
+                label = f"{processes} проц." + (", сбой" if kill else "")
+                bonds_workers.enqueue_filter(queue, store, rules)
+                timings[('filter', label)] = run_stage(bonds_workers, queue, 'filter', options, processes,
+                                                       fetcher_factory, args.kill_after if kill else None)
+                failures += [f"filter, {label}: {problem}"
+                             for problem in check_results(queue, 'filter', expected_filter)]
+                bonds_workers.merge_filter(queue, store, save_csv=False)
+
+                bonds_workers.enqueue_rating(queue, store, options)
+                timings[('rating', label)] = run_stage(bonds_workers, queue, 'rating', options, processes,
+                                                       fetcher_factory, args.kill_after if kill else None)
+                failures += [f"rating, {label}: {problem}"
+                             for problem in check_results(queue, 'rating', expected_rating)]
+    finally:
+        queue.close()
+        store.close()
+        stub.stop()
+    return timings, failures
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Обработка очереди заданий несколькими процессами на локальной "
+                                                 "заглушке сайтов: скорость и проверка результатов после сбоя "
+                                                 "обработчика")
+    parser.add_argument('--listing-pages', type=int, default=2, help="Страниц списка в синтетическом корпусе")
+    parser.add_argument('--page-size', type=int, default=50, help="Облигаций на странице синтетического корпуса")
+    parser.add_argument('--latency-ms', type=float, default=50.0, help="Задержка ответа заглушки")
+    parser.add_argument('--jitter-ms', type=float, default=20.0, help="Случайная добавка к задержке")
+    parser.add_argument('--seed', type=int, default=1, help="Начальное значение генератора случайных чисел")
+    parser.add_argument('--threads', type=int, default=2, help="Одновременных запросов в каждом процессе")
+    parser.add_argument('--processes', type=int, nargs='+', default=[1, 2, 4], help="Количество процессов")
+    parser.add_argument('--kill-after', type=float, default=1.0,
+                        help="Через сколько секунд аварийно завершается один из обработчиков в проверке сбоя")
+    parser.add_argument('--visibility-timeout', type=float, default=3.0,
+                        help="Время аренды задания: после него задания упавшего обработчика выдаются снова")
+    parser.add_argument('--parser', default='lxml', help="Библиотека разбора HTML")
+    parser.add_argument('--verbose', action='store_true', help="Выводить логи обработчиков")
+    args = parser.parse_args()
+
+    pages = synthetic_corpus(args.listing_pages, args.page_size, seed=args.seed)
+    with tempfile.TemporaryDirectory() as work_dir:
+        # База, очередь и логи пишутся во временный каталог; обработчики наследуют его как рабочий
+        os.chdir(work_dir)
+        timings, failures = run_benchmark(pages, args)
+        os.chdir(REPO_DIR)
+
+    print(f"{'Этап':<8} {'Запуск':<16} {'с':>8}")
+    for (stage, label), seconds in timings.items():
+        print(f"{stage:<8} {label:<16} {seconds:>8.2f}")
+    if failures:
+        print("Результаты очереди отличаются от однопроцессного запуска:")
+        for failure in failures:
+            print(f"  {failure}")
+        sys.exit(1)
+    print("Результаты очереди совпадают с однопроцессным запуском, включая запуски со сбоем обработчика")
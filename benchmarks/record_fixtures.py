@@ -0,0 +1,75 @@
+import os
+import sys
+import json
+import argparse
+import threading
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARKS_DIR))
+
+from corpus import FIXTURES_DIR, MANIFEST_FILE, save_fixture
+
+
+class RecordingFetcher:
+    """Обертка загрузчика, сохраняющая каждую загруженную страницу в корпус"""
+
+    def __init__(self, fetcher, directory, manifest=None, page_type='rating'):
+        self.fetcher = fetcher
+        self.directory = directory
+        self.manifest = manifest if manifest is not None else {}  # Общий manifest для нескольких загрузчиков
+        self.page_type = page_type  # Тип страниц, запрашиваемых без ожидаемого элемента
+        self.lock = threading.Lock()
+
+    def __getattr__(self, name):
+        return getattr(self.fetcher, name)
+
+    def fetch(self, url, ready=None):
+        html = self.fetcher.fetch(url, ready)
+        # Тип страницы определяется по ожидаемому элементу; страницы smart-lab запрашиваются без него
+        with self.lock:
+            save_fixture(self.directory, self.manifest, url, ready or self.page_type, html)
+        return html
+
+    def save_manifest(self):
+        with open(os.path.join(self.directory, MANIFEST_FILE), 'w', encoding='utf-8') as manifest_file:
+            json.dump(self.manifest, manifest_file, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Запись страниц finam и smart-lab в корпус для офлайн-бенчмарков")
+    parser.add_argument('--output', default=FIXTURES_DIR, help="Каталог корпуса")
+    parser.add_argument('--bonds', type=int, default=50, help="Количество облигаций, для которых записываются "
+                                                               "страницы облигации, платежей и рейтинга")
+    parser.add_argument('--rps', type=float, default=1.0, help="Максимальное количество запросов в секунду к сайту")
+    args = parser.parse_args()
+
+    from bonds_scraper import BondsScraper
+    from bonds_filter import BondsFilter
+    from bonds_rating import create_rating_fetcher, load_rating_index
+    from fetchers import HttpFetcher
+    from rating_engine import RATING_URL
+
+    if not os.path.exists(args.output):
+        os.makedirs(args.output)
+
+    # Все страницы списка нужны сборщику, чтобы на заглушке определить количество страниц так же, как на сайте
+    fetcher = RecordingFetcher(HttpFetcher(requests_per_second=args.rps), args.output)
+    listing = BondsScraper(fetcher=fetcher, max_workers=1).collect()
+
+    # Для ограниченного числа облигаций записываются страницы облигации и вкладки 'Платежи'
+    bonds_filter = BondsFilter(fetcher=fetcher, max_workers=1)
+    bond_details = [bonds_filter.extract_bond_details(bond_data) for bond_data in listing[:args.bonds]]
+
+    rating_fetcher = RecordingFetcher(create_rating_fetcher(use_cache=False, requests_per_second=args.rps),
+                                      args.output, fetcher.manifest)
+    for details in bond_details:
+        if details['isin']:
+            rating_fetcher.fetch(RATING_URL.format(isin=details['isin']))
+    # Страницы списка облигаций smart-lab для пакетного режима рейтингов
+    load_rating_index(RecordingFetcher(rating_fetcher.fetcher, args.output, fetcher.manifest, 'rating_list'),
+                      concurrency=1)
+
+    fetcher.save_manifest()
+    fetcher.close()
+    rating_fetcher.close()
+    print(f"Записано страниц: {len(fetcher.manifest)} в каталог {args.output}")
@@ -0,0 +1,209 @@
+import io
+import os
+import sys
+import time
+import sqlite3
+import logging
+import argparse
+import tempfile
+import threading
+from collections import Counter
+from contextlib import redirect_stdout
+from datetime import date
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARKS_DIR)
+sys.path.insert(0, REPO_DIR)
+
+from corpus import synthetic_corpus, rating_page, SMART_LAB_HOST
+from stub_server import StubServer, StubFetcher
+
+
+class RecordingFetcher(StubFetcher):
+    """Загрузчик заглушки, запоминающий время и адрес каждого запроса"""
+
+    def __init__(self, stub_url, requests, **kwargs):
+        super().__init__(stub_url, **kwargs)
+        self.requests = requests  # Общий список (время, адрес) всех загрузчиков режима
+
+    def fetch(self, url, ready=None):
+        self.requests.append((time.monotonic(), url))
+        return super().fetch(url, ready)
+
+
+class FreshnessSampler:
+    """Раз в секунду запоминает возраст самых старых данных отбора и рейтингов в базе"""
+
+    def __init__(self, path="output/bonds.sqlite", interval=1.0):
+        self.path = path
+        self.interval = interval
+        self.samples = []  # (возраст данных отбора, возраст рейтингов) в секундах
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def run(self):
+        connection = sqlite3.connect(self.path)
+        try:
+            while not self.stopped.wait(self.interval):
+                screened, rated = connection.execute(
+                    "SELECT MIN(screened_at), MIN(CASE WHEN accepted = 1 AND isin <> '' THEN rated_at END) "
+                    "FROM bonds WHERE position IS NOT NULL").fetchone()
+                now = time.time()
+                self.samples.append((now - (screened or now), now - (rated or now)))
+        finally:
+            connection.close()
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+        self.thread.join()
+
+
+def full_crawl(create_fetcher, args):
+    """Полный сбор всех этапов, как при запуске по расписанию"""
+    from bonds_scraper import BondsScraper
+    from bonds_filter import BondsFilter
+    from bonds_rating import process_bonds
+    from screening import ScreeningRules
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.ERROR)
+    rules = ScreeningRules.load(os.path.join(REPO_DIR, 'screening_rules.json'))
+    BondsScraper(fetcher=create_fetcher(), max_workers=args.workers, rules=rules).run()
+    BondsFilter(fetcher=create_fetcher(), max_workers=args.workers, rules=rules).run()
+    # process_bonds печатает каждую облигацию; в бенчмарке этот вывод скрывается
+    with redirect_stdout(io.StringIO()):
+        process_bonds(concurrency=args.workers, fetcher=create_fetcher())
+
+
+def run_periodic(stub, requests, args):
+    """Полный сбор каждые crawl_every секунд в течение duration"""
+    create_fetcher = lambda: RecordingFetcher(stub.url, requests, pool_size=args.workers, requests_per_second=0)
+    deadline = time.monotonic() + args.duration
+    while time.monotonic() < deadline:
+        started = time.monotonic()
+        full_crawl(create_fetcher, args)
+        time.sleep(max(0.0, min(deadline, started + args.crawl_every) - time.monotonic()))
+
+
+def run_daemon(stub, requests, pages, args):
+    """Демон обновления в течение duration; на середине у части облигаций меняется рейтинг"""
+    from refresh_daemon import RefreshDaemon, LISTING, DETAIL, RATING
+    from screening import ScreeningRules
+
+    day = args.day_seconds
+    # Облигации корпуса погашаются 1-28 марта 2030 года: первые near_maturity_day дней считаются близким погашением
+    near_maturity_days = (date(2030, 3, args.near_maturity_day) - date.today()).days
+    daemon = RefreshDaemon(intervals={LISTING: day / 4, DETAIL: day, RATING: day / 2}, workers=args.workers,
+                           rules=ScreeningRules.load(os.path.join(REPO_DIR, 'screening_rules.json')),
+                           near_maturity_days=near_maturity_days, snapshot_seconds=day / 10,
+                           finam_fetcher=RecordingFetcher(stub.url, requests, pool_size=args.workers,
+                                                          requests_per_second=0),
+                           rating_fetcher=RecordingFetcher(stub.url, requests, pool_size=args.workers,
+                                                           requests_per_second=0))
+    changed = [key for key, (page_type, _) in pages.items() if page_type == 'rating'][:args.rating_changes]
+    changed_at = []
+
+    def change_ratings():
+        changed_at.append(time.monotonic())
+        for key in changed:
+            pages[key] = ('rating', rating_page('ruCCC', 'red'))
+
+    timer = threading.Timer(args.duration / 2, change_ratings)
+    timer.start()
+    try:
+        daemon.run(args.duration)
+    finally:
+        timer.cancel()
+        daemon.close()
+    return {f"https://{key}" for key in changed}, changed_at[0]
+
+
+def load_profile(requests, started, duration):
+    """Запросов в каждую секунду окна измерения"""
+    buckets = Counter(int(moment - started) for moment, _ in requests if moment >= started)
+    return [buckets.get(second, 0) for second in range(int(duration))]
+
+
+def summarize(name, requests, started, sampler, args):
+    profile = sorted(load_profile(requests, started, args.duration))
+    total = sum(profile)
+    mean = total / len(profile)
+    to_hours = 24 / args.day_seconds  # Секунды бенчмарка -> часы реального времени
+    detail_age = max(sample[0] for sample in sampler.samples) * to_hours
+    rating_age = max(sample[1] for sample in sampler.samples) * to_hours
+    print(f"{name:<22} {total:>9} {mean:>10.1f} {profile[-1]:>10} {profile[int(len(profile) * 0.95)]:>8} "
+          f"{profile[-1] / mean if mean else 0:>9.1f} {detail_age:>14.1f} {rating_age:>15.1f}")
+
+
+def refreshes(requests, started, urls):
+    """Сколько раз после started запрашивался каждый адрес из urls"""
+    counts = Counter(url for moment, url in requests if moment >= started and url in urls)
+    return sum(counts.values()) / len(urls) if urls else 0.0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Периодический полный сбор и демон обновления по срокам: "
+                                                 "равномерность нагрузки и свежесть данных (локальная заглушка)")
+    parser.add_argument('--bonds', type=int, default=200, help="Облигаций в синтетическом корпусе")
+    parser.add_argument('--day-seconds', type=float, default=80.0,
+                        help="Сколько секунд бенчмарка соответствуют суткам (интервалы демона: список - четверть "
+                             "суток, страница облигации - сутки, рейтинг - половина суток)")
+    parser.add_argument('--duration', type=float, default=120.0, help="Длительность измерения каждого режима, секунд")
+    parser.add_argument('--crawl-every', type=float, default=None,
+                        help="Период полного сбора (по умолчанию - интервал рейтингов демона)")
+    parser.add_argument('--near-maturity-day', type=int, default=3,
+                        help="Облигации, погашаемые до этого дня марта 2030 года, считаются близкими к погашению")
+    parser.add_argument('--rating-changes', type=int, default=10, help="У скольких облигаций меняется рейтинг")
+    parser.add_argument('--latency-ms', type=float, default=20.0, help="Задержка ответа заглушки")
+    parser.add_argument('--jitter-ms', type=float, default=5.0, help="Случайная добавка к задержке")
+    parser.add_argument('--workers', type=int, default=4, help="Потоков загрузки")
+    parser.add_argument('--seed', type=int, default=1, help="Начальное значение генератора случайных чисел")
+    parser.add_argument('--modes', nargs='+', choices=['periodic', 'daemon'], default=['periodic', 'daemon'],
+                        help="Сравниваемые режимы")
+    parser.add_argument('--verbose', action='store_true', help="Выводить логи")
+    args = parser.parse_args()
+    args.crawl_every = args.crawl_every or args.day_seconds / 2
+
+    print(f"{'Режим':<22} {'Запросов':>9} {'В среднем':>10} {'Пик':>10} {'p95':>8} {'Пик/ср.':>9} "
+          f"{'Отбор, макс. ч':>14} {'Рейтинг, макс. ч':>15}")
+    results = {}
+    for mode in args.modes:
+        pages = synthetic_corpus(max(1, args.bonds // 50), 50, seed=args.seed)
+        with tempfile.TemporaryDirectory() as work_dir:
+            # База, CSV и логи пишутся во временный каталог; модули пайплайна импортируются после перехода в него
+            os.chdir(work_dir)
+            stub = StubServer(pages, args.latency_ms, args.jitter_ms, seed=args.seed).start()
+            try:
+                # Оба режима начинают с заполненной базы, как после первого запуска пайплайна
+                full_crawl(lambda: RecordingFetcher(stub.url, [], pool_size=args.workers, requests_per_second=0),
+                           args)
+                requests = []
+                started = time.monotonic()
+                with FreshnessSampler() as sampler:
+                    if mode == 'periodic':
+                        run_periodic(stub, requests, args)
+                    else:
+                        changed, changed_at = run_daemon(stub, requests, pages, args)
+                name = f"полный сбор каждые {args.crawl_every:g} с" if mode == 'periodic' else "демон обновления"
+                summarize(name, requests, started, sampler, args)
+                results[mode] = requests
+            finally:
+                stub.stop()
+                os.chdir(REPO_DIR)
+
+    if 'daemon' not in results:
+        sys.exit(0)
+    # Приоритеты демона: страницы облигаций с близким погашением и рейтинги, которые изменились
+    requests = results['daemon']
+    detail_urls = {url for _, url in requests if '/issue/bonds' in url and url.endswith('default.asp')}
+    near = {url for url in detail_urls if int(url.split('/issue/bonds')[1].split('/')[0]) % 28 + 1
+            <= args.near_maturity_day}
+    print(f"\nОбновлений страницы облигации за {args.duration:g} с: близкое погашение "
+          f"{refreshes(requests, 0, near):.1f}, остальные {refreshes(requests, 0, detail_urls - near):.1f}")
+    rating_urls = {url for _, url in requests if SMART_LAB_HOST in url}
+    print(f"Обновлений рейтинга после изменения: изменившиеся "
+          f"{refreshes(requests, changed_at, changed & rating_urls):.1f}, "
+          f"остальные {refreshes(requests, changed_at, rating_urls - changed):.1f}")
@@ -0,0 +1,95 @@
+import io
+import os
+import sys
+import time
+import logging
+import argparse
+import tempfile
+from contextlib import redirect_stdout
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARKS_DIR)
+sys.path.insert(0, REPO_DIR)
+
+from corpus import synthetic_corpus, page_key
+from stub_server import StubServer, StubFetcher
+
+OUTPUT_FILES = ['bonds_data.csv', 'bonds_filter.csv', 'bonds_with_ratings.csv']
+
+
+def run_stages(create_fetcher, args):
+    """Сбор, фильтрация и рейтинги с загрузчиками create_fetcher(). Возвращает длительность и содержимое
+    CSV-файлов этапов"""
+    # Модули пайплайна импортируются после перехода во временный каталог, где пишутся база и CSV
+    from bonds_scraper import BondsScraper
+    from bonds_filter import BondsFilter
+    from bonds_rating import process_bonds
+    from screening import ScreeningRules
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.ERROR)
+
+    rules = ScreeningRules.load(os.path.join(REPO_DIR, 'screening_rules.json'))
+    start = time.perf_counter()
+    BondsScraper(fetcher=create_fetcher(), max_workers=args.workers, rules=rules).run()
+    BondsFilter(fetcher=create_fetcher(), max_workers=args.workers, rules=rules).run()
+    # process_bonds печатает каждую облигацию; в бенчмарке этот вывод скрывается
+    with redirect_stdout(sys.stdout if args.verbose else io.StringIO()):
+        process_bonds(concurrency=args.workers, fetcher=create_fetcher())
+    wall = time.perf_counter() - start
+    outputs = {}
+    for name in OUTPUT_FILES:
+        with open(os.path.join('output', name), 'rb') as infile:
+            outputs[name] = infile.read()
+    return wall, outputs
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Сбор с сохранением страниц в архив и повторное извлечение данных "
+                                                 "из архива (локальная заглушка сайтов)")
+    parser.add_argument('--bonds', type=int, default=1000, help="Облигаций в синтетическом корпусе")
+    parser.add_argument('--latency-ms', type=float, default=20.0, help="Задержка ответа заглушки")
+    parser.add_argument('--jitter-ms', type=float, default=5.0, help="Случайная добавка к задержке")
+    parser.add_argument('--workers', type=int, default=4, help="Потоков загрузки каждого этапа")
+    parser.add_argument('--seed', type=int, default=1, help="Начальное значение генератора случайных чисел")
+    parser.add_argument('--verbose', action='store_true', help="Выводить логи и ход обработки")
+    args = parser.parse_args()
+
+    pages = synthetic_corpus(max(1, args.bonds // 50), 50, seed=args.seed)
+    with tempfile.TemporaryDirectory() as work_dir:
+        # База, CSV, архив и логи этапов пишутся во временный каталог
+        os.chdir(work_dir)
+        from fetchers import ReplayFetcher
+        from page_archive import PageArchive
+
+        archive_dir = os.path.join(work_dir, 'archive')
+        stub = StubServer(pages, args.latency_ms, args.jitter_ms, seed=args.seed).start()
+        try:
+            crawl_wall, crawled = run_stages(
+                lambda: StubFetcher(stub.url, pool_size=args.workers, requests_per_second=0,
+                                    archive=PageArchive(archive_dir)), args)
+        finally:
+            stub.stop()
+        archive = PageArchive(archive_dir, readonly=True)
+        summary = archive.summary()
+        raw_size = sum(len(pages[page_key(url)][1].encode('utf-8')) for url in archive.locations()) / (1024 * 1024)
+        archive.close()
+
+        # Повторное извлечение дважды: результат не должен зависеть ни от сети, ни от запуска
+        replays = [run_stages(lambda: ReplayFetcher(args.workers, PageArchive(archive_dir, readonly=True)), args)
+                   for _ in range(2)]
+        os.chdir(REPO_DIR)
+
+    print(f"Архив: {summary['records']} записей, {summary['urls']} адресов, {summary['size_mb']} МБ "
+          f"(без сжатия {raw_size:.1f} МБ)")
+    print(f"Сбор с сайтов (заглушка {args.latency_ms:g} мс): {crawl_wall:.2f} с")
+    for number, (wall, _) in enumerate(replays, 1):
+        print(f"Извлечение из архива, запуск {number}: {wall:.2f} с")
+    problems = []
+    for name in OUTPUT_FILES:
+        if replays[0][1][name] != crawled[name]:
+            problems.append(f"{name} отличается от сбора с сайтов")
+        if replays[1][1][name] != replays[0][1][name]:
+            problems.append(f"{name} отличается между запусками")
+    if problems:
+        print("Результаты различаются: " + "; ".join(problems))
+        sys.exit(1)
+    print("Результаты извлечения из архива совпадают со сбором с сайтов")
@@ -0,0 +1,129 @@
+import os
+import sys
+import time
+import logging
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARKS_DIR)
+sys.path.insert(0, REPO_DIR)
+
+from corpus import synthetic_corpus, FINAM_HOST, SMART_LAB_HOST
+from stub_server import StubServer, StubFetcher
+from fetchers import FetchError, HostRateLimiter, retry_delay
+from host_scheduler import AdaptiveScheduler
+
+
+def fetch_all(fetcher, urls, threads, max_retries):
+    """Загрузка страниц threads потоками с повторами при временных ошибках, как на этапах пайплайна.
+    Возвращает (загружено, не загружено, повторов)"""
+    retries = [0]
+
+    def fetch(url):
+        for attempt in range(max_retries + 1):
+            try:
+                fetcher.fetch(url)
+                return True
+            except FetchError as e:
+                if not e.transient or attempt == max_retries:
+                    return False
+                retries[0] += 1
+                time.sleep(retry_delay(fetcher, attempt, e, backoff_base=0.5))
+        return False
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        results = list(executor.map(fetch, urls))
+    return sum(results), len(results) - sum(results), retries[0]
+
+
+def run_mode(pages, urls, rate_limiter, args):
+    """Одновременная загрузка страниц finam и smart-lab с общим ограничением частоты.
+    Возвращает длительность, результаты по сайтам и статистику заглушки"""
+    stub = StubServer(pages, args.latency_ms, args.jitter_ms, seed=args.seed,
+                      capacity={FINAM_HOST: args.finam_capacity, SMART_LAB_HOST: args.smart_lab_capacity},
+                      overload_ms=args.overload_ms, retry_after=args.retry_after).start()
+    fetcher = StubFetcher(stub.url, pool_size=args.threads * 2, rate_limiter=rate_limiter)
+    start = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=len(urls)) as executor:
+            futures = {host: executor.submit(fetch_all, fetcher, host_urls, args.threads, args.max_retries)
+                       for host, host_urls in urls.items()}
+            results = {host: future.result() for host, future in futures.items()}
+        wall = time.perf_counter() - start
+    finally:
+        fetcher.session.close()
+        stub.stop()
+    return wall, results, stub.stats
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Фиксированная частота запросов и адаптивный планировщик (AIMD) "
+                                                 "на заглушке сайтов, которая деградирует под нагрузкой")
+    parser.add_argument('--bonds', type=int, default=300, help="Страниц облигаций finam и рейтингов smart-lab")
+    parser.add_argument('--threads', type=int, default=8, help="Потоков загрузки каждого сайта")
+    parser.add_argument('--fixed-rps', type=float, nargs='+', default=[0.0, 5.0],
+                        help="Фиксированные частоты для сравнения (0 - без ограничения)")
+    parser.add_argument('--latency-ms', type=float, default=20.0, help="Задержка ответа заглушки без нагрузки")
+    parser.add_argument('--jitter-ms', type=float, default=5.0, help="Случайная добавка к задержке")
+    parser.add_argument('--finam-capacity', type=int, default=4,
+                        help="Одновременных запросов к finam, которые заглушка выдерживает без деградации")
+    parser.add_argument('--smart-lab-capacity', type=int, default=2,
+                        help="Одновременных запросов к smart-lab без деградации")
+    parser.add_argument('--overload-ms', type=float, default=40.0,
+                        help="Добавка к задержке за каждый запрос сверх допустимых")
+    parser.add_argument('--retry-after', type=int, default=1, help="Retry-After ответов 429 заглушки")
+    parser.add_argument('--crawl-delay', type=float, default=0.02, help="Crawl-delay в robots.txt smart-lab")
+    parser.add_argument('--max-rate', type=float, default=200.0,
+                        help="Верхняя граница частоты адаптивного планировщика")
+    parser.add_argument('--rate-step', type=float, default=5.0,
+                        help="Шаг увеличения частоты адаптивного планировщика")
+    parser.add_argument('--max-retries', type=int, default=4, help="Повторов загрузки одной страницы")
+    parser.add_argument('--seed', type=int, default=1, help="Начальное значение генератора случайных чисел")
+    parser.add_argument('--verbose', action='store_true', help="Выводить изменения бюджета сайтов")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.ERROR)
+
+    pages = synthetic_corpus(max(1, args.bonds // 50), 50, seed=args.seed)
+    pages[f"{SMART_LAB_HOST}/robots.txt"] = ('robots', f"User-agent: *\nCrawl-delay: {args.crawl_delay}\n")
+    urls = {FINAM_HOST: [], SMART_LAB_HOST: []}
+    for key, (page_type, _) in pages.items():
+        if page_type == 'detail':
+            urls[FINAM_HOST].append(f"https://{key}")
+        elif page_type == 'rating':
+            urls[SMART_LAB_HOST].append(f"https://{key}")
+
+    # Адаптивный планировщик начинает с той же частоты, что и этапы пайплайна по умолчанию. Верхние границы
+    # и шаг частоты подняты, а порог медленного ответа уменьшен под масштаб заглушки: предел задает
+    # деградация заглушки, а не бюджет реальных сайтов
+    budgets = {host: {'max_rate': args.max_rate, 'rate_step': args.rate_step, 'max_concurrency': args.threads,
+                      'slow_seconds': args.latency_ms * 4 / 1000}
+               for host in urls}
+    modes = [(f"фиксированная {rps:g}" if rps else "без ограничения", HostRateLimiter(rps))
+             for rps in args.fixed_rps]
+    modes.append(("адаптивная", AdaptiveScheduler(budgets)))
+
+    print(f"{'Режим':<18} {'Сайт':<15} {'Время, с':>9} {'Загружено':>10} {'Ошибок':>7} {'Повторов':>9} "
+          f"{'Макс. одновр.':>14}")
+    lost = 0
+    scheduler = None
+    for name, rate_limiter in modes:
+        wall, results, stub_stats = run_mode(pages, urls, rate_limiter, args)
+        for host, (fetched, failed, retries) in results.items():
+            print(f"{name:<18} {host:<15} {wall:>9.2f} {fetched:>10} {failed:>7} {retries:>9} "
+                  f"{stub_stats['max_in_flight'].get(host, 0):>14}")
+            if rate_limiter.adaptive:
+                lost += failed
+        print(f"{'':<18} ответов 429 от заглушки: {stub_stats['overloaded']}")
+        if rate_limiter.adaptive:
+            scheduler = rate_limiter
+
+    print("\nБюджеты адаптивного планировщика после прогона:")
+    for host, stats in scheduler.stats().items():
+        print(f"  {host}: одновременных {stats['concurrency']}, частота {stats['rate']} в секунду, "
+              f"crawl-delay {stats['crawl_delay']} с, задержка {stats['latency_ms']} мс "
+              f"(обычная {stats['baseline_ms']} мс), запросов {stats['requests']}, 429/503 {stats['throttled']}, "
+              f"медленных {stats['slow']}, увеличений {stats['increases']}, снижений {stats['decreases']}")
+    if lost:
+        print(f"Адаптивный планировщик потерял страниц: {lost}")
+        sys.exit(1)
@@ -0,0 +1,135 @@
+import time
+import random
+import logging
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit
+from fetchers import HttpFetcher
+from corpus import page_key
+
+
+class StubServer:
+    """Локальная заглушка finam и smart-lab: отдает страницы корпуса с задержкой и ошибками.
+    Адрес страницы передается в пути запроса: http://127.0.0.1:<порт>/<хост>/<путь>?<параметры>.
+    С параметром capacity заглушка деградирует под нагрузкой, как перегруженный сайт: каждый одновременный
+    запрос сверх capacity добавляет overload_ms к задержке, а сверх удвоенной capacity получает
+    overload_status с Retry-After"""
+
+    def __init__(self, pages, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0, error_status=503, seed=1,
+                 capacity=None, overload_ms=0.0, overload_status=429, retry_after=1):
+        self.pages = pages  # Ключ страницы -> (тип, HTML)
+        self.latency_ms = latency_ms  # Задержка ответа
+        self.jitter_ms = jitter_ms  # Случайная добавка к задержке (от 0 до jitter_ms)
+        self.error_rate = error_rate  # Доля ответов с ошибкой
+        self.error_status = error_status
+        self.capacity = capacity  # Одновременных запросов без деградации: число или словарь хост -> число
+        self.overload_ms = overload_ms
+        self.overload_status = overload_status
+        self.retry_after = retry_after
+        self.in_flight = {}  # Хост -> запросов в обработке
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {'served': 0, 'errors': 0, 'not_found': 0, 'overloaded': 0, 'max_in_flight': {}}
+        self.server = None
+        self.thread = None
+
+    def host_capacity(self, host):
+        if isinstance(self.capacity, dict):
+            return self.capacity.get(host)
+        return self.capacity
+
+    def plan_response(self, host=None):
+        """Задержка, признак ошибки и признак перегрузки для очередного запроса (воспроизводимо при
+        одинаковом seed и одинаковой нагрузке)"""
+        with self.lock:
+            delay = (self.latency_ms + self.random.uniform(0, self.jitter_ms)) / 1000
+            failed = self.random.random() < self.error_rate
+            in_flight = self.in_flight[host] = self.in_flight.get(host, 0) + 1
+            max_in_flight = self.stats['max_in_flight']
+            max_in_flight[host] = max(max_in_flight.get(host, 0), in_flight)
+        capacity = self.host_capacity(host)
+        overloaded = False
+        if capacity is not None and in_flight > capacity:
+            delay += self.overload_ms * (in_flight - capacity) / 1000
+            overloaded = in_flight > 2 * capacity
+        return delay, failed, overloaded
+
+    def finish_request(self, host):
+        with self.lock:
+            self.in_flight[host] -= 1
+
+    def handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive, как у реальных сайтов
+            # Заголовки и тело уходят одним пакетом, иначе задержанные ACK добавляют ~40 мс к каждому ответу
+            disable_nagle_algorithm = True
+            wbufsize = 64 * 1024
+
+            def do_GET(self):
+                host = self.path.split('/')[1]
+                delay, failed, overloaded = stub.plan_response(host)
+                try:
+                    time.sleep(delay)
+                finally:
+                    stub.finish_request(host)
+                page = stub.pages.get(page_key('https:/' + self.path))
+                retry_after = '0'
+                if overloaded:
+                    status, body = stub.overload_status, b'Too Many Requests'
+                    retry_after = str(stub.retry_after)
+                elif failed:
+                    status, body = stub.error_status, b'Service Unavailable'
+                elif page is None:
+                    status, body = 404, b'Not Found'
+                else:
+                    status, body = 200, page[1].encode('utf-8')
+                with stub.lock:
+                    stub.stats['overloaded' if overloaded else 'errors' if failed
+                               else 'not_found' if page is None else 'served'] += 1
+
+                self.send_response(status)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                if status in (429, 503):
+                    self.send_header('Retry-After', retry_after)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        """Запуск сервера в фоновом потоке на свободном порту"""
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self.handler())
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        logging.info(f"Заглушка сайтов запущена: {self.url}")
+        return self
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+
+class StubFetcher(HttpFetcher):
+    """HttpFetcher, который отправляет запросы в заглушку вместо реальных сайтов"""
+
+    def __init__(self, stub_url, **kwargs):
+        super().__init__(**kwargs)
+        self.stub_url = stub_url
+
+    def route(self, url):
+        parts = urlsplit(url)
+        return f"{self.stub_url}/{parts.netloc}{parts.path}" + (f"?{parts.query}" if parts.query else '')
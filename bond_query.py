@@ -0,0 +1,351 @@
+import json
+import time
+import logging
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+import numpy as np
+from bonds_store import BondsStore, DEFAULT_STORE_PATH
+from html_parsers import parse_rating_grade
+from sort_bonds import RATING_ORDER, get_rating_value
+from records import RATING_COLUMNS
+from streaming import iter_csv
+from log_setup import setup_logging
+
+# Поля с отсортированными индексами: рейтинг (номер в RATING_ORDER, меньше - лучше), ставка купона, дата
+# погашения (дни от 1970-01-01) и доходность к погашению
+INDEXED_FIELDS = ['rating', 'coupon', 'maturity', 'ytm']
+DEFAULT_LIMIT = 100
+DEFAULT_PORT = 8765
+RELOAD_SECONDS = 300  # Как часто сервер перечитывает базу
+# Параметры запроса HTTP -> преобразование значения
+FLOAT_PARAMS = ['min_coupon', 'max_coupon', 'min_ytm', 'max_ytm']
+TEXT_PARAMS = ['min_rating', 'max_rating', 'maturity_from', 'maturity_to', 'order_by']
+
+
+def rating_rank(rating):
+    """Номер рейтинга в RATING_ORDER: записи агентств ('ruAA-', 'AA-(RU)') приводятся к шкале sort_bonds"""
+    if rating in RATING_ORDER:
+        return RATING_ORDER[rating]
+    grade = parse_rating_grade(rating or '')
+    return RATING_ORDER.get(grade, get_rating_value(rating))
+
+
+def parse_float(value):
+    """Число из значения CSV или базы ('18.3%', '12,5', 12.5); NaN, если значения нет"""
+    if value is None or value == '':
+        return np.nan
+    try:
+        return float(str(value).replace('%', '').replace(',', '.'))
+    except ValueError:
+        return np.nan
+
+
+def parse_day(value, end=False):
+    """Граница даты погашения ('2028' или '2028-06-30') в днях от 1970-01-01. Год без дня означает 1 января,
+    а для верхней границы (end) - 31 декабря"""
+    if value is None:
+        return None
+    value = str(value)
+    if len(value) == 4 and value.isdigit():
+        value = f"{value}-12-31" if end else f"{value}-01-01"
+    try:
+        return int(np.datetime64(value, 'D').astype(np.int64))
+    except ValueError as e:
+        raise ValueError(f"Неверная дата погашения: {value} (ожидается YYYY или YYYY-MM-DD)") from e
+
+
+class BondIndex:
+    """Облигации с рейтингом в памяти по колонкам с отсортированными индексами.
+
+    Значения каждой колонки bonds_with_ratings.csv хранятся отдельным списком, а поля INDEXED_FIELDS - массивами
+    numpy. Для каждого поля индекса хранятся номера облигаций, отсортированные по значению, и сами значения
+    в том же порядке. Диапазон значений находится бинарным поиском (np.searchsorted) за O(log n). Запрос
+    начинается с самого узкого диапазона среди условий, а остальные условия проверяются только на его
+    облигациях. Индекс неизменяемый: при обновлении данных строится новый"""
+
+    def __init__(self, rows):
+        rows = [list(row) for row in rows]
+        self.size = len(rows)
+        self.columns = {column: [row[number] for row in rows] for number, column in enumerate(RATING_COLUMNS)}
+        dates = [value or 'NaT' for value in self.columns['Дата погашения']]
+        try:
+            maturity = np.array(dates, dtype='datetime64[D]')
+        except ValueError:
+            maturity = np.array([np.datetime64(value, 'D') if value[:4].isdigit() else np.datetime64('NaT')
+                                 for value in dates], dtype='datetime64[D]')
+        self.values = {
+            'rating': np.array([rating_rank(value) for value in self.columns['Рейтинг']], dtype=np.float64),
+            'coupon': np.array([parse_float(value) for value in self.columns['Ставка купона']], dtype=np.float64),
+            # Даты хранятся как числа с плавающей точкой: отсутствующая дата - NaN, как и у остальных полей
+            'maturity': np.where(np.isnat(maturity), np.nan, maturity.astype(np.int64)).astype(np.float64),
+            'ytm': np.array([parse_float(value) for value in self.columns['Доходность к погашению, %']],
+                            dtype=np.float64)
+        }
+        # Облигации без значения поля в его индекс не попадают и не проходят условия по нему
+        self.indexes = {}
+        self.missing = {}
+        for field, values in self.values.items():
+            unknown = np.isnan(values)
+            known = np.flatnonzero(~unknown)
+            order = known[np.argsort(values[known], kind='stable')]
+            self.indexes[field] = (values[order], order)
+            self.missing[field] = np.flatnonzero(unknown)
+
+    @classmethod
+    def from_store(cls, path=DEFAULT_STORE_PATH):
+        """Облигации с рейтингом из базы (в порядке рейтинга, как в bonds_with_ratings.csv)"""
+        store = BondsStore(path)
+        try:
+            return cls(store.rated())
+        finally:
+            store.close()
+
+    @classmethod
+    def from_csv(cls, path="./output/bonds_with_ratings.csv"):
+        """Облигации из bonds_with_ratings.csv (колонки берутся по названиям)"""
+        return cls([[row.get(column, '') for column in RATING_COLUMNS] for row in iter_csv(path)])
+
+    def bounds(self, min_rating=None, max_rating=None, min_coupon=None, max_coupon=None, maturity_from=None,
+               maturity_to=None, min_ytm=None, max_ytm=None):
+        """Условия запроса в виде {поле: (нижняя граница, верхняя граница)}; None - без границы.
+        min_rating - худший допустимый рейтинг ('AA-' - AA- и выше), max_rating - лучший допустимый"""
+        for rating in (min_rating, max_rating):
+            if rating is not None and rating_rank(rating) >= RATING_ORDER['Нет данных']:
+                raise ValueError(f"Неизвестный рейтинг: {rating}")
+        bounds = {
+            'rating': (rating_rank(max_rating) if max_rating else None,
+                       rating_rank(min_rating) if min_rating else None),
+            'coupon': (min_coupon, max_coupon),
+            'maturity': (parse_day(maturity_from), parse_day(maturity_to, end=True)),
+            'ytm': (min_ytm, max_ytm)
+        }
+        return {field: bound for field, bound in bounds.items() if bound != (None, None)}
+
+    def range(self, field, low=None, high=None):
+        """Номера облигаций со значением поля от low до high включительно, по возрастанию значения"""
+        keys, order = self.indexes[field]
+        start = 0 if low is None else np.searchsorted(keys, low, side='left')
+        stop = len(keys) if high is None else np.searchsorted(keys, high, side='right')
+        return order[start:stop]
+
+    def match(self, bounds):
+        """Номера облигаций, удовлетворяющих всем условиям, и поле, по которому они упорядочены"""
+        if not bounds:
+            return np.arange(self.size), None
+        # Начинаем с самого узкого диапазона: его размер - разность двух позиций бинарного поиска
+        ranges = {field: self.range(field, low, high) for field, (low, high) in bounds.items()}
+        driver = min(ranges, key=lambda field: len(ranges[field]))
+        ids = ranges[driver]
+        for field, (low, high) in bounds.items():
+            if field == driver or not len(ids):
+                continue
+            values = self.values[field][ids]
+            mask = ~np.isnan(values)
+            if low is not None:
+                mask &= values >= low
+            if high is not None:
+                mask &= values <= high
+            ids = ids[mask]
+        return ids, driver
+
+    def search(self, order_by='rating', descending=False, limit=DEFAULT_LIMIT, **filters):
+        """Номера облигаций, удовлетворяющих условиям filters (см. bounds), в порядке поля order_by,
+        не больше limit (None - все), и общее количество подходящих облигаций"""
+        if order_by not in self.indexes:
+            raise ValueError(f"Сортировка возможна только по полям {', '.join(INDEXED_FIELDS)}")
+        if limit is not None and limit < 0:
+            raise ValueError(f"Неверное количество облигаций (limit): {limit}")
+        bounds = self.bounds(**filters)
+        if not bounds:
+            # Без условий первые k облигаций берутся прямо из индекса поля сортировки
+            keys, order = self.indexes[order_by]
+            ids = (order[::-1] if descending else order)[:limit]
+            if limit is None or len(ids) < limit:
+                ids = np.concatenate((ids, self.missing[order_by]))[:limit]
+            return ids, self.size
+
+        ids, driver = self.match(bounds)
+        total = len(ids)
+        if driver != order_by:
+            values = self.values[order_by][ids]
+            if limit is not None and limit < total:
+                # Первые k по значению без полной сортировки; облигации без значения - в конце
+                values = np.where(np.isnan(values), np.inf if not descending else -np.inf, values)
+                part = np.argpartition(-values if descending else values, limit - 1)[:limit]
+                ids, values = ids[part], values[part]
+            ids = ids[np.argsort(-values if descending else values, kind='stable')]
+        elif descending:
+            ids = ids[::-1]
+        return (ids if limit is None else ids[:limit]), total
+
+    def records(self, ids):
+        """Облигации по номерам: словари с колонками bonds_with_ratings.csv"""
+        return [{column: self.columns[column][number] for column in RATING_COLUMNS} for number in ids.tolist()]
+
+    def query(self, order_by='rating', descending=False, limit=DEFAULT_LIMIT, **filters):
+        """Облигации, удовлетворяющие условиям, например:
+        index.query(min_rating='AA-', min_coupon=17, maturity_from='2028', maturity_to='2030')"""
+        ids, _ = self.search(order_by, descending, limit, **filters)
+        return self.records(ids)
+
+
+def parse_params(query_string):
+    """Параметры запроса HTTP (?min_rating=AA-&min_coupon=17&limit=20) -> аргументы BondIndex.search"""
+    params = {name: values[-1] for name, values in parse_qs(query_string).items()}
+    unknown = set(params) - set(FLOAT_PARAMS) - set(TEXT_PARAMS) - {'desc', 'limit'}
+    if unknown:
+        raise ValueError(f"Неизвестные параметры: {', '.join(sorted(unknown))}")
+    arguments = {name: params[name] for name in TEXT_PARAMS if name in params}
+    try:
+        arguments.update({name: float(params[name].replace(',', '.')) for name in FLOAT_PARAMS if name in params})
+        if 'limit' in params:
+            arguments['limit'] = int(params['limit']) if params['limit'] else None
+    except ValueError as e:
+        raise ValueError(f"Неверное число в параметрах запроса: {str(e)}") from e
+    if arguments.get('limit') is not None and arguments['limit'] < 0:
+        raise ValueError(f"Неверное количество облигаций (limit): {arguments['limit']}")
+    arguments['descending'] = params.get('desc', '').lower() in ('1', 'true', 'yes')
+    return arguments
+
+
+class QueryServer:
+    """Локальный HTTP-сервер запросов к индексу: GET /bonds?<условия> и GET /stats (ответы в JSON).
+    Индекс перестраивается из источника load() каждые reload_seconds секунд и подменяется целиком,
+    поэтому запросы во время перестроения обслуживаются прежним индексом"""
+
+    def __init__(self, load, host='127.0.0.1', port=DEFAULT_PORT, reload_seconds=RELOAD_SECONDS):
+        self.load = load
+        self.reload_seconds = reload_seconds
+        self.index = load()
+        self.loaded_at = time.time()
+        self.stopped = threading.Event()
+        self.server = ThreadingHTTPServer((host, port), self.handler())
+        self.server.daemon_threads = True
+        self.threads = []
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def reload(self):
+        started = time.perf_counter()
+        self.index = self.load()
+        self.loaded_at = time.time()
+        logging.info(f"Индекс облигаций перестроен: {self.index.size} облигаций за "
+                     f"{time.perf_counter() - started:.2f} с")
+
+    def reload_loop(self):
+        while not self.stopped.wait(self.reload_seconds):
+            try:
+                self.reload()
+            except Exception as e:
+                logging.error(f"Ошибка при перестроении индекса облигаций: {str(e)}")
+
+    def handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                parts = urlsplit(self.path)
+                index = server.index
+                if parts.path == '/stats':
+                    self.reply(200, {'bonds': index.size, 'loaded_at': server.loaded_at,
+                                     'indexed': {field: len(index.indexes[field][1]) for field in INDEXED_FIELDS}})
+                    return
+                if parts.path != '/bonds':
+                    self.reply(404, {'error': "Доступны /bonds и /stats"})
+                    return
+                started = time.perf_counter()
+                try:
+                    arguments = parse_params(parts.query)
+                    limit = arguments.pop('limit', DEFAULT_LIMIT)
+                    ids, total = index.search(limit=limit, **arguments)
+                except (ValueError, TypeError) as e:
+                    self.reply(400, {'error': str(e)})
+                    return
+                self.reply(200, {'total': total, 'returned': len(ids),
+                                 'query_ms': round((time.perf_counter() - started) * 1000, 3),
+                                 'bonds': index.records(ids)})
+
+            def reply(self, status, payload):
+                body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logging.debug(f"{self.address_string()} {format % args}")
+
+        return Handler
+
+    def start(self):
+        """Запуск сервера и перестроения индекса в фоновых потоках"""
+        self.threads = [threading.Thread(target=self.server.serve_forever, daemon=True)]
+        if self.reload_seconds:
+            self.threads.append(threading.Thread(target=self.reload_loop, daemon=True))
+        for thread in self.threads:
+            thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def add_filter_arguments(parser):
+    parser.add_argument('--min-rating', help="Худший допустимый рейтинг (AA- - AA- и выше)")
+    parser.add_argument('--max-rating', help="Лучший допустимый рейтинг")
+    parser.add_argument('--min-coupon', type=float, help="Минимальная ставка купона, %%")
+    parser.add_argument('--max-coupon', type=float, help="Максимальная ставка купона, %%")
+    parser.add_argument('--maturity-from', help="Погашение не раньше (YYYY или YYYY-MM-DD)")
+    parser.add_argument('--maturity-to', help="Погашение не позже (YYYY - до конца года, или YYYY-MM-DD)")
+    parser.add_argument('--min-ytm', type=float, help="Минимальная доходность к погашению, %%")
+    parser.add_argument('--max-ytm', type=float, help="Максимальная доходность к погашению, %%")
+    parser.add_argument('--order-by', choices=INDEXED_FIELDS, default='rating', help="Поле сортировки")
+    parser.add_argument('--desc', action='store_true', help="Сортировка по убыванию")
+    parser.add_argument('--limit', type=int, default=DEFAULT_LIMIT, help="Сколько облигаций вывести")
+
+
+if __name__ == '__main__':
+    setup_logging()
+
+    parser = argparse.ArgumentParser(description="Запросы к облигациям с рейтингом по индексам в памяти")
+    parser.add_argument('--db', default=DEFAULT_STORE_PATH, help="Файл базы SQLite")
+    parser.add_argument('--csv', help="Брать облигации из bonds_with_ratings.csv вместо базы")
+    commands = parser.add_subparsers(dest='command', required=True)
+    query_parser = commands.add_parser('query', help="Вывести облигации, удовлетворяющие условиям")
+    add_filter_arguments(query_parser)
+    serve_parser = commands.add_parser('serve', help="Локальный HTTP-сервер запросов (GET /bonds, /stats)")
+    serve_parser.add_argument('--host', default='127.0.0.1', help="Адрес сервера")
+    serve_parser.add_argument('--port', type=int, default=DEFAULT_PORT, help="Порт сервера")
+    serve_parser.add_argument('--reload-minutes', type=float, default=RELOAD_SECONDS / 60,
+                              help="Как часто перечитывать базу (0 - не перечитывать)")
+    args = parser.parse_args()
+
+    load = (lambda: BondIndex.from_csv(args.csv)) if args.csv else (lambda: BondIndex.from_store(args.db))
+    if args.command == 'query':
+        index = load()
+        started = time.perf_counter()
+        ids, total = index.search(args.order_by, args.desc, args.limit, min_rating=args.min_rating,
+                                  max_rating=args.max_rating, min_coupon=args.min_coupon, max_coupon=args.max_coupon,
+                                  maturity_from=args.maturity_from, maturity_to=args.maturity_to,
+                                  min_ytm=args.min_ytm, max_ytm=args.max_ytm)
+        elapsed = (time.perf_counter() - started) * 1000
+        for bond in index.records(ids):
+            print(f"{bond['Рейтинг']:<8} {bond['Ставка купона']:>7} {bond['Дата погашения']} {bond['ISIN']} "
+                  f"{bond['Название облигации']}")
+        print(f"Найдено облигаций: {total} из {index.size}, показано {len(ids)}, запрос занял {elapsed:.3f} мс")
+    else:
+        server = QueryServer(load, args.host, args.port, args.reload_minutes * 60).start()
+        logging.info(f"Сервер запросов к облигациям: {server.url}/bonds?min_rating=AA-&min_coupon=17 "
+                     f"({server.index.size} облигаций)")
+        try:
+            server.threads[0].join()
+        except KeyboardInterrupt:
+            server.stop()
@@ -1,67 +1,65 @@
 import os
-import logging
 import time
-import pandas as pd
-from bs4 import BeautifulSoup
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.chrome.options import Options
-from webdriver_manager.chrome import ChromeDriverManager
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
+import logging
+import argparse
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urljoin
-
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('bonds_filter.log', encoding='utf-8'),
-        logging.StreamHandler()
-    ]
-)
+from fetchers import FetchError, create_fetcher, retry_delay, FETCHER_BACKENDS
+from html_parsers import create_parser, PARSER_BACKENDS
+from http_cache import ResponseCache
+from page_archive import PageArchive, parse_as_of
+from state_store import PipelineState, fingerprint, DETAIL_MAX_AGE_HOURS
+from checkpoint import CheckpointJournal
+from screening import ScreeningRules, DEFAULT_RULES_FILE
+from bonds_store import BondsStore
+from cashflows import add_analytics, load_prices
+from records import FilteredBond, FILTER_COLUMNS, ANALYTICS_COLUMNS
+from streaming import CsvWriter, batched, bounded_map, READ_BATCH, FLUSH_EVERY
+from metrics import METRICS, StageProfiler
+from log_setup import setup_logging, set_log_level
 
 class BondsFilter:
-    def __init__(self, test_mode=False):
+    def __init__(self, test_mode=False, backend='http', fetcher=None, max_workers=4, requests_per_second=2.0,
+                 use_cache=True, incremental=False, max_age_hours=DETAIL_MAX_AGE_HOURS, resume=False,
+                 parser='lxml', rules=None, save_csv=True, prices=None, adaptive=False, max_retries=2, archive=None,
+                 as_of=None):
         # Настройки
-        self.min_coupon_rate = 5.0  # Минимальный купонный доход в процентах
-        self.input_file = "./output/bonds_data.csv"
+        self.rules = rules or ScreeningRules.load()  # Критерии отбора (screening_rules.json)
         self.output_file = "./output/bonds_filter.csv"
+        self.save_csv = save_csv  # Результат сохраняется в базу; CSV - дополнительная выгрузка
+        self.prices = prices  # Чистые цены (ISIN -> % от номинала) для расчета доходности
+        self.checkpoint_file = "./output/bonds_filter.journal.jsonl"
         self.site_base_url = "https://bonds.finam.ru"
         self.test_mode = test_mode  # Режим тестирования
+        self.max_workers = max_workers  # Количество одновременно обрабатываемых облигаций
+        self.max_age_hours = max_age_hours  # Окно свежести данных в инкрементальном режиме
+        self.max_retries = max_retries  # Повторы загрузки страницы при временных ошибках (429, 5xx, сеть)
+        
+        # В инкрементальном режиме страницы неизменившихся облигаций не загружаются повторно
+        self.state = PipelineState() if incremental else None
         
-        # Инициализация WebDriver
-        self.setup_driver()
+        # Журнал обработанных облигаций для продолжения прерванного запуска
+        self.resume = resume
+        self.journal = None
+        
+        # Движок загрузки страниц: HTTP по умолчанию, Selenium для страниц с JavaScript, replay - страницы
+        # из архива (archive - архив для сохранения загруженных страниц или для воспроизведения)
+        if fetcher is None:
+            options = {'pool_size': max_workers, 'archive': archive}
+            if backend in ('http', 'selenium'):
+                options['requests_per_second'] = requests_per_second
+                options['adaptive'] = adaptive
+            if backend == 'http':
+                options['cache'] = ResponseCache() if use_cache else None
+            if backend == 'replay':
+                options['as_of'] = as_of
+            fetcher = create_fetcher(backend, **options)
+        self.fetcher = fetcher
+        self.parser = create_parser(parser)  # Разбор HTML: lxml по умолчанию, bs4 - исходная реализация
         
         # Создание директории для выходных файлов
         self.create_output_directory()
 
-    def setup_driver(self):
-        """Настройка Selenium WebDriver для Chrome"""
-        chrome_options = Options()
-        chrome_options.add_argument("--headless=new")
-        chrome_options.add_argument("--no-sandbox")
-        chrome_options.add_argument("--disable-dev-shm-usage")
-        chrome_options.add_argument("--disable-gpu")
-        chrome_options.add_argument("--disable-software-rasterizer")
-        chrome_options.add_argument("--disable-webgl")
-        chrome_options.add_argument("--window-size=1920,1080")
-        chrome_options.add_argument("--start-maximized")
-        chrome_options.add_argument("--disable-notifications")
-        chrome_options.add_argument("--disable-extensions")
-        chrome_options.add_argument("--disable-infobars")
-        chrome_options.add_argument("--enable-javascript")
-        chrome_options.add_argument("--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36")
-        chrome_options.add_argument("--disable-blink-features=AutomationControlled")
-        chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
-        chrome_options.add_experimental_option('useAutomationExtension', False)
-        
-        service = Service(ChromeDriverManager().install())
-        self.driver = webdriver.Chrome(service=service, options=chrome_options)
-        self.wait = WebDriverWait(self.driver, 30)
-        logging.info("Драйвер Chrome успешно инициализирован")
-
     def create_output_directory(self):
         """Создание директории для выходных файлов"""
         output_dir = os.path.dirname(self.output_file)
@@ -69,156 +67,297 @@ class BondsFilter:
             os.makedirs(output_dir)
             logging.info(f"Создана директория для выходных файлов: {output_dir}")
 
-    def get_isin(self, soup):
-        """Получение ISIN кода облигации"""
-        try:
-            info_div = soup.find('div', class_='info')
-            if info_div:
-                tds = info_div.find_all('td')
-                for td in tds:
-                    if 'ISIN код:' in td.text:
-                        isin_span = td.find('span')
-                        if isin_span:
-                            isin = isin_span.text.strip()
-                            logging.info(f"Найден ISIN: {isin}")
-                            return isin
-            return None
-        except Exception as e:
-            logging.error(f"Ошибка при получении ISIN: {str(e)}")
+    def fetch_page(self, url, ready):
+        """Загрузка страницы с повторами при временных ошибках"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                return self.fetcher.fetch(url, ready=ready)
+            except FetchError as e:
+                if not e.transient or attempt == self.max_retries:
+                    raise
+                METRICS.inc('retries', stage='filter')
+                # При адаптивном планировщике паузу перед повтором выдерживает он сам
+                time.sleep(retry_delay(self.fetcher, attempt, e))
+
+    def get_payments_url(self, page, bond_link):
+        """Адрес вкладки 'Платежи' из ссылки на странице облигации"""
+        href = (page['payments_href'] or '').strip()
+        if not href or href.startswith('#') or href.lower().startswith('javascript'):
             return None
+        return urljoin(bond_link, href)
 
-    def check_offer(self, soup):
-        """Проверка наличия оферты"""
+    def get_payments(self, page, bond_link):
+        """Получение ставки купона и графика платежей без клика, если это возможно"""
         try:
-            offer_element = soup.find('a', string='Оферты')
-            if offer_element:
-                logging.info("Найдена оферта")
-                return True
-            return False
-        except Exception as e:
-            logging.error(f"Ошибка при проверке оферты: {str(e)}")
-            return False
+            payments_url = self.get_payments_url(page, bond_link)
+            # Таблица платежей может уже присутствовать на странице облигации
+            if page['has_payments']:
+                payments = {'coupon_rate': page['coupon_rate'], 'schedule': page['schedule']}
+            elif payments_url:
+                payments = self.parser.parse_payments(self.fetch_page(payments_url, 'payments'))
+            elif hasattr(self.fetcher, 'click_tab'):
+                # Вкладка без прямой ссылки открывается только кликом в браузере
+                payments = self.parser.parse_payments(self.fetcher.click_tab('Платежи', ready='payments'))
+            else:
+                logging.warning(f"Не найдена ссылка на вкладку 'Платежи' для {bond_link}")
+                return None
 
-    def get_coupon_rate(self, soup):
-        """Получение ставки купона"""
-        try:
-            payments_tab = self.wait.until(
-                EC.presence_of_element_located((By.XPATH, "//a[contains(text(), 'Платежи')]"))
-            )
-            payments_tab.click()
-            time.sleep(3)
-            
-            page_source = self.driver.page_source
-            soup = BeautifulSoup(page_source, 'html.parser')
-            
-            tables = soup.find_all('table')
-            for i, table in enumerate(tables):
-                headers = table.find_all('th')
-                header_texts = [header.get_text(strip=True) for header in headers]
-                
-                if 'Купоны' in header_texts and 'Погашение' in header_texts:
-                    rows = table.find_all('tr')
-                    if len(rows) >= 2:
-                        second_level_headers = rows[1].find_all('th')
-                        second_level_texts = [header.get_text(strip=True) for header in second_level_headers]
-                        
-                        if 'Ставка' in second_level_texts:
-                            rate_col_index = second_level_texts.index('Ставка')
-                            
-                            for row in rows[2:]:
-                                cells = row.find_all('td')
-                                if len(cells) > rate_col_index:
-                                    try:
-                                        rate_text = cells[rate_col_index].text.strip()
-                                        if '%' in rate_text:
-                                            rate = float(rate_text.replace('%', '').replace(',', '.'))
-                                            logging.info(f"Найдена ставка купона: {rate}%")
-                                            return rate
-                                    except ValueError:
-                                        continue
-            return None
+            if payments['coupon_rate'] is not None:
+                logging.debug(f"Найдена ставка купона: {payments['coupon_rate']}%",
+                              extra={'event': 'bond_details', 'stage': 'filter', 'url': bond_link})
+            return payments
         except Exception as e:
             logging.error(f"Ошибка при получении ставки купона: {str(e)}")
             return None
 
+    def extract_bond_details(self, bond_data):
+        """Загрузка страницы облигации и извлечение ISIN, признака оферты и ставки купона"""
+        try:
+            page = self.parser.parse_detail(self.fetch_page(bond_data['bond_link'], 'detail'))
+            context = {'event': 'bond_details', 'stage': 'filter', 'bond': bond_data['bond_name'], 'isin': page['isin']}
+            if page['isin']:
+                logging.debug(f"Найден ISIN: {page['isin']}", extra=context)
+            if page['has_offer']:
+                logging.debug("Найдена оферта", extra=context)
+            
+            details = {'isin': page['isin'], 'has_offer': page['has_offer'], 'coupon_rate': None, 'schedule': None}
+            # Облигация, отбракованная по данным страницы, не требует загрузки вкладки 'Платежи'
+            if self.rules.check_page(details):
+                return details
+            details.update(self.get_payments(page, bond_data['bond_link']) or {})
+            return details
+        finally:
+            # Браузер возвращается в пул только после вкладки 'Платежи' той же страницы
+            self.fetcher.release()
+
+    def get_bond_details(self, bond_data):
+        """Данные страницы облигации: из состояния прошлого запуска или с сайта"""
+        if self.state is None:
+            return self.extract_bond_details(bond_data)
+        
+        listing_fingerprint = fingerprint(bond_data['bond_name'], bond_data['placement_date'], bond_data['maturity_date'])
+        details = self.state.get_detail(bond_data['bond_link'], listing_fingerprint, self.max_age_hours)
+        # Сохраненные без ставки купона (или графика платежей) данные подходят, только если облигация
+        # отбраковывается и без них
+        if details is not None and ((details['coupon_rate'] is not None and 'schedule' in details)
+                                    or self.rules.check_page(details)):
+            METRICS.inc('state_hits', stage='filter')
+            logging.info(f"Облигация {bond_data['bond_name']} не изменилась, используются сохраненные данные",
+                         extra={'event': 'bond_state', 'stage': 'filter', 'bond': bond_data['bond_name'],
+                                'isin': details['isin']})
+            return details
+        
+        details = self.extract_bond_details(bond_data)
+        # Неполные данные не сохраняем, чтобы в следующий раз повторить загрузку
+        if details['coupon_rate'] is not None or self.rules.check_page(details):
+            self.state.save_detail(bond_data['bond_link'], listing_fingerprint, details)
+        return details
+
+    def describe_rejection(self, reason, details):
+        """Описание причины отказа для лога"""
+        descriptions = {
+            'offer': "имеет оферту",
+            'no_isin': "не найден ISIN",
+            'no_coupon': "не удалось получить ставку купона",
+            'low_coupon': f"ставка купона {details['coupon_rate']}% ниже минимальной {self.rules.get_value('min_coupon_rate')}%",
+            'high_coupon': f"ставка купона {details['coupon_rate']}% выше максимальной {self.rules.get_value('max_coupon_rate')}%"
+        }
+        return descriptions.get(reason, reason)
+
+    def evaluate_bond(self, bond_data):
+        """Проверка облигации по критериям. Возвращает (результат, причина отказа)"""
+        details = self.get_bond_details(bond_data)
+        coupon_rate = details['coupon_rate']
+        
+        # Правила проверяются в порядке из screening_rules.json, правила по данным страницы - первыми
+        reason = self.rules.check_page(details) or self.rules.check(details)
+        METRICS.inc('bonds_screened', stage='detail', result=reason or 'accepted')
+        context = {'stage': 'filter', 'bond': bond_data['bond_name'], 'isin': details['isin']}
+        if reason:
+            logging.info(f"Облигация {bond_data['bond_name']} отбракована: {self.describe_rejection(reason, details)}",
+                         extra=context)
+            return None, reason
+        
+        result = {
+            'Название облигации': bond_data['bond_name'],
+            'ISIN': details['isin'],
+            'Дата размещения': bond_data['placement_date'],
+            'Дата погашения': bond_data['maturity_date'],
+            'Ставка купона': f"{coupon_rate}%" if coupon_rate is not None else '',
+            # Доходность и дюрация рассчитываются одним проходом по всем отобранным облигациям
+            **{column: '' for column in ANALYTICS_COLUMNS},
+            'Ссылка': bond_data['bond_link'],
+            'schedule': details.get('schedule')
+        }
+        
+        logging.info(f"Облигация {bond_data['bond_name']} соответствует критериям", extra=context)
+        return result, None
+
     def process_bond(self, bond_data):
         """Обработка одной облигации"""
         try:
-            self.driver.get(bond_data['bond_link'])
-            time.sleep(3)
-            
-            page_source = self.driver.page_source
-            soup = BeautifulSoup(page_source, 'html.parser')
-            
-            isin = self.get_isin(soup)
-            has_offer = self.check_offer(soup)
-            coupon_rate = self.get_coupon_rate(soup)
-            
-            if has_offer:
-                logging.info(f"Облигация {bond_data['bond_name']} отбракована: имеет оферту")
-                return None
-                
-            if coupon_rate is None:
-                logging.info(f"Облигация {bond_data['bond_name']} отбракована: не удалось получить ставку купона")
-                return None
-                
-            if coupon_rate < self.min_coupon_rate:
-                logging.info(f"Облигация {bond_data['bond_name']} отбракована: ставка купона {coupon_rate}% ниже минимальной {self.min_coupon_rate}%")
-                return None
-            
-            result = {
-                'Название облигации': bond_data['bond_name'],
-                'ISIN': isin,
-                'Дата размещения': bond_data['placement_date'],
-                'Дата погашения': bond_data['maturity_date'],
-                'Ставка купона': f"{coupon_rate}%",
-                'Ссылка': bond_data['bond_link']
-            }
-            
-            logging.info(f"Облигация {bond_data['bond_name']} соответствует критериям")
+            result, reason = self.evaluate_bond(bond_data)
+            # Облигации без ставки купона не записываются в журнал, чтобы повторить их при продолжении
+            if self.journal and reason != 'no_coupon':
+                self.journal.append(bond_data['bond_link'], result)
             return result
-            
         except Exception as e:
-            logging.error(f"Ошибка при обработке облигации {bond_data['bond_name']}: {str(e)}")
+            METRICS.inc('bonds_screened', stage='detail', result='error')
+            logging.error(f"Ошибка при обработке облигации {bond_data['bond_name']}: {str(e)}",
+                          extra={'stage': 'filter', 'bond': bond_data['bond_name'], 'url': bond_data['bond_link']})
             return None
 
+    def read_input(self, store):
+        """Поток облигаций последнего собранного списка из базы (None, если список пуст)"""
+        count = store.listing_size()
+        logging.info(f"В базе {store.path} {count} облигаций списка")
+        return store.iter_listing() if count else None
+
+    def iter_filtered(self, bonds):
+        """Облигации, прошедшие отбор, в порядке входного потока (по мере готовности)"""
+        # Уже обработанные в прерванном запуске облигации берутся из журнала
+        self.journal = CheckpointJournal(self.checkpoint_file)
+        completed = self.journal.open(resume=self.resume)
+        
+        # Облигации, не прошедшие правила списка, отбраковываются пачками без загрузки страниц
+        def prefiltered():
+            for batch in batched(bonds, READ_BATCH):
+                yield from self.rules.prefilter(batch)
+        
+        def screen(bond_data):
+            if bond_data['bond_link'] in completed:
+                METRICS.inc('journal_hits', stage='filter')
+                return completed[bond_data['bond_link']]
+            return self.process_bond(bond_data)
+        
+        # Движки без поддержки нескольких потоков работают в один поток
+        workers = self.max_workers if getattr(self.fetcher, 'thread_safe', False) else 1
+        logging.info(f"Обработка облигаций в {workers} потоков, в журнале прерванного запуска: {len(completed)}")
+        
+        # Результаты отдаются в порядке входного потока; вперед обрабатывается не больше четырех облигаций на поток
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for processed_bond in bounded_map(executor, screen, prefiltered(), workers * 4):
+                if processed_bond:
+                    yield processed_bond
+
+    def add_analytics(self, filtered_bonds):
+        """Доходность, дюрация и НКД для отобранных облигаций по графикам платежей"""
+        bonds = [FilteredBond.from_dict(bond_data) for bond_data in filtered_bonds]
+        return [bond.to_dict() for bond in add_analytics(bonds, self.prices)]
+
+    def save_results(self, filtered_bonds):
+        """Сохранение отобранных облигаций в bonds_filter.csv"""
+        with CsvWriter(self.output_file, FILTER_COLUMNS) as writer:
+            writer.writerows([bond[column] for column in FILTER_COLUMNS] for bond in filtered_bonds)
+        logging.info(f"Сохранено {writer.count} облигаций в файл {self.output_file}")
+
+    def close(self):
+        """Освобождение загрузчика, журнала и состояния"""
+        self.fetcher.close()
+        if self.journal:
+            self.journal.close()
+        if self.state:
+            self.state.close()
+
     def run(self):
-        """Основной метод выполнения"""
+        """Основной метод выполнения: отобранные облигации сохраняются в базу и CSV пачками по мере отбора"""
+        started = time.perf_counter()
+        store = BondsStore()
+        writer = None
+        saved = 0
         try:
-            if not os.path.exists(self.input_file):
-                logging.error(f"Входной файл не найден: {self.input_file}")
+            bonds = self.read_input(store)
+            if bonds is None:
+                logging.error("В базе нет списка облигаций: запустите bonds_scraper.py "
+                              "или загрузите CSV командой python bonds_store.py import")
                 return
-                
-            df = pd.read_csv(self.input_file, sep=';', encoding='utf-8')
-            logging.info(f"Прочитано {len(df)} облигаций из файла {self.input_file}")
             
-            filtered_bonds = []
-            for _, row in df.iterrows():
-                bond_data = {
-                    'bond_name': row['bond_name'],
-                    'placement_date': row['placement_date'],
-                    'maturity_date': row['maturity_date'],
-                    'bond_link': row['bond_link']
-                }
-                
-                processed_bond = self.process_bond(bond_data)
-                if processed_bond:
-                    filtered_bonds.append(processed_bond)
+            # Доходность и дюрация считаются одним векторным расчетом на пачку облигаций
+            screened_at = time.time()
+            writer = CsvWriter(self.output_file, FILTER_COLUMNS) if self.save_csv else None
+            for filtered_bonds in batched(self.iter_filtered(bonds), FLUSH_EVERY):
+                filtered_bonds = self.add_analytics(filtered_bonds)
+                store.add_filtered(filtered_bonds, screened_at)
+                if writer:
+                    writer.writerows([bond[column] for column in FILTER_COLUMNS] for bond in filtered_bonds)
+                if not saved:
+                    METRICS.set('first_output_seconds', round(time.perf_counter() - started, 3), stage='filter')
+                saved += len(filtered_bonds)
+            # Облигации, не сохраненные в этом запуске, отмечаются как не прошедшие отбор только после полного прохода
+            store.finish_screening(screened_at)
             
-            if filtered_bonds:
-                result_df = pd.DataFrame(filtered_bonds)
-                result_df.to_csv(self.output_file, sep=';', index=False, encoding='utf-8')
-                logging.info(f"Сохранено {len(filtered_bonds)} облигаций в файл {self.output_file}")
+            if saved:
+                logging.info(f"Сохранено {saved} отобранных облигаций в базу {store.path}"
+                             + (f" и файл {self.output_file}" if writer else ""))
             else:
                 logging.warning("Не найдено облигаций, соответствующих критериям")
                 
         except Exception as e:
             logging.error(f"Критическая ошибка при выполнении скрипта: {str(e)}")
         finally:
-            self.driver.quit()
+            if writer:
+                writer.close()
+            store.close()
+            self.close()
             logging.info("Работа скрипта завершена")
 
 if __name__ == "__main__":
+    # Настройка логирования: запись в консоль и файл (JSON) выполняется в отдельном потоке
+    setup_logging('bonds_filter.log')
+    parser = argparse.ArgumentParser(description="Фильтрация облигаций по данным страниц Finam")
+    parser.add_argument('--backend', choices=list(FETCHER_BACKENDS), default='http',
+                        help="Движок загрузки страниц: http (без браузера), selenium или replay (страницы из архива)")
+    parser.add_argument('--workers', type=int, default=4,
+                        help="Количество одновременно обрабатываемых облигаций")
+    parser.add_argument('--rps', type=float, default=2.0,
+                        help="Максимальное количество запросов в секунду к одному сайту")
+    parser.add_argument('--adaptive', action='store_true',
+                        help="Подстраивать частоту и число одновременных запросов под задержку и ошибки сайта "
+                             "(--rps задает начальную частоту)")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="Не использовать кэш загруженных страниц")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Загружать только новые, изменившиеся или устаревшие облигации")
+    parser.add_argument('--max-age-hours', type=float, default=DETAIL_MAX_AGE_HOURS,
+                        help="Через сколько часов данные облигации считаются устаревшими")
+    parser.add_argument('--resume', action='store_true',
+                        help="Продолжить прерванный запуск, пропустив уже обработанные облигации")
+    parser.add_argument('--parser', choices=list(PARSER_BACKENDS), default='lxml',
+                        help="Библиотека разбора HTML: lxml, selectolax или bs4 (BeautifulSoup)")
+    parser.add_argument('--rules', default=DEFAULT_RULES_FILE,
+                        help="Файл с критериями отбора облигаций (JSON)")
+    parser.add_argument('--no-csv', action='store_true',
+                        help="Сохранять результат только в базу, без bonds_filter.csv")
+    parser.add_argument('--archive', action='store_true',
+                        help="Сохранять загруженные страницы в архив (output/archive) для повторного извлечения "
+                             "данных с --backend replay")
+    parser.add_argument('--as-of',
+                        help="Для --backend replay: страницы архива на момент YYYY-MM-DD (конец дня) или "
+                             "YYYY-MM-DDTHH:MM; по умолчанию - последние")
+    parser.add_argument('--prices',
+                        help="CSV с чистыми ценами облигаций (колонки ISIN и Цена в %% от номинала) для расчета "
+                             "доходности; по умолчанию расчет ведется по номиналу")
+    parser.add_argument('--metrics',
+                        help="Файл отчета с метриками: *.json или текстовый формат Prometheus (например, bonds.prom)")
+    parser.add_argument('--profile', metavar='DIR',
+                        help="Каталог для профиля cProfile")
+    parser.add_argument('--profile-memory', action='store_true',
+                        help="Дополнительно профилировать память (tracemalloc, замедляет работу)")
+    parser.add_argument('--log-level', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
+                        help="Уровень логирования (по умолчанию - из переменной BONDS_LOG_LEVEL)")
+    args = parser.parse_args()
+    if args.log_level:
+        set_log_level(args.log_level)
+
     logging.info("Запуск скрипта для фильтрации облигаций")
-    filter = BondsFilter(test_mode=False)
-    filter.run() 
\ No newline at end of file
+    filter = BondsFilter(test_mode=False, backend=args.backend, max_workers=args.workers,
+                         requests_per_second=args.rps, use_cache=not args.no_cache,
+                         incremental=args.incremental, max_age_hours=args.max_age_hours, resume=args.resume,
+                         parser=args.parser, rules=ScreeningRules.load(args.rules),
+                         save_csv=not args.no_csv, prices=load_prices(args.prices) if args.prices else None,
+                         adaptive=args.adaptive, archive=PageArchive() if args.archive else None,
+                         as_of=parse_as_of(args.as_of))
+    with StageProfiler(args.profile, memory=args.profile_memory).stage('filter'):
+        filter.run()
+    if args.metrics:
+        METRICS.write(args.metrics) 
\ No newline at end of file
@@ -1,47 +1,81 @@
 import pandas as pd
 import logging
+import argparse
+from bonds_store import BondsStore
+from isin_resolver import load_resolver, DEFAULT_REFERENCE_FILE
+from records import FILTER_COLUMNS
+from log_setup import setup_logging
 
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('bonds_no_isin.log', encoding='utf-8'),
-        logging.StreamHandler()
-    ]
-)
+def resolve_missing_isins(df, resolver):
+    """Подстановка ISIN из справочника бумаг облигациям без ISIN (одним проходом по всем названиям).
+    Возвращает словарь ссылка -> найденный ISIN"""
+    missing = df['ISIN'].isna() | (df['ISIN'] == '')
+    results = resolver.resolve_many(df.loc[missing, 'Название облигации'].tolist())
+    resolved = {}
+    for index in df.index[missing]:
+        name = df.at[index, 'Название облигации']
+        result = results.get(name)
+        if result:
+            isin, method, score = result
+            df.at[index, 'ISIN'] = isin
+            resolved[df.at[index, 'Ссылка']] = isin
+            logging.info(f"ISIN облигации {name} найден в справочнике: {isin} ({method}, похожесть {score})")
+    return resolved
 
-def find_bonds_without_isin():
-    try:
-        # Чтение исходного файла
-        input_file = "./output/bonds_filter.csv"
-        output_file = "./output/bonds_no_isin.csv"
-        
-        logging.info(f"Чтение данных из файла {input_file}")
-        df = pd.read_csv(input_file, sep=';', encoding='utf-8')
-        
-        # Поиск облигаций без ISIN
-        no_isin_df = df[df['ISIN'].isna() | (df['ISIN'] == '')]
-        
-        # Сохранение результата
+def report_bonds_without_isin(df, output_file=None):
+    # Поиск облигаций без ISIN
+    no_isin_df = df[df['ISIN'].isna() | (df['ISIN'] == '')]
+    
+    # Сохранение результата
+    if output_file:
         no_isin_df.to_csv(output_file, sep=';', index=False, encoding='utf-8')
-        
-        # Логирование результатов
-        total_bonds = len(df)
-        no_isin_count = len(no_isin_df)
-        logging.info(f"Всего облигаций: {total_bonds}")
-        logging.info(f"Найдено облигаций без ISIN: {no_isin_count}")
+    
+    # Логирование результатов
+    total_bonds = len(df)
+    no_isin_count = len(no_isin_df)
+    logging.info(f"Всего облигаций: {total_bonds}")
+    logging.info(f"Найдено облигаций без ISIN: {no_isin_count}")
+    if output_file:
         logging.info(f"Данные сохранены в файл {output_file}")
+    
+    if no_isin_count > 0:
+        logging.info("Список облигаций без ISIN:")
+        for _, row in no_isin_df.iterrows():
+            logging.info(f"- {row['Название облигации']}")
+    return no_isin_df
+
+def find_bonds_without_isin(save_csv=True, reference_file=None):
+    store = BondsStore()
+    try:
+        # Отобранные облигации читаются из базы
+        output_file = "./output/bonds_no_isin.csv" if save_csv else None
         
-        if no_isin_count > 0:
-            logging.info("Список облигаций без ISIN:")
-            for _, row in no_isin_df.iterrows():
-                logging.info(f"- {row['Название облигации']}")
+        logging.info(f"Чтение данных из базы {store.path}")
+        df = pd.DataFrame(store.filtered(), columns=FILTER_COLUMNS)
+        # Найденные в справочнике ISIN сохраняются в базу, и этап рейтингов обрабатывает эти облигации
+        resolver = load_resolver(reference_file) if reference_file else None
+        if resolver is not None:
+            resolved = resolve_missing_isins(df, resolver)
+            if resolved:
+                store.set_isins(resolved)
+        report_bonds_without_isin(df, output_file)
         
     except Exception as e:
         logging.error(f"Ошибка при обработке данных: {str(e)}")
+    finally:
+        store.close()
 
 if __name__ == "__main__":
+    # Настройка логирования: запись в консоль и файл (JSON) выполняется в отдельном потоке
+    setup_logging('bonds_no_isin.log')
+    parser = argparse.ArgumentParser(description="Поиск отобранных облигаций без ISIN")
+    parser.add_argument('--no-csv', action='store_true',
+                        help="Только вывести список в лог, без bonds_no_isin.csv")
+    parser.add_argument('--resolve', nargs='?', const=DEFAULT_REFERENCE_FILE, metavar='FILE',
+                        help="Подставить отсутствующие ISIN из справочника бумаг Московской биржи "
+                             f"(по умолчанию {DEFAULT_REFERENCE_FILE}, загрузка: python isin_resolver.py download)")
+    args = parser.parse_args()
+    
     logging.info("Запуск скрипта поиска облигаций без ISIN")
-    find_bonds_without_isin()
+    find_bonds_without_isin(save_csv=not args.no_csv, reference_file=args.resolve)
     logging.info("Работа скрипта завершена") 
\ No newline at end of file
@@ -1,108 +1,213 @@
-import csv
-import requests
-from bs4 import BeautifulSoup
 import time
+import argparse
 import logging
+from fetchers import HttpFetcher, ReplayFetcher
+from html_parsers import create_parser, PARSER_BACKENDS
+from http_cache import ResponseCache
+from page_archive import PageArchive, parse_as_of
+from rating_engine import AsyncRatingEngine, RatingIndex, RATING_URL, RATING_LIST_URL
+from state_store import PipelineState, RATING_MAX_AGE_HOURS
+from checkpoint import CheckpointJournal
+from bonds_store import BondsStore
+from records import FILTER_COLUMNS, RATING_COLUMNS
+from streaming import CsvWriter, FLUSH_EVERY
+from metrics import METRICS, StageProfiler
+from log_setup import setup_logging, set_log_level
 
-# Настраиваем логирование только для ошибок
-logging.basicConfig(level=logging.ERROR, format='%(asctime)s - %(levelname)s - %(message)s')
+def create_rating_fetcher(use_cache=True, requests_per_second=1.0, pool_size=4, adaptive=False, rate_limiter=None,
+                          archive=None, replay=False, as_of=None):
+    # Частота запросов к smart-lab ограничена token bucket или адаптивным планировщиком (общим с finam,
+    # если передан rate_limiter); ответы из кэша отдаются без задержки.
+    # В режиме replay страницы берутся из архива (archive) без обращения к сайту
+    if replay:
+        return ReplayFetcher(pool_size=pool_size, archive=archive, as_of=as_of)
+    cache = ResponseCache() if use_cache else None
+    return HttpFetcher(timeout=15, pool_size=pool_size, requests_per_second=requests_per_second, cache=cache,
+                       adaptive=adaptive, rate_limiter=rate_limiter, archive=archive)
 
-def get_bond_rating(isin):
-    url = f"https://smart-lab.ru/q/bonds/{isin}/"
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-    }
+def parse_bond_rating(html, parser='lxml'):
+    # Блок с рейтингом ищется по тексту 'рейтинг', рейтинг и цвет берутся из прогресс-бара
+    return create_parser(parser).parse_rating(html)
+
+def get_bond_rating(isin, fetcher=None):
+    url = RATING_URL.format(isin=isin)
+    own_fetcher = fetcher is None
+    if own_fetcher:
+        fetcher = create_rating_fetcher()
     
     try:
-        response = requests.get(url, headers=headers, timeout=15)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        # Ищем блок с рейтингом по тексту
-        rating_text = soup.find(string=lambda text: text and 'рейтинг' in text.lower())
-        if not rating_text:
-            return "Нет данных", "Нет данных"
-            
-        # Находим родительский div
-        rating_parent = rating_text.find_parent('div')
-        if not rating_parent:
-            return "Нет данных", "Нет данных"
-            
-        # Ищем прогресс-бар с рейтингом
-        progress_bar = rating_parent.find('div', class_='linear-progress-bar')
-        if not progress_bar:
-            # Пробуем найти в соседних элементах
-            progress_bar = rating_parent.find_next('div', class_='linear-progress-bar')
-            if not progress_bar:
-                return "Нет данных", "Нет данных"
-            
-        # Получаем цвет и значение рейтинга
-        rating_filled = progress_bar.find('div', class_='linear-progress-bar__filed')
-        if not rating_filled:
-            return "Нет данных", "Нет данных"
-            
-        # Определяем цвет
-        color = "Нет данных"
-        if 'linear-progress-bar__filed--red' in rating_filled.get('class', []):
-            color = "Красный"
-        elif 'linear-progress-bar__filed--yellow' in rating_filled.get('class', []):
-            color = "Желтый"
-        elif 'linear-progress-bar__filed--green' in rating_filled.get('class', []):
-            color = "Зеленый"
-            
-        # Получаем значение рейтинга
-        rating_text = rating_filled.find('div', class_='linear-progress-bar__text')
-        rating = rating_text.get_text(strip=True) if rating_text else "Нет данных"
-        
-        return rating, color
-        
+        return parse_bond_rating(fetcher.fetch(url))
     except Exception as e:
         logging.error(f"Ошибка при получении рейтинга для {isin}: {str(e)}")
         return "Ошибка", "Ошибка"
+    finally:
+        if own_fetcher:
+            fetcher.close()
 
-def process_bonds():
-    input_file = 'output/bonds_filter.csv'
-    output_file = 'output/bonds_with_ratings.csv'
+def load_rating_index(fetcher, parser='lxml', concurrency=4, url_template=RATING_LIST_URL):
+    """Рейтинги из списка облигаций smart-lab: несколько запросов вместо запроса на каждую облигацию"""
+    return RatingIndex(fetcher, create_parser(parser).parse_rating_list, url_template=url_template,
+                       concurrency=concurrency).load()
+
+def rate_rows(rows, engine, link_index, on_row, state=None, journal=None, completed=None,
+              max_age_hours=RATING_MAX_AGE_HOURS, index=None):
+    """Добавление рейтинга и цвета к строкам облигаций.
+    rows может быть потоком строк от предыдущего этапа; on_row(row) вызывается в порядке rows.
+    index - RatingIndex списка smart-lab: страница облигации запрашивается, только если ее нет в списке"""
+    completed = completed or {}
+    rated_rows = {}  # Номер в потоке -> строка, ожидающая рейтинга
+    
+    def isins():
+        # Обрабатываем только облигации с ISIN
+        number = 0
+        for row in rows:
+            if len(row) >= 2 and row[1]:
+                rated_rows[number] = row
+                number += 1
+                yield row[1]
+    
+    def lookup(isin):
+        # Рейтинг из журнала прерванного запуска, из списка smart-lab или из состояния прошлых запусков
+        if isin in completed:
+            return tuple(completed[isin])
+        known = index.get(isin) if index else None
+        if known is not None:
+            return known
+        return state.get_rating(isin, max_age_hours) if state else None
+    
+    def on_result(index, result, fetched):
+        row = rated_rows.pop(index)
+        rating, color = result
+        print(f"Обработана облигация {index+1}: {row[0]} (ISIN: {row[1]}) - {rating}")
+        if fetched and rating != "Ошибка":
+            if journal:
+                journal.append(row[1], list(result))
+            if state:
+                state.save_rating(row[1], rating, color)
+        # Вставляем рейтинг и цвет перед ссылкой
+        row.insert(link_index, rating)
+        row.insert(link_index + 1, color)
+        on_row(row)
+    
+    engine.run(isins(), on_result=on_result, lookup=lookup)
+    print(f"Получено рейтингов: {engine.stats['fetched']}, повторов: {engine.stats['retries']}, "
+          f"ошибок: {engine.stats['failed']}"
+          + (f", из списка smart-lab: {index.stats['hits']}" if index else ""))
+
+def process_bonds(use_cache=True, concurrency=4, requests_per_second=1.0, incremental=False,
+                  max_age_hours=RATING_MAX_AGE_HOURS, resume=False, parser='lxml', save_csv=True, bulk=False,
+                  fetcher=None, adaptive=False, archive=None, replay=False, as_of=None):
+    # Отобранные облигации читаются из базы потоком; bonds_with_ratings.csv - дополнительная выгрузка
+    output_file = 'output/bonds_with_ratings.csv' if save_csv else None
+    checkpoint_file = 'output/bonds_with_ratings.journal.jsonl'
+    started = time.perf_counter()
+    
+    fetcher = fetcher or create_rating_fetcher(use_cache, requests_per_second, pool_size=concurrency,
+                                               adaptive=adaptive, archive=archive, replay=replay, as_of=as_of)
+    engine = AsyncRatingEngine(fetcher, create_parser(parser).parse_rating, concurrency=concurrency)
+    # В инкрементальном режиме свежие рейтинги берутся из состояния прошлых запусков
+    state = PipelineState() if incremental else None
+    # Журнал полученных рейтингов для продолжения прерванного запуска
+    journal = CheckpointJournal(checkpoint_file)
+    store = BondsStore()
     
     try:
-        # Читаем заголовки из входного файла
-        with open(input_file, 'r', encoding='utf-8') as infile:
-            headers = next(csv.reader(infile, delimiter=';'))
-            
-        # Читаем все строки из входного файла
-        with open(input_file, 'r', encoding='utf-8') as infile:
-            rows = list(csv.reader(infile, delimiter=';'))
-            rows = rows[1:]  # Пропускаем заголовки
-            
-        # Находим индекс колонки со ставкой и ссылкой
-        link_index = len(headers) - 1  # Ссылка обычно последняя
-        rate_index = link_index - 1    # Ставка перед ссылкой
+        if not store.filtered_size():
+            logging.error("В базе нет отобранных облигаций: запустите bonds_filter.py")
+            return
+        rows = ([bond[column] for column in FILTER_COLUMNS] for bond in store.iter_filtered())
+        link_index = FILTER_COLUMNS.index('Ссылка')
+        completed = journal.open(resume=resume)
+        pending = []  # Рейтинги, еще не сохраненные в базу
+        saved = 0
+        # В пакетном режиме рейтинги сначала берутся из списка облигаций smart-lab
+        index = load_rating_index(fetcher, parser, concurrency) if bulk else None
         
-        # Добавляем колонки рейтинга и цвета после ставки
-        headers.insert(link_index, 'Рейтинг')
-        headers.insert(link_index + 1, 'Цвет рейтинга')
+        def save_pending():
+            nonlocal saved
+            store.save_ratings(pending)
+            if not saved:
+                METRICS.set('first_output_seconds', round(time.perf_counter() - started, 3), stage='rating')
+            saved += len(pending)
+            pending.clear()
         
-        # Записываем результаты в выходной файл
-        with open(output_file, 'w', encoding='utf-8-sig', newline='') as outfile:
-            writer = csv.writer(outfile, delimiter=';')
-            writer.writerow(headers)
+        # Записываем результаты в выходной файл по мере готовности в порядке отбора,
+        # в базу - пачками по FLUSH_EVERY облигаций
+        writer = CsvWriter(output_file, RATING_COLUMNS, encoding='utf-8-sig') if output_file else None
+        try:
+            def on_row(row):
+                pending.append(row)
+                if writer:
+                    writer.writerow(row)
+                if len(pending) >= FLUSH_EVERY:
+                    save_pending()
             
-            # Обрабатываем все облигации
-            total_bonds = len(rows)
-            for i, row in enumerate(rows):
-                if len(row) >= 2:  # Проверяем наличие ISIN
-                    isin = row[1]
-                    if isin:  # Проверяем, что ISIN не пустой
-                        print(f"Обработка облигации {i+1}/{total_bonds}: {row[0]} (ISIN: {isin})")
-                        rating, color = get_bond_rating(isin)
-                        # Вставляем рейтинг и цвет перед ссылкой
-                        row.insert(link_index, rating)
-                        row.insert(link_index + 1, color)
-                        writer.writerow(row)
-                        time.sleep(5)  # Задержка между запросами
+            rate_rows(rows, engine, link_index, on_row, state=state, journal=journal,
+                      completed=completed, max_age_hours=max_age_hours, index=index)
+        finally:
+            if writer:
+                writer.close()
+        if pending:
+            save_pending()
 
     except Exception as e:
-        logging.error(f"Ошибка при обработке файлов: {str(e)}")
+        logging.error(f"Ошибка при получении рейтингов: {str(e)}")
+    finally:
+        fetcher.close()
+        journal.close()
+        store.close()
+        if state:
+            state.close()
 
 if __name__ == '__main__':
-    process_bonds() 
\ No newline at end of file
+    # Настраиваем логирование только для ошибок: ход обработки выводится через print
+    setup_logging(level=logging.ERROR)
+    parser = argparse.ArgumentParser(description="Получение рейтингов облигаций со smart-lab")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="Не использовать кэш загруженных страниц")
+    parser.add_argument('--concurrency', type=int, default=4,
+                        help="Количество одновременных запросов к smart-lab")
+    parser.add_argument('--rps', type=float, default=1.0,
+                        help="Максимальное количество запросов в секунду к smart-lab")
+    parser.add_argument('--adaptive', action='store_true',
+                        help="Подстраивать частоту и число одновременных запросов под задержку и ошибки сайта "
+                             "(--rps задает начальную частоту)")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Загружать только отсутствующие или устаревшие рейтинги")
+    parser.add_argument('--max-age-hours', type=float, default=RATING_MAX_AGE_HOURS,
+                        help="Через сколько часов рейтинг считается устаревшим")
+    parser.add_argument('--resume', action='store_true',
+                        help="Продолжить прерванный запуск, пропустив уже полученные рейтинги")
+    parser.add_argument('--parser', choices=list(PARSER_BACKENDS), default='lxml',
+                        help="Библиотека разбора HTML: lxml, selectolax или bs4 (BeautifulSoup)")
+    parser.add_argument('--no-csv', action='store_true',
+                        help="Сохранять рейтинги только в базу, без bonds_with_ratings.csv")
+    parser.add_argument('--archive', action='store_true',
+                        help="Сохранять загруженные страницы в архив (output/archive)")
+    parser.add_argument('--replay', action='store_true',
+                        help="Брать страницы smart-lab из архива вместо сайта")
+    parser.add_argument('--as-of',
+                        help="Для --replay: страницы архива на момент YYYY-MM-DD (конец дня) или YYYY-MM-DDTHH:MM; "
+                             "по умолчанию - последние")
+    parser.add_argument('--bulk', action='store_true',
+                        help="Брать рейтинги из списка облигаций smart-lab (несколько страниц), "
+                             "страницы отдельных облигаций загружать только для отсутствующих в нем")
+    parser.add_argument('--metrics',
+                        help="Файл отчета с метриками: *.json или текстовый формат Prometheus (например, bonds.prom)")
+    parser.add_argument('--profile', metavar='DIR',
+                        help="Каталог для профиля cProfile")
+    parser.add_argument('--profile-memory', action='store_true',
+                        help="Дополнительно профилировать память (tracemalloc, замедляет работу)")
+    parser.add_argument('--log-level', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
+                        help="Уровень логирования (по умолчанию - из переменной BONDS_LOG_LEVEL)")
+    args = parser.parse_args()
+    if args.log_level:
+        set_log_level(args.log_level)
+    with StageProfiler(args.profile, memory=args.profile_memory).stage('rating'):
+        process_bonds(use_cache=not args.no_cache, concurrency=args.concurrency, requests_per_second=args.rps,
+                      incremental=args.incremental, max_age_hours=args.max_age_hours, resume=args.resume,
+                      parser=args.parser, save_csv=not args.no_csv, bulk=args.bulk, adaptive=args.adaptive,
+                      archive=PageArchive() if args.archive else None, replay=args.replay,
+                      as_of=parse_as_of(args.as_of))
+    if args.metrics:
+        METRICS.write(args.metrics)
@@ -1,60 +1,49 @@
 import os
-import logging
+import math
 import time
+import logging
+import argparse
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-import pandas as pd
-from bs4 import BeautifulSoup
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.chrome.options import Options
-from webdriver_manager.chrome import ChromeDriverManager
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
 from urllib.parse import urljoin
-
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('scraper.log', encoding='utf-8'),
-        logging.StreamHandler()
-    ]
-)
+from fetchers import FetchError, create_fetcher, retry_delay, FETCHER_BACKENDS
+from html_parsers import create_parser, PARSER_BACKENDS
+from screening import ScreeningRules, DEFAULT_RULES_FILE
+from bonds_store import BondsStore
+from page_archive import PageArchive, parse_as_of
+from records import ListingBond, LISTING_COLUMNS
+from streaming import CsvWriter, batched, bounded_map, FLUSH_EVERY
+from metrics import METRICS, StageProfiler
+from log_setup import setup_logging, set_log_level
 
 class BondsScraper:
-    def __init__(self):
+    def __init__(self, backend='http', fetcher=None, max_workers=4, requests_per_second=1.0, max_retries=3,
+                 parser='lxml', rules=None, save_csv=True, adaptive=False, archive=None, as_of=None):
         self.base_url = "https://bonds.finam.ru/issue/search/default.asp?page=0&showEmitter=1&showStatus=&showSector=&showTime=&showOperator=&showMoney=&showYTM=&showLiquid=&emitterCustomName=&status=4&sectorId=&FieldId=0&placementFrom=1%2F1%2F2018&placementTo=&paymentFrom=30%2F4%2F2027&paymentTo=&registrationDateFrom=&registrationDateTo=&couponRateFrom=10&couponRateTo=100&couponDateFrom=&couponDateTo=&offerExecDateFrom=&offerExecDateTo=&currencyId=1&volumeFrom=&volumeTo=&faceValueSign=&faceValue=&operatorId=0&operatorIdName=&opemitterCustomName=&operatorTypeId=0&operatorTypeName=&amortization=0&registrationDate=&regNumber=&govRegBody=&emissionForm1=&emissionForm2=&leaderDateFrom=&leaderDateTo=&placementMethod=0&quoteType=1&YTMOffer=on&YTMFrom=&YTMTo=&liquidRange=0&isRPS=0&liquidFrom=&liquidTo=&transactionsFrom=&transactionsTo=&liquidType=0&liquidTop=3&rating=&orderby=-2&is_finam_placed="
+        # Критерии поиска (даты размещения и погашения, ставка купона, валюта) берутся из screening_rules.json
+        self.rules = rules or ScreeningRules.load()
+        self.base_url = self.rules.apply_to_url(self.base_url)
         self.site_base_url = "https://bonds.finam.ru"
         self.output_dir = "./output"
         self.output_file = os.path.join(self.output_dir, "bonds_data.csv")
-        self.setup_driver()
-
-    def setup_driver(self):
-        """Настройка Selenium WebDriver для Chrome"""
-        chrome_options = Options()
-        chrome_options.add_argument("--headless=new")
-        chrome_options.add_argument("--no-sandbox")
-        chrome_options.add_argument("--disable-dev-shm-usage")
-        chrome_options.add_argument("--disable-gpu")
-        chrome_options.add_argument("--disable-software-rasterizer")
-        chrome_options.add_argument("--disable-webgl")
-        chrome_options.add_argument("--window-size=1920,1080")
-        chrome_options.add_argument("--start-maximized")
-        chrome_options.add_argument("--disable-notifications")
-        chrome_options.add_argument("--disable-extensions")
-        chrome_options.add_argument("--disable-infobars")
-        chrome_options.add_argument("--enable-javascript")
-        chrome_options.add_argument("--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36")
-        chrome_options.add_argument("--disable-blink-features=AutomationControlled")
-        chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
-        chrome_options.add_experimental_option('useAutomationExtension', False)
+        self.save_csv = save_csv  # Список сохраняется в базу; CSV - дополнительная выгрузка
+        self.max_workers = max_workers  # Количество одновременно загружаемых страниц
+        self.max_retries = max_retries  # Количество попыток загрузки одной страницы
+        self.failed_pages = []  # Страницы списка, которые не удалось загрузить при последнем обходе
+        self.retry_delay = 5  # Базовая пауза между попытками в секундах
         
-        service = Service(ChromeDriverManager().install())
-        self.driver = webdriver.Chrome(service=service, options=chrome_options)
-        self.wait = WebDriverWait(self.driver, 30)
-        logging.info("Драйвер Chrome успешно инициализирован")
+        # Движок загрузки страниц: HTTP по умолчанию, Selenium для страниц с JavaScript, replay - страницы
+        # из архива (archive - архив для сохранения загруженных страниц или для воспроизведения)
+        if fetcher is None:
+            options = {'pool_size': max_workers, 'archive': archive}
+            if backend in ('http', 'selenium'):
+                options['requests_per_second'] = requests_per_second
+                options['adaptive'] = adaptive
+            if backend == 'replay':
+                options['as_of'] = as_of
+            fetcher = create_fetcher(backend, **options)
+        self.fetcher = fetcher
+        self.parser = create_parser(parser)  # Разбор HTML: lxml по умолчанию, bs4 - исходная реализация
 
     def create_output_directory(self):
         """Создание директории для выходных файлов"""
@@ -62,53 +51,29 @@ class BondsScraper:
             os.makedirs(self.output_dir)
             logging.info(f"Создана директория для выходных файлов: {self.output_dir}")
 
-    def find_bonds_table(self, soup):
-        """Поиск таблицы с облигациями по наличию столбца '№'"""
-        tables = soup.find_all('table')
-        logging.info(f"Найдено таблиц на странице: {len(tables)}")
-        
-        for i, table in enumerate(tables):
-            # Проверяем заголовки таблицы
-            headers = table.find_all('th')
-            header_texts = [header.get_text(strip=True) for header in headers]
-            logging.info(f"Таблица {i+1} заголовки: {header_texts}")
-            
-            # Проверяем наличие столбца '№'
-            if '№' in header_texts:
-                logging.info(f"Найдена таблица с облигациями (таблица {i+1})")
-                return table
-        
-        logging.warning("Таблица с облигациями не найдена")
-        return None
-
     def parse_bond_data(self, row):
-        """Парсинг данных облигации из строки таблицы"""
+        """Парсинг данных облигации из строки таблицы (тексты ячеек и ссылка во второй ячейке)"""
         try:
-            # Пропускаем строку, если это заголовок
-            if row.find('th'):
-                return None
-                
-            cells = row.find_all('td')
+            cells, relative_link = row
             if len(cells) < 4:
                 return None
 
             # Извлечение названия облигации и ссылки
-            bond_cell = cells[1]
-            bond_name = bond_cell.get_text(strip=True)
+            bond_name = cells[1]
             
-            # Получаем относительную ссылку и преобразуем её в абсолютную
-            link_element = bond_cell.find('a')
-            if link_element and 'href' in link_element.attrs:
-                relative_link = link_element['href']
+            # Преобразуем относительную ссылку в абсолютную
+            if relative_link:
                 bond_link = urljoin(self.site_base_url, relative_link)
-                logging.info(f"Сформирована ссылка для облигации {bond_name}: {bond_link}")
+                logging.debug(f"Сформирована ссылка для облигации {bond_name}: {bond_link}",
+                              extra={'event': 'listing_row', 'stage': 'scrape', 'bond': bond_name, 'url': bond_link})
             else:
                 bond_link = ''
-                logging.warning(f"Не найдена ссылка для облигации {bond_name}")
+                logging.warning(f"Не найдена ссылка для облигации {bond_name}",
+                                extra={'event': 'listing_row', 'stage': 'scrape', 'bond': bond_name})
 
             # Извлечение дат
-            placement_date = cells[3].get_text(strip=True)  # Размещение
-            maturity_date = cells[4].get_text(strip=True)   # Погашение
+            placement_date = cells[3]  # Размещение
+            maturity_date = cells[4]   # Погашение
 
             # Конвертация дат в формат YYYY-MM-DD
             try:
@@ -128,28 +93,50 @@ class BondsScraper:
             logging.error(f"Ошибка при парсинге данных облигации: {str(e)}")
             return None
 
-    def scrape_page(self, page_number):
-        """Сбор данных со страницы облигаций"""
-        url = self.base_url.replace("page=0", f"page={page_number}")
-        logging.info(f"Начало сбора данных со страницы {page_number}")
-        
+    def get_page_url(self, page_number):
+        """Адрес страницы списка облигаций"""
+        return self.base_url.replace("page=0", f"page={page_number}")
+
+    def get_page_count(self, listing, page_size):
+        """Определение количества страниц по общему числу облигаций или по ссылкам пагинации"""
+        if listing['total'] is not None and page_size:
+            logging.info(f"Всего облигаций по запросу: {listing['total']}")
+            return max(1, math.ceil(listing['total'] / page_size))
+        if listing['max_page'] is not None:
+            return listing['max_page'] + 1
+        return 1
+
+    def fetch_page(self, page_number):
+        """Загрузка и разбор страницы списка облигаций с повторными попытками"""
+        url = self.get_page_url(page_number)
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                logging.info(f"Загрузка страницы {page_number}")
+                page_source = self.fetcher.fetch(url, ready='listing')
+                return self.parser.parse_listing(page_source)
+            except Exception as e:
+                logging.warning(f"Попытка {attempt}/{self.max_retries} загрузки страницы {page_number} не удалась: {str(e)}",
+                                extra={'stage': 'scrape', 'page': page_number, 'url': url})
+                # Постоянная ошибка (404, страницы нет в архиве) не исправится повтором
+                if isinstance(e, FetchError) and not e.transient:
+                    break
+                if attempt < self.max_retries:
+                    METRICS.inc('retries', stage='scrape')
+                    # При адаптивном планировщике паузу перед повтором выдерживает он сам
+                    time.sleep(retry_delay(self.fetcher, attempt - 1, e, backoff_base=self.retry_delay))
+            finally:
+                self.fetcher.release()
+        return None
+
+    def parse_page(self, listing, page_number):
+        """Разбор облигаций из загруженной страницы"""
         try:
-            self.driver.get(url)
-            logging.info(f"Загрузка страницы {page_number}")
-            time.sleep(5)  # Ожидание загрузки страницы
-            
-            # Получаем HTML страницы
-            page_source = self.driver.page_source
-            soup = BeautifulSoup(page_source, 'html.parser')
-            
-            # Ищем таблицу с облигациями
-            table = self.find_bonds_table(soup)
-            if not table:
+            # Строки таблицы с облигациями (таблица определяется по наличию столбца '№')
+            rows = listing['rows']
+            if rows is None:
                 logging.error(f"Таблица с облигациями не найдена на странице {page_number}")
                 return []
             
-            # Поиск строк в таблице
-            rows = table.find_all('tr')
             if not rows:
                 logging.warning(f"На странице {page_number} не найдено строк в таблице")
                 return []
@@ -159,50 +146,176 @@ class BondsScraper:
                 bond_data = self.parse_bond_data(row)
                 if bond_data:
                     bonds_data.append(bond_data)
-                    logging.info(f"Обработана облигация: {bond_data['bond_name']}")
+                    logging.debug(f"Обработана облигация: {bond_data['bond_name']}",
+                                  extra={'event': 'listing_bond', 'stage': 'scrape', 'bond': bond_data['bond_name'],
+                                         'page': page_number})
             
-            logging.info(f"На странице {page_number} найдено {len(bonds_data)} облигаций")
+            logging.info(f"На странице {page_number} найдено {len(bonds_data)} облигаций",
+                         extra={'stage': 'scrape', 'page': page_number})
             return bonds_data
         except Exception as e:
             logging.error(f"Ошибка при сборе данных со страницы {page_number}: {str(e)}")
             return []
 
+    def scrape_page(self, page_number):
+        """Сбор данных со страницы облигаций. Возвращает None, если страницу не удалось загрузить"""
+        logging.info(f"Начало сбора данных со страницы {page_number}")
+        listing = self.fetch_page(page_number)
+        if listing is None:
+            logging.error(f"Не удалось загрузить страницу {page_number} за {self.max_retries} попыток")
+            METRICS.inc('pages_failed', stage='scrape')
+            return None
+        return self.parse_page(listing, page_number)
+
     def save_to_csv(self, data):
         """Сохранение данных в CSV файл"""
-        df = pd.DataFrame(data)
-        df.to_csv(self.output_file, sep=';', index=False, encoding='utf-8')
+        with CsvWriter(self.output_file, LISTING_COLUMNS) as writer:
+            writer.writerows([bond_data[column] for column in LISTING_COLUMNS] for bond_data in data)
         logging.info(f"Данные сохранены в файл {self.output_file}")
 
+    def iter_bonds(self):
+        """Облигации списка на сайте (ListingBond) в порядке страниц по мере их загрузки, без повторов по ссылке.
+        Номера страниц, которые не удалось загрузить, после обхода остаются в self.failed_pages"""
+        self.failed_pages = failed_pages = []
+        # Первая страница дает размер страницы и общее количество страниц
+        first_listing = self.fetch_page(0)
+        if first_listing is None:
+            logging.error("Не удалось загрузить первую страницу списка облигаций")
+            failed_pages.append(0)
+            return
+        first_page = self.parse_page(first_listing, 0)
+        page_size = len(first_page)
+        page_count = self.get_page_count(first_listing, page_size) if page_size else 1
+        logging.info(f"Ожидается страниц: {page_count}, облигаций на странице: {page_size}")
+        seen_links = set()
+
+        def unique(bonds_data):
+            for bond_data in bonds_data:
+                link = bond_data['bond_link']
+                if link and link in seen_links:
+                    continue
+                seen_links.add(link)
+                yield ListingBond.from_dict(bond_data)
+
+        yield from unique(first_page)
+
+        # Остальные страницы загружаются параллельно; впереди загружается не больше двух страниц на поток
+        workers = self.max_workers if getattr(self.fetcher, 'thread_safe', False) else 1
+        page_numbers = range(1, page_count)
+        last_page = first_page
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for page_number, bonds_data in zip(page_numbers,
+                                               bounded_map(executor, self.scrape_page, page_numbers, workers * 2)):
+                if bonds_data is None:
+                    failed_pages.append(page_number)
+                else:
+                    yield from unique(bonds_data)
+                last_page = bonds_data
+
+        # Количество страниц по ссылкам пагинации может быть неполным: если последняя страница заполнена полностью,
+        # список может продолжаться. По общему числу облигаций количество страниц известно точно
+        page_number = page_count
+        exact = first_listing['total'] is not None
+        while not exact and page_size and last_page and len(last_page) >= page_size:
+            last_page = self.scrape_page(page_number)
+            if last_page is None:
+                failed_pages.append(page_number)
+            else:
+                yield from unique(last_page)
+            page_number += 1
+        logging.info(f"Достигнут конец списка облигаций на странице {page_number - 1}")
+
+        if failed_pages:
+            logging.error(f"Не удалось загрузить страницы: {failed_pages}")
+
+    def collect(self):
+        """Сбор всех облигаций из списка на сайте"""
+        return [bond.to_dict() for bond in self.iter_bonds()]
+
     def run(self):
-        """Основной метод выполнения"""
+        """Основной метод выполнения: облигации сохраняются в базу и CSV пачками по мере загрузки страниц"""
+        started = time.perf_counter()
+        store = BondsStore()
+        writer = None
+        saved = 0
         try:
             self.create_output_directory()
-            all_bonds_data = []
-            page_number = 0
-            
-            while True:
-                bonds_data = self.scrape_page(page_number)
-                if not bonds_data:
-                    logging.info(f"Достигнут конец списка облигаций на странице {page_number}")
-                    break
-                
-                all_bonds_data.extend(bonds_data)
-                logging.info(f"Обработана страница {page_number}, найдено {len(bonds_data)} облигаций")
-                page_number += 1
-            
-            if all_bonds_data:
-                self.save_to_csv(all_bonds_data)
-                logging.info(f"Всего обработано {len(all_bonds_data)} облигаций")
+            listed_at = time.time()
+            for bonds in batched(self.iter_bonds(), FLUSH_EVERY):
+                store.add_listing([bond.to_dict() for bond in bonds], listed_at, start=saved)
+                if self.save_csv:
+                    writer = writer or CsvWriter(self.output_file, LISTING_COLUMNS)
+                    writer.writerows(bond.to_row() for bond in bonds)
+                if not saved:
+                    METRICS.set('first_output_seconds', round(time.perf_counter() - started, 3), stage='scrape')
+                saved += len(bonds)
+
+            if saved and self.failed_pages:
+                # Облигации с незагруженных страниц остаются в списке с прежними данными
+                kept = store.keep_listing(listed_at, saved)
+                logging.warning(f"Список собран не полностью (не загружены страницы {self.failed_pages}): "
+                                f"{kept} облигаций, которых нет в собранной части, остаются в списке")
+            elif saved:
+                # Облигации, которых больше нет в списке, исключаются только после полного сбора
+                store.finish_listing(listed_at)
+            if saved:
+                logging.info(f"Всего обработано {saved} облигаций, сохранено в базу {store.path}"
+                             + (f" и файл {self.output_file}" if writer else ""))
             else:
                 logging.warning("Не удалось собрать данные об облигациях")
                 
         except Exception as e:
             logging.error(f"Критическая ошибка при выполнении скрипта: {str(e)}")
         finally:
-            self.driver.quit()
+            if writer:
+                writer.close()
+            store.close()
+            self.fetcher.close()
             logging.info("Работа скрипта завершена")
 
 if __name__ == "__main__":
+    # Настройка логирования: запись в консоль и файл (JSON) выполняется в отдельном потоке
+    setup_logging('scraper.log')
+    parser = argparse.ArgumentParser(description="Сбор данных об облигациях с сайта Finam")
+    parser.add_argument('--backend', choices=list(FETCHER_BACKENDS), default='http',
+                        help="Движок загрузки страниц: http (без браузера), selenium или replay (страницы из архива)")
+    parser.add_argument('--workers', type=int, default=4,
+                        help="Количество одновременно загружаемых страниц")
+    parser.add_argument('--rps', type=float, default=1.0,
+                        help="Максимальное количество запросов в секунду к сайту")
+    parser.add_argument('--adaptive', action='store_true',
+                        help="Подстраивать частоту и число одновременных запросов под задержку и ошибки сайта "
+                             "(--rps задает начальную частоту)")
+    parser.add_argument('--parser', choices=list(PARSER_BACKENDS), default='lxml',
+                        help="Библиотека разбора HTML: lxml, selectolax или bs4 (BeautifulSoup)")
+    parser.add_argument('--rules', default=DEFAULT_RULES_FILE,
+                        help="Файл с критериями отбора облигаций (JSON)")
+    parser.add_argument('--no-csv', action='store_true',
+                        help="Сохранять список только в базу, без bonds_data.csv")
+    parser.add_argument('--archive', action='store_true',
+                        help="Сохранять загруженные страницы в архив (output/archive) для повторного извлечения "
+                             "данных с --backend replay")
+    parser.add_argument('--as-of',
+                        help="Для --backend replay: страницы архива на момент YYYY-MM-DD (конец дня) или "
+                             "YYYY-MM-DDTHH:MM; по умолчанию - последние")
+    parser.add_argument('--metrics',
+                        help="Файл отчета с метриками: *.json или текстовый формат Prometheus (например, bonds.prom)")
+    parser.add_argument('--profile', metavar='DIR',
+                        help="Каталог для профиля cProfile")
+    parser.add_argument('--profile-memory', action='store_true',
+                        help="Дополнительно профилировать память (tracemalloc, замедляет работу)")
+    parser.add_argument('--log-level', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
+                        help="Уровень логирования (по умолчанию - из переменной BONDS_LOG_LEVEL)")
+    args = parser.parse_args()
+    if args.log_level:
+        set_log_level(args.log_level)
+
     logging.info("Запуск скрипта для сбора данных об облигациях")
-    scraper = BondsScraper()
-    scraper.run() 
\ No newline at end of file
+    scraper = BondsScraper(backend=args.backend, max_workers=args.workers, requests_per_second=args.rps,
+                           parser=args.parser, rules=ScreeningRules.load(args.rules),
+                           save_csv=not args.no_csv, adaptive=args.adaptive,
+                           archive=PageArchive() if args.archive else None, as_of=parse_as_of(args.as_of))
+    with StageProfiler(args.profile, memory=args.profile_memory).stage('scrape'):
+        scraper.run()
+    if args.metrics:
+        METRICS.write(args.metrics) 
\ No newline at end of file
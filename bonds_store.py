@@ -0,0 +1,327 @@
+import os
+import json
+import time
+import logging
+import argparse
+import sqlite3
+import threading
+from datetime import datetime
+import pandas as pd
+from records import LISTING_COLUMNS, FILTER_COLUMNS, RATING_COLUMNS, ANALYTICS_COLUMNS
+from sort_bonds import get_rating_value
+from streaming import iter_csv, READ_BATCH
+from log_setup import setup_logging
+
+DEFAULT_STORE_PATH = "./output/bonds.sqlite"
+SNAPSHOT_DIR = "./output/snapshots"
+
+# Колонки CSV этапов -> колонки таблицы bonds
+ANALYTICS_FIELDS = ['ytm', 'current_yield', 'duration', 'modified_duration', 'accrued_interest']
+FILTER_FIELDS = ['bond_name', 'isin', 'placement_date', 'maturity_date', 'coupon_rate', *ANALYTICS_FIELDS, 'bond_link']
+RATING_FIELDS = ['bond_name', 'isin', 'placement_date', 'maturity_date', 'coupon_rate', *ANALYTICS_FIELDS, 'rating',
+                 'rating_color', 'bond_link']
+# Колонки, добавленные после первой версии базы: в существующие базы добавляются при открытии
+ADDED_COLUMNS = [(field, 'REAL') for field in ANALYTICS_FIELDS] + [('schedule', 'TEXT'), ('rating_changed_at', 'REAL')]
+RATING_ERROR = "Ошибка"  # Рейтинг облигаций, для которых его не удалось получить
+
+
+def empty_to_null(value):
+    return None if value == '' else value
+
+
+class BondsStore:
+    """Хранилище облигаций всех этапов (SQLite с индексами по ISIN, ссылке, рейтингу и погашению)"""
+
+    def __init__(self, path=DEFAULT_STORE_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+
+        store_dir = os.path.dirname(path)
+        if store_dir and not os.path.exists(store_dir):
+            os.makedirs(store_dir)
+
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        # position - номер в последнем собранном списке (NULL, если облигации в нем больше нет);
+        # accepted - результат отбора (NULL - не проверялась)
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS bonds (
+                bond_link TEXT PRIMARY KEY,
+                bond_name TEXT NOT NULL,
+                placement_date TEXT,
+                maturity_date TEXT,
+                position INTEGER,
+                isin TEXT,
+                coupon_rate TEXT,
+                accepted INTEGER,
+                rating TEXT,
+                rating_color TEXT,
+                rating_rank INTEGER,
+                ytm REAL,
+                current_yield REAL,
+                duration REAL,
+                modified_duration REAL,
+                accrued_interest REAL,
+                schedule TEXT,
+                listed_at REAL,
+                screened_at REAL,
+                rated_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS bonds_isin ON bonds (isin);
+            CREATE INDEX IF NOT EXISTS bonds_position ON bonds (position);
+            CREATE INDEX IF NOT EXISTS bonds_rating ON bonds (accepted, rating_rank, position);
+            CREATE INDEX IF NOT EXISTS bonds_maturity ON bonds (maturity_date);
+        """)
+        existing = {row[1] for row in self.connection.execute("PRAGMA table_info(bonds)")}
+        for column, column_type in ADDED_COLUMNS:
+            if column not in existing:
+                self.connection.execute(f"ALTER TABLE bonds ADD COLUMN {column} {column_type}")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS bonds_ytm ON bonds (accepted, ytm)")
+        self.connection.commit()
+
+    def query(self, sql, params=()):
+        with self.lock:
+            return self.connection.execute(sql, params).fetchall()
+
+    def add_listing(self, bonds, listed_at, start=0):
+        """Сохранение части собранного списка (позиции с start): новые облигации добавляются, известные
+        обновляются, данные отбора и рейтинги сохраняются. Возвращает количество сохраненных облигаций"""
+        rows = [(bond['bond_link'], bond['bond_name'], bond['placement_date'], bond['maturity_date'], position,
+                 listed_at)
+                for position, bond in enumerate(bonds, start) if bond['bond_link']]
+        if len(rows) < len(bonds):
+            logging.warning(f"Облигаций без ссылки не сохранено в базу: {len(bonds) - len(rows)}")
+        with self.lock, self.connection:
+            self.connection.executemany(
+                "INSERT INTO bonds (bond_link, bond_name, placement_date, maturity_date, position, listed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (bond_link) DO UPDATE SET bond_name = excluded.bond_name, "
+                "placement_date = excluded.placement_date, maturity_date = excluded.maturity_date, "
+                "position = excluded.position, listed_at = excluded.listed_at",
+                rows
+            )
+        return len(rows)
+
+    def finish_listing(self, listed_at):
+        """Завершение сохранения списка: облигации, не попавшие в список со временем listed_at, исключаются из него"""
+        with self.lock, self.connection:
+            self.connection.execute("UPDATE bonds SET position = NULL "
+                                    "WHERE position IS NOT NULL AND (listed_at IS NULL OR listed_at <> ?)",
+                                    (listed_at,))
+
+    def keep_listing(self, listed_at, start):
+        """Завершение неполного сбора списка: облигации, не попавшие в собранную часть со временем listed_at,
+        остаются в списке с прежними данными на позициях после нее (с start, в прежнем порядке).
+        Возвращает количество таких облигаций"""
+        with self.lock, self.connection:
+            links = self.connection.execute("SELECT bond_link FROM bonds "
+                                            "WHERE position IS NOT NULL AND (listed_at IS NULL OR listed_at <> ?) "
+                                            "ORDER BY position", (listed_at,)).fetchall()
+            self.connection.executemany("UPDATE bonds SET position = ? WHERE bond_link = ?",
+                                        [(position, link) for position, (link,) in enumerate(links, start)])
+        return len(links)
+
+    def drop_unlisted(self, before):
+        """Исключение из списка облигаций, которых не было на страницах списка с момента before"""
+        with self.lock, self.connection:
+            cursor = self.connection.execute("UPDATE bonds SET position = NULL "
+                                             "WHERE position IS NOT NULL AND (listed_at IS NULL OR listed_at < ?)",
+                                             (before,))
+        return cursor.rowcount
+
+    def replace_listing(self, bonds):
+        """Сохранение собранного списка целиком"""
+        now = time.time()
+        saved = self.add_listing(bonds, now)
+        self.finish_listing(now)
+        logging.info(f"Сохранено {saved} облигаций списка в базу {self.path}")
+
+    def add_filtered(self, filtered_bonds, screened_at):
+        """Сохранение части результата отбора: облигации filtered_bonds прошли отбор"""
+        rows = [(bond['ISIN'] or '', bond['Ставка купона'],
+                 *[empty_to_null(bond.get(column, '')) for column in ANALYTICS_COLUMNS],
+                 json.dumps(bond['schedule']) if bond.get('schedule') else None, screened_at, bond['Ссылка'])
+                for bond in filtered_bonds]
+        with self.lock, self.connection:
+            self.connection.executemany(
+                "UPDATE bonds SET isin = ?, coupon_rate = ?, "
+                + ''.join(f"{field} = ?, " for field in ANALYTICS_FIELDS)
+                + "schedule = ?, accepted = 1, screened_at = ? WHERE bond_link = ?",
+                rows
+            )
+        return len(rows)
+
+    def reject(self, links, screened_at):
+        """Облигации links не прошли отбор (повторная проверка отдельных облигаций)"""
+        with self.lock, self.connection:
+            self.connection.executemany("UPDATE bonds SET accepted = 0, screened_at = ? WHERE bond_link = ?",
+                                        [(screened_at, link) for link in links])
+
+    def finish_screening(self, screened_at):
+        """Завершение отбора: облигации текущего списка, не сохраненные отбором со временем screened_at,
+        не прошли отбор"""
+        with self.lock, self.connection:
+            self.connection.execute("UPDATE bonds SET accepted = 0, screened_at = ? "
+                                    "WHERE position IS NOT NULL AND (screened_at IS NULL OR screened_at <> ?)",
+                                    (screened_at, screened_at))
+
+    def save_filtered(self, filtered_bonds):
+        """Сохранение результата отбора: облигации текущего списка, которых нет в filtered_bonds, не прошли отбор"""
+        now = time.time()
+        saved = self.add_filtered(filtered_bonds, now)
+        self.finish_screening(now)
+        logging.info(f"Сохранено {saved} отобранных облигаций в базу {self.path}")
+
+    def set_isins(self, isins):
+        """ISIN облигаций, найденные без страницы облигации (словарь ссылка -> ISIN)"""
+        with self.lock, self.connection:
+            self.connection.executemany("UPDATE bonds SET isin = ? WHERE bond_link = ?",
+                                        [(isin, link) for link, isin in isins.items()])
+        logging.info(f"Сохранено {len(isins)} найденных ISIN в базу {self.path}")
+
+    def save_ratings(self, rows):
+        """Обновление рейтингов по строкам с колонками RATING_COLUMNS"""
+        rating_index, color_index = RATING_COLUMNS.index('Рейтинг'), RATING_COLUMNS.index('Цвет рейтинга')
+        link_index = RATING_COLUMNS.index('Ссылка')
+        saved = self.set_ratings([(row[link_index], row[rating_index], row[color_index]) for row in rows])
+        logging.info(f"Сохранено {saved} рейтингов в базу {self.path}")
+
+    def set_ratings(self, ratings, rated_at=None):
+        """Обновление рейтингов по кортежам (ссылка, рейтинг, цвет). Если известный рейтинг облигации изменился,
+        запоминается время изменения (rating_changed_at); ошибки получения рейтинга изменением не считаются"""
+        rated_at = rated_at or time.time()
+        updates = [(rating, rating, rated_at, rating, color, get_rating_value(rating), rated_at, link)
+                   for link, rating, color in ratings]
+        with self.lock, self.connection:
+            # В правой части SET все колонки имеют значения до обновления
+            self.connection.executemany(
+                "UPDATE bonds SET rating_changed_at = CASE "
+                f"WHEN rating NOT IN ('', '{RATING_ERROR}') AND ? NOT IN ('', '{RATING_ERROR}') AND rating <> ? "
+                "THEN ? ELSE rating_changed_at END, "
+                "rating = ?, rating_color = ?, rating_rank = ?, rated_at = ? WHERE bond_link = ?",
+                updates
+            )
+        return len(updates)
+
+    def iter_positions(self, fields, condition, batch_size=READ_BATCH):
+        """Строки облигаций текущего списка в порядке позиций, запросами по batch_size строк.
+        Между запросами база не заблокирована, поэтому результаты можно сохранять во время чтения"""
+        position = -1
+        while True:
+            rows = self.query(f"SELECT position, {', '.join(fields)} FROM bonds "
+                              f"WHERE {condition} AND position > ? ORDER BY position LIMIT ?",
+                              (position, batch_size))
+            for row in rows:
+                yield row[1:]
+            if len(rows) < batch_size:
+                return
+            position = rows[-1][0]
+
+    def iter_listing(self):
+        """Поток облигаций последнего собранного списка (словари с колонками bonds_data.csv)"""
+        for row in self.iter_positions(LISTING_COLUMNS, "position IS NOT NULL"):
+            yield dict(zip(LISTING_COLUMNS, row))
+
+    def iter_filtered(self):
+        """Поток отобранных облигаций в порядке списка (словари с колонками bonds_filter.csv)"""
+        for row in self.iter_positions(FILTER_FIELDS, "accepted = 1 AND position IS NOT NULL"):
+            yield dict(zip(FILTER_COLUMNS, row))
+
+    def listing(self):
+        """Облигации последнего собранного списка (словари с колонками bonds_data.csv)"""
+        return list(self.iter_listing())
+
+    def filtered(self):
+        """Отобранные облигации в порядке списка (словари с колонками bonds_filter.csv)"""
+        return list(self.iter_filtered())
+
+    def listing_size(self):
+        """Количество облигаций последнего собранного списка"""
+        return self.query("SELECT COUNT(*) FROM bonds WHERE position IS NOT NULL")[0][0]
+
+    def filtered_size(self):
+        """Количество отобранных облигаций текущего списка"""
+        return self.query("SELECT COUNT(*) FROM bonds WHERE accepted = 1 AND position IS NOT NULL")[0][0]
+
+    def rated(self):
+        """Отобранные облигации с рейтингом, отсортированные по рейтингу (строки bonds_with_ratings.csv)"""
+        rows = self.query(f"SELECT {', '.join(RATING_FIELDS)} FROM bonds "
+                          "WHERE accepted = 1 AND position IS NOT NULL AND isin <> '' AND rating IS NOT NULL "
+                          "ORDER BY rating_rank, position")
+        return [list(row) for row in rows]
+
+    def find_by_isin(self, isin):
+        """Все сохраненные данные облигации по ISIN (словарь или None)"""
+        with self.lock:
+            cursor = self.connection.execute("SELECT * FROM bonds WHERE isin = ?", (isin,))
+            row = cursor.fetchone()
+            columns = [description[0] for description in cursor.description]
+        return dict(zip(columns, row)) if row else None
+
+    def to_dataframe(self):
+        """Вся таблица облигаций для анализа"""
+        with self.lock:
+            return pd.read_sql_query("SELECT * FROM bonds ORDER BY position IS NULL, position", self.connection)
+
+    def export_parquet(self, path=None):
+        """Снимок таблицы в Parquet (нужен pyarrow или fastparquet). Возвращает путь к файлу или None"""
+        path = path or os.path.join(SNAPSHOT_DIR, f"bonds-{datetime.now():%Y%m%d-%H%M%S}.parquet")
+        snapshot_dir = os.path.dirname(path)
+        if snapshot_dir and not os.path.exists(snapshot_dir):
+            os.makedirs(snapshot_dir)
+        try:
+            self.to_dataframe().to_parquet(path, index=False)
+        except ImportError:
+            logging.error("Для сохранения в Parquet установите pyarrow: pip install pyarrow")
+            return None
+        logging.info(f"Снимок базы сохранен в файл {path}")
+        return path
+
+    def import_csv(self, output_dir="./output"):
+        """Перенос данных из CSV-файлов предыдущих версий (bonds_data, bonds_filter, bonds_with_ratings)"""
+        listing_file = os.path.join(output_dir, "bonds_data.csv")
+        filter_file = os.path.join(output_dir, "bonds_filter.csv")
+        rating_file = os.path.join(output_dir, "bonds_with_ratings.csv")
+        if os.path.exists(listing_file):
+            self.replace_listing(list(iter_csv(listing_file)))
+        if os.path.exists(filter_file):
+            self.save_filtered(list(iter_csv(filter_file)))
+        if os.path.exists(rating_file):
+            # Колонки берутся по названиям: в файлах ранних версий нет колонок доходности
+            self.save_ratings([[row.get(column, '') for column in RATING_COLUMNS] for row in iter_csv(rating_file)])
+
+    def close(self):
+        """Закрытие базы"""
+        with self.lock:
+            self.connection.close()
+
+
+if __name__ == '__main__':
+    setup_logging()
+
+    parser = argparse.ArgumentParser(description="Работа с базой облигаций")
+    parser.add_argument('--db', default=DEFAULT_STORE_PATH, help="Файл базы SQLite")
+    commands = parser.add_subparsers(dest='command', required=True)
+    import_parser = commands.add_parser('import', help="Загрузить в базу CSV-файлы из каталога output")
+    import_parser.add_argument('--dir', default="./output", help="Каталог с CSV-файлами")
+    parquet_parser = commands.add_parser('parquet', help="Сохранить снимок базы в Parquet")
+    parquet_parser.add_argument('--output', help="Файл снимка; по умолчанию output/snapshots/bonds-<время>.parquet")
+    isin_parser = commands.add_parser('isin', help="Показать данные облигации по ISIN")
+    isin_parser.add_argument('isin')
+    args = parser.parse_args()
+
+    store = BondsStore(args.db)
+    try:
+        if args.command == 'import':
+            store.import_csv(args.dir)
+        elif args.command == 'parquet':
+            store.export_parquet(args.output)
+        else:
+            bond = store.find_by_isin(args.isin)
+            if bond is None:
+                print(f"Облигация {args.isin} не найдена")
+            else:
+                for key, value in bond.items():
+                    print(f"{key}: {value}")
+    finally:
+        store.close()
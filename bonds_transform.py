@@ -1,33 +1,28 @@
 import pandas as pd
 import logging
+from bonds_store import BondsStore
+from records import RATING_COLUMNS
+from log_setup import setup_logging
 
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('bonds_transform.log', encoding='utf-8'),
-        logging.StreamHandler()
-    ]
-)
+def build_transformed(df):
+    # Создание нового DataFrame с нужными колонками
+    return pd.DataFrame({
+        'Название облигации': df['Название облигации'],
+        'B': 'B',
+        'ISIN': df['ISIN'],
+        '1': 1,
+        '0.01': 0.01
+    })
 
 def transform_data():
+    store = BondsStore()
     try:
-        # Чтение исходного файла
-        input_file = "./output/bonds_with_ratings.csv"
+        # Облигации с рейтингом читаются из базы в порядке рейтинга
         output_file = "./output/bonds_transformed.csv"
         
-        logging.info(f"Чтение данных из файла {input_file}")
-        df = pd.read_csv(input_file, sep=';', encoding='utf-8')
-        
-        # Создание нового DataFrame с нужными колонками
-        new_df = pd.DataFrame({
-            'Название облигации': df['Название облигации'],
-            'B': 'B',
-            'ISIN': df['ISIN'],
-            '1': 1,
-            '0.01': 0.01
-        })
+        logging.info(f"Чтение данных из базы {store.path}")
+        df = pd.DataFrame(store.rated(), columns=RATING_COLUMNS)
+        new_df = build_transformed(df)
         
         # Сохранение результата
         new_df.to_csv(output_file, sep=';', index=False, encoding='utf-8')
@@ -36,8 +31,12 @@ def transform_data():
         
     except Exception as e:
         logging.error(f"Ошибка при преобразовании данных: {str(e)}")
+    finally:
+        store.close()
 
 if __name__ == "__main__":
+    # Настройка логирования: запись в консоль и файл (JSON) выполняется в отдельном потоке
+    setup_logging('bonds_transform.log')
     logging.info("Запуск скрипта преобразования данных")
     transform_data()
     logging.info("Работа скрипта завершена") 
\ No newline at end of file
@@ -0,0 +1,345 @@
+import os
+import csv
+import time
+import socket
+import logging
+import argparse
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+from bonds_filter import BondsFilter
+from bonds_rating import create_rating_fetcher, load_rating_index
+from rating_engine import AsyncRatingEngine
+from fetchers import FETCHER_BACKENDS
+from html_parsers import create_parser, PARSER_BACKENDS
+from screening import ScreeningRules, DEFAULT_RULES_FILE
+from bonds_store import BondsStore
+from cashflows import add_analytics, load_prices
+from records import FilteredBond, FILTER_COLUMNS, RATING_COLUMNS
+from work_queue import WorkQueue, DEFAULT_QUEUE_PATH, VISIBILITY_TIMEOUT, MAX_ATTEMPTS, DONE, FAILED
+from log_setup import setup_logging, set_log_level
+
+# Очереди этапов: ключ задания - ссылка на страницу облигации
+FILTER_QUEUE = 'filter'
+RATING_QUEUE = 'rating'
+STAGES = [FILTER_QUEUE, RATING_QUEUE]
+POLL_INTERVAL = 2.0  # Пауза обработчика, если свободных заданий нет, но другие обработчики еще работают
+FILTER_OUTPUT = "./output/bonds_filter.csv"
+RATING_OUTPUT = "./output/bonds_with_ratings.csv"
+
+
+def worker_name():
+    """Имя обработчика, уникальное для процессов на нескольких машинах с общей очередью"""
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def init_logging(options):
+    """Логирование процесса-обработчика: процесс запускается через spawn и настраивает его заново"""
+    setup_logging('bonds_workers.log')
+    if options.get('log_level'):
+        set_log_level(options['log_level'])
+
+
+def open_queue(options):
+    return WorkQueue(options['queue_path'], options['visibility_timeout'], options['max_attempts'])
+
+
+def work_loop(queue, name, owner, batch_size, process_batch, poll_interval=POLL_INTERVAL):
+    """Выдача заданий обработчику пачками до опустошения очереди. Пока пачка обрабатывается, ее аренда
+    продлевается. Обработчик ждет, пока задания, арендованные другими, не будут выполнены: задания упавшего
+    обработчика выдаются снова после истечения аренды"""
+    processed = 0
+    while True:
+        jobs = queue.lease(name, owner, batch_size)
+        if not jobs:
+            if not queue.unfinished(name):
+                break
+            time.sleep(poll_interval)
+            continue
+        with queue.keep_leased(name, owner, [key for key, _, _ in jobs]):
+            process_batch(jobs)
+        processed += len(jobs)
+    logging.info(f"Обработчик {owner} завершил работу с очередью '{name}': обработано заданий {processed}")
+    return processed
+
+
+def run_filter_worker(options, fetcher_factory=None):
+    """Процесс-обработчик очереди отбора: загрузка страниц облигаций и проверка по критериям"""
+    init_logging(options)
+    queue = open_queue(options)
+    owner = worker_name()
+    fetcher = fetcher_factory(pool_size=options['threads']) if fetcher_factory else None
+    bonds_filter = BondsFilter(backend=options['backend'], fetcher=fetcher, max_workers=options['threads'],
+                               requests_per_second=options['rps'], use_cache=options['use_cache'],
+                               incremental=options['incremental'], parser=options['parser'],
+                               rules=ScreeningRules.load(options['rules_file']),
+                               adaptive=options.get('adaptive', False))
+    threads = options['threads'] if getattr(bonds_filter.fetcher, 'thread_safe', False) else 1
+
+    def process_job(job):
+        key, bond_data, attempt = job
+        try:
+            result, reason = bonds_filter.evaluate_bond(bond_data)
+        except Exception as e:
+            logging.error(f"Ошибка при обработке облигации {bond_data['bond_name']} (попытка {attempt}): {str(e)}",
+                          extra={'stage': 'filter', 'bond': bond_data['bond_name'], 'url': key})
+            queue.fail(FILTER_QUEUE, owner, key, e)
+            return
+        if reason == 'no_coupon':
+            # Ставка купона могла не загрузиться из-за ошибки сети: облигация проверяется еще раз
+            queue.fail(FILTER_QUEUE, owner, key, "не удалось получить ставку купона")
+            return
+        queue.complete(FILTER_QUEUE, owner, key, result)
+
+    try:
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            work_loop(queue, FILTER_QUEUE, owner, threads, lambda jobs: list(executor.map(process_job, jobs)))
+    finally:
+        bonds_filter.close()
+        queue.close()
+
+
+def run_rating_worker(options, fetcher_factory=None):
+    """Процесс-обработчик очереди рейтингов smart-lab"""
+    init_logging(options)
+    queue = open_queue(options)
+    owner = worker_name()
+    if fetcher_factory:
+        fetcher = fetcher_factory(pool_size=options['threads'])
+    else:
+        fetcher = create_rating_fetcher(options['use_cache'], options['rps'], pool_size=options['threads'],
+                                        adaptive=options.get('adaptive', False))
+    engine = AsyncRatingEngine(fetcher, create_parser(options['parser']).parse_rating, concurrency=options['threads'])
+
+    def process_batch(jobs):
+        # Повторы при временных ошибках выполняет движок; задание с ошибкой выдается снова позже
+        results = engine.run([payload['isin'] for _, payload, _ in jobs])
+        for (key, payload, _), (rating, color) in zip(jobs, results):
+            if rating == "Ошибка":
+                queue.fail(RATING_QUEUE, owner, key, f"Ошибка при получении рейтинга для {payload['isin']}")
+            else:
+                queue.complete(RATING_QUEUE, owner, key, [rating, color])
+
+    try:
+        work_loop(queue, RATING_QUEUE, owner, options['threads'] * 2, process_batch)
+    finally:
+        fetcher.close()
+        queue.close()
+
+
+WORKERS = {
+    FILTER_QUEUE: run_filter_worker,
+    RATING_QUEUE: run_rating_worker
+}
+
+
+def start_workers(stage, options, processes, fetcher_factory=None):
+    """Запуск processes процессов-обработчиков очереди этапа. Частота запросов делится между ними"""
+    # Запуск процесса с импортом модулей занимает около секунды процессорного времени, а загрузка страниц
+    # распараллеливается потоками (--threads): процессы сверх числа ядер только замедляют этап
+    cpus = os.cpu_count() or 1
+    if processes > cpus:
+        logging.warning(f"Обработчиков ({processes}) больше, чем ядер процессора ({cpus}): лишние процессы "
+                        "не ускоряют обработку, для большего числа одновременных запросов увеличьте --threads")
+    # spawn: процесс-обработчик заново настраивает логирование и не наследует потоки родителя
+    context = multiprocessing.get_context('spawn')
+    worker_options = dict(options, rps=options['rps'] / processes)
+    workers = [context.Process(target=WORKERS[stage], args=(worker_options, fetcher_factory),
+                               name=f"{stage}-worker-{number}")
+               for number in range(processes)]
+    for worker in workers:
+        worker.start()
+    logging.info(f"Запущено обработчиков очереди '{stage}': {processes}")
+    return workers
+
+
+def wait_workers(workers):
+    """Ожидание завершения обработчиков. Возвращает количество завершившихся с ошибкой"""
+    for worker in workers:
+        worker.join()
+    failed = sum(1 for worker in workers if worker.exitcode != 0)
+    if failed:
+        logging.warning(f"Обработчиков завершилось с ошибкой: {failed}; их задания выданы другим обработчикам "
+                        "после истечения аренды")
+    return failed
+
+
+def enqueue_filter(queue, store, rules):
+    """Задания отбора для последнего собранного списка (без облигаций, отбракованных правилами списка)"""
+    bonds = rules.prefilter(store.listing())
+    queue.enqueue(FILTER_QUEUE, [(bond_data['bond_link'], bond_data) for bond_data in bonds])
+    return len(bonds)
+
+
+def enqueue_rating(queue, store, options, bulk=False):
+    """Задания рейтингов для отобранных облигаций с ISIN; в пакетном режиме рейтинги из списка smart-lab
+    записываются сразу как выполненные задания"""
+    bonds = [bond for bond in store.filtered() if bond['ISIN']]
+    results = {}
+    if bulk:
+        fetcher = create_rating_fetcher(options['use_cache'], options['rps'], pool_size=options['threads'])
+        try:
+            index = load_rating_index(fetcher, options['parser'], options['threads'])
+        finally:
+            fetcher.close()
+        for bond in bonds:
+            known = index.get(bond['ISIN'])
+            if known is not None:
+                results[bond['Ссылка']] = list(known)
+    queue.enqueue(RATING_QUEUE, [(bond['Ссылка'], {'isin': bond['ISIN']}) for bond in bonds], results)
+    return len(bonds)
+
+
+def finished_jobs(queue, name, force=False):
+    """Задания очереди для объединения; None, если часть заданий еще не выполнена"""
+    jobs = queue.results(name)
+    unfinished = sum(1 for job in jobs if job[3] not in (DONE, FAILED))
+    if unfinished and not force:
+        logging.error(f"В очереди '{name}' не выполнено заданий: {unfinished}. Дождитесь обработчиков "
+                      "или объедините результаты с флагом --force")
+        return None
+    failed = [job for job in jobs if job[3] == FAILED]
+    if failed:
+        logging.warning(f"В очереди '{name}' заданий с отказом: {len(failed)} (повторить: retry {name})")
+    return jobs
+
+
+def merge_filter(queue, store, prices=None, save_csv=True, force=False):
+    """Отобранные облигации из результатов очереди в порядке списка: в базу и bonds_filter.csv"""
+    jobs = finished_jobs(queue, FILTER_QUEUE, force)
+    if jobs is None:
+        return None
+    bonds = [FilteredBond.from_dict(result) for _, _, result, status, _ in jobs if status == DONE and result]
+    filtered_bonds = [bond.to_dict() for bond in add_analytics(bonds, prices)]
+    store.save_filtered(filtered_bonds)
+    if save_csv:
+        pd.DataFrame(filtered_bonds, columns=FILTER_COLUMNS).to_csv(FILTER_OUTPUT, sep=';', index=False,
+                                                                    encoding='utf-8')
+        logging.info(f"Сохранено {len(filtered_bonds)} облигаций в файл {FILTER_OUTPUT}")
+    return filtered_bonds
+
+
+def merge_rating(queue, store, save_csv=True, force=False):
+    """Рейтинги из результатов очереди: в базу и bonds_with_ratings.csv (облигации без рейтинга - 'Ошибка')"""
+    jobs = finished_jobs(queue, RATING_QUEUE, force)
+    if jobs is None:
+        return None
+    ratings = {key: result for key, _, result, status, _ in jobs if status == DONE}
+    link_index = FILTER_COLUMNS.index('Ссылка')
+    rated_rows = []
+    for bond in store.filtered():
+        if not bond['ISIN']:
+            continue
+        row = [bond[column] for column in FILTER_COLUMNS]
+        rating, color = ratings.get(bond['Ссылка'], ("Ошибка", "Ошибка"))
+        row.insert(link_index, rating)
+        row.insert(link_index + 1, color)
+        rated_rows.append(row)
+    store.save_ratings(rated_rows)
+    if save_csv:
+        with open(RATING_OUTPUT, 'w', encoding='utf-8-sig', newline='') as outfile:
+            writer = csv.writer(outfile, delimiter=';')
+            writer.writerow(RATING_COLUMNS)
+            writer.writerows(rated_rows)
+        logging.info(f"Сохранено {len(rated_rows)} облигаций с рейтингом в файл {RATING_OUTPUT}")
+    return rated_rows
+
+
+def print_status(queue):
+    for name in STAGES:
+        counts = queue.counts(name)
+        print(f"{name}: ожидают {counts['pending']}, в работе {counts['leased']}, выполнено {counts['done']}, "
+              f"отказ {counts['failed']}")
+
+
+if __name__ == '__main__':
+    # Настройка логирования: запись в консоль и файл (JSON) выполняется в отдельном потоке
+    setup_logging('bonds_workers.log')
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--queue', default=DEFAULT_QUEUE_PATH, help="Файл очереди SQLite")
+    common.add_argument('--visibility-timeout', type=float, default=VISIBILITY_TIMEOUT,
+                        help="Через сколько секунд задание обработчика, который не ответил, выдается снова")
+    common.add_argument('--max-attempts', type=int, default=MAX_ATTEMPTS,
+                        help="Количество попыток обработки задания")
+    common.add_argument('--log-level', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
+                        help="Уровень логирования (по умолчанию - из переменной BONDS_LOG_LEVEL)")
+
+    stage_options = argparse.ArgumentParser(add_help=False)
+    stage_options.add_argument('stage', choices=STAGES, help="Этап: filter (страницы finam) или rating (smart-lab)")
+    stage_options.add_argument('--backend', choices=list(FETCHER_BACKENDS), default='http',
+                               help="Движок загрузки страниц finam: http (без браузера) или selenium")
+    stage_options.add_argument('--threads', type=int, default=4,
+                               help="Количество одновременных запросов в каждом процессе")
+    stage_options.add_argument('--rps', type=float, default=2.0,
+                               help="Максимальное количество запросов в секунду ко всем процессам вместе")
+    stage_options.add_argument('--adaptive', action='store_true',
+                               help="Подстраивать частоту и число одновременных запросов каждого процесса под "
+                                    "задержку и ошибки сайта (--rps задает начальную частоту)")
+    stage_options.add_argument('--no-cache', action='store_true', help="Не использовать кэш загруженных страниц")
+    stage_options.add_argument('--incremental', action='store_true',
+                               help="Не загружать страницы неизменившихся облигаций")
+    stage_options.add_argument('--parser', choices=list(PARSER_BACKENDS), default='lxml',
+                               help="Библиотека разбора HTML: lxml, selectolax или bs4 (BeautifulSoup)")
+    stage_options.add_argument('--rules', default=DEFAULT_RULES_FILE,
+                               help="Файл с критериями отбора облигаций (JSON)")
+    stage_options.add_argument('--processes', type=int, default=4,
+                               help="Количество процессов-обработчиков на этой машине")
+    stage_options.add_argument('--bulk', action='store_true',
+                               help="Этап rating: рейтинги из списка облигаций smart-lab, задания - только для "
+                                    "отсутствующих в нем")
+    stage_options.add_argument('--no-csv', action='store_true', help="Сохранять результат только в базу, без CSV")
+    stage_options.add_argument('--prices',
+                               help="Этап filter: CSV с чистыми ценами облигаций для расчета доходности")
+    stage_options.add_argument('--force', action='store_true',
+                               help="Объединить результаты, даже если часть заданий не выполнена")
+
+    parser = argparse.ArgumentParser(description="Обработка облигаций несколькими процессами через очередь заданий")
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('enqueue', parents=[common, stage_options],
+                        help="Заполнить очередь этапа из базы облигаций (новый запуск)")
+    commands.add_parser('work', parents=[common, stage_options],
+                        help="Запустить обработчики очереди (на каждой машине с доступом к файлу очереди)")
+    commands.add_parser('merge', parents=[common, stage_options],
+                        help="Сохранить результаты очереди в базу и CSV в формате bonds_filter.py/bonds_rating.py")
+    commands.add_parser('run', parents=[common, stage_options],
+                        help="Заполнить очередь, обработать ее на этой машине и сохранить результаты")
+    commands.add_parser('retry', parents=[common, stage_options], help="Вернуть в очередь задания с отказом")
+    commands.add_parser('status', parents=[common], help="Состояние очередей")
+    args = parser.parse_args()
+    if args.log_level:
+        set_log_level(args.log_level)
+
+    queue = WorkQueue(args.queue, args.visibility_timeout, args.max_attempts)
+    try:
+        if args.command == 'status':
+            print_status(queue)
+        elif args.command == 'retry':
+            queue.retry_failed(args.stage)
+        else:
+            options = {
+                'queue_path': args.queue, 'visibility_timeout': args.visibility_timeout,
+                'max_attempts': args.max_attempts, 'log_level': args.log_level, 'backend': args.backend,
+                'threads': args.threads, 'rps': args.rps, 'use_cache': not args.no_cache,
+                'adaptive': args.adaptive,
+                'incremental': args.incremental, 'parser': args.parser, 'rules_file': args.rules
+            }
+            store = BondsStore()
+            try:
+                if args.command in ('enqueue', 'run'):
+                    if args.stage == FILTER_QUEUE:
+                        enqueue_filter(queue, store, ScreeningRules.load(args.rules))
+                    else:
+                        enqueue_rating(queue, store, options, bulk=args.bulk)
+                if args.command in ('work', 'run'):
+                    wait_workers(start_workers(args.stage, options, args.processes))
+                if args.command in ('merge', 'run'):
+                    if args.stage == FILTER_QUEUE:
+                        merge_filter(queue, store, load_prices(args.prices) if args.prices else None,
+                                     save_csv=not args.no_csv, force=args.force)
+                    else:
+                        merge_rating(queue, store, save_csv=not args.no_csv, force=args.force)
+                print_status(queue)
+            finally:
+                store.close()
+    finally:
+        queue.close()
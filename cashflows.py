@@ -0,0 +1,183 @@
+import logging
+from datetime import date
+import numpy as np
+import pandas as pd
+
+FACE_VALUE = 1000.0  # Номинал, если в графике нет сумм погашения
+DAYS_IN_YEAR = 365.0
+DEFAULT_PRICE = 100.0  # Чистая цена в % от номинала, если рыночная цена неизвестна
+MAX_ITERATIONS = 50
+TOLERANCE = 1e-10
+
+# Показатели расчета в порядке ANALYTICS_COLUMNS и количество знаков после запятой
+ANALYTICS_FIELDS = [('ytm', 2), ('current_yield', 2), ('duration', 2), ('modified_duration', 2), ('accrued', 2)]
+
+
+def to_array(values):
+    return np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+
+
+def parse_day(value):
+    """Дата ГГГГ-ММ-ДД -> номер дня от 1970-01-01; None для пустых и некорректных значений"""
+    try:
+        day = np.datetime64(value, 'D') if value else None
+    except ValueError:
+        return None
+    return None if day is None or np.isnat(day) else int(day.astype(np.int64))
+
+
+class PaymentSchedule:
+    """График платежей облигации в массивах NumPy: даты и начала купонных периодов (дни от 1970-01-01),
+    суммы купонов и погашений в рублях, ставки и непогашенный номинал"""
+
+    __slots__ = ('days', 'starts', 'coupons', 'redemptions', 'rates', 'outstanding')
+
+    def __init__(self, dates, coupons, rates, redemptions, start_date=None):
+        self.days = np.array(dates, dtype='datetime64[D]').astype(np.int64)
+        coupons, rates, redemptions = to_array(coupons), to_array(rates), to_array(redemptions)
+
+        redemptions = np.nan_to_num(redemptions)
+        if redemptions.sum() <= 0:
+            # Суммы погашения не указаны: номинал погашается в последнюю дату графика
+            redemptions[-1] = FACE_VALUE
+        self.redemptions = redemptions
+        self.outstanding = redemptions.sum() - np.concatenate(([0.0], np.cumsum(redemptions)[:-1]))
+
+        # Неизвестные ставки будущих купонов принимаются равными последней известной
+        known = np.where(~np.isnan(rates), np.arange(len(rates)), -1)
+        filled = np.maximum.accumulate(known)
+        first_known = np.argmax(~np.isnan(rates)) if (~np.isnan(rates)).any() else None
+        self.rates = np.where(filled >= 0, rates[np.maximum(filled, 0)],
+                              rates[first_known] if first_known is not None else np.nan)
+
+        # Первый период начинается с даты размещения или имеет ту же длину, что и следующий
+        start = parse_day(start_date)
+        if start is not None and start < self.days[0]:
+            first_start = start
+        elif len(self.days) > 1:
+            first_start = 2 * self.days[0] - self.days[1]
+        else:
+            first_start = self.days[0] - 182
+        self.starts = np.concatenate(([first_start], self.days[:-1]))
+
+        # Суммы купонов, которых нет в таблице (плавающие купоны), оцениваются по ставке
+        missing = np.isnan(coupons)
+        period = (self.days - self.starts) / DAYS_IN_YEAR
+        coupons[missing] = self.rates[missing] / 100 * self.outstanding[missing] * period[missing]
+        self.coupons = coupons
+
+    @classmethod
+    def from_dict(cls, data, start_date=None):
+        """График из результата разбора таблицы 'Платежи' (html_parsers.parse_payment_schedule)"""
+        return cls(data['dates'], data['coupons'], data['rates'], data['redemptions'], start_date)
+
+    def __len__(self):
+        return len(self.days)
+
+
+def analyze(schedules, prices=None, settlement=None):
+    """Расчет доходности к погашению, текущей доходности, дюрации и НКД для всех облигаций одним проходом.
+    schedules - список PaymentSchedule (None - графика нет), prices - чистые цены в % от номинала.
+    Возвращает словарь массивов; для облигаций без графика или будущих платежей значения - NaN"""
+    count = len(schedules)
+    settlement = np.datetime64(settlement or date.today(), 'D').astype(np.int64)
+    prices = np.full(count, DEFAULT_PRICE) if prices is None else np.asarray(prices, dtype=np.float64)
+    width = max([len(schedule) for schedule in schedules if schedule is not None], default=1)
+
+    # Графики выравниваются в матрицы (облигация x платеж); пустые ячейки не участвуют в расчете
+    days = np.zeros((count, width), dtype=np.int64)
+    starts = np.zeros((count, width), dtype=np.int64)
+    coupons = np.zeros((count, width))
+    redemptions = np.zeros((count, width))
+    rates = np.full((count, width), np.nan)
+    outstanding = np.zeros((count, width))
+    valid = np.zeros((count, width), dtype=bool)
+    for index, schedule in enumerate(schedules):
+        if schedule is None:
+            continue
+        size = len(schedule)
+        days[index, :size] = schedule.days
+        starts[index, :size] = schedule.starts
+        coupons[index, :size] = schedule.coupons
+        redemptions[index, :size] = schedule.redemptions
+        rates[index, :size] = schedule.rates
+        outstanding[index, :size] = schedule.outstanding
+        valid[index, :size] = True
+
+    with np.errstate(all='ignore'):
+        future = valid & (days > settlement)
+        has_future = future.any(axis=1)
+        rows = np.arange(count)
+        next_index = np.argmax(future, axis=1)
+
+        # НКД - доля ближайшего купона, накопленная с начала текущего периода
+        next_start, next_day = starts[rows, next_index], days[rows, next_index]
+        next_coupon = coupons[rows, next_index]
+        period = np.maximum(next_day - next_start, 1)
+        accrued = next_coupon * np.clip((settlement - next_start) / period, 0.0, 1.0)
+        face = outstanding[rows, next_index]
+        dirty_price = prices / 100 * face + accrued
+
+        cashflows = np.where(future, coupons + redemptions, 0.0)
+        years = np.where(future, (days - settlement) / DAYS_IN_YEAR, 0.0)
+
+        # Метод Ньютона одновременно для всех облигаций (годовая капитализация)
+        ytm = np.full(count, 0.1)
+        for _ in range(MAX_ITERATIONS):
+            discount = np.exp(-years * np.log1p(ytm)[:, None])
+            present_value = (cashflows * discount).sum(axis=1)
+            slope = -(years * cashflows * discount).sum(axis=1) / (1 + ytm)
+            step = np.where(slope != 0, (present_value - dirty_price) / slope, 0.0)
+            ytm = np.maximum(ytm - step, -0.99)
+            if not (np.abs(step) > TOLERANCE).any():
+                break
+
+        discount = np.exp(-years * np.log1p(ytm)[:, None])
+        present_value = (cashflows * discount).sum(axis=1)
+        duration = (years * cashflows * discount).sum(axis=1) / present_value
+
+        # Текущая доходность - годовой купон по ставке ближайшего купона к чистой цене
+        next_rate = rates[rows, next_index]
+        annual_coupon = np.where(np.isnan(next_rate), next_coupon * DAYS_IN_YEAR / period / face * 100, next_rate)
+        current_yield = annual_coupon / (prices / 100)
+
+    unknown = ~has_future | np.isnan(present_value) | np.isnan(dirty_price)
+    results = {
+        'ytm': ytm * 100,
+        'current_yield': current_yield,
+        'duration': duration,
+        'modified_duration': duration / (1 + ytm),
+        'accrued': accrued
+    }
+    for values in results.values():
+        values[unknown] = np.nan
+    return results
+
+
+def load_prices(path):
+    """Чистые цены в % от номинала из CSV с колонками 'ISIN' и 'Цена' (разделитель ';')"""
+    df = pd.read_csv(path, sep=';', encoding='utf-8', dtype={'ISIN': str})
+    prices = dict(zip(df['ISIN'], pd.to_numeric(df['Цена'].astype(str).str.replace(',', '.'), errors='coerce')))
+    logging.info(f"Загружено {len(prices)} цен из файла {path}")
+    return prices
+
+
+def add_analytics(bonds, prices=None, settlement=None):
+    """Заполнение показателей ANALYTICS_COLUMNS у записей FilteredBond по их графикам платежей.
+    prices - словарь ISIN -> чистая цена в % от номинала; без цены расчет ведется по номиналу"""
+    prices = prices or {}
+    schedules = []
+    for bond in bonds:
+        try:
+            schedules.append(PaymentSchedule.from_dict(bond.schedule, bond.placement_date) if bond.schedule else None)
+        except (ValueError, KeyError, IndexError) as e:
+            logging.warning(f"Некорректный график платежей облигации {bond.name}: {str(e)}")
+            schedules.append(None)
+    bond_prices = [prices.get(bond.isin, DEFAULT_PRICE) for bond in bonds]
+    results = analyze(schedules, bond_prices, settlement)
+    for index, bond in enumerate(bonds):
+        bond.analytics = ['' if np.isnan(results[key][index]) else round(float(results[key][index]), digits)
+                          for key, digits in ANALYTICS_FIELDS]
+    calculated = sum(1 for bond in bonds if bond.analytics[0] != '')
+    logging.info(f"Доходность рассчитана для {calculated} из {len(bonds)} облигаций")
+    return bonds
@@ -0,0 +1,58 @@
+import os
+import json
+import logging
+import threading
+
+
+class CheckpointJournal:
+    """Журнал обработанных записей (append-only JSONL) для продолжения прерванного запуска"""
+
+    def __init__(self, path, sync=True):
+        self.path = path
+        self.sync = sync  # fsync после каждой записи, чтобы не потерять ее при сбое
+        self.lock = threading.Lock()
+        self.file = None
+
+        journal_dir = os.path.dirname(path)
+        if journal_dir and not os.path.exists(journal_dir):
+            os.makedirs(journal_dir)
+
+    def load(self):
+        """Чтение журнала. Возвращает словарь ключ -> результат"""
+        records = {}
+        if not os.path.exists(self.path):
+            return records
+        with open(self.path, 'r', encoding='utf-8') as journal:
+            for line_number, line in enumerate(journal, 1):
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # Последняя строка могла быть записана не полностью при сбое
+                    logging.warning(f"Пропущена поврежденная строка {line_number} журнала {self.path}")
+                    continue
+                records[record['key']] = record['result']
+        return records
+
+    def open(self, resume=False):
+        """Открытие журнала: продолжение прерванного запуска или начало нового. Возвращает готовые записи"""
+        records = self.load() if resume else {}
+        if resume:
+            logging.info(f"Продолжение запуска: в журнале {self.path} найдено {len(records)} записей")
+        self.file = open(self.path, 'a' if resume else 'w', encoding='utf-8')
+        return records
+
+    def append(self, key, result):
+        """Запись результата обработки одной записи"""
+        line = json.dumps({'key': key, 'result': result}, ensure_ascii=False)
+        with self.lock:
+            self.file.write(line + '\n')
+            self.file.flush()
+            if self.sync:
+                os.fsync(self.file.fileno())
+
+    def close(self):
+        """Закрытие журнала"""
+        with self.lock:
+            if self.file:
+                self.file.close()
+                self.file = None
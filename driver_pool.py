@@ -0,0 +1,187 @@
+import os
+import queue
+import atexit
+import shutil
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from fetchers import USER_AGENT
+from metrics import METRICS
+
+DRIVER_PATH_CACHE = "./output/.chromedriver_path"
+
+_driver_path = None
+_driver_path_lock = threading.Lock()
+_shared_pool = None
+_shared_pool_lock = threading.Lock()
+
+
+def resolve_driver_path():
+    """Путь к chromedriver: из переменной окружения, сохраненного пути, PATH или через ChromeDriverManager"""
+    global _driver_path
+    with _driver_path_lock:
+        if _driver_path and os.path.exists(_driver_path):
+            return _driver_path
+
+        candidates = [os.environ.get('CHROMEDRIVER_PATH')]
+        if os.path.exists(DRIVER_PATH_CACHE):
+            with open(DRIVER_PATH_CACHE, 'r', encoding='utf-8') as cache_file:
+                candidates.append(cache_file.read().strip())
+        candidates.append(shutil.which('chromedriver'))
+
+        for candidate in candidates:
+            if candidate and os.path.exists(candidate):
+                _driver_path = candidate
+                logging.info(f"Используется установленный chromedriver: {candidate}")
+                return _driver_path
+
+        # Проверка версии и загрузка драйвера только если он еще не установлен
+        from webdriver_manager.chrome import ChromeDriverManager
+        _driver_path = ChromeDriverManager().install()
+        cache_dir = os.path.dirname(DRIVER_PATH_CACHE)
+        if cache_dir and not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        with open(DRIVER_PATH_CACHE, 'w', encoding='utf-8') as cache_file:
+            cache_file.write(_driver_path)
+        logging.info(f"chromedriver установлен: {_driver_path}")
+        return _driver_path
+
+
+def create_driver():
+    """Запуск headless Chrome с настройками парсеров"""
+    from selenium import webdriver
+    from selenium.webdriver.chrome.service import Service
+    from selenium.webdriver.chrome.options import Options
+
+    chrome_options = Options()
+    chrome_options.add_argument("--headless=new")
+    chrome_options.add_argument("--no-sandbox")
+    chrome_options.add_argument("--disable-dev-shm-usage")
+    chrome_options.add_argument("--disable-gpu")
+    chrome_options.add_argument("--disable-software-rasterizer")
+    chrome_options.add_argument("--disable-webgl")
+    chrome_options.add_argument("--window-size=1920,1080")
+    chrome_options.add_argument("--start-maximized")
+    chrome_options.add_argument("--disable-notifications")
+    chrome_options.add_argument("--disable-extensions")
+    chrome_options.add_argument("--disable-infobars")
+    chrome_options.add_argument("--enable-javascript")
+    chrome_options.add_argument(f"--user-agent={USER_AGENT}")
+    chrome_options.add_argument("--disable-blink-features=AutomationControlled")
+    chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
+    chrome_options.add_experimental_option('useAutomationExtension', False)
+
+    service = Service(resolve_driver_path())
+    driver = webdriver.Chrome(service=service, options=chrome_options)
+    logging.info("Драйвер Chrome успешно инициализирован")
+    return driver
+
+
+class PooledDriver:
+    """Браузер из пула со счетчиком загруженных страниц"""
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.pages = 0
+
+
+class DriverPool:
+    """Пул заранее запущенных браузеров с перезапуском после K страниц и заменой упавших"""
+
+    def __init__(self, size=1, max_pages_per_driver=50, driver_factory=create_driver):
+        self.max_pages_per_driver = max_pages_per_driver
+        self.driver_factory = driver_factory
+        self.size = 0
+        self.idle = queue.Queue()
+        self.lock = threading.Lock()
+        self.closed = False
+        self.stats = {'created': 0, 'recycled': 0, 'replaced': 0}
+        self.ensure_size(size)
+
+    def new_driver(self):
+        """Запуск нового браузера"""
+        start = time.perf_counter()
+        pooled = PooledDriver(self.driver_factory())
+        METRICS.observe('driver_start_seconds', time.perf_counter() - start)
+        METRICS.inc('drivers', event='created')
+        with self.lock:
+            self.stats['created'] += 1
+        return pooled
+
+    def ensure_size(self, size):
+        """Увеличение пула до заданного размера (браузеры запускаются параллельно)"""
+        with self.lock:
+            missing = size - self.size
+            if missing <= 0:
+                return
+            self.size = size
+        with ThreadPoolExecutor(max_workers=missing) as executor:
+            for pooled in executor.map(lambda _: self.new_driver(), range(missing)):
+                self.idle.put(pooled)
+        logging.info(f"Пул браузеров: {self.size} экземпляров")
+
+    def is_healthy(self, pooled):
+        """Проверка, что браузер отвечает"""
+        try:
+            return pooled.driver.execute_script("return 1") == 1
+        except Exception:
+            return False
+
+    def quit_driver(self, pooled):
+        """Закрытие браузера без выброса ошибок"""
+        try:
+            pooled.driver.quit()
+        except Exception as e:
+            logging.warning(f"Ошибка при закрытии браузера: {str(e)}")
+
+    def acquire(self):
+        """Получение исправного браузера из пула (ожидает, если все заняты)"""
+        pooled = self.idle.get()
+        if not self.is_healthy(pooled):
+            logging.warning("Браузер не отвечает, запускается новый")
+            self.quit_driver(pooled)
+            pooled = self.new_driver()
+            METRICS.inc('drivers', event='replaced')
+            with self.lock:
+                self.stats['replaced'] += 1
+        return pooled
+
+    def release(self, pooled):
+        """Возврат браузера в пул; после max_pages_per_driver страниц браузер перезапускается"""
+        pooled.pages += 1
+        if self.closed:
+            self.quit_driver(pooled)
+            return
+        if pooled.pages >= self.max_pages_per_driver:
+            # Перезапуск ограничивает рост потребления памяти браузером
+            self.quit_driver(pooled)
+            pooled = self.new_driver()
+            METRICS.inc('drivers', event='recycled')
+            with self.lock:
+                self.stats['recycled'] += 1
+        self.idle.put(pooled)
+
+    def close(self):
+        """Закрытие всех свободных браузеров пула"""
+        self.closed = True
+        while True:
+            try:
+                pooled = self.idle.get_nowait()
+            except queue.Empty:
+                break
+            self.quit_driver(pooled)
+        logging.info(f"Пул браузеров закрыт: запущено {self.stats['created']}, "
+                     f"перезапущено {self.stats['recycled']}, заменено упавших {self.stats['replaced']}")
+
+
+def get_shared_pool(size=1, max_pages_per_driver=50):
+    """Общий пул браузеров процесса для всех этапов парсинга"""
+    global _shared_pool
+    with _shared_pool_lock:
+        if _shared_pool is None or _shared_pool.closed:
+            _shared_pool = DriverPool(size, max_pages_per_driver)
+            atexit.register(_shared_pool.close)
+        else:
+            _shared_pool.ensure_size(size)
+        return _shared_pool
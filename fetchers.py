@@ -0,0 +1,452 @@
+import re
+import random
+import logging
+import threading
+import time
+import requests
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import quote, urlparse
+from requests.adapters import HTTPAdapter
+from metrics import METRICS
+from host_scheduler import AdaptiveScheduler, parse_crawl_delay
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+META_CHARSET_RE = re.compile(rb'<meta[^>]+charset=["\']?([\w-]+)', re.IGNORECASE)
+
+
+class FetchError(Exception):
+    """Ошибка загрузки страницы"""
+
+    def __init__(self, url, status=None, message='', retry_after=None):
+        self.url = url
+        self.status = status
+        self.retry_after = retry_after  # Пауза из заголовка Retry-After в секундах
+        super().__init__(message or f"Не удалось загрузить {url} (статус {status})")
+
+    @property
+    def transient(self):
+        """Временная ошибка, после которой имеет смысл повторить запрос"""
+        return self.status is None or self.status == 429 or self.status >= 500
+
+
+def parse_retry_after(value):
+    """Разбор заголовка Retry-After (число секунд или дата) в секунды"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_date = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, (retry_date - datetime.now(timezone.utc)).total_seconds())
+
+
+def get_backoff(attempt, error, backoff_base=2.0, max_backoff=60.0):
+    """Пауза перед повтором: Retry-After сервера или экспоненциальная с разбросом"""
+    retry_after = getattr(error, 'retry_after', None)
+    if retry_after is not None:
+        return min(max_backoff, retry_after)
+    delay = min(max_backoff, backoff_base * (2 ** attempt))
+    return delay * random.uniform(0.5, 1.0)
+
+
+def retry_delay(fetcher, attempt, error, backoff_base=2.0, max_backoff=60.0):
+    """Пауза перед повтором запроса. Адаптивный планировщик сам задерживает следующий запрос к сайту
+    (Retry-After, сниженные частота и число запросов), поэтому при нем повтор сразу встает в его очередь"""
+    if getattr(fetcher, 'adaptive', False):
+        return 0.0
+    return get_backoff(attempt, error, backoff_base, max_backoff)
+
+
+def tab_url(url, link_text):
+    """Адрес, под которым в архиве хранится вкладка страницы url, открытая кликом по ссылке link_text
+    (у такой вкладки нет собственного адреса)"""
+    return f"{url}#tab={quote(link_text)}"
+
+
+class HostRateLimiter:
+    """Ограничение частоты запросов отдельно для каждого хоста (token bucket, потокобезопасное)"""
+
+    adaptive = False
+
+    def __init__(self, requests_per_second=1.0, burst=1):
+        self.rate = requests_per_second  # 0 - без ограничения
+        self.burst = burst  # Сколько запросов можно отправить подряд без паузы
+        self.lock = threading.Lock()
+        self.buckets = {}  # Хост -> (количество токенов, время последнего пересчета)
+        self.paused_until = {}  # Хост -> время, до которого запросы приостановлены
+
+    def acquire(self, url):
+        """Ожидание своей очереди на запрос к хосту"""
+        if self.rate <= 0:
+            return
+        host = urlparse(url).netloc
+        start = time.perf_counter()
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                delay = self.paused_until.get(host, 0.0) - now
+                if delay <= 0:
+                    tokens, updated = self.buckets.get(host, (self.burst, now))
+                    tokens = min(self.burst, tokens + (now - updated) * self.rate)
+                    if tokens >= 1:
+                        self.buckets[host] = (tokens - 1, now)
+                        METRICS.observe('rate_limit_wait_seconds', time.perf_counter() - start, host=host)
+                        return
+                    self.buckets[host] = (tokens, now)
+                    delay = (1 - tokens) / self.rate
+            time.sleep(delay)
+
+    def pause(self, url, seconds):
+        """Приостановка всех запросов к хосту (например, после ответа 429)"""
+        host = urlparse(url).netloc
+        with self.lock:
+            self.paused_until[host] = max(self.paused_until.get(host, 0.0), time.monotonic() + seconds)
+
+    def release(self, url, seconds=None, status=None, retry_after=None):
+        """Результат запроса на фиксированную частоту не влияет"""
+
+    def needs_robots(self, url):
+        return False
+
+
+class HttpFetcher:
+    """Загрузка страниц обычными HTTP-запросами без браузера"""
+
+    name = 'http'
+    thread_safe = True
+
+    def __init__(self, timeout=30, pool_size=10, requests_per_second=1.0, rate_limiter=None, cache=None,
+                 adaptive=False, archive=None):
+        self.timeout = timeout
+        self.cache = cache  # Необязательный кэш ответов (http_cache.ResponseCache)
+        self.archive = archive  # Необязательный архив загруженных страниц (page_archive.PageArchive)
+        # Ограничение частоты запросов к каждому сайту, чтобы не нагружать его: фиксированная частота или
+        # адаптивный бюджет, который подстраивается под задержку и ошибки сайта
+        self.own_rate_limiter = rate_limiter is None  # Общий планировщик выводит сводку у владельца
+        if rate_limiter is None:
+            rate_limiter = (AdaptiveScheduler(requests_per_second=requests_per_second or None) if adaptive
+                            else HostRateLimiter(requests_per_second))
+        self.rate_limiter = rate_limiter
+
+        # Пул соединений с keep-alive и сжатием
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update({
+            'User-Agent': USER_AGENT,
+            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+            'Accept-Language': 'ru-RU,ru;q=0.9,en;q=0.8',
+            'Accept-Encoding': 'gzip, deflate',
+            'Connection': 'keep-alive'
+        })
+        logging.info("HTTP-сессия успешно инициализирована")
+
+    @property
+    def adaptive(self):
+        """Паузы между запросами и после ошибок выдерживает планировщик, а не вызывающий код"""
+        return getattr(self.rate_limiter, 'adaptive', False)
+
+    def route(self, url):
+        """Адрес, по которому фактически отправляется запрос (заглушки сайтов подменяют его)"""
+        return url
+
+    def load_robots(self, url):
+        """Минимальный интервал между запросами из robots.txt сайта для адаптивного планировщика"""
+        parts = urlparse(url)
+        robots_url = f"{parts.scheme}://{parts.netloc}/robots.txt"
+        try:
+            response = self.session.get(self.route(robots_url), timeout=self.timeout)
+        except requests.RequestException as e:
+            logging.warning(f"Не удалось загрузить {robots_url}: {str(e)}")
+            return
+        if response.status_code != 200:
+            return
+        delay = parse_crawl_delay(response.text)
+        if delay:
+            self.rate_limiter.set_crawl_delay(url, delay)
+
+    def fetch(self, url, ready=None):
+        """Загрузка HTML страницы. Параметр ready нужен только браузерному движку"""
+        host = urlparse(url).netloc
+        entry = self.cache.lookup(url) if self.cache else None
+        if entry and entry['fresh']:
+            METRICS.inc('cache_hits', host=host, result='fresh')
+            return self.archived(url, entry['body'])
+        headers = self.cache.conditional_headers(entry) if self.cache else {}
+
+        if self.rate_limiter.needs_robots(url):
+            self.load_robots(url)
+        self.rate_limiter.acquire(url)
+        start = time.perf_counter()
+        response = None
+        try:
+            response = self.session.get(self.route(url), headers=headers, timeout=self.timeout)
+        except requests.RequestException as e:
+            METRICS.inc('pages_fetched', backend=self.name, host=host, status='error')
+            raise FetchError(url, message=f"Ошибка запроса {url}: {str(e)}") from e
+        finally:
+            seconds = time.perf_counter() - start
+            METRICS.observe('fetch_seconds', seconds, backend=self.name, host=host)
+            # Задержка и статус ответа нужны адаптивному планировщику для подстройки бюджета сайта
+            retry_after = parse_retry_after(response.headers.get('Retry-After')) if response is not None else None
+            self.rate_limiter.release(url, seconds, response.status_code if response is not None else None,
+                                      retry_after)
+        METRICS.inc('pages_fetched', backend=self.name, host=host, status=response.status_code)
+
+        # Страница не изменилась с момента сохранения в кэш
+        if response.status_code == 304 and entry:
+            METRICS.inc('cache_hits', host=host, result='revalidated')
+            self.cache.revalidated(url)
+            return self.archived(url, entry['body'])
+
+        if response.status_code >= 400:
+            raise FetchError(url, status=response.status_code, retry_after=retry_after)
+
+        # Сайты часто не указывают кодировку в заголовках (finam отдает windows-1251)
+        if not response.encoding or response.encoding.lower() == 'iso-8859-1':
+            match = META_CHARSET_RE.search(response.content[:4096])
+            response.encoding = match.group(1).decode('ascii') if match else response.apparent_encoding
+        body = response.text
+
+        if self.cache:
+            self.cache.store(url, body, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+        return self.archived(url, body)
+
+    def archived(self, url, body):
+        """Сохранение страницы в архив (и страниц из кэша: архив должен содержать все страницы запуска)"""
+        if self.archive:
+            self.archive.store(url, body)
+        return body
+
+    def release(self):
+        """Освобождение ресурсов текущего потока (для HTTP ничего не требуется)"""
+
+    def close(self):
+        """Закрытие HTTP-сессии"""
+        self.session.close()
+        if self.adaptive and self.own_rate_limiter:
+            self.rate_limiter.log_stats()
+        if self.cache:
+            self.cache.close()
+        if self.archive:
+            self.archive.close()
+
+
+class SeleniumFetcher:
+    """Загрузка страниц через headless Chrome для страниц, которым нужен JavaScript"""
+
+    name = 'selenium'
+    thread_safe = True  # Каждый поток получает собственный браузер из пула
+
+    # Элементы, появление которых означает готовность страницы каждого типа
+    # ('xpath' и 'css selector' - значения By.XPATH и By.CSS_SELECTOR)
+    READY_LOCATORS = {
+        'listing': ('xpath', "//table[.//th[normalize-space()='№']]"),
+        'detail': ('css selector', 'div.info'),
+        'payments': ('xpath', "//table[.//th[normalize-space()='Купоны'] and .//th[normalize-space()='Погашение']]")
+    }
+
+    def __init__(self, wait_timeout=30, pool=None, pool_size=1, max_pages_per_driver=50, archive=None,
+                 requests_per_second=1.0, rate_limiter=None, adaptive=False):
+        from driver_pool import get_shared_pool
+
+        self.wait_timeout = wait_timeout
+        self.archive = archive  # Необязательный архив загруженных страниц (page_archive.PageArchive)
+        # Браузер нагружает сайт так же, как HTTP-запросы, поэтому частота переходов ограничивается тем же способом
+        self.own_rate_limiter = rate_limiter is None
+        if rate_limiter is None:
+            rate_limiter = (AdaptiveScheduler(requests_per_second=requests_per_second or None, robots=False)
+                            if adaptive else HostRateLimiter(requests_per_second))
+        self.rate_limiter = rate_limiter
+        self.wait_timings = {}  # Тип страницы -> список длительностей ожидания в секундах
+        # По умолчанию используется общий пул браузеров процесса, чтобы этапы не запускали Chrome заново
+        self.pool = pool or get_shared_pool(pool_size, max_pages_per_driver)
+        self.local = threading.local()  # Браузер, выданный текущему потоку
+
+    @property
+    def adaptive(self):
+        """Паузы между запросами и после ошибок выдерживает планировщик, а не вызывающий код"""
+        return getattr(self.rate_limiter, 'adaptive', False)
+
+    def lease_driver(self):
+        """Браузер для новой страницы текущего потока"""
+        self.release()
+        self.local.pooled = self.pool.acquire()
+        return self.local.pooled.driver
+
+    def current_driver(self):
+        """Браузер, на котором текущий поток открыл последнюю страницу"""
+        pooled = getattr(self.local, 'pooled', None)
+        if pooled is None:
+            raise FetchError('', message="В текущем потоке не открыта ни одна страница")
+        return pooled.driver
+
+    def release(self):
+        """Возврат браузера текущего потока в пул"""
+        pooled = getattr(self.local, 'pooled', None)
+        if pooled is not None:
+            self.local.pooled = None
+            self.pool.release(pooled)
+
+    def wait_until_ready(self, driver, ready):
+        """Ожидание появления ключевого элемента страницы с замером времени"""
+        from selenium.common.exceptions import TimeoutException
+        from selenium.webdriver.support import expected_conditions as EC
+        from selenium.webdriver.support.ui import WebDriverWait
+
+        locator = self.READY_LOCATORS.get(ready)
+        if not locator:
+            return
+        start = time.perf_counter()
+        try:
+            WebDriverWait(driver, self.wait_timeout).until(EC.presence_of_element_located(locator))
+        except TimeoutException:
+            logging.warning(f"Страница типа '{ready}' не загрузилась за {self.wait_timeout} с: {driver.current_url}")
+        finally:
+            elapsed = time.perf_counter() - start
+            self.wait_timings.setdefault(ready, []).append(elapsed)
+            METRICS.observe('page_wait_seconds', elapsed, backend=self.name, page=ready)
+            logging.debug(f"Ожидание страницы типа '{ready}' заняло {elapsed:.2f} с",
+                          extra={'event': 'page_wait', 'page': ready})
+
+    def get_wait_stats(self):
+        """Сводка по времени ожидания загрузки страниц каждого типа"""
+        stats = {}
+        for ready, timings in list(self.wait_timings.items()):
+            stats[ready] = {
+                'count': len(timings),
+                'total': sum(timings),
+                'avg': sum(timings) / len(timings),
+                'max': max(timings)
+            }
+        return stats
+
+    def fetch(self, url, ready=None):
+        """Загрузка HTML страницы в браузере"""
+        host = urlparse(url).netloc
+        driver = self.lease_driver()
+        self.local.url = url  # Адрес страницы, вкладки которой открываются кликом
+        self.rate_limiter.acquire(url)
+        start = time.perf_counter()
+        status = None
+        try:
+            driver.get(url)
+            self.wait_until_ready(driver, ready)
+            page_source = driver.page_source
+            status = 200  # Браузер не сообщает HTTP-статус: загруженная страница считается успешной
+        except Exception as e:
+            METRICS.inc('pages_fetched', backend=self.name, host=host, status='error')
+            raise FetchError(url, message=f"Ошибка загрузки {url} в браузере: {str(e)}") from e
+        finally:
+            seconds = time.perf_counter() - start
+            METRICS.observe('fetch_seconds', seconds, backend=self.name, host=host)
+            self.rate_limiter.release(url, seconds, status)
+        METRICS.inc('pages_fetched', backend=self.name, host=host, status='ok')
+        if self.archive:
+            self.archive.store(url, page_source)
+        return page_source
+
+    def click_tab(self, link_text, ready=None):
+        """Переход на вкладку текущей страницы кликом по ссылке"""
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support import expected_conditions as EC
+        from selenium.webdriver.support.ui import WebDriverWait
+
+        driver = self.current_driver()
+        url = driver.current_url
+        status = None
+        try:
+            tab = WebDriverWait(driver, self.wait_timeout).until(
+                EC.presence_of_element_located((By.XPATH, f"//a[contains(text(), '{link_text}')]"))
+            )
+            # Клик по вкладке тоже загружает данные с сайта и учитывается в ограничении частоты
+            self.rate_limiter.acquire(url)
+            start = time.perf_counter()
+            try:
+                tab.click()
+                self.wait_until_ready(driver, ready)
+                page_source = driver.page_source
+                status = 200
+            finally:
+                self.rate_limiter.release(url, time.perf_counter() - start, status)
+        except Exception as e:
+            raise FetchError(url, message=f"Не удалось открыть вкладку '{link_text}': {str(e)}") from e
+        if self.archive:
+            self.archive.store(tab_url(getattr(self.local, 'url', url), link_text), page_source)
+        return page_source
+
+    def close(self):
+        """Возврат браузера в пул; сам пул закрывается при завершении процесса"""
+        self.release()
+        if self.adaptive and self.own_rate_limiter:
+            self.rate_limiter.log_stats()
+        if self.archive:
+            self.archive.close()
+        for ready, stats in self.get_wait_stats().items():
+            logging.info(f"Ожидание страниц типа '{ready}': {stats['count']} раз, "
+                         f"в среднем {stats['avg']:.2f} с, максимум {stats['max']:.2f} с")
+
+
+class ReplayFetcher:
+    """Страницы из архива вместо сайтов: повторное извлечение данных без обращения к сети.
+    Каждый адрес отдается в последней версии не позже момента as_of, поэтому повторный запуск воспроизводим"""
+
+    name = 'replay'
+    thread_safe = True
+
+    def __init__(self, pool_size=1, archive=None, as_of=None):
+        from page_archive import PageArchive
+
+        self.archive = archive or PageArchive(readonly=True)
+        self.as_of = as_of  # Метка времени: страницы, загруженные позже, не используются
+        # Расположение всех страниц загружается одним запросом к индексу
+        self.locations = self.archive.locations(as_of)
+        self.local = threading.local()  # Последняя страница, открытая текущим потоком
+        logging.info(f"Воспроизведение из архива {self.archive.directory}: {len(self.locations)} страниц")
+
+    def fetch(self, url, ready=None):
+        """Страница из архива; отсутствующая страница - постоянная ошибка (как 404)"""
+        host = urlparse(url).netloc
+        location = self.locations.get(url)
+        if location is None:
+            METRICS.inc('pages_fetched', backend=self.name, host=host, status=404)
+            raise FetchError(url, status=404, message=f"Страница {url} отсутствует в архиве")
+        with METRICS.timer('fetch_seconds', backend=self.name, host=host):
+            body = self.archive.read_at(*location)
+        METRICS.inc('pages_fetched', backend=self.name, host=host, status=200)
+        self.local.url = url
+        return body
+
+    def click_tab(self, link_text, ready=None):
+        """Вкладка последней страницы текущего потока, сохраненная браузерным движком при клике"""
+        url = getattr(self.local, 'url', None)
+        if url is None:
+            raise FetchError('', message="В текущем потоке не открыта ни одна страница")
+        body = self.fetch(tab_url(url, link_text), ready)
+        self.local.url = url
+        return body
+
+    def release(self):
+        """Освобождение ресурсов текущего потока (ничего не требуется)"""
+
+    def close(self):
+        self.archive.close()
+
+
+FETCHER_BACKENDS = {
+    HttpFetcher.name: HttpFetcher,
+    SeleniumFetcher.name: SeleniumFetcher,
+    ReplayFetcher.name: ReplayFetcher
+}
+
+
+def create_fetcher(backend='http', **kwargs):
+    """Создание движка загрузки страниц по имени"""
+    if backend not in FETCHER_BACKENDS:
+        raise ValueError(f"Неизвестный движок загрузки: {backend}. Доступны: {', '.join(FETCHER_BACKENDS)}")
+    return FETCHER_BACKENDS[backend](**kwargs)
@@ -0,0 +1,251 @@
+import re
+import logging
+import threading
+import time
+from urllib.parse import urlparse
+from metrics import METRICS
+
+# Начальные и предельные бюджеты запросов к сайтам: запросов в секунду и одновременных запросов.
+# Бюджет сайта действует и для его поддоменов (www.smart-lab.ru)
+DEFAULT_BUDGET = {'rate': 1.0, 'min_rate': 0.1, 'max_rate': 5.0, 'rate_step': 0.25,
+                  'concurrency': 2, 'max_concurrency': 4, 'slow_seconds': 2.0}
+DEFAULT_BUDGETS = {
+    'bonds.finam.ru': dict(DEFAULT_BUDGET, rate=2.0, max_rate=10.0, rate_step=0.5, max_concurrency=8),
+    'smart-lab.ru': dict(DEFAULT_BUDGET, max_rate=4.0)
+}
+DECREASE_FACTOR = 0.5  # Во сколько раз снижаются частота и число запросов при признаках перегрузки
+SLOW_FACTOR = 3.0  # Ответ во столько раз медленнее обычного считается признаком перегрузки
+MIN_SAMPLES = 5  # Ответов, после которых обычная задержка сайта считается известной
+LATENCY_ALPHA = 0.2  # Вес нового ответа в сглаженной задержке
+BASELINE_ALPHA = 0.05  # Вес нового ответа в обычной задержке (меняется медленно)
+MIN_DECREASE_INTERVAL = 1.0  # Ответы на запросы, отправленные до снижения, не снижают бюджет повторно
+MAX_PAUSE = 300.0  # Ограничение паузы из Retry-After
+
+CRAWL_DELAY_RE = re.compile(r'^\s*crawl-delay\s*:\s*([\d.]+)', re.IGNORECASE)
+REQUEST_RATE_RE = re.compile(r'^\s*request-rate\s*:\s*(\d+)\s*/\s*(\d+)\s*([smh]?)', re.IGNORECASE)
+USER_AGENT_RE = re.compile(r'^\s*user-agent\s*:\s*(\S+)', re.IGNORECASE)
+
+
+def parse_crawl_delay(text):
+    """Минимальный интервал между запросами из robots.txt (Crawl-delay или Request-rate для всех роботов)
+    в секундах или None. urllib.robotparser не понимает дробный Crawl-delay, поэтому разбор свой"""
+    delay = None
+    applies = False
+    in_agents = False
+    for line in text.splitlines():
+        line = line.split('#', 1)[0]
+        agent = USER_AGENT_RE.match(line)
+        if agent:
+            # Несколько строк User-agent подряд относятся к одной группе правил
+            applies = (applies and in_agents) or agent.group(1) == '*'
+            in_agents = True
+            continue
+        in_agents = False
+        if not applies:
+            continue
+        crawl_delay = CRAWL_DELAY_RE.match(line)
+        request_rate = REQUEST_RATE_RE.match(line)
+        if crawl_delay:
+            try:
+                value = float(crawl_delay.group(1))
+            except ValueError:
+                continue
+        elif request_rate and int(request_rate.group(1)) > 0:
+            unit = {'m': 60, 'h': 3600}.get(request_rate.group(3).lower(), 1)
+            value = int(request_rate.group(2)) * unit / int(request_rate.group(1))
+        else:
+            continue
+        delay = max(delay or 0.0, value)
+    return delay
+
+
+class AdaptiveScheduler:
+    """Общий планировщик запросов с отдельным бюджетом для каждого сайта (AIMD, потокобезопасный).
+    После каждого ответа учитываются задержка и статус: пока сайт отвечает быстро и без ошибок, число
+    одновременных запросов и частота растут на шаг за каждый полный круг успешных ответов; при 429, 5xx,
+    сетевой ошибке или резком росте задержки оба значения уменьшаются вдвое. Retry-After и Crawl-delay
+    из robots.txt задают паузу и минимальный интервал между запросами"""
+
+    adaptive = True
+
+    def __init__(self, budgets=None, requests_per_second=None, robots=True):
+        # Бюджеты сайтов: значения по умолчанию с переопределениями вызывающего кода
+        self.budgets = {host: dict(budget) for host, budget in DEFAULT_BUDGETS.items()}
+        for host, overrides in (budgets or {}).items():
+            self.budgets[host] = dict(self.budgets.get(host, DEFAULT_BUDGET), **overrides)
+        self.requests_per_second = requests_per_second  # Начальная частота для всех сайтов (--rps)
+        self.robots = robots  # Учитывать Crawl-delay из robots.txt
+        self.condition = threading.Condition()
+        self.hosts = {}  # Хост -> состояние (текущий бюджет, задержки, счетчики)
+        self.robots_checked = set()
+
+    def budget(self, host):
+        """Бюджет сайта: точное совпадение или родительский домен"""
+        for name, budget in self.budgets.items():
+            if host == name or host.endswith('.' + name):
+                return budget
+        return DEFAULT_BUDGET
+
+    def state(self, host):
+        """Состояние сайта (вызывается под блокировкой)"""
+        state = self.hosts.get(host)
+        if state is None:
+            budget = self.budget(host)
+            rate = self.requests_per_second or budget['rate']
+            state = self.hosts[host] = {
+                'budget': budget,
+                'concurrency': budget['concurrency'],
+                'rate': min(budget['max_rate'], max(budget['min_rate'], rate)),
+                'crawl_delay': 0.0,
+                'active': 0,
+                'next_start': 0.0,
+                'paused_until': 0.0,
+                'last_decrease': 0.0,
+                'successes': 0,
+                'latency': None,
+                'baseline': None,
+                'samples': 0,
+                'stats': {'requests': 0, 'errors': 0, 'throttled': 0, 'slow': 0, 'increases': 0,
+                          'decreases': 0, 'wait_seconds': 0.0}
+            }
+            self.publish(host, state)
+        return state
+
+    def interval(self, state):
+        """Минимальный интервал между началом запросов к сайту"""
+        return max(1.0 / state['rate'], state['crawl_delay'])
+
+    def acquire(self, url):
+        """Ожидание свободного места в бюджете сайта: число одновременных запросов, интервал и пауза"""
+        host = urlparse(url).netloc
+        start = time.perf_counter()
+        with self.condition:
+            state = self.state(host)
+            while True:
+                now = time.monotonic()
+                delay = max(state['paused_until'], state['next_start']) - now
+                if state['active'] < state['concurrency'] and delay <= 0:
+                    state['active'] += 1
+                    state['next_start'] = now + self.interval(state)
+                    break
+                # Место освобождается в release, интервал и пауза истекают сами
+                self.condition.wait(delay if delay > 0 else None)
+            waited = time.perf_counter() - start
+            state['stats']['wait_seconds'] += waited
+        METRICS.observe('rate_limit_wait_seconds', waited, host=host)
+
+    def release(self, url, seconds=None, status=None, retry_after=None):
+        """Учет результата запроса: длительность, HTTP-статус (None - сетевая ошибка) и Retry-After"""
+        host = urlparse(url).netloc
+        with self.condition:
+            state = self.state(host)
+            stats = state['stats']
+            now = time.monotonic()
+            state['active'] = max(0, state['active'] - 1)
+            stats['requests'] += 1
+            reason = None
+            if status is None or status == 429 or status >= 500:
+                reason = 'throttled' if status in (429, 503) else 'error'
+            elif seconds is not None:
+                reason = self.observe_latency(state, seconds)
+            if retry_after:
+                state['paused_until'] = max(state['paused_until'], now + min(MAX_PAUSE, retry_after))
+            if reason:
+                stats['errors' if reason == 'error' else reason] += 1
+                self.decrease(host, state, now, reason)
+            else:
+                self.increase(host, state)
+            self.condition.notify_all()
+
+    def observe_latency(self, state, seconds):
+        """Сглаженная и обычная задержка сайта; 'slow', если ответ намного медленнее обычного"""
+        state['samples'] += 1
+        if state['latency'] is None:
+            state['latency'] = state['baseline'] = seconds
+            return None
+        state['latency'] += LATENCY_ALPHA * (seconds - state['latency'])
+        threshold = max(state['budget']['slow_seconds'], SLOW_FACTOR * state['baseline'])
+        if state['samples'] > MIN_SAMPLES and seconds > threshold:
+            return 'slow'
+        # Медленные ответы не сдвигают обычную задержку, иначе перегрузка стала бы нормой
+        state['baseline'] += BASELINE_ALPHA * (seconds - state['baseline'])
+        return None
+
+    def increase(self, host, state):
+        """Аддитивное увеличение: +1 запрос и +шаг частоты после полного круга успешных ответов"""
+        state['successes'] += 1
+        if state['successes'] < state['concurrency']:
+            return
+        state['successes'] = 0
+        budget = state['budget']
+        concurrency = min(budget['max_concurrency'], state['concurrency'] + 1)
+        rate = min(budget['max_rate'], state['rate'] + budget['rate_step'])
+        if (concurrency, rate) != (state['concurrency'], state['rate']):
+            state['concurrency'], state['rate'] = concurrency, rate
+            state['stats']['increases'] += 1
+            self.publish(host, state)
+
+    def decrease(self, host, state, now, reason):
+        """Мультипликативное уменьшение. Ответы на запросы, отправленные до предыдущего снижения, бюджет
+        повторно не уменьшают"""
+        state['successes'] = 0
+        METRICS.inc('host_congestion', host=host, reason=reason)
+        if now - state['last_decrease'] < max(MIN_DECREASE_INTERVAL, state['latency'] or 0.0):
+            return
+        budget = state['budget']
+        state['last_decrease'] = now
+        state['concurrency'] = max(1, int(state['concurrency'] * DECREASE_FACTOR))
+        state['rate'] = max(budget['min_rate'], state['rate'] * DECREASE_FACTOR)
+        state['next_start'] = max(state['next_start'], now + self.interval(state))
+        state['stats']['decreases'] += 1
+        self.publish(host, state)
+        logging.info(f"Признаки перегрузки {host} ({reason}): одновременных запросов {state['concurrency']}, "
+                     f"частота {state['rate']:.2f} запроса в секунду",
+                     extra={'event': 'host_budget', 'host': host})
+
+    def publish(self, host, state):
+        METRICS.set('host_concurrency', state['concurrency'], host=host)
+        METRICS.set('host_rate', round(state['rate'], 3), host=host)
+
+    def pause(self, url, seconds):
+        """Приостановка всех запросов к хосту (например, после ответа 429)"""
+        host = urlparse(url).netloc
+        with self.condition:
+            state = self.state(host)
+            state['paused_until'] = max(state['paused_until'], time.monotonic() + min(MAX_PAUSE, seconds))
+
+    def needs_robots(self, url):
+        """True один раз для каждого сайта, чей robots.txt еще не загружался"""
+        if not self.robots:
+            return False
+        host = urlparse(url).netloc
+        with self.condition:
+            if host in self.robots_checked:
+                return False
+            self.robots_checked.add(host)
+            return True
+
+    def set_crawl_delay(self, url, seconds):
+        """Минимальный интервал между запросами к сайту из robots.txt"""
+        host = urlparse(url).netloc
+        with self.condition:
+            self.state(host)['crawl_delay'] = seconds
+        logging.info(f"robots.txt {host}: интервал между запросами не меньше {seconds} с",
+                     extra={'event': 'host_budget', 'host': host})
+
+    def stats(self):
+        """Текущий бюджет и счетчики по каждому сайту"""
+        with self.condition:
+            return {host: dict(state['stats'], concurrency=state['concurrency'], rate=round(state['rate'], 3),
+                               crawl_delay=state['crawl_delay'], active=state['active'],
+                               latency_ms=round((state['latency'] or 0.0) * 1000, 1),
+                               baseline_ms=round((state['baseline'] or 0.0) * 1000, 1))
+                    for host, state in self.hosts.items()}
+
+    def log_stats(self):
+        for host, stats in self.stats().items():
+            logging.info(f"Запросы к {host}: {stats['requests']}, ошибок {stats['errors']}, 429/503 "
+                         f"{stats['throttled']}, медленных {stats['slow']}; одновременных запросов "
+                         f"{stats['concurrency']}, частота {stats['rate']} запроса в секунду, "
+                         f"задержка {stats['latency_ms']} мс",
+                         extra={'event': 'host_budget', 'host': host})
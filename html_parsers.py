@@ -0,0 +1,616 @@
+import re
+import time
+import logging
+from datetime import datetime
+from bs4 import BeautifulSoup
+from metrics import METRICS
+
+# Общее количество найденных облигаций и номер страницы в ссылках пагинации
+TOTAL_COUNT_RE = re.compile(r'Найдено[^\d]{0,30}(\d+)', re.IGNORECASE)
+PAGE_PARAM_RE = re.compile(r'[?&]page=(\d+)')
+
+# Классы прогресс-бара рейтинга smart-lab и соответствующие им цвета
+RATING_BAR_CLASS = 'linear-progress-bar'
+RATING_FILLED_CLASS = 'linear-progress-bar__filed'
+RATING_TEXT_CLASS = 'linear-progress-bar__text'
+RATING_COLORS = [
+    ('linear-progress-bar__filed--red', "Красный"),
+    ('linear-progress-bar__filed--yellow', "Желтый"),
+    ('linear-progress-bar__filed--green', "Зеленый")
+]
+NO_DATA = "Нет данных"
+# Цвет рейтинга по шкале, как на страницах облигаций smart-lab: от AA- - зеленый, от BBB- - желтый, ниже - красный
+RATING_GRADE_COLORS = {
+    **{grade: "Зеленый" for grade in ('AAA', 'AA+', 'AA', 'AA-')},
+    **{grade: "Желтый" for grade in ('A+', 'A', 'A-', 'BBB+', 'BBB', 'BBB-')}
+}
+LOW_RATING_COLOR = "Красный"
+# Рейтинг в записи агентств ('ruAA-', 'AA-(RU)', 'AA-.ru') и ISIN в ссылках и ячейках списка облигаций smart-lab
+RATING_GRADE_RE = re.compile(r'(?<![A-Za-z])(?:ru)?(AAA|AA|A|BBB|BB|B|CCC|CC|C|D)([+-]?)(?![A-Za-z])')
+ISIN_RE = re.compile(r'(?<![A-Z0-9])([A-Z]{2}[A-Z0-9]{9}\d)(?![A-Z0-9])')
+LIST_PAGE_RE = re.compile(r'/page(\d+)/?$')
+# Результат разбора, если таблицы платежей на странице нет
+NO_PAYMENTS = {'coupon_rate': None, 'schedule': None}
+
+
+def parse_coupon_rate(rows):
+    """Ставка купона из строк таблицы платежей: rows - список (заголовки th, ячейки td) каждой строки"""
+    if len(rows) < 2:
+        return None
+    second_level_texts = rows[1][0]
+    if 'Ставка' not in second_level_texts:
+        return None
+    rate_col_index = second_level_texts.index('Ставка')
+    for _, cells in rows[2:]:
+        if len(cells) > rate_col_index:
+            rate_text = cells[rate_col_index]
+            if '%' in rate_text:
+                try:
+                    return float(rate_text.replace('%', '').replace(',', '.'))
+                except ValueError:
+                    continue
+    return None
+
+
+def parse_number(text):
+    """Число из ячейки таблицы ('1 000,00', '25,5%'); None для пустых ячеек и прочерков"""
+    try:
+        return float(text.replace('%', '').replace('\xa0', '').replace(' ', '').replace(',', '.'))
+    except ValueError:
+        return None
+
+
+def parse_date(text):
+    """Дата из ячейки таблицы в формате ДД.ММ.ГГГГ -> ГГГГ-ММ-ДД; None, если в ячейке не дата"""
+    try:
+        return datetime.strptime(text.strip(), '%d.%m.%Y').strftime('%Y-%m-%d')
+    except ValueError:
+        return None
+
+
+def parse_payment_schedule(rows):
+    """График платежей из строк таблицы: даты, суммы и ставки купонов, суммы погашения номинала.
+    Возвращает словарь списков (сохраняется в JSON) или None, если в таблице нет дат платежей"""
+    if len(rows) < 2:
+        return None
+    headers = rows[1][0]
+    # Первый столбец 'Дата' относится к купонам, второй - к погашению; 'Сумма' следует за своей датой
+    date_columns = [index for index, header in enumerate(headers) if header.startswith('Дата')]
+    if not date_columns:
+        return None
+    coupon_date = date_columns[0]
+    redemption_date = date_columns[1] if len(date_columns) > 1 else None
+    amount_columns = [index for index, header in enumerate(headers) if header.startswith('Сумма')]
+    coupon_amount = next((index for index in amount_columns
+                          if redemption_date is None or index < redemption_date), None)
+    redemption_amount = next((index for index in amount_columns
+                              if redemption_date is not None and index > redemption_date), None)
+    rate_column = headers.index('Ставка') if 'Ставка' in headers else None
+
+    def cell(cells, index):
+        return cells[index] if index is not None and index < len(cells) else ''
+
+    payments = {}  # Дата -> [сумма купона, ставка, сумма погашения]
+    for _, cells in rows[2:]:
+        date = parse_date(cell(cells, coupon_date))
+        if date:
+            payment = payments.setdefault(date, [None, None, None])
+            payment[0] = parse_number(cell(cells, coupon_amount))
+            payment[1] = parse_number(cell(cells, rate_column))
+        date = parse_date(cell(cells, redemption_date))
+        if date:
+            # Дата только с погашением номинала не несет купона
+            payments.setdefault(date, [0.0, None, None])[2] = parse_number(cell(cells, redemption_amount))
+    if not payments:
+        return None
+    dates = sorted(payments)
+    return {
+        'dates': dates,
+        'coupons': [payments[date][0] for date in dates],
+        'rates': [payments[date][1] for date in dates],
+        'redemptions': [payments[date][2] for date in dates]
+    }
+
+
+def parse_payments_table(rows):
+    """Ставка купона и график платежей из строк таблицы 'Платежи'"""
+    return {'coupon_rate': parse_coupon_rate(rows), 'schedule': parse_payment_schedule(rows)}
+
+
+def parse_page_count(text, hrefs):
+    """Общее количество облигаций из текста страницы и максимальный номер страницы из ссылок пагинации"""
+    match = TOTAL_COUNT_RE.search(text)
+    page_numbers = [int(page_match.group(1)) for page_match in map(PAGE_PARAM_RE.search, hrefs) if page_match]
+    return {
+        'total': int(match.group(1)) if match else None,
+        'max_page': max(page_numbers) if page_numbers else None
+    }
+
+
+def parse_rating_grade(text):
+    """Рейтинг из текста ячейки в шкале sort_bonds ('ruAA-' -> 'AA-'); None, если рейтинга нет"""
+    match = RATING_GRADE_RE.search(text)
+    return match.group(1) + match.group(2) if match else None
+
+
+def find_isin(cells):
+    """ISIN облигации в строке списка: в ссылке на ее страницу или в тексте ячейки"""
+    for text, hrefs, _ in cells:
+        for value in (*hrefs, text):
+            match = ISIN_RE.search(value)
+            if match:
+                return match.group(1)
+    return None
+
+
+def parse_rating_rows(headers, rows, hrefs):
+    """Рейтинги из таблицы списка облигаций smart-lab: headers - заголовки столбцов, rows - ячейки каждой строки
+    в виде (текст, ссылки, классы элементов ячейки), hrefs - все ссылки страницы для пагинации.
+    Возвращает словарь ISIN -> (рейтинг, цвет) и номер последней страницы списка"""
+    page_numbers = [int(match.group(1)) for match in map(LIST_PAGE_RE.search, hrefs) if match]
+    listing = {'ratings': {}, 'max_page': max(page_numbers) if page_numbers else None}
+    rating_column = next((index for index, header in enumerate(headers) if 'рейтинг' in header.lower()), None)
+    if rating_column is None:
+        return listing
+
+    for cells in rows:
+        if len(cells) <= rating_column:
+            continue
+        isin = find_isin(cells)
+        rating_text, _, classes = cells[rating_column]
+        rating = parse_rating_grade(rating_text)
+        if isin is None or rating is None:
+            # Облигации без рейтинга в списке проверяются по их странице
+            continue
+        # Цвет берется из оформления ячейки, если он там есть, иначе по шкале рейтинга
+        color = next((name for css_class, name in RATING_COLORS if css_class in classes),
+                     RATING_GRADE_COLORS.get(rating, LOW_RATING_COLOR))
+        listing['ratings'][isin] = (rating, color)
+    return listing
+
+
+class SoupParser:
+    """Разбор страниц через BeautifulSoup (html.parser) - исходная реализация, не требует C-библиотек"""
+
+    name = 'bs4'
+
+    def __init__(self, features='html.parser'):
+        self.features = features
+
+    def soup(self, html):
+        return BeautifulSoup(html, self.features)
+
+    def find_table(self, soup, *required_headers):
+        """Первая таблица, в заголовках которой есть все указанные столбцы"""
+        for table in soup.find_all('table'):
+            header_texts = [header.get_text(strip=True) for header in table.find_all('th')]
+            if all(header in header_texts for header in required_headers):
+                return table
+        return None
+
+    def parse_listing(self, html):
+        """Строки таблицы облигаций (тексты ячеек и ссылка во второй ячейке) и данные для пагинации"""
+        soup = self.soup(html)
+        listing = parse_page_count(soup.get_text(' ', strip=True),
+                                   [link['href'] for link in soup.find_all('a', href=True)])
+        table = self.find_table(soup, '№')
+        if table is None:
+            listing['rows'] = None
+            return listing
+
+        listing['rows'] = []
+        for row in table.find_all('tr'):
+            # Пропускаем строку, если это заголовок
+            if row.find('th'):
+                continue
+            cells = row.find_all('td')
+            link_element = cells[1].find('a') if len(cells) > 1 else None
+            href = link_element.get('href') if link_element else None
+            listing['rows'].append(([cell.get_text(strip=True) for cell in cells], href))
+        return listing
+
+    def payments_rows(self, table):
+        return [
+            ([header.get_text(strip=True) for header in row.find_all('th')],
+             [cell.text.strip() for cell in row.find_all('td')])
+            for row in table.find_all('tr')
+        ]
+
+    def parse_payments(self, html):
+        """Ставка купона и график платежей со страницы (вкладки) 'Платежи'"""
+        table = self.find_table(self.soup(html), 'Купоны', 'Погашение')
+        return parse_payments_table(self.payments_rows(table)) if table is not None else dict(NO_PAYMENTS)
+
+    def parse_detail(self, html):
+        """ISIN, признак оферты, ссылка на вкладку 'Платежи', ставка купона и график платежей,
+        если таблица платежей есть на странице"""
+        soup = self.soup(html)
+
+        isin = None
+        info_div = soup.find('div', class_='info')
+        if info_div:
+            for td in info_div.find_all('td'):
+                if 'ISIN код:' in td.text:
+                    isin_span = td.find('span')
+                    if isin_span:
+                        isin = isin_span.text.strip()
+                        break
+
+        payments_link = soup.find('a', string=lambda text: text and 'Платежи' in text)
+        table = self.find_table(soup, 'Купоны', 'Погашение')
+        details = {
+            'isin': isin,
+            'has_offer': soup.find('a', string='Оферты') is not None,
+            'payments_href': payments_link.get('href') if payments_link else None,
+            'has_payments': table is not None
+        }
+        details.update(parse_payments_table(self.payments_rows(table)) if table is not None else NO_PAYMENTS)
+        return details
+
+    def parse_rating(self, html):
+        """Рейтинг и цвет из прогресс-бара на странице облигации smart-lab"""
+        soup = self.soup(html)
+
+        # Ищем блок с рейтингом по тексту
+        rating_text = soup.find(string=lambda text: text and 'рейтинг' in text.lower())
+        rating_parent = rating_text.find_parent('div') if rating_text else None
+        if not rating_parent:
+            return NO_DATA, NO_DATA
+
+        # Ищем прогресс-бар с рейтингом в блоке или в следующих за ним элементах
+        progress_bar = rating_parent.find('div', class_=RATING_BAR_CLASS) or \
+            rating_parent.find_next('div', class_=RATING_BAR_CLASS)
+        rating_filled = progress_bar.find('div', class_=RATING_FILLED_CLASS) if progress_bar else None
+        if not rating_filled:
+            return NO_DATA, NO_DATA
+
+        classes = rating_filled.get('class', [])
+        color = next((name for css_class, name in RATING_COLORS if css_class in classes), NO_DATA)
+        rating_text = rating_filled.find('div', class_=RATING_TEXT_CLASS)
+        return (rating_text.get_text(strip=True) if rating_text else NO_DATA), color
+
+    def parse_rating_list(self, html):
+        """Рейтинги облигаций со страницы списка облигаций smart-lab и номер последней страницы списка"""
+        soup = self.soup(html)
+        hrefs = [link['href'] for link in soup.find_all('a', href=True)]
+        for table in soup.find_all('table'):
+            headers = [header.get_text(strip=True) for header in table.find_all('th')]
+            if not any('рейтинг' in header.lower() for header in headers):
+                continue
+            rows = []
+            for row in table.find_all('tr'):
+                if row.find('th'):
+                    continue
+                rows.append([
+                    (cell.get_text(strip=True), [link['href'] for link in cell.find_all('a', href=True)],
+                     [css_class for element in [cell, *cell.find_all(True)] for css_class in element.get('class', [])])
+                    for cell in row.find_all('td')
+                ])
+            return parse_rating_rows(headers, rows, hrefs)
+        return parse_rating_rows([], [], hrefs)
+
+
+def has_class(css_class):
+    """XPath-условие наличия класса у элемента"""
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {css_class} ')"
+
+
+class LxmlParser:
+    """Разбор страниц через lxml с заранее скомпилированными XPath-выражениями"""
+
+    name = 'lxml'
+
+    def __init__(self):
+        from lxml import etree, html as lxml_html
+
+        self.lxml_html = lxml_html
+        self.parser = lxml_html.HTMLParser(remove_comments=True)
+        self.bytes_parser = lxml_html.HTMLParser(remove_comments=True, encoding='utf-8')
+        xpath = etree.XPath
+        self.tables = xpath('//table')
+        self.headers = xpath('.//th')
+        self.rows = xpath('.//tr')
+        self.row_cells = xpath('.//td')
+        self.hrefs = xpath('//a/@href')
+        self.first_link = xpath('(.//a)[1]')
+        self.info_cells = xpath(f"//div[{has_class('info')}]//td[contains(., 'ISIN код:')]")
+        self.first_span = xpath('(.//span)[1]')
+        self.offer_link = xpath("//a[normalize-space(.)='Оферты']")
+        self.payments_link = xpath("(//a[contains(., 'Платежи')])[1]")
+        self.rating_block = xpath(
+            "(//*[text()[contains(translate(., 'РЕЙТИНГ', 'рейтинг'), 'рейтинг')]])[1]/ancestor-or-self::div[1]"
+        )
+        self.inner_bar = xpath(f".//div[{has_class(RATING_BAR_CLASS)}]")
+        self.next_bar = xpath(f"following::div[{has_class(RATING_BAR_CLASS)}][1]")
+        self.rating_filled = xpath(f"(.//div[{has_class(RATING_FILLED_CLASS)}])[1]")
+        self.rating_value = xpath(f"(.//div[{has_class(RATING_TEXT_CLASS)}])[1]")
+        self.cell_hrefs = xpath('.//a/@href')
+        self.cell_classes = xpath('descendant-or-self::*/@class')
+
+    def document(self, html):
+        if not html or not html.strip():
+            return None
+        try:
+            return self.lxml_html.document_fromstring(html, parser=self.parser)
+        except ValueError:
+            # lxml не принимает строки с XML-объявлением кодировки
+            return self.lxml_html.document_fromstring(html.encode('utf-8'), parser=self.bytes_parser)
+
+    def text(self, element):
+        """Аналог get_text(strip=True): фрагменты текста без пробелов по краям, склеенные без разделителя"""
+        return ''.join(fragment.strip() for fragment in element.itertext())
+
+    def find_table(self, document, *required_headers):
+        for table in self.tables(document):
+            header_texts = [self.text(header) for header in self.headers(table)]
+            if all(header in header_texts for header in required_headers):
+                return table
+        return None
+
+    def parse_listing(self, html):
+        """Строки таблицы облигаций (тексты ячеек и ссылка во второй ячейке) и данные для пагинации"""
+        document = self.document(html)
+        if document is None:
+            return {'total': None, 'max_page': None, 'rows': None}
+        listing = parse_page_count(' '.join(document.text_content().split()), self.hrefs(document))
+        table = self.find_table(document, '№')
+        if table is None:
+            listing['rows'] = None
+            return listing
+
+        listing['rows'] = []
+        for row in self.rows(table):
+            if self.headers(row):
+                continue
+            cells = self.row_cells(row)
+            links = self.first_link(cells[1]) if len(cells) > 1 else []
+            href = links[0].get('href') if links else None
+            listing['rows'].append(([self.text(cell) for cell in cells], href))
+        return listing
+
+    def payments_rows(self, table):
+        return [
+            ([self.text(header) for header in self.headers(row)],
+             [cell.text_content().strip() for cell in self.row_cells(row)])
+            for row in self.rows(table)
+        ]
+
+    def parse_payments(self, html):
+        """Ставка купона и график платежей со страницы (вкладки) 'Платежи'"""
+        document = self.document(html)
+        table = self.find_table(document, 'Купоны', 'Погашение') if document is not None else None
+        return parse_payments_table(self.payments_rows(table)) if table is not None else dict(NO_PAYMENTS)
+
+    def parse_detail(self, html):
+        """ISIN, признак оферты, ссылка на вкладку 'Платежи', ставка купона и график платежей,
+        если таблица платежей есть на странице"""
+        document = self.document(html)
+        if document is None:
+            return dict(NO_PAYMENTS, isin=None, has_offer=False, payments_href=None, has_payments=False)
+
+        isin = None
+        for td in self.info_cells(document):
+            spans = self.first_span(td)
+            if spans:
+                isin = spans[0].text_content().strip()
+                break
+
+        payments_link = self.payments_link(document)
+        table = self.find_table(document, 'Купоны', 'Погашение')
+        details = {
+            'isin': isin,
+            'has_offer': bool(self.offer_link(document)),
+            'payments_href': payments_link[0].get('href') if payments_link else None,
+            'has_payments': table is not None
+        }
+        details.update(parse_payments_table(self.payments_rows(table)) if table is not None else NO_PAYMENTS)
+        return details
+
+    def parse_rating(self, html):
+        """Рейтинг и цвет из прогресс-бара на странице облигации smart-lab"""
+        document = self.document(html)
+        blocks = self.rating_block(document) if document is not None else []
+        if not blocks:
+            return NO_DATA, NO_DATA
+
+        progress_bar = (self.inner_bar(blocks[0]) or self.next_bar(blocks[0]) or [None])[0]
+        rating_filled = self.rating_filled(progress_bar) if progress_bar is not None else []
+        if not rating_filled:
+            return NO_DATA, NO_DATA
+
+        classes = (rating_filled[0].get('class') or '').split()
+        color = next((name for css_class, name in RATING_COLORS if css_class in classes), NO_DATA)
+        rating_text = self.rating_value(rating_filled[0])
+        return (self.text(rating_text[0]) if rating_text else NO_DATA), color
+
+    def parse_rating_list(self, html):
+        """Рейтинги облигаций со страницы списка облигаций smart-lab и номер последней страницы списка"""
+        document = self.document(html)
+        if document is None:
+            return parse_rating_rows([], [], [])
+        hrefs = self.hrefs(document)
+        for table in self.tables(document):
+            headers = [self.text(header) for header in self.headers(table)]
+            if not any('рейтинг' in header.lower() for header in headers):
+                continue
+            rows = [
+                [(self.text(cell), self.cell_hrefs(cell),
+                  [css_class for classes in self.cell_classes(cell) for css_class in classes.split()])
+                 for cell in self.row_cells(row)]
+                for row in self.rows(table) if not self.headers(row)
+            ]
+            return parse_rating_rows(headers, rows, hrefs)
+        return parse_rating_rows([], [], hrefs)
+
+
+class SelectolaxParser:
+    """Разбор страниц через selectolax (lexbor) по CSS-селекторам"""
+
+    name = 'selectolax'
+
+    def __init__(self):
+        from selectolax.lexbor import LexborHTMLParser
+
+        self.html_parser = LexborHTMLParser
+
+    def document(self, html):
+        return self.html_parser(html or '')
+
+    def text(self, node):
+        return node.text(deep=True, separator='', strip=True)
+
+    def find_table(self, document, *required_headers):
+        for table in document.css('table'):
+            header_texts = [self.text(header) for header in table.css('th')]
+            if all(header in header_texts for header in required_headers):
+                return table
+        return None
+
+    def parse_listing(self, html):
+        """Строки таблицы облигаций (тексты ячеек и ссылка во второй ячейке) и данные для пагинации"""
+        document = self.document(html)
+        body = document.body
+        text = ' '.join(body.text(separator=' ').split()) if body is not None else ''
+        listing = parse_page_count(text, [link.attributes.get('href') or '' for link in document.css('a[href]')])
+        table = self.find_table(document, '№')
+        if table is None:
+            listing['rows'] = None
+            return listing
+
+        listing['rows'] = []
+        for row in table.css('tr'):
+            if row.css_first('th') is not None:
+                continue
+            cells = row.css('td')
+            link_element = cells[1].css_first('a') if len(cells) > 1 else None
+            href = link_element.attributes.get('href') if link_element is not None else None
+            listing['rows'].append(([self.text(cell) for cell in cells], href))
+        return listing
+
+    def payments_rows(self, table):
+        return [
+            ([self.text(header) for header in row.css('th')],
+             [cell.text(deep=True).strip() for cell in row.css('td')])
+            for row in table.css('tr')
+        ]
+
+    def parse_payments(self, html):
+        """Ставка купона и график платежей со страницы (вкладки) 'Платежи'"""
+        table = self.find_table(self.document(html), 'Купоны', 'Погашение')
+        return parse_payments_table(self.payments_rows(table)) if table is not None else dict(NO_PAYMENTS)
+
+    def parse_detail(self, html):
+        """ISIN, признак оферты, ссылка на вкладку 'Платежи', ставка купона и график платежей,
+        если таблица платежей есть на странице"""
+        document = self.document(html)
+
+        isin = None
+        for td in document.css('div.info td'):
+            if 'ISIN код:' in td.text(deep=True):
+                isin_span = td.css_first('span')
+                if isin_span is not None:
+                    isin = isin_span.text(deep=True).strip()
+                    break
+
+        links = document.css('a')
+        payments_link = next((link for link in links if 'Платежи' in link.text(deep=True)), None)
+        table = self.find_table(document, 'Купоны', 'Погашение')
+        details = {
+            'isin': isin,
+            'has_offer': any(link.text(deep=True).strip() == 'Оферты' for link in links),
+            'payments_href': payments_link.attributes.get('href') if payments_link is not None else None,
+            'has_payments': table is not None
+        }
+        details.update(parse_payments_table(self.payments_rows(table)) if table is not None else NO_PAYMENTS)
+        return details
+
+    def parse_rating(self, html):
+        """Рейтинг и цвет из прогресс-бара на странице облигации smart-lab"""
+        document = self.document(html)
+        progress_bar = None
+        rating_block = None
+        # Обход узлов в порядке документа: первый текст со словом 'рейтинг', затем прогресс-бар в его блоке или после него
+        for node in document.root.traverse(include_text=True) if document.root is not None else []:
+            if rating_block is None:
+                if node.tag == '-text' and 'рейтинг' in (node.text_content or '').lower():
+                    rating_block = node.parent
+                    while rating_block is not None and rating_block.tag != 'div':
+                        rating_block = rating_block.parent
+                    if rating_block is None:
+                        return NO_DATA, NO_DATA
+                    progress_bar = rating_block.css_first(f'div.{RATING_BAR_CLASS}')
+                    if progress_bar is not None:
+                        break
+            elif node.tag == 'div' and RATING_BAR_CLASS in (node.attributes.get('class') or '').split():
+                progress_bar = node
+                break
+
+        rating_filled = progress_bar.css_first(f'div.{RATING_FILLED_CLASS}') if progress_bar is not None else None
+        if rating_filled is None:
+            return NO_DATA, NO_DATA
+
+        classes = (rating_filled.attributes.get('class') or '').split()
+        color = next((name for css_class, name in RATING_COLORS if css_class in classes), NO_DATA)
+        rating_text = rating_filled.css_first(f'div.{RATING_TEXT_CLASS}')
+        return (self.text(rating_text) if rating_text is not None else NO_DATA), color
+
+    def parse_rating_list(self, html):
+        """Рейтинги облигаций со страницы списка облигаций smart-lab и номер последней страницы списка"""
+        document = self.document(html)
+        hrefs = [link.attributes.get('href') or '' for link in document.css('a[href]')]
+        for table in document.css('table'):
+            headers = [self.text(header) for header in table.css('th')]
+            if not any('рейтинг' in header.lower() for header in headers):
+                continue
+            rows = [
+                [(self.text(cell), [link.attributes.get('href') or '' for link in cell.css('a[href]')],
+                  [css_class for element in [cell, *cell.css('*')]
+                   for css_class in (element.attributes.get('class') or '').split()])
+                 for cell in row.css('td')]
+                for row in table.css('tr') if row.css_first('th') is None
+            ]
+            return parse_rating_rows(headers, rows, hrefs)
+        return parse_rating_rows([], [], hrefs)
+
+
+class MeasuredParser:
+    """Парсер с замером времени разбора страниц каждого типа в метрики"""
+
+    def __init__(self, parser):
+        self.parser = parser
+
+    def __getattr__(self, name):
+        method = getattr(self.parser, name)
+        if not name.startswith('parse_'):
+            return method
+        page = name[len('parse_'):]
+
+        def measured(html):
+            start = time.perf_counter()
+            try:
+                return method(html)
+            finally:
+                METRICS.observe('parse_seconds', time.perf_counter() - start, parser=self.parser.name, page=page)
+        return measured
+
+
+PARSER_BACKENDS = {
+    LxmlParser.name: LxmlParser,
+    SelectolaxParser.name: SelectolaxParser,
+    SoupParser.name: SoupParser
+}
+
+_parsers = {}
+
+
+def create_parser(backend='lxml'):
+    """Парсер страниц по имени. Если библиотека не установлена, используется BeautifulSoup"""
+    if backend not in PARSER_BACKENDS:
+        raise ValueError(f"Неизвестный парсер: {backend}. Доступны: {', '.join(PARSER_BACKENDS)}")
+    if backend not in _parsers:
+        try:
+            _parsers[backend] = MeasuredParser(PARSER_BACKENDS[backend]())
+        except ImportError:
+            logging.warning(f"Библиотека для парсера '{backend}' не установлена, используется BeautifulSoup")
+            _parsers[backend] = create_parser(SoupParser.name)
+    return _parsers[backend]
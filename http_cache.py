@@ -0,0 +1,147 @@
+import os
+import logging
+import sqlite3
+import threading
+import time
+
+# Время жизни закэшированных страниц по префиксу адреса (в секундах)
+CACHE_TTLS = {
+    'https://bonds.finam.ru/issue/details': 24 * 3600,  # Страницы облигаций и вкладки платежей
+    'https://smart-lab.ru/q/bonds/': 12 * 3600  # Страницы рейтингов
+}
+DEFAULT_TTL = 3600
+EVICT_BATCH = 100  # Сколько самых давно использованных страниц читается за один запрос при вытеснении
+EVICT_TO = 0.9  # Вытеснение освобождает место до этой доли размера кэша, чтобы не повторяться на каждой странице
+
+
+class ResponseCache:
+    """Кэш HTTP-ответов на диске (SQLite) с временем жизни и повторной проверкой по ETag/Last-Modified"""
+
+    def __init__(self, path="./output/http_cache.sqlite", ttls=None, default_ttl=DEFAULT_TTL, max_size_mb=200):
+        self.path = path
+        self.ttls = CACHE_TTLS if ttls is None else ttls
+        self.default_ttl = default_ttl
+        self.max_size = max_size_mb * 1024 * 1024
+        self.lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'revalidated': 0, 'stored': 0, 'evicted': 0}
+
+        cache_dir = os.path.dirname(path)
+        if cache_dir and not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                url TEXT PRIMARY KEY,
+                body TEXT NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                fetched_at REAL NOT NULL,
+                last_access REAL NOT NULL,
+                size INTEGER NOT NULL
+            )
+        """)
+        self.connection.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses (last_access)")
+        self.connection.commit()
+        # Размер кэша считается один раз и дальше обновляется при сохранении и вытеснении страниц
+        self.total_size = self.table_size()
+
+    def table_size(self):
+        return self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def get_ttl(self, url):
+        """Время жизни страницы по самому длинному подходящему префиксу адреса"""
+        matches = [prefix for prefix in self.ttls if url.startswith(prefix)]
+        if not matches:
+            return self.default_ttl
+        return self.ttls[max(matches, key=len)]
+
+    def lookup(self, url):
+        """Поиск страницы в кэше. Возвращает словарь с признаком свежести или None"""
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT body, etag, last_modified, fetched_at FROM responses WHERE url = ?", (url,)
+            ).fetchone()
+            if row is None:
+                self.stats['misses'] += 1
+                return None
+
+            body, etag, last_modified, fetched_at = row
+            now = time.time()
+            fresh = now - fetched_at < self.get_ttl(url)
+            if fresh:
+                self.stats['hits'] += 1
+                self.connection.execute("UPDATE responses SET last_access = ? WHERE url = ?", (now, url))
+                self.connection.commit()
+            else:
+                self.stats['misses'] += 1
+            return {'body': body, 'etag': etag, 'last_modified': last_modified, 'fresh': fresh}
+
+    def conditional_headers(self, entry):
+        """Заголовки для повторной проверки устаревшей страницы"""
+        headers = {}
+        if entry:
+            if entry['etag']:
+                headers['If-None-Match'] = entry['etag']
+            if entry['last_modified']:
+                headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def revalidated(self, url):
+        """Продление жизни страницы после ответа 304 Not Modified"""
+        now = time.time()
+        with self.lock:
+            self.stats['revalidated'] += 1
+            self.connection.execute(
+                "UPDATE responses SET fetched_at = ?, last_access = ? WHERE url = ?", (now, now, url)
+            )
+            self.connection.commit()
+
+    def store(self, url, body, etag=None, last_modified=None):
+        """Сохранение страницы в кэш с вытеснением давно не использованных записей"""
+        now = time.time()
+        size = len(body.encode('utf-8'))
+        with self.lock:
+            self.stats['stored'] += 1
+            previous = self.connection.execute("SELECT size FROM responses WHERE url = ?", (url,)).fetchone()
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses (url, body, etag, last_modified, fetched_at, last_access, size) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (url, body, etag, last_modified, now, now, size)
+            )
+            self.total_size += size - (previous[0] if previous else 0)
+            if self.total_size > self.max_size:
+                self.evict()
+            self.connection.commit()
+
+    def evict(self):
+        """Удаление давно не использованных страниц при превышении размера кэша (вызывается под блокировкой).
+        Размер пересчитывается по таблице: кэш могут пополнять другие процессы"""
+        self.total_size = self.table_size()
+        target = self.max_size * EVICT_TO if self.total_size > self.max_size else self.max_size
+        while self.total_size > target:
+            rows = self.connection.execute("SELECT url, size FROM responses ORDER BY last_access LIMIT ?",
+                                           (EVICT_BATCH,)).fetchall()
+            if not rows:
+                break
+            for url, size in rows:
+                if self.total_size <= target:
+                    break
+                self.connection.execute("DELETE FROM responses WHERE url = ?", (url,))
+                self.total_size -= size
+                self.stats['evicted'] += 1
+
+    def get_stats(self):
+        """Счетчики попаданий и промахов кэша"""
+        with self.lock:
+            return dict(self.stats)
+
+    def close(self):
+        """Закрытие базы кэша"""
+        stats = self.get_stats()
+        logging.info(f"Кэш HTTP-ответов: попаданий {stats['hits']}, промахов {stats['misses']}, "
+                     f"подтверждено сервером {stats['revalidated']}, сохранено {stats['stored']}, "
+                     f"вытеснено {stats['evicted']}")
+        with self.lock:
+            self.connection.close()
@@ -0,0 +1,226 @@
+import re
+import os
+import csv
+import time
+import logging
+import argparse
+from collections import Counter
+from fetchers import HttpFetcher
+from metrics import METRICS
+from log_setup import setup_logging
+
+DEFAULT_REFERENCE_FILE = "./output/moex_securities.csv"
+# Облигации Московской биржи одной таблицей ISS (без постраничной загрузки)
+MOEX_SECURITIES_URL = ("https://iss.moex.com/iss/engines/stock/markets/bonds/securities.csv?iss.only=securities"
+                       "&securities.columns=SECID,SHORTNAME,SECNAME,LATNAME,ISIN,REGNUMBER")
+NAME_COLUMNS = ['SHORTNAME', 'SECNAME', 'NAME', 'LATNAME']
+NGRAM_SIZE = 3
+MIN_SCORE = 0.5  # Минимальная похожесть названий (коэффициент Дайса по триграммам)
+AMBIGUITY_MARGIN = 0.05  # Если второй кандидат почти так же похож, ISIN не подставляется
+
+# Кириллические буквы, которые в названиях выпусков пишут и латиницей (003Р-13 и 003P-13)
+LOOKALIKES = str.maketrans('АВЕКМНОРСТУХ', 'ABEKMHOPCTYX')
+# Слова, которые не помогают различать выпуски
+STOP_WORDS = {'ПАО', 'АО', 'ОАО', 'ЗАО', 'ООО', 'БАНК', 'БО', 'ПБО', 'ОБЛ', 'PAO', 'AO', 'OOO', 'BANK', 'BO'}
+TOKEN_RE = re.compile(r'[0-9A-ZА-Я]+')
+NUMBER_RE = re.compile(r'\d+')
+LEADING_ZEROS_RE = re.compile(r'^0+(?=\d)')
+ISIN_RE = re.compile(r'(?<![0-9A-Z])([A-Z]{2}[0-9A-Z]{9}\d)(?![0-9A-Z])')
+# Регистрационный номер выпуска: 4B02-13-00003-B-001P, 4-01-36400-R
+REGNUMBER_RE = re.compile(r'(?<![0-9A-Z])(\d[0-9A-Z]{0,3}-\d{2}-\d{5}-[A-Z](?:-\d{3}P)?)(?![0-9A-Z-])')
+
+
+def normalize(name):
+    """Название для сравнения: заглавные буквы, без знаков препинания, общих слов и ведущих нулей в номерах
+    (003Р-01 и 3P-1 совпадают), латиница вместо похожей кириллицы"""
+    tokens = TOKEN_RE.findall(name.upper().replace('Ё', 'Е'))
+    return ' '.join(LEADING_ZEROS_RE.sub('', token) for token in tokens
+                    if token not in STOP_WORDS).translate(LOOKALIKES)
+
+
+def normalize_code(code):
+    return code.upper().replace(' ', '').translate(LOOKALIKES)
+
+
+def ngrams(text):
+    """Триграммы названия (с границами слов)"""
+    text = f" {text} "
+    return {text[i:i + NGRAM_SIZE] for i in range(len(text) - NGRAM_SIZE + 1)}
+
+
+def issue_numbers(text):
+    """Числа нормализованного названия по порядку (номер программы и выпуска): '3P 13' дает (3, 13)"""
+    return tuple(int(number) for number in NUMBER_RE.findall(text))
+
+
+def contains_numbers(numbers, entry_numbers):
+    """Все числа названия встречаются в названии справочника в том же порядке"""
+    remaining = iter(entry_numbers)
+    return all(number in remaining for number in numbers)
+
+
+def read_reference(path):
+    """Строки CSV-справочника бумаг (словари с заглавными названиями колонок). Выгрузка ISS начинается с
+    названия таблицы, поэтому заголовком считается первая строка с колонкой ISIN"""
+    with open(path, 'rb') as infile:
+        content = infile.read()
+    try:
+        text = content.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        text = content.decode('cp1251')  # Кодировка ISS по умолчанию
+    lines = text.splitlines()
+    header = next((number for number, line in enumerate(lines)
+                   if 'ISIN' in (column.strip().upper() for column in line.split(';'))), None)
+    if header is None:
+        raise ValueError(f"В файле {path} нет колонки ISIN")
+    for row in csv.DictReader(lines[header:], delimiter=';'):
+        yield {(key or '').strip().upper(): (value or '').strip() for key, value in row.items()}
+
+
+class IsinResolver:
+    """Поиск ISIN по локальному справочнику бумаг: точный - по регистрационному номеру, тикеру и названию
+    (словари), нечеткий - по триграммам названия (заранее построенный индекс триграмма -> названия)"""
+
+    def __init__(self, min_score=MIN_SCORE):
+        self.min_score = min_score
+        self.isins = set()
+        self.by_regnumber = {}
+        self.by_ticker = {}
+        self.by_name = {}
+        self.entries = []  # Названия: (ISIN, количество триграмм, числа в названии)
+        self.ngrams = {}  # Триграмма -> номера названий в entries
+
+    def add(self, isin, ticker=None, regnumber=None, names=()):
+        """Добавление бумаги; повторные строки (например, разные режимы торгов) пропускаются"""
+        if not isin or isin in self.isins:
+            return
+        self.isins.add(isin)
+        if ticker:
+            self.by_ticker.setdefault(normalize_code(ticker), isin)
+        if regnumber:
+            self.by_regnumber.setdefault(normalize_code(regnumber), isin)
+        for normalized in {normalize(name) for name in names if name}:
+            if not normalized:
+                continue
+            self.by_name.setdefault(normalized, isin)
+            entry = len(self.entries)
+            grams = ngrams(normalized)
+            self.entries.append((isin, len(grams), issue_numbers(normalized)))
+            for gram in grams:
+                self.ngrams.setdefault(gram, []).append(entry)
+
+    @classmethod
+    def load(cls, path=DEFAULT_REFERENCE_FILE, min_score=MIN_SCORE):
+        """Справочник из CSV-файла бумаг (выгрузка ISS Московской биржи или таблица с колонками ISIN, SECID,
+        REGNUMBER и названиями SHORTNAME, SECNAME, NAME, LATNAME)"""
+        started = time.perf_counter()
+        resolver = cls(min_score)
+        for row in read_reference(path):
+            resolver.add(row.get('ISIN'), row.get('SECID'), row.get('REGNUMBER'),
+                         [row[column] for column in NAME_COLUMNS if row.get(column)])
+        logging.info(f"Справочник {path}: {len(resolver.isins)} бумаг, {len(resolver.entries)} названий, "
+                     f"загружен за {(time.perf_counter() - started) * 1000:.0f} мс")
+        return resolver
+
+    def match_name(self, normalized):
+        """Самое похожее название справочника с теми же номерами программы и выпуска: (ISIN, похожесть) или None"""
+        grams = ngrams(normalized)
+        shared = Counter()
+        for gram in grams:
+            shared.update(self.ngrams.get(gram, ()))
+        numbers = issue_numbers(normalized)
+        scores = {}
+        for entry, count in shared.items():
+            isin, size, entry_numbers = self.entries[entry]
+            if not contains_numbers(numbers, entry_numbers):
+                continue
+            score = 2 * count / (len(grams) + size)
+            if score > scores.get(isin, 0):
+                scores[isin] = score
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        if not ranked or ranked[0][1] < self.min_score:
+            return None
+        if len(ranked) > 1 and ranked[1][1] > ranked[0][1] - AMBIGUITY_MARGIN:
+            logging.warning(f"Название '{normalized}' одинаково похоже на {ranked[0][0]} и {ranked[1][0]}, "
+                            "ISIN не подставлен")
+            return None
+        return ranked[0]
+
+    def resolve(self, name):
+        """ISIN облигации по названию из списка finam: (ISIN, способ, похожесть) или None"""
+        text = name.upper().translate(LOOKALIKES)
+        result = None
+        isin = ISIN_RE.search(text)
+        if isin:
+            result = (isin.group(1), 'isin', 1.0)
+        for code in REGNUMBER_RE.findall(text) if result is None else ():
+            if code in self.by_regnumber:
+                result = (self.by_regnumber[code], 'regnumber', 1.0)
+                break
+        for token in TOKEN_RE.findall(text) if result is None else ():
+            if len(token) >= 6 and token in self.by_ticker:
+                result = (self.by_ticker[token], 'ticker', 1.0)
+                break
+        normalized = normalize(name)
+        if result is None and normalized in self.by_name:
+            result = (self.by_name[normalized], 'name', 1.0)
+        if result is None and normalized:
+            match = self.match_name(normalized)
+            if match:
+                result = (match[0], 'fuzzy', round(match[1], 3))
+        METRICS.inc('isin_resolved', method=result[1] if result else 'not_found')
+        return result
+
+    def resolve_many(self, names):
+        """ISIN для списка названий за один проход: словарь название -> (ISIN, способ, похожесть) или None"""
+        started = time.perf_counter()
+        results = {name: self.resolve(name) for name in dict.fromkeys(names)}
+        found = sum(1 for result in results.values() if result)
+        logging.info(f"ISIN найден в справочнике для {found} из {len(results)} облигаций "
+                     f"за {(time.perf_counter() - started) * 1000:.1f} мс")
+        return results
+
+
+def load_resolver(path=DEFAULT_REFERENCE_FILE):
+    """Справочник бумаг или None, если файл не загружен"""
+    if not os.path.exists(path):
+        logging.error(f"Справочник бумаг {path} не найден: загрузите его командой python isin_resolver.py download")
+        return None
+    return IsinResolver.load(path)
+
+
+def download_reference(path=DEFAULT_REFERENCE_FILE, url=MOEX_SECURITIES_URL, fetcher=None):
+    """Загрузка справочника облигаций Московской биржи в локальный файл (UTF-8)"""
+    fetcher = fetcher or HttpFetcher(pool_size=1)
+    try:
+        text = fetcher.fetch(url)
+    finally:
+        fetcher.close()
+    reference_dir = os.path.dirname(path)
+    if reference_dir and not os.path.exists(reference_dir):
+        os.makedirs(reference_dir)
+    with open(path, 'w', encoding='utf-8', newline='') as outfile:
+        outfile.write(text)
+    logging.info(f"Справочник бумаг сохранен в файл {path}")
+    return path
+
+
+if __name__ == '__main__':
+    setup_logging()
+
+    parser = argparse.ArgumentParser(description="Справочник бумаг Московской биржи для поиска ISIN по названию")
+    parser.add_argument('--reference', default=DEFAULT_REFERENCE_FILE, help="Файл справочника (CSV)")
+    commands = parser.add_subparsers(dest='command', required=True)
+    download_parser = commands.add_parser('download', help="Загрузить справочник облигаций с iss.moex.com")
+    download_parser.add_argument('--url', default=MOEX_SECURITIES_URL, help="Адрес выгрузки ISS")
+    resolve_parser = commands.add_parser('resolve', help="Найти ISIN по названиям облигаций")
+    resolve_parser.add_argument('names', nargs='+')
+    args = parser.parse_args()
+
+    if args.command == 'download':
+        download_reference(args.reference, args.url)
+    else:
+        resolver = load_resolver(args.reference)
+        if resolver is not None:
+            for name, result in resolver.resolve_many(args.names).items():
+                print(f"{name}: " + (f"{result[0]} ({result[1]}, {result[2]})" if result else "не найден"))
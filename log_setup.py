@@ -0,0 +1,128 @@
+import os
+import json
+import time
+import queue
+import atexit
+import logging
+import threading
+from logging.handlers import QueueHandler, QueueListener
+
+# Уровень и формат файла логов задаются один раз для всех этапов через переменные окружения
+LOG_LEVEL_ENV = 'BONDS_LOG_LEVEL'  # DEBUG, INFO, WARNING, ERROR
+LOG_FORMAT_ENV = 'BONDS_LOG_FORMAT'  # json (по умолчанию) или text
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+# Поля контекста, которые передаются через extra={...} и попадают в JSON-записи
+CONTEXT_FIELDS = ('stage', 'event', 'bond', 'isin', 'url', 'page', 'host', 'suppressed')
+
+# Прореживание частых событий горячих циклов: событие -> каждое N-е сообщение или не больше N в секунду.
+# Предупреждения и ошибки не прореживаются
+SAMPLING = {
+    'listing_row': {'every': 100},
+    'listing_bond': {'every': 100},
+    'bond_details': {'per_second': 20},
+    'bond_state': {'per_second': 5},
+    'page_wait': {'per_second': 5}
+}
+
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Запись лога одной строкой JSON с полями контекста (облигация, ISIN, этап)"""
+
+    def format(self, record):
+        data = {
+            'time': f"{self.formatTime(record, '%Y-%m-%dT%H:%M:%S')}.{int(record.msecs):03d}",
+            'level': record.levelname,
+            'thread': record.threadName,
+            'message': record.getMessage()
+        }
+        for field in CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                data[field] = value
+        if record.exc_info:
+            data['exception'] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """Прореживание событий из SAMPLING до постановки в очередь; число пропущенных сообщений
+    записывается в поле suppressed следующего пропущенного фильтром сообщения"""
+
+    def __init__(self, rules=SAMPLING):
+        super().__init__()
+        self.rules = rules
+        self.lock = threading.Lock()
+        self.events = {}  # Событие -> счетчики и токены
+
+    def filter(self, record):
+        event = getattr(record, 'event', None)
+        rule = self.rules.get(event) if event else None
+        if rule is None or record.levelno >= logging.WARNING:
+            return True
+
+        with self.lock:
+            state = self.events.setdefault(event, {'seen': 0, 'suppressed': 0,
+                                                   'tokens': rule.get('per_second', 0), 'updated': time.monotonic()})
+            state['seen'] += 1
+            if 'every' in rule:
+                passed = (state['seen'] - 1) % rule['every'] == 0
+            else:
+                now = time.monotonic()
+                state['tokens'] = min(rule['per_second'],
+                                      state['tokens'] + (now - state['updated']) * rule['per_second'])
+                state['updated'] = now
+                passed = state['tokens'] >= 1
+                if passed:
+                    state['tokens'] -= 1
+            if not passed:
+                state['suppressed'] += 1
+                return False
+            if state['suppressed']:
+                record.suppressed = state['suppressed']
+                state['suppressed'] = 0
+        return True
+
+
+def setup_logging(log_file=None, level=logging.INFO):
+    """Настройка логирования процесса: потоки только ставят записи в очередь, вывод в консоль и файл
+    выполняет отдельный поток. Как и basicConfig, действует только первый вызов в процессе"""
+    global _listener
+    root = logging.getLogger()
+    if _listener is not None or root.handlers:
+        return
+
+    console = logging.StreamHandler()
+    console.setFormatter(logging.Formatter(TEXT_FORMAT))
+    handlers = [console]
+    if log_file:
+        file_handler = logging.FileHandler(log_file, encoding='utf-8')
+        text = os.environ.get(LOG_FORMAT_ENV, 'json').lower() == 'text'
+        file_handler.setFormatter(logging.Formatter(TEXT_FORMAT) if text else JsonFormatter())
+        handlers.append(file_handler)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter())
+    root.addHandler(queue_handler)
+    root.setLevel(os.environ.get(LOG_LEVEL_ENV, '').upper() or level)
+
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    # Записи, оставшиеся в очереди, выводятся при завершении процесса
+    atexit.register(stop_logging)
+
+
+def set_log_level(level):
+    """Уровень логирования всего процесса (например, из параметра --log-level)"""
+    logging.getLogger().setLevel(level.upper() if isinstance(level, str) else level)
+
+
+def stop_logging():
+    """Остановка потока вывода после записи всех сообщений из очереди"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,247 @@
+import os
+import io
+import sys
+import json
+import time
+import pstats
+import cProfile
+import logging
+import threading
+import tracemalloc
+from contextlib import contextmanager
+
+# Границы интервалов гистограмм длительностей в секундах
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+METRIC_PREFIX = 'bonds_'
+
+
+def label_key(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ''
+    escaped = [(name, value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for name, value in pairs]
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+class Histogram:
+    """Распределение длительностей по интервалам (как гистограмма Prometheus)"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Последний интервал - больше максимальной границы
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """Оценка квантиля сверху: граница интервала, в который попадает q-я доля наблюдений"""
+        if not self.count:
+            return None
+        threshold = q * self.count
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            if cumulative >= threshold:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 6),
+            'avg': round(self.sum / self.count, 6) if self.count else None,
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'max': round(self.max, 6)
+        }
+
+
+class MetricsRegistry:
+    """Счетчики, значения и гистограммы этапов пайплайна (потокобезопасно)"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}  # Имя -> {метки -> значение}
+        self.gauges = {}
+        self.histograms = {}
+
+    def inc(self, name, value=1, **labels):
+        """Увеличение счетчика"""
+        with self.lock:
+            series = self.counters.setdefault(name, {})
+            key = label_key(labels)
+            series[key] = series.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        """Установка значения (например, длительности этапа или потребления памяти)"""
+        with self.lock:
+            self.gauges.setdefault(name, {})[label_key(labels)] = value
+
+    def observe(self, name, seconds, **labels):
+        """Добавление длительности в гистограмму"""
+        with self.lock:
+            series = self.histograms.setdefault(name, {})
+            key = label_key(labels)
+            if key not in series:
+                series[key] = Histogram()
+            series[key].observe(seconds)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Замер длительности блока кода в гистограмму"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def reset(self):
+        with self.lock:
+            self.counters.clear()
+            self.gauges.clear()
+            self.histograms.clear()
+
+    def report(self):
+        """Все метрики в виде словаря для JSON-отчета"""
+        with self.lock:
+            return {
+                'counters': {name: [dict(key, value=value) for key, value in sorted(series.items())]
+                             for name, series in sorted(self.counters.items())},
+                'gauges': {name: [dict(key, value=value) for key, value in sorted(series.items())]
+                           for name, series in sorted(self.gauges.items())},
+                'histograms': {name: [dict(key, **histogram.to_dict()) for key, histogram in sorted(series.items())]
+                               for name, series in sorted(self.histograms.items())}
+            }
+
+    def to_prometheus(self):
+        """Метрики в текстовом формате Prometheus (для node_exporter textfile collector)"""
+        lines = []
+        with self.lock:
+            for name, series in sorted(self.counters.items()):
+                metric = f"{METRIC_PREFIX}{name}_total"
+                lines.append(f"# TYPE {metric} counter")
+                lines.extend(f"{metric}{format_labels(key)} {value}" for key, value in sorted(series.items()))
+            for name, series in sorted(self.gauges.items()):
+                metric = f"{METRIC_PREFIX}{name}"
+                lines.append(f"# TYPE {metric} gauge")
+                lines.extend(f"{metric}{format_labels(key)} {value}" for key, value in sorted(series.items()))
+            for name, series in sorted(self.histograms.items()):
+                metric = f"{METRIC_PREFIX}{name}"
+                lines.append(f"# TYPE {metric} histogram")
+                for key, histogram in sorted(series.items()):
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        cumulative += count
+                        lines.append(f"{metric}_bucket{format_labels(key, [('le', str(bound))])} {cumulative}")
+                    lines.append(f"{metric}_bucket{format_labels(key, [('le', '+Inf')])} {histogram.count}")
+                    lines.append(f"{metric}_sum{format_labels(key)} {histogram.sum}")
+                    lines.append(f"{metric}_count{format_labels(key)} {histogram.count}")
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        """Запись отчета: JSON для файлов *.json, иначе текстовый формат Prometheus"""
+        report_dir = os.path.dirname(path)
+        if report_dir and not os.path.exists(report_dir):
+            os.makedirs(report_dir)
+        # Запись через временный файл, чтобы textfile collector не прочитал файл наполовину
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as report_file:
+            if path.endswith('.json'):
+                json.dump(self.report(), report_file, ensure_ascii=False, indent=2)
+            else:
+                report_file.write(self.to_prometheus())
+        os.replace(temp_path, path)
+        logging.info(f"Метрики сохранены в файл {path}")
+
+
+# Общий реестр метрик процесса
+METRICS = MetricsRegistry()
+
+
+class StageProfiler:
+    """Профилирование этапов по запросу: cProfile (все потоки этапа) и tracemalloc"""
+
+    def __init__(self, output_dir=None, memory=False, top=30):
+        self.output_dir = output_dir  # None - профилирование выключено
+        self.memory = memory
+        self.top = top  # Количество строк в текстовых сводках
+
+        if output_dir and not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+
+    @contextmanager
+    def stage(self, name):
+        """Профилирование блока кода этапа; без каталога профилей только замеряет длительность этапа"""
+        start = time.perf_counter()
+        if not self.output_dir:
+            try:
+                yield
+            finally:
+                METRICS.set('stage_seconds', round(time.perf_counter() - start, 3), stage=name)
+            return
+
+        profiles = [cProfile.Profile()]
+
+        def profile_thread(*args):
+            # Потоки, запущенные во время этапа (пулы загрузки и разбора), профилируются отдельно
+            sys.setprofile(None)
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:
+                # В Python 3.12+ профилировщик один на процесс и уже охватывает все потоки
+                return
+            profiles.append(profile)
+
+        if self.memory:
+            tracemalloc.start()
+        threading.setprofile(profile_thread)
+        profiles[0].enable()
+        try:
+            yield
+        finally:
+            profiles[0].disable()
+            threading.setprofile(None)
+            METRICS.set('stage_seconds', round(time.perf_counter() - start, 3), stage=name)
+            self.dump_cpu(name, profiles)
+            if self.memory:
+                snapshot = tracemalloc.take_snapshot()
+                current, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                METRICS.set('stage_peak_traced_bytes', peak, stage=name)
+                self.dump_memory(name, snapshot, current, peak)
+
+    def dump_cpu(self, name, profiles):
+        """Сохранение профиля (для snakeviz/pstats) и текстовой сводки по суммарному времени функций"""
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            stats.add(profile)
+        path = os.path.join(self.output_dir, f"{name}.prof")
+        stats.dump_stats(path)
+
+        summary = io.StringIO()
+        stats.stream = summary
+        stats.sort_stats('cumulative').print_stats(self.top)
+        with open(os.path.join(self.output_dir, f"{name}.prof.txt"), 'w', encoding='utf-8') as summary_file:
+            summary_file.write(summary.getvalue())
+        logging.info(f"Профиль этапа '{name}' сохранен в файл {path}")
+
+    def dump_memory(self, name, snapshot, current, peak):
+        """Сводка по строкам кода с наибольшим объемом выделенной памяти"""
+        path = os.path.join(self.output_dir, f"{name}.tracemalloc.txt")
+        with open(path, 'w', encoding='utf-8') as memory_file:
+            memory_file.write(f"Текущий объем: {current / 1024 / 1024:.1f} МБ, пик: {peak / 1024 / 1024:.1f} МБ\n\n")
+            for statistic in snapshot.statistics('lineno')[:self.top]:
+                memory_file.write(f"{statistic}\n")
+        logging.info(f"Профиль памяти этапа '{name}' сохранен в файл {path}")
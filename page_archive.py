@@ -0,0 +1,317 @@
+import os
+import gzip
+import uuid
+import base64
+import hashlib
+import logging
+import sqlite3
+import argparse
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta, timezone
+from log_setup import setup_logging
+
+DEFAULT_ARCHIVE_DIR = "./output/archive"
+INDEX_FILE = "index.sqlite"
+COMMIT_EVERY = 50  # Записей индекса между фиксациями транзакции
+COMPRESS_LEVEL = 6
+READ_CHUNK = 64 * 1024  # Размер части файла при последовательном чтении архива
+HTTP_STATUS_TEXT = {200: 'OK', 304: 'Not Modified', 404: 'Not Found'}
+
+
+def payload_digest(payload):
+    """Хеш содержимого в формате WARC-Payload-Digest (sha1 в base32)"""
+    return 'sha1:' + base64.b32encode(hashlib.sha1(payload).digest()).decode('ascii')
+
+
+def warc_date(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+
+def parse_warc_date(value):
+    return datetime.strptime(value, '%Y-%m-%dT%H:%M:%S.%fZ').replace(tzinfo=timezone.utc).timestamp()
+
+
+def parse_as_of(value):
+    """Момент, на который берутся страницы архива: дата (конец дня) или дата и время в местном времени.
+    Возвращает метку времени или None"""
+    if not value:
+        return None
+    moment = datetime.fromisoformat(value)
+    if len(value) == 10:
+        moment += timedelta(days=1)
+    return moment.timestamp()
+
+
+def build_record(warc_type, url, fetched_at, digest, payload=b'', status=200, refers_to=None):
+    """Запись WARC/1.1: ответ (response) с HTTP-заголовками и страницей или повтор (revisit) без тела"""
+    block = b''
+    if warc_type == 'response':
+        http_head = (f"HTTP/1.1 {status} {HTTP_STATUS_TEXT.get(status, '')}\r\n"
+                     f"Content-Type: text/html; charset=utf-8\r\nContent-Length: {len(payload)}\r\n\r\n")
+        block = http_head.encode('ascii') + payload
+    headers = [
+        'WARC/1.1',
+        f'WARC-Type: {warc_type}',
+        f'WARC-Record-ID: <urn:uuid:{uuid.uuid4()}>',
+        f'WARC-Date: {warc_date(fetched_at)}',
+        f'WARC-Target-URI: {url}',
+        f'WARC-Payload-Digest: {digest}'
+    ]
+    if refers_to:
+        headers.append(f'WARC-Refers-To-Date: {warc_date(refers_to)}')
+        headers.append('WARC-Profile: http://netpreserve.org/warc/1.1/revisit/identical-payload-digest')
+    headers.append('Content-Type: application/http; msgtype=response')
+    headers.append(f'Content-Length: {len(block)}')
+    return ('\r\n'.join(headers) + '\r\n\r\n').encode('utf-8') + block + b'\r\n\r\n'
+
+
+def parse_record(data):
+    """Заголовки WARC (словарь) и содержимое страницы (для response) из распакованной записи"""
+    head, _, block = data.partition(b'\r\n\r\n')
+    lines = head.decode('utf-8').split('\r\n')
+    headers = dict(line.split(': ', 1) for line in lines[1:] if ': ' in line)
+    payload = None
+    if headers.get('WARC-Type') == 'response':
+        block = block[:int(headers['Content-Length'])]
+        payload = block.partition(b'\r\n\r\n')[2]
+    return headers, payload
+
+
+def iter_members(path):
+    """Сжатые записи файла архива: (смещение, длина, распакованная запись). Каждая запись - отдельный
+    gzip-член, поэтому запись читается по смещению без распаковки файла целиком. Файл читается частями
+    по READ_CHUNK байт; непрочитанный остаток части переходит к следующей записи"""
+    with open(path, 'rb') as infile:
+        offset = 0
+        pending = b''  # Прочитанные байты, которые еще не относятся ни к одной записи
+        while True:
+            pending = pending or infile.read(READ_CHUNK)
+            if not pending:
+                return
+            decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+            parts = []
+            length = 0
+            try:
+                while True:
+                    parts.append(decompressor.decompress(pending))
+                    if decompressor.eof:
+                        length += len(pending) - len(decompressor.unused_data)
+                        pending = decompressor.unused_data
+                        break
+                    length += len(pending)
+                    pending = infile.read(READ_CHUNK)
+                    if not pending:
+                        logging.warning(f"Незавершенная запись в конце {path} (смещение {offset})")
+                        return
+            except zlib.error as e:
+                logging.warning(f"Поврежденная запись в {path} со смещения {offset}: {str(e)}")
+                return
+            yield offset, length, b''.join(parts)
+            offset += length
+
+
+class PageArchive:
+    """Архив загруженных страниц: файлы WARC со сжатием gzip (по записи на страницу, только дописываются)
+    и индекс SQLite по адресу и времени загрузки. Неизменившаяся страница записывается как revisit без тела,
+    а индекс указывает на запись с ее содержимым"""
+
+    def __init__(self, directory=DEFAULT_ARCHIVE_DIR, readonly=False):
+        self.directory = directory
+        self.readonly = readonly
+        self.lock = threading.Lock()
+        self.stats = {'stored': 0, 'revisits': 0, 'bytes': 0, 'read': 0}
+        self.file = None  # Файл текущего запуска открывается при первой записи
+        self.file_name = None
+        self.offset = 0
+        self.pending = 0
+        self.readers = {}  # Имя файла -> открытый для чтения файл
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self.connection = sqlite3.connect(os.path.join(directory, INDEX_FILE), check_same_thread=False,
+                                          timeout=30)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS records (
+                url TEXT NOT NULL,
+                fetched_at REAL NOT NULL,
+                type TEXT NOT NULL,
+                digest TEXT NOT NULL,
+                file TEXT NOT NULL,
+                offset INTEGER NOT NULL,
+                length INTEGER NOT NULL
+            )
+        """)
+        self.connection.execute("CREATE INDEX IF NOT EXISTS idx_records_url ON records (url, fetched_at)")
+        self.connection.commit()
+
+    def open_file(self):
+        """Новый файл для записей текущего процесса: несколько процессов не пишут в один файл"""
+        self.file_name = f"pages-{datetime.now():%Y%m%d-%H%M%S}-{os.getpid()}.warc.gz"
+        self.file = open(os.path.join(self.directory, self.file_name), 'ab')
+        self.offset = self.file.tell()
+        logging.info(f"Страницы сохраняются в архив {os.path.join(self.directory, self.file_name)}")
+
+    def store(self, url, body, status=200):
+        """Сохранение загруженной страницы (текст HTML) с текущим временем"""
+        if self.readonly:
+            return
+        payload = body.encode('utf-8')
+        digest = payload_digest(payload)
+        fetched_at = time.time()
+        with self.lock:
+            latest = self.connection.execute(
+                "SELECT digest, fetched_at, file, offset, length FROM records WHERE url = ? "
+                "ORDER BY fetched_at DESC LIMIT 1", (url,)
+            ).fetchone()
+            if latest and latest[0] == digest:
+                # Содержимое не изменилось: короткая запись revisit ссылается на прошлую загрузку
+                record = build_record('revisit', url, fetched_at, digest, refers_to=latest[1])
+            else:
+                record = build_record('response', url, fetched_at, digest, payload, status)
+            data = gzip.compress(record, COMPRESS_LEVEL)
+            if self.file is None:
+                self.open_file()
+            self.file.write(data)
+            self.file.flush()
+            if latest and latest[0] == digest:
+                location = ('revisit', latest[2], latest[3], latest[4])
+                self.stats['revisits'] += 1
+            else:
+                location = ('response', self.file_name, self.offset, len(data))
+                self.stats['stored'] += 1
+            self.offset += len(data)
+            self.stats['bytes'] += len(data)
+            self.connection.execute("INSERT INTO records VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                    (url, fetched_at, location[0], digest) + location[1:])
+            self.pending += 1
+            if self.pending >= COMMIT_EVERY:
+                self.connection.commit()
+                self.pending = 0
+
+    def read_at(self, file_name, offset, length):
+        """Содержимое страницы из записи по смещению в файле архива"""
+        with self.lock:
+            reader = self.readers.get(file_name)
+            if reader is None:
+                reader = self.readers[file_name] = open(os.path.join(self.directory, file_name), 'rb')
+            reader.seek(offset)
+            data = reader.read(length)
+            self.stats['read'] += 1
+        _, payload = parse_record(gzip.decompress(data))
+        return payload.decode('utf-8')
+
+    def locations(self, as_of=None):
+        """Последняя загрузка каждого адреса (не позже as_of): адрес -> (файл, смещение, длина)"""
+        with self.lock:
+            self.connection.commit()
+            rows = self.connection.execute(
+                "SELECT url, file, offset, length, MAX(fetched_at) FROM records WHERE fetched_at <= ? GROUP BY url",
+                (as_of if as_of is not None else float('inf'),)
+            ).fetchall()
+        return {url: (file_name, offset, length) for url, file_name, offset, length, _ in rows}
+
+    def lookup(self, url, as_of=None):
+        """Последняя сохраненная версия страницы (не позже as_of) или None"""
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT file, offset, length FROM records WHERE url = ? AND fetched_at <= ? "
+                "ORDER BY fetched_at DESC LIMIT 1", (url, as_of if as_of is not None else float('inf'))
+            ).fetchone()
+        return self.read_at(*row) if row else None
+
+    def history(self, url):
+        """Загрузки адреса: список (время, тип записи, хеш содержимого)"""
+        with self.lock:
+            return self.connection.execute(
+                "SELECT fetched_at, type, digest FROM records WHERE url = ? ORDER BY fetched_at", (url,)
+            ).fetchall()
+
+    def summary(self):
+        """Количество записей и адресов, размер файлов архива"""
+        with self.lock:
+            records, urls = self.connection.execute("SELECT COUNT(*), COUNT(DISTINCT url) FROM records").fetchone()
+            first, last = self.connection.execute("SELECT MIN(fetched_at), MAX(fetched_at) FROM records").fetchone()
+        files = [name for name in os.listdir(self.directory) if name.endswith('.warc.gz')]
+        size = sum(os.path.getsize(os.path.join(self.directory, name)) for name in files)
+        return {'records': records, 'urls': urls, 'files': len(files), 'size_mb': round(size / (1024 * 1024), 2),
+                'first': first, 'last': last}
+
+    def reindex(self):
+        """Перестроение индекса по файлам архива (после сбоя или копирования файлов с другой машины)"""
+        with self.lock:
+            self.connection.commit()
+            self.connection.execute("DELETE FROM records")
+            responses = {}  # (адрес, хеш) -> расположение записи с содержимым
+            count = 0
+            for file_name in sorted(name for name in os.listdir(self.directory) if name.endswith('.warc.gz')):
+                for offset, length, data in iter_members(os.path.join(self.directory, file_name)):
+                    headers, _ = parse_record(data)
+                    url, digest = headers['WARC-Target-URI'], headers['WARC-Payload-Digest']
+                    warc_type = headers['WARC-Type']
+                    location = responses.get((url, digest)) if warc_type == 'revisit' else (file_name, offset, length)
+                    if location is None:
+                        continue
+                    responses[(url, digest)] = location
+                    self.connection.execute("INSERT INTO records VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                            (url, parse_warc_date(headers['WARC-Date']), warc_type, digest)
+                                            + location)
+                    count += 1
+            self.connection.commit()
+        logging.info(f"Индекс архива {self.directory} перестроен: {count} записей")
+        return count
+
+    def close(self):
+        """Фиксация индекса и закрытие файлов (повторный вызов ничего не делает)"""
+        with self.lock:
+            if self.connection is None:
+                return
+            self.connection.commit()
+            self.connection.close()
+            self.connection = None
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+            for reader in self.readers.values():
+                reader.close()
+            self.readers = {}
+        if self.stats['stored'] or self.stats['revisits']:
+            logging.info(f"В архив сохранено страниц: {self.stats['stored']} новых, {self.stats['revisits']} "
+                         f"без изменений, {self.stats['bytes'] / (1024 * 1024):.1f} МБ")
+
+
+if __name__ == '__main__':
+    setup_logging()
+
+    parser = argparse.ArgumentParser(description="Архив загруженных страниц (WARC + gzip)")
+    parser.add_argument('--archive-dir', default=DEFAULT_ARCHIVE_DIR, help="Каталог архива")
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('stats', help="Количество записей и размер архива")
+    history_parser = commands.add_parser('history', help="Загрузки страницы по адресу")
+    history_parser.add_argument('url')
+    show_parser = commands.add_parser('show', help="Вывести сохраненную страницу")
+    show_parser.add_argument('url')
+    show_parser.add_argument('--as-of', help="Версия на момент (YYYY-MM-DD или YYYY-MM-DDTHH:MM)")
+    commands.add_parser('reindex', help="Перестроить индекс по файлам архива")
+    args = parser.parse_args()
+
+    archive = PageArchive(args.archive_dir, readonly=True)
+    try:
+        if args.command == 'stats':
+            summary = archive.summary()
+            period = (f", с {datetime.fromtimestamp(summary['first']):%Y-%m-%d %H:%M} "
+                      f"по {datetime.fromtimestamp(summary['last']):%Y-%m-%d %H:%M}" if summary['records'] else '')
+            print(f"Записей: {summary['records']}, адресов: {summary['urls']}, файлов: {summary['files']}, "
+                  f"{summary['size_mb']} МБ{period}")
+        elif args.command == 'history':
+            for fetched_at, warc_type, digest in archive.history(args.url):
+                print(f"{datetime.fromtimestamp(fetched_at):%Y-%m-%d %H:%M:%S} {warc_type:<8} {digest}")
+        elif args.command == 'show':
+            body = archive.lookup(args.url, parse_as_of(args.as_of))
+            print(body if body is not None else f"Страница {args.url} отсутствует в архиве")
+        else:
+            archive.reindex()
+    finally:
+        archive.close()
@@ -0,0 +1,327 @@
+import os
+import time
+import logging
+import argparse
+from contextlib import contextmanager
+import pandas as pd
+from bonds_scraper import BondsScraper
+from bonds_filter import BondsFilter
+from bonds_no_isin import report_bonds_without_isin
+from isin_resolver import load_resolver, DEFAULT_REFERENCE_FILE
+from bonds_rating import create_rating_fetcher, rate_rows, load_rating_index
+from bonds_transform import build_transformed
+from rating_engine import AsyncRatingEngine
+from checkpoint import CheckpointJournal
+from fetchers import create_fetcher, FETCHER_BACKENDS
+from host_scheduler import AdaptiveScheduler
+from html_parsers import create_parser, PARSER_BACKENDS
+from http_cache import ResponseCache
+from page_archive import PageArchive, parse_as_of
+from screening import ScreeningRules, DEFAULT_RULES_FILE
+from metrics import METRICS, StageProfiler
+from bonds_store import BondsStore, SNAPSHOT_DIR
+from cashflows import add_analytics, load_prices
+from records import FilteredBond, LISTING_COLUMNS, FILTER_COLUMNS, RATING_COLUMNS
+from streaming import CsvWriter, batched, FLUSH_EVERY
+from log_setup import setup_logging, set_log_level
+
+# Этапы, результаты которых можно сохранять в CSV
+CSV_STAGES = ['scrape', 'filter', 'no_isin', 'rating', 'transform']
+OUTPUT_DIR = "./output"
+
+
+class BondsPipeline:
+    """Запуск всех этапов в одном процессе с передачей записей в памяти"""
+
+    def __init__(self, backend='http', workers=4, requests_per_second=2.0, rating_concurrency=4,
+                 rating_requests_per_second=1.0, use_cache=True, incremental=False, resume=False,
+                 csv_stages=CSV_STAGES, parser='lxml', rules_file=DEFAULT_RULES_FILE, metrics_file=None,
+                 profile_dir=None, profile_memory=False, parquet_file=None, prices_file=None, bulk_ratings=False,
+                 isin_reference=None, adaptive=False, archive=False, as_of=None):
+        self.backend = backend
+        self.workers = workers
+        self.requests_per_second = requests_per_second
+        self.rating_concurrency = rating_concurrency
+        self.rating_requests_per_second = rating_requests_per_second
+        self.use_cache = use_cache
+        self.incremental = incremental
+        self.resume = resume
+        self.csv_stages = set(csv_stages)  # Этапы, результаты которых записываются в CSV
+        self.parser = parser  # Библиотека разбора HTML для всех этапов
+        self.rules_file = rules_file  # Критерии отбора для поиска на сайте и фильтрации
+        self.metrics_file = metrics_file  # Отчет с метриками (JSON или текстовый формат Prometheus)
+        self.profiler = StageProfiler(profile_dir, memory=profile_memory)  # Профили этапов по запросу
+        self.parquet_file = parquet_file  # Снимок базы облигаций в Parquet после запуска
+        self.prices_file = prices_file  # Чистые цены облигаций для расчета доходности (по умолчанию - номинал)
+        self.bulk_ratings = bulk_ratings  # Рейтинги из списка облигаций smart-lab вместо страницы каждой облигации
+        self.isin_reference = isin_reference  # Справочник бумаг для поиска отсутствующих ISIN по названию
+        self.adaptive = adaptive  # Общий адаптивный планировщик запросов к finam и smart-lab
+        self.archive = archive  # Сохранять загруженные страницы в архив
+        self.as_of = as_of  # Для движка replay: страницы архива на этот момент (метка времени)
+        self.store = None
+        self.timings = {}
+        self.counts = {'listing': 0, 'filtered': 0, 'rated': 0}  # Облигаций, прошедших каждый этап
+        self.listing_complete = True  # Все страницы списка загружены
+
+    def create_scheduler(self):
+        """Адаптивный планировщик с отдельными бюджетами finam и smart-lab; --rps и --rating-rps задают
+        начальную частоту"""
+        budgets = {}
+        for host, rate in (('bonds.finam.ru', self.requests_per_second),
+                           ('smart-lab.ru', self.rating_requests_per_second)):
+            if rate > 0:
+                budgets[host] = {'rate': rate}
+        return AdaptiveScheduler(budgets)
+
+    def create_finam_fetcher(self, scheduler=None, archive=None):
+        """Общий загрузчик страниц finam для сбора списка и фильтрации"""
+        options = {'pool_size': self.workers, 'archive': archive}
+        if self.backend in ('http', 'selenium'):
+            options['requests_per_second'] = self.requests_per_second
+            options['rate_limiter'] = scheduler
+        if self.backend == 'http':
+            options['cache'] = ResponseCache() if self.use_cache else None
+        if self.backend == 'replay':
+            options['as_of'] = self.as_of
+        return create_fetcher(self.backend, **options)
+
+    @contextmanager
+    def stage(self, name):
+        """Выполнение этапа с замером длительности и профилированием (если включено)"""
+        started = time.perf_counter()
+        with self.profiler.stage(name):
+            yield
+        self.timings[name] = time.perf_counter() - started
+        logging.info(f"Этап '{name}' занял {self.timings[name]:.1f} с")
+
+    def scrape(self, scraper, listed_at):
+        """Сбор списка облигаций: пачки облигаций сохраняются в базу и CSV и сразу передаются фильтру"""
+        writer = None
+        saved = 0
+        try:
+            for bonds in batched(scraper.iter_bonds(), FLUSH_EVERY):
+                listing = [bond.to_dict() for bond in bonds]
+                self.store.add_listing(listing, listed_at, start=saved)
+                if 'scrape' in self.csv_stages:
+                    writer = writer or CsvWriter(scraper.output_file, LISTING_COLUMNS)
+                    writer.writerows(bond.to_row() for bond in bonds)
+                saved += len(bonds)
+                yield from listing
+        finally:
+            if writer:
+                writer.close()
+        self.counts['listing'] = saved
+        self.listing_complete = not scraper.failed_pages
+        if saved and scraper.failed_pages:
+            kept = self.store.keep_listing(listed_at, saved)
+            logging.warning(f"Список собран не полностью (не загружены страницы {scraper.failed_pages}): "
+                            f"{kept} облигаций, которых нет в собранной части, остаются в списке")
+        elif saved:
+            self.store.finish_listing(listed_at)
+
+    def filter_bonds(self, bonds_filter, listing, resolver=None):
+        """Отобранные облигации пачками по мере отбора: ISIN из справочника, доходность и дюрация считаются
+        на пачку, пачка сохраняется в базу и CSV. Отдает строки для этапа рейтингов"""
+        prices = load_prices(self.prices_file) if self.prices_file else None
+        screened_at = time.time()
+        writer = CsvWriter(bonds_filter.output_file, FILTER_COLUMNS) if 'filter' in self.csv_stages else None
+        saved = 0
+        try:
+            for results in batched(bonds_filter.iter_filtered(listing), FLUSH_EVERY):
+                filtered = [FilteredBond.from_dict(result) for result in results]
+                for bond in filtered:
+                    if not bond.isin and resolver:
+                        resolved = resolver.resolve(bond.name)
+                        if resolved:
+                            bond.isin = resolved[0]
+                            logging.info(f"ISIN облигации {bond.name} найден в справочнике: {resolved[0]} "
+                                         f"({resolved[1]}, похожесть {resolved[2]})")
+                add_analytics(filtered, prices)
+                self.store.add_filtered([bond.to_dict() for bond in filtered], screened_at)
+                rows = [bond.to_row() for bond in filtered]
+                if writer:
+                    writer.writerows(rows)
+                saved += len(rows)
+                yield from rows
+        finally:
+            if writer:
+                writer.close()
+        self.counts['filtered'] = saved
+        # Облигации с незагруженных страниц списка сохраняют прежние результаты отбора
+        if self.listing_complete:
+            self.store.finish_screening(screened_at)
+
+    def rate(self, engine, rows, state=None, index=None):
+        """Рейтинги отобранных облигаций по мере отбора; в базу сохраняются пачками по FLUSH_EVERY облигаций"""
+        pending = []  # Рейтинги, еще не сохраненные в базу
+
+        def save_pending():
+            self.store.save_ratings(pending)
+            self.counts['rated'] += len(pending)
+            pending.clear()
+
+        def on_row(row):
+            pending.append(row)
+            if len(pending) >= FLUSH_EVERY:
+                save_pending()
+
+        journal = CheckpointJournal(os.path.join(OUTPUT_DIR, "bonds_with_ratings.journal.jsonl"))
+        try:
+            completed = journal.open(resume=self.resume)
+            rate_rows(rows, engine, FILTER_COLUMNS.index('Ссылка'), on_row, state=state, journal=journal,
+                      completed=completed, index=index)
+        finally:
+            journal.close()
+        if pending:
+            save_pending()
+
+    def report_no_isin(self):
+        """Отчет об облигациях без ISIN"""
+        df = pd.DataFrame(self.store.filtered(), columns=FILTER_COLUMNS)
+        output_file = os.path.join(OUTPUT_DIR, "bonds_no_isin.csv") if 'no_isin' in self.csv_stages else None
+        report_bonds_without_isin(df, output_file)
+
+    def save_rated(self):
+        """bonds_with_ratings.csv и итоговый файл для импорта: облигации в порядке рейтинга из базы"""
+        rated = self.store.rated()
+        if 'rating' in self.csv_stages:
+            output_file = os.path.join(OUTPUT_DIR, "bonds_with_ratings.csv")
+            with CsvWriter(output_file, RATING_COLUMNS, encoding='utf-8-sig') as writer:
+                writer.writerows(rated)
+            logging.info(f"Сохранено {writer.count} облигаций с рейтингом в файл {output_file}")
+        new_df = build_transformed(pd.DataFrame(rated, columns=RATING_COLUMNS))
+        if 'transform' in self.csv_stages:
+            output_file = os.path.join(OUTPUT_DIR, "bonds_transformed.csv")
+            new_df.to_csv(output_file, sep=';', index=False, encoding='utf-8')
+            logging.info(f"Данные сохранены в файл {output_file}")
+        return new_df
+
+    def run(self):
+        """Основной метод выполнения"""
+        started = time.perf_counter()
+        os.makedirs(OUTPUT_DIR, exist_ok=True)
+
+        scheduler = self.create_scheduler() if self.adaptive else None
+        # Страницы обоих сайтов сохраняются в один архив; в режиме replay оба этапа читают страницы из него
+        replay = self.backend == 'replay'
+        archive = PageArchive(readonly=replay) if self.archive or replay else None
+        finam_fetcher = self.create_finam_fetcher(scheduler, archive)
+        rating_fetcher = create_rating_fetcher(self.use_cache, self.rating_requests_per_second,
+                                               pool_size=self.rating_concurrency, rate_limiter=scheduler,
+                                               archive=archive, replay=replay, as_of=self.as_of)
+        rules = ScreeningRules.load(self.rules_file)
+        scraper = BondsScraper(fetcher=finam_fetcher, max_workers=self.workers, parser=self.parser, rules=rules)
+        bonds_filter = BondsFilter(fetcher=finam_fetcher, max_workers=self.workers, incremental=self.incremental,
+                                   resume=self.resume, parser=self.parser, rules=rules)
+        engine = AsyncRatingEngine(rating_fetcher, create_parser(self.parser).parse_rating,
+                                   concurrency=self.rating_concurrency)
+        self.store = BondsStore()
+
+        try:
+            index = None
+            if self.bulk_ratings:
+                with self.stage('rating_index'):
+                    index = load_rating_index(rating_fetcher, self.parser, self.rating_concurrency)
+            resolver = load_resolver(self.isin_reference) if self.isin_reference else None
+            # Сбор, фильтрация и рейтинги идут одним потоком пачками: облигация отбирается, как только собрана
+            # ее страница списка, а рейтинг запрашивается сразу после отбора
+            with self.stage('scrape_filter_rating'):
+                listing = self.scrape(scraper, time.time())
+                self.rate(engine, self.filter_bonds(bonds_filter, listing, resolver), bonds_filter.state, index)
+            if not self.counts['listing']:
+                logging.warning("Не удалось собрать данные об облигациях")
+                return
+            with self.stage('report'):
+                self.report_no_isin()
+                self.save_rated()
+            logging.info(f"Облигаций в списке: {self.counts['listing']}, отобрано: {self.counts['filtered']}, "
+                         f"с рейтингом: {self.counts['rated']}")
+            if self.parquet_file is not None:
+                self.store.export_parquet(self.parquet_file or None)
+        except Exception as e:
+            logging.error(f"Критическая ошибка при выполнении пайплайна: {str(e)}")
+        finally:
+            bonds_filter.close()
+            rating_fetcher.close()
+            if scheduler is not None:
+                scheduler.log_stats()
+            self.store.close()
+            METRICS.set('run_seconds', round(time.perf_counter() - started, 3))
+            if self.metrics_file:
+                METRICS.write(self.metrics_file)
+            logging.info(f"Работа пайплайна завершена за {time.perf_counter() - started:.1f} с")
+
+
+if __name__ == "__main__":
+    # Настройка логирования: запись в консоль и файл (JSON) выполняется в отдельном потоке
+    setup_logging('pipeline.log')
+    parser = argparse.ArgumentParser(description="Полный цикл: сбор, фильтрация, рейтинги, сортировка и итоговый файл")
+    parser.add_argument('--backend', choices=list(FETCHER_BACKENDS), default='http',
+                        help="Движок загрузки страниц finam: http (без браузера), selenium или replay "
+                             "(страницы finam и smart-lab из архива)")
+    parser.add_argument('--workers', type=int, default=4,
+                        help="Количество одновременно загружаемых страниц finam")
+    parser.add_argument('--rps', type=float, default=2.0,
+                        help="Максимальное количество запросов в секунду к finam")
+    parser.add_argument('--rating-concurrency', type=int, default=4,
+                        help="Количество одновременных запросов к smart-lab")
+    parser.add_argument('--rating-rps', type=float, default=1.0,
+                        help="Максимальное количество запросов в секунду к smart-lab")
+    parser.add_argument('--adaptive', action='store_true',
+                        help="Подстраивать частоту и число одновременных запросов к finam и smart-lab под задержку "
+                             "и ошибки сайтов (--rps и --rating-rps задают начальную частоту)")
+    parser.add_argument('--archive', action='store_true',
+                        help="Сохранять загруженные страницы в архив (output/archive) для повторного извлечения "
+                             "данных с --backend replay")
+    parser.add_argument('--as-of',
+                        help="Для --backend replay: страницы архива на момент YYYY-MM-DD (конец дня) или "
+                             "YYYY-MM-DDTHH:MM; по умолчанию - последние")
+    parser.add_argument('--bulk-ratings', action='store_true',
+                        help="Брать рейтинги из списка облигаций smart-lab, страницы отдельных облигаций "
+                             "загружать только для отсутствующих в нем")
+    parser.add_argument('--resolve-isin', nargs='?', const=DEFAULT_REFERENCE_FILE, metavar='FILE',
+                        help="Подставлять отсутствующие ISIN из справочника бумаг Московской биржи "
+                             f"(по умолчанию {DEFAULT_REFERENCE_FILE})")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="Не использовать кэш загруженных страниц")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Загружать только новые, изменившиеся или устаревшие данные")
+    parser.add_argument('--resume', action='store_true',
+                        help="Продолжить прерванный запуск по журналам этапов")
+    parser.add_argument('--no-csv', nargs='*', choices=CSV_STAGES, default=None,
+                        help="Этапы, результаты которых не нужно выгружать в CSV; без списка этапов - ни одного "
+                             "CSV (все данные сохраняются в базу output/bonds.sqlite)")
+    parser.add_argument('--prices',
+                        help="CSV с чистыми ценами облигаций (колонки ISIN и Цена в %% от номинала) для расчета "
+                             "доходности; по умолчанию расчет ведется по номиналу")
+    parser.add_argument('--parquet', nargs='?', const='', metavar='FILE',
+                        help=f"Сохранить снимок базы в Parquet (по умолчанию в {SNAPSHOT_DIR}, нужен pyarrow)")
+    parser.add_argument('--parser', choices=list(PARSER_BACKENDS), default='lxml',
+                        help="Библиотека разбора HTML: lxml, selectolax или bs4 (BeautifulSoup)")
+    parser.add_argument('--rules', default=DEFAULT_RULES_FILE,
+                        help="Файл с критериями отбора облигаций (JSON)")
+    parser.add_argument('--metrics',
+                        help="Файл отчета с метриками: *.json или текстовый формат Prometheus (например, bonds.prom)")
+    parser.add_argument('--profile', metavar='DIR',
+                        help="Каталог для профилей cProfile каждого этапа")
+    parser.add_argument('--profile-memory', action='store_true',
+                        help="Дополнительно профилировать память этапов (tracemalloc, замедляет работу)")
+    parser.add_argument('--log-level', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
+                        help="Уровень логирования (по умолчанию - из переменной BONDS_LOG_LEVEL)")
+    args = parser.parse_args()
+    if args.log_level:
+        set_log_level(args.log_level)
+    # --no-csv без списка этапов отключает выгрузку всех CSV
+    no_csv = CSV_STAGES if args.no_csv == [] else args.no_csv or []
+
+    logging.info("Запуск пайплайна обработки облигаций")
+    pipeline = BondsPipeline(backend=args.backend, workers=args.workers, requests_per_second=args.rps,
+                             rating_concurrency=args.rating_concurrency, rating_requests_per_second=args.rating_rps,
+                             use_cache=not args.no_cache, incremental=args.incremental, resume=args.resume,
+                             csv_stages=[stage for stage in CSV_STAGES if stage not in no_csv],
+                             parser=args.parser, rules_file=args.rules, metrics_file=args.metrics,
+                             profile_dir=args.profile, profile_memory=args.profile_memory,
+                             parquet_file=args.parquet, prices_file=args.prices, bulk_ratings=args.bulk_ratings,
+                             isin_reference=args.resolve_isin, adaptive=args.adaptive, archive=args.archive,
+                             as_of=parse_as_of(args.as_of))
+    pipeline.run()
@@ -0,0 +1,194 @@
+import time
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from fetchers import FetchError, retry_delay
+from metrics import METRICS
+
+RATING_URL = "https://smart-lab.ru/q/bonds/{isin}/"
+# Страницы списка облигаций smart-lab: рейтинги многих облигаций на одной странице
+RATING_LIST_URL = "https://smart-lab.ru/q/bonds/page{page}/"
+MAX_LIST_PAGES = 50
+
+
+class RatingIndex:
+    """Рейтинги из списка облигаций smart-lab: ISIN -> (рейтинг, цвет).
+    Список загружается один раз за запуск; страницы отдельных облигаций запрашиваются только для ISIN,
+    которых в нем нет"""
+
+    def __init__(self, fetcher, parser, url_template=RATING_LIST_URL, max_pages=MAX_LIST_PAGES, concurrency=4,
+                 max_retries=2):
+        self.fetcher = fetcher
+        self.parser = parser  # Функция разбора HTML страницы списка (parse_rating_list)
+        self.url_template = url_template  # Адрес страницы списка с подстановкой {page}
+        self.max_pages = max_pages
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.ratings = {}
+        self.stats = {'pages': 0, 'hits': 0}
+
+    def fetch_page(self, number):
+        """Рейтинги одной страницы списка; None, если страницу не удалось загрузить"""
+        url = self.url_template.format(page=number)
+        for attempt in range(self.max_retries + 1):
+            try:
+                listing = self.parser(self.fetcher.fetch(url))
+            except FetchError as e:
+                if not e.transient or attempt == self.max_retries:
+                    logging.warning(f"Не удалось загрузить страницу {number} списка рейтингов: {str(e)}",
+                                    extra={'stage': 'rating', 'page': number, 'url': url})
+                    return None
+                delay = retry_delay(self.fetcher, attempt, e)
+                METRICS.inc('retries', stage='rating_list')
+                time.sleep(delay)
+                continue
+            except Exception as e:
+                logging.warning(f"Ошибка при разборе страницы {number} списка рейтингов: {str(e)}",
+                                extra={'stage': 'rating', 'page': number, 'url': url})
+                return None
+            self.stats['pages'] += 1
+            METRICS.inc('rating_list_pages')
+            return listing
+        return None
+
+    def load(self):
+        """Загрузка всех страниц списка: количество страниц определяется по пагинации первой"""
+        first = self.fetch_page(1)
+        if first is None:
+            return self
+        self.ratings.update(first['ratings'])
+        last_page = min(first['max_page'] or 1, self.max_pages)
+        if last_page > 1:
+            with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+                for listing in executor.map(self.fetch_page, range(2, last_page + 1)):
+                    if listing is not None:
+                        self.ratings.update(listing['ratings'])
+        if not self.ratings:
+            logging.warning("В списке облигаций smart-lab не найдено рейтингов: "
+                            "рейтинги будут запрошены со страниц облигаций")
+        logging.info(f"Загружено {len(self.ratings)} рейтингов из списка smart-lab (страниц: {self.stats['pages']})",
+                     extra={'stage': 'rating'})
+        return self
+
+    def get(self, isin):
+        """Рейтинг и цвет облигации из списка или None"""
+        rating = self.ratings.get(isin)
+        if rating is not None:
+            self.stats['hits'] += 1
+            METRICS.inc('rating_index_hits')
+        return rating
+
+
+class AsyncRatingEngine:
+    """Параллельное получение рейтингов на asyncio с ограничением числа запросов и повторами"""
+
+    def __init__(self, fetcher, parser, concurrency=4, max_retries=4, backoff_base=2.0, max_backoff=60.0,
+                 url_template=RATING_URL):
+        self.fetcher = fetcher  # Загрузчик страниц; частоту запросов ограничивает его rate_limiter
+        self.parser = parser  # Функция разбора HTML страницы в (рейтинг, цвет)
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.max_backoff = max_backoff
+        self.url_template = url_template  # Адрес страницы рейтинга с подстановкой {isin}
+        self.stats = {'fetched': 0, 'retries': 0, 'failed': 0}
+
+    def get_backoff(self, attempt, error):
+        """Пауза перед повтором: Retry-After сервера или экспоненциальная с разбросом (без паузы при
+        адаптивном планировщике загрузчика)"""
+        return retry_delay(self.fetcher, attempt, error, self.backoff_base, self.max_backoff)
+
+    async def fetch_rating(self, isin, executor, semaphore):
+        """Получение рейтинга одной облигации с повторами при временных ошибках"""
+        loop = asyncio.get_running_loop()
+        url = self.url_template.format(isin=isin)
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with semaphore:
+                    html = await loop.run_in_executor(executor, self.fetcher.fetch, url)
+                self.stats['fetched'] += 1
+                METRICS.inc('ratings', source='fetched')
+                return self.parser(html)
+            except FetchError as e:
+                if not e.transient or attempt == self.max_retries:
+                    logging.error(f"Ошибка при получении рейтинга для {isin}: {str(e)}",
+                                  extra={'stage': 'rating', 'isin': isin})
+                    break
+                delay = self.get_backoff(attempt, e)
+                self.stats['retries'] += 1
+                METRICS.inc('retries', stage='rating')
+                logging.warning(f"Повтор {attempt + 1}/{self.max_retries} для {isin} через {delay:.1f} с: {str(e)}",
+                                extra={'stage': 'rating', 'isin': isin})
+                # После 429 притормаживаем все запросы к сайту, а не только текущий
+                rate_limiter = getattr(self.fetcher, 'rate_limiter', None)
+                if e.status == 429 and rate_limiter:
+                    rate_limiter.pause(url, delay)
+                await asyncio.sleep(delay)
+            except Exception as e:
+                logging.error(f"Ошибка при получении рейтинга для {isin}: {str(e)}",
+                              extra={'stage': 'rating', 'isin': isin})
+                break
+        self.stats['failed'] += 1
+        METRICS.inc('ratings', source='error')
+        return "Ошибка", "Ошибка"
+
+    async def rate_stream(self, isins, on_result=None, lookup=None):
+        """Получение рейтингов для потока ISIN.
+
+        isins может быть любым итерируемым источником, в том числе генератором предыдущего этапа:
+        он читается в отдельном потоке, поэтому запросы начинаются до его завершения.
+        Как в streaming.bounded_map, вперед читается не больше concurrency * 2 ISIN: следующий ISIN
+        берется из источника, только когда отдан самый старый результат.
+        lookup(isin) возвращает уже известный рейтинг или None.
+        on_result(index, result, fetched) вызывается в порядке источника по мере готовности.
+        Список результатов возвращается только без on_result, чтобы память не росла с размером потока."""
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        window = self.concurrency * 2
+        source = iter(isins)
+        end_of_source = object()
+        futures = {}  # Номер в источнике -> ожидающий результат; отданные результаты удаляются
+        results = []
+        emitted = 0
+
+        def emit_ready(_=None):
+            # Отдаем готовые результаты, не нарушая порядок источника
+            nonlocal emitted
+            while emitted in futures and futures[emitted].done():
+                result, fetched = futures.pop(emitted).result()
+                if on_result:
+                    on_result(emitted, result, fetched)
+                else:
+                    results.append(result)
+                emitted += 1
+
+        async def fetch(isin, executor):
+            return await self.fetch_rating(isin, executor, semaphore), True
+
+        with ThreadPoolExecutor(max_workers=1) as reader, ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            while True:
+                # Окно заполнено: ждем самый старый результат, а не читаем источник дальше
+                while len(futures) >= window:
+                    await asyncio.wait([futures[emitted]])
+                    emit_ready()
+                isin = await loop.run_in_executor(reader, next, source, end_of_source)
+                if isin is end_of_source:
+                    break
+                known = lookup(isin) if lookup else None
+                if known is not None:
+                    METRICS.inc('ratings', source='stored')
+                    future = loop.create_future()
+                    future.set_result((known, False))
+                else:
+                    future = asyncio.ensure_future(fetch(isin, executor))
+                futures[emitted + len(futures)] = future
+                future.add_done_callback(emit_ready)
+                emit_ready()
+            if futures:
+                await asyncio.gather(*futures.values())
+            emit_ready()
+        return None if on_result else results
+
+    def run(self, isins, on_result=None, lookup=None):
+        """Синхронный запуск обработки потока ISIN"""
+        return asyncio.run(self.rate_stream(isins, on_result, lookup))
@@ -0,0 +1,91 @@
+# Записи об облигациях, которые этапы пайплайна передают друг другу в памяти
+
+# Колонки CSV-файлов этапов (порядок совпадает с существующими файлами в output/)
+LISTING_COLUMNS = ['bond_name', 'placement_date', 'maturity_date', 'bond_link']
+# Показатели, рассчитанные по графику платежей (cashflows.py), следуют за ставкой купона
+ANALYTICS_COLUMNS = ['Доходность к погашению, %', 'Текущая доходность, %', 'Дюрация, лет', 'Модифицированная дюрация',
+                     'НКД, руб.']
+FILTER_COLUMNS = ['Название облигации', 'ISIN', 'Дата размещения', 'Дата погашения', 'Ставка купона',
+                  *ANALYTICS_COLUMNS, 'Ссылка']
+RATING_COLUMNS = ['Название облигации', 'ISIN', 'Дата размещения', 'Дата погашения', 'Ставка купона',
+                  *ANALYTICS_COLUMNS, 'Рейтинг', 'Цвет рейтинга', 'Ссылка']
+
+
+class ListingBond:
+    """Облигация из списка на сайте (bonds_data.csv)"""
+
+    __slots__ = ('bond_name', 'placement_date', 'maturity_date', 'bond_link')
+
+    def __init__(self, bond_name, placement_date, maturity_date, bond_link):
+        self.bond_name = bond_name
+        self.placement_date = placement_date
+        self.maturity_date = maturity_date
+        self.bond_link = bond_link
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['bond_name'], data['placement_date'], data['maturity_date'], data['bond_link'])
+
+    def to_dict(self):
+        return {column: getattr(self, column) for column in LISTING_COLUMNS}
+
+    def to_row(self):
+        return [getattr(self, column) for column in LISTING_COLUMNS]
+
+
+class FilteredBond:
+    """Облигация, прошедшая отбор (bonds_filter.csv)"""
+
+    __slots__ = ('name', 'isin', 'placement_date', 'maturity_date', 'coupon_rate', 'analytics', 'link', 'schedule')
+
+    def __init__(self, name, isin, placement_date, maturity_date, coupon_rate, analytics, link, schedule=None):
+        self.name = name
+        self.isin = isin or ''
+        self.placement_date = placement_date
+        self.maturity_date = maturity_date
+        self.coupon_rate = coupon_rate  # Строка вида '25.5%', как в CSV
+        self.analytics = list(analytics)  # Значения ANALYTICS_COLUMNS ('' - не рассчитано)
+        self.link = link
+        self.schedule = schedule  # График платежей со страницы облигации (не выгружается в CSV)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['Название облигации'], data['ISIN'], data['Дата размещения'], data['Дата погашения'],
+                   data['Ставка купона'], [data.get(column, '') for column in ANALYTICS_COLUMNS], data['Ссылка'],
+                   data.get('schedule'))
+
+    def to_dict(self):
+        data = dict(zip(FILTER_COLUMNS, self.to_row()))
+        data['schedule'] = self.schedule
+        return data
+
+    def to_row(self):
+        return [self.name, self.isin, self.placement_date, self.maturity_date, self.coupon_rate, *self.analytics,
+                self.link]
+
+
+class RatedBond:
+    """Облигация с рейтингом (bonds_with_ratings.csv)"""
+
+    __slots__ = ('name', 'isin', 'placement_date', 'maturity_date', 'coupon_rate', 'analytics', 'rating',
+                 'rating_color', 'link')
+
+    def __init__(self, name, isin, placement_date, maturity_date, coupon_rate, analytics, rating, rating_color, link):
+        self.name = name
+        self.isin = isin
+        self.placement_date = placement_date
+        self.maturity_date = maturity_date
+        self.coupon_rate = coupon_rate
+        self.analytics = list(analytics)
+        self.rating = rating
+        self.rating_color = rating_color
+        self.link = link
+
+    @classmethod
+    def from_row(cls, row):
+        analytics_end = 5 + len(ANALYTICS_COLUMNS)
+        return cls(*row[:5], row[5:analytics_end], *row[analytics_end:len(RATING_COLUMNS)])
+
+    def to_row(self):
+        return [self.name, self.isin, self.placement_date, self.maturity_date, self.coupon_rate, *self.analytics,
+                self.rating, self.rating_color, self.link]
@@ -0,0 +1,526 @@
+import os
+import csv
+import time
+import heapq
+import signal
+import logging
+import argparse
+from datetime import date
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import pandas as pd
+from bonds_scraper import BondsScraper
+from bonds_filter import BondsFilter
+from bonds_transform import build_transformed
+from rating_engine import RATING_URL
+from fetchers import FetchError, HttpFetcher, create_fetcher, retry_delay
+from host_scheduler import AdaptiveScheduler
+from html_parsers import create_parser, PARSER_BACKENDS
+from http_cache import ResponseCache
+from page_archive import PageArchive
+from screening import ScreeningRules, DEFAULT_RULES_FILE
+from bonds_store import BondsStore, RATING_ERROR
+from cashflows import add_analytics, load_prices
+from records import FilteredBond, RATING_COLUMNS
+from streaming import write_atomic
+from metrics import METRICS
+from log_setup import setup_logging, set_log_level
+
+# Виды задач обновления: страница списка (ключ - номер страницы), страница облигации и рейтинг (ключ - ссылка)
+LISTING = 'listing'
+DETAIL = 'detail'
+RATING = 'rating'
+TASK_KINDS = [LISTING, DETAIL, RATING]
+DEFAULT_INTERVALS = {LISTING: 6 * 3600, DETAIL: 24 * 3600, RATING: 12 * 3600}  # Интервалы обновления в секундах
+NEAR_MATURITY_DAYS = 90  # Облигации, до погашения которых осталось меньше, обновляются чаще
+NEAR_MATURITY_FACTOR = 4.0  # Во сколько раз чаще
+RATING_CHANGE_DAYS = 7  # Облигации, рейтинг которых изменился за это время, обновляются чаще
+RATING_CHANGE_FACTOR = 3.0  # Во сколько раз чаще
+CATCH_UP = 2.0  # Задачи одного вида запускаются не чаще, чем вдвое быстрее среднего темпа их обновления
+RETRY_SECONDS = 900  # Повтор задачи после ошибки (не позже обычного срока)
+UNLISTED_ROUNDS = 2  # Облигация исключается из списка, если ее нет на страницах списка столько интервалов
+SNAPSHOT_SECONDS = 300  # Как часто выгружаются CSV-файлы, если данные изменились
+MAX_WAIT = 5.0  # Наибольшая пауза цикла: за это время замечается остановка
+OUTPUT_DIR = "./output"
+UNIVERSE_FIELDS = ['bond_link', 'bond_name', 'placement_date', 'maturity_date', 'isin', 'accepted', 'rating',
+                   'listed_at', 'screened_at', 'rated_at', 'rating_changed_at']
+# Поля облигации, которые берутся со страницы списка
+LISTING_FIELDS = ['bond_name', 'placement_date', 'maturity_date']
+
+
+def revalidating_cache():
+    """Кэш ответов без свежих попаданий: каждая страница перепроверяется по ETag/Last-Modified, и неизменившаяся
+    страница обходится ответом 304 без тела. Срок обновления задает демон, а не время жизни кэша"""
+    return ResponseCache(ttls={}, default_ttl=0)
+
+
+class RefreshDaemon:
+    """Постоянное обновление данных облигаций вместо периодического полного сбора.
+
+    Облигации последнего списка держатся в памяти; для каждой страницы списка, страницы облигации и рейтинга
+    в очереди с приоритетом (heapq) хранится срок следующего обновления: время прошлого обновления плюс
+    интервал вида задачи. Облигациям с близким погашением и с недавно изменившимся рейтингом интервал
+    сокращается. Задачи одного вида запускаются с темпом, рассчитанным по их числу и интервалу, поэтому
+    нагрузка на сайты распределяется по суткам. Результаты сохраняются в базу сразу, а bonds_with_ratings.csv
+    и bonds_transformed.csv перезаписываются атомарно не чаще раза в snapshot_seconds"""
+
+    def __init__(self, intervals=None, workers=2, requests_per_second=2.0, rating_requests_per_second=1.0,
+                 use_cache=True, adaptive=False, archive=False, parser='lxml', rules=None, prices=None,
+                 near_maturity_days=NEAR_MATURITY_DAYS, rating_change_days=RATING_CHANGE_DAYS,
+                 snapshot_seconds=SNAPSHOT_SECONDS, metrics_file=None, finam_fetcher=None, rating_fetcher=None,
+                 max_retries=2):
+        self.intervals = dict(DEFAULT_INTERVALS, **(intervals or {}))
+        self.workers = workers  # Одновременно выполняемых задач
+        self.rules = rules or ScreeningRules.load()
+        self.prices = prices  # Чистые цены (ISIN -> % от номинала) для расчета доходности
+        self.near_maturity_days = near_maturity_days
+        self.rating_change_days = rating_change_days
+        self.snapshot_seconds = snapshot_seconds
+        self.metrics_file = metrics_file  # Отчет с метриками, обновляется вместе с CSV-файлами
+        self.max_retries = max_retries  # Повторы загрузки страницы рейтинга при временных ошибках
+
+        # Общий адаптивный планировщик запросов к finam и smart-lab (--adaptive); страницы могут сохраняться
+        # в архив для повторного извлечения данных
+        self.scheduler = None
+        if adaptive and (finam_fetcher is None or rating_fetcher is None):
+            self.scheduler = AdaptiveScheduler({'bonds.finam.ru': {'rate': requests_per_second},
+                                                'smart-lab.ru': {'rate': rating_requests_per_second}})
+        self.archive = PageArchive() if archive else None
+        if finam_fetcher is None:
+            finam_fetcher = create_fetcher('http', pool_size=workers, requests_per_second=requests_per_second,
+                                           cache=revalidating_cache() if use_cache else None,
+                                           rate_limiter=self.scheduler, archive=self.archive)
+        if rating_fetcher is None:
+            rating_fetcher = HttpFetcher(timeout=15, pool_size=workers, requests_per_second=rating_requests_per_second,
+                                         cache=revalidating_cache() if use_cache else None,
+                                         rate_limiter=self.scheduler, archive=self.archive)
+        self.rating_fetcher = rating_fetcher
+        self.parse_rating = create_parser(parser).parse_rating
+        self.scraper = BondsScraper(fetcher=finam_fetcher, max_workers=workers, parser=parser, rules=self.rules,
+                                    save_csv=False)
+        self.bonds_filter = BondsFilter(fetcher=finam_fetcher, max_workers=workers, parser=parser, rules=self.rules,
+                                        save_csv=False)
+        self.store = BondsStore()
+
+        self.bonds = {}  # Ссылка -> облигация текущего списка (словарь с полями UNIVERSE_FIELDS)
+        self.queues = {kind: [] for kind in TASK_KINDS}  # Куча (срок, номер записи, ключ) для каждого вида
+        self.tasks = {kind: {} for kind in TASK_KINDS}  # Ключ -> (срок, интервал, вне темпа, номер записи)
+        self.load = {kind: 0.0 for kind in TASK_KINDS}  # Сколько задач вида нужно выполнять в секунду
+        self.next_start = {kind: 0.0 for kind in TASK_KINDS}  # Раньше этого времени задача вида не запускается
+        self.running = set()  # (вид, ключ) выполняемых задач
+        self.sequence = 0
+        self.page_size = None  # Облигаций на странице списка (по первой странице)
+        self.last_listing = None  # Время последнего сбора списка до запуска
+        self.last_snapshot = 0.0
+        self.dirty = False  # Данные изменились после последней выгрузки CSV
+        self.stopped = False
+        self.handlers = {LISTING: (self.refresh_listing, self.apply_listing),
+                         DETAIL: (self.refresh_detail, self.apply_detail),
+                         RATING: (self.refresh_rating, self.apply_rating)}
+
+    def priority(self, bond):
+        """Во сколько раз чаще обычного обновляется облигация: близкое погашение и недавнее изменение рейтинга"""
+        factor = 1.0
+        try:
+            days = (date.fromisoformat(bond['maturity_date']) - date.today()).days
+        except (TypeError, ValueError):
+            days = None
+        if days is not None and 0 <= days <= self.near_maturity_days:
+            factor *= NEAR_MATURITY_FACTOR
+        changed_at = bond['rating_changed_at']
+        if changed_at and time.time() - changed_at <= self.rating_change_days * 86400:
+            factor *= RATING_CHANGE_FACTOR
+        return factor
+
+    def schedule(self, kind, key, last=None, factor=1.0, delay=None):
+        """Постановка задачи в очередь со сроком last + интервал / factor. Задача без прошлого обновления
+        (новая облигация или страница) выполняется сразу и вне темпа; delay - повтор через delay секунд.
+        Прежняя запись задачи в куче становится недействительной и отбрасывается при извлечении"""
+        self.unschedule(kind, key)
+        interval = self.intervals[kind] / factor
+        now = time.time()
+        if delay is not None:
+            due = now + min(delay, interval)
+        else:
+            due = now if last is None else last + interval
+        self.sequence += 1
+        self.tasks[kind][key] = (due, interval, last is None and delay is None, self.sequence)
+        self.load[kind] += 1.0 / interval
+        heapq.heappush(self.queues[kind], (due, self.sequence, key))
+
+    def unschedule(self, kind, key):
+        task = self.tasks[kind].pop(key, None)
+        if task is not None:
+            self.load[kind] = max(0.0, self.load[kind] - 1.0 / task[1])
+
+    def stagger(self, kind):
+        """Разнесение совпавших сроков (например, после полного сбора): k-я по сроку задача вида выполняется
+        не позже, чем через k / средний темп секунд, и первый круг обновлений распределяется по интервалу.
+        Сроки только приближаются, поэтому данные не становятся старше интервала"""
+        if not self.load[kind]:
+            return
+        now = time.time()
+        tasks = sorted(self.tasks[kind].items(), key=lambda item: item[1][0])
+        for number, (key, (due, interval, urgent, _)) in enumerate(tasks):
+            spread_due = now + number / self.load[kind]
+            if not urgent and spread_due < due:
+                self.sequence += 1
+                self.tasks[kind][key] = (spread_due, interval, urgent, self.sequence)
+                heapq.heappush(self.queues[kind], (spread_due, self.sequence, key))
+
+    def peek(self, kind):
+        """Ближайшая задача вида: (время, когда ее можно запустить, ключ) или None"""
+        queue = self.queues[kind]
+        while queue:
+            due, sequence, key = queue[0]
+            task = self.tasks[kind].get(key)
+            if task is None or task[3] != sequence:
+                heapq.heappop(queue)
+                continue
+            # Задачи по сроку выполняются не чаще темпа вида, чтобы накопившиеся задачи не шли пачкой
+            return (due if task[2] else max(due, self.next_start[kind])), key
+        return None
+
+    def take(self, kind, key, now):
+        """Извлечение задачи из очереди для запуска"""
+        due, _, urgent, _ = self.tasks[kind][key]
+        heapq.heappop(self.queues[kind])
+        if not urgent:
+            self.next_start[kind] = now + 1.0 / (CATCH_UP * max(self.load[kind], 1.0 / self.intervals[kind]))
+        self.unschedule(kind, key)
+        self.running.add((kind, key))
+        METRICS.set('refresh_lag_seconds', round(max(0.0, now - due), 3), kind=kind)
+
+    def retry(self, kind, key):
+        """Повтор задачи после ошибки; данные облигации остаются прежними"""
+        METRICS.inc('refresh_tasks', kind=kind, result='error')
+        if kind == LISTING:
+            self.schedule(LISTING, key, delay=RETRY_SECONDS)
+        elif key in self.bonds:
+            self.schedule(kind, key, factor=self.priority(self.bonds[key]), delay=RETRY_SECONDS)
+
+    def load_universe(self):
+        """Облигации последнего списка из базы и их задачи по времени прошлых обновлений"""
+        rows = self.store.query(f"SELECT {', '.join(UNIVERSE_FIELDS)} FROM bonds WHERE position IS NOT NULL")
+        for row in rows:
+            bond = dict(zip(UNIVERSE_FIELDS, row))
+            self.bonds[bond['bond_link']] = bond
+        listed = [bond['listed_at'] for bond in self.bonds.values() if bond['listed_at']]
+        self.last_listing = max(listed) if listed else None
+        # Остальные страницы списка ставятся в очередь после первой: по ней определяется их количество
+        self.schedule(LISTING, 0, self.last_listing)
+        for link, bond in self.bonds.items():
+            self.schedule(DETAIL, link, bond['screened_at'], self.priority(bond))
+            if bond['accepted'] == 1 and bond['isin']:
+                self.schedule(RATING, link, bond['rated_at'], self.priority(bond))
+        self.stagger(DETAIL)
+        self.stagger(RATING)
+        logging.info(f"В базе {self.store.path} {len(self.bonds)} облигаций списка, в очереди задач: "
+                     + ', '.join(f"{kind} {len(self.tasks[kind])}" for kind in TASK_KINDS))
+
+    def refresh_listing(self, page_number):
+        """Загрузка и разбор страницы списка (в потоке обработки). None - страницу загрузить не удалось"""
+        listing = self.scraper.fetch_page(page_number)
+        if listing is None:
+            return None
+        return listing, self.scraper.parse_page(listing, page_number)
+
+    def refresh_detail(self, bond_data):
+        """Проверка облигации по критериям (в потоке обработки): (FilteredBond или None, причина отказа)"""
+        if not self.rules.prefilter([bond_data]):
+            return None, 'listing'
+        result, reason = self.bonds_filter.evaluate_bond(bond_data)
+        if result is None:
+            return None, reason
+        bond = FilteredBond.from_dict(result)
+        add_analytics([bond], self.prices)
+        return bond, None
+
+    def refresh_rating(self, isin):
+        """Рейтинг и цвет со страницы облигации smart-lab (в потоке обработки) с повторами при временных ошибках"""
+        url = RATING_URL.format(isin=isin)
+        for attempt in range(self.max_retries + 1):
+            try:
+                return self.parse_rating(self.rating_fetcher.fetch(url))
+            except FetchError as e:
+                if not e.transient or attempt == self.max_retries:
+                    raise
+                METRICS.inc('retries', stage='refresh')
+                time.sleep(retry_delay(self.rating_fetcher, attempt, e))
+
+    def apply_listing(self, page_number, result):
+        """Сохранение страницы списка: новые облигации и облигации с изменившимися датами проверяются сразу"""
+        listing, bonds = result
+        now = time.time()
+        if page_number == 0:
+            self.page_size = len(bonds) or self.page_size
+            page_count = self.scraper.get_page_count(listing, len(bonds)) if bonds else 1
+            for number in range(1, page_count):
+                if number not in self.tasks[LISTING] and (LISTING, number) not in self.running:
+                    self.schedule(LISTING, number, self.last_listing)
+            for number in [number for number in self.tasks[LISTING] if number >= page_count]:
+                self.unschedule(LISTING, number)
+
+        self.store.add_listing(bonds, now, start=page_number * (self.page_size or len(bonds)))
+        added = 0
+        for bond_data in bonds:
+            link = bond_data['bond_link']
+            if not link:
+                continue
+            bond = self.bonds.get(link)
+            if bond is None:
+                bond = self.bonds[link] = dict.fromkeys(UNIVERSE_FIELDS)
+                added += 1
+            changed = any(bond[field] != bond_data[field] for field in LISTING_FIELDS)
+            bond.update({field: bond_data[field] for field in LISTING_FIELDS}, bond_link=link, listed_at=now)
+            if changed:
+                self.schedule(DETAIL, link)
+        if added:
+            logging.info(f"На странице списка {page_number} новых облигаций: {added}")
+            METRICS.inc('refresh_new_bonds', added)
+
+        if page_number == 0:
+            # Облигации, которых давно нет ни на одной странице, исключаются из списка
+            before = now - UNLISTED_ROUNDS * self.intervals[LISTING]
+            unlisted = [link for link, bond in self.bonds.items() if (bond['listed_at'] or 0) < before]
+            if unlisted:
+                self.store.drop_unlisted(before)
+                for link in unlisted:
+                    del self.bonds[link]
+                    self.unschedule(DETAIL, link)
+                    self.unschedule(RATING, link)
+                self.dirty = True
+                logging.info(f"Исключено из списка облигаций: {len(unlisted)}")
+        self.schedule(LISTING, page_number, now)
+
+    def apply_detail(self, link, result):
+        """Сохранение результата отбора; облигации, прошедшей отбор, ставится задача рейтинга"""
+        bond = self.bonds.get(link)
+        if bond is None:
+            return
+        filtered, reason = result
+        # Без ставки купона результат не окончательный: проверка повторяется позже
+        if reason == 'no_coupon':
+            self.retry(DETAIL, link)
+            return
+        now = time.time()
+        if filtered is None:
+            self.store.reject([link], now)
+            bond['accepted'] = 0
+            self.unschedule(RATING, link)
+        else:
+            self.store.add_filtered([filtered.to_dict()], now)
+            isin_changed = filtered.isin != bond['isin']
+            bond.update(accepted=1, isin=filtered.isin)
+            if filtered.isin and (isin_changed or link not in self.tasks[RATING]) \
+                    and (RATING, link) not in self.running:
+                self.schedule(RATING, link, None if isin_changed else bond['rated_at'], self.priority(bond))
+        bond['screened_at'] = now
+        self.dirty = True
+        self.schedule(DETAIL, link, now, self.priority(bond))
+
+    def apply_rating(self, link, result):
+        """Сохранение рейтинга; при изменении рейтинга облигация обновляется чаще"""
+        bond = self.bonds.get(link)
+        if bond is None or bond['accepted'] != 1:
+            return
+        rating, color = result
+        now = time.time()
+        self.store.set_ratings([(link, rating, color)], now)
+        if bond['rating'] not in (None, '', RATING_ERROR) and rating not in ('', RATING_ERROR) \
+                and rating != bond['rating']:
+            logging.info(f"Рейтинг облигации {bond['bond_name']} изменился: {bond['rating']} -> {rating}",
+                         extra={'event': 'rating_changed', 'stage': 'refresh', 'isin': bond['isin']})
+            METRICS.inc('rating_changes')
+            bond['rating_changed_at'] = now
+            if link in self.tasks[DETAIL]:
+                self.schedule(DETAIL, link, bond['screened_at'], self.priority(bond))
+        bond.update(rating=rating, rated_at=now)
+        self.dirty = True
+        self.schedule(RATING, link, now, self.priority(bond))
+
+    def submit(self, executor, kind, key):
+        """Запуск задачи в потоке обработки"""
+        refresh = self.handlers[kind][0]
+        if kind == DETAIL:
+            bond = self.bonds[key]
+            argument = {field: bond[field] for field in ['bond_link', *LISTING_FIELDS]}
+        elif kind == RATING:
+            argument = self.bonds[key]['isin']
+        else:
+            argument = key
+        return executor.submit(refresh, argument)
+
+    def finish(self, kind, key, future):
+        """Обработка результата задачи (в основном потоке: база и очередь меняются только здесь)"""
+        self.running.discard((kind, key))
+        try:
+            result = future.result()
+            if result is not None:
+                self.handlers[kind][1](key, result)
+                METRICS.inc('refresh_tasks', kind=kind, result='ok')
+                return
+        except Exception as e:
+            logging.error(f"Ошибка обновления {kind} {key}: {str(e)}", extra={'stage': 'refresh'})
+        self.retry(kind, key)
+
+    def publish_freshness(self):
+        """Метрики свежести: сколько задач просрочено и возраст самых старых данных каждого вида"""
+        now = time.time()
+        for kind, field in ((LISTING, 'listed_at'), (DETAIL, 'screened_at'), (RATING, 'rated_at')):
+            METRICS.set('refresh_overdue', sum(1 for task in self.tasks[kind].values() if task[0] <= now),
+                        kind=kind)
+            times = [bond[field] for bond in self.bonds.values()
+                     if kind != RATING or (bond['accepted'] == 1 and bond['isin'])]
+            if times:
+                METRICS.set('refresh_max_age_seconds', round(now - min(value or 0 for value in times), 1),
+                            kind=kind)
+
+    def write_snapshots(self):
+        """Атомарная выгрузка bonds_with_ratings.csv и bonds_transformed.csv из базы"""
+        rows = self.store.rated()
+
+        def write_ratings(path):
+            with open(path, 'w', encoding='utf-8-sig', newline='') as outfile:
+                writer = csv.writer(outfile, delimiter=';')
+                writer.writerow(RATING_COLUMNS)
+                writer.writerows(rows)
+
+        transformed = build_transformed(pd.DataFrame(rows, columns=RATING_COLUMNS))
+        write_atomic(os.path.join(OUTPUT_DIR, "bonds_with_ratings.csv"), write_ratings)
+        write_atomic(os.path.join(OUTPUT_DIR, "bonds_transformed.csv"),
+                     lambda path: transformed.to_csv(path, sep=';', index=False, encoding='utf-8'))
+        self.dirty = False
+        METRICS.inc('snapshots')
+        logging.info(f"Выгружено {len(rows)} облигаций с рейтингом в bonds_with_ratings.csv и bonds_transformed.csv")
+
+    def checkpoint(self):
+        """Выгрузка CSV-файлов (если данные изменились) и отчета с метриками"""
+        self.last_snapshot = time.time()
+        if self.dirty:
+            self.write_snapshots()
+        self.publish_freshness()
+        if self.metrics_file:
+            METRICS.write(self.metrics_file)
+
+    def stop(self, *_):
+        """Остановка после завершения выполняемых задач (обработчик SIGTERM и SIGINT)"""
+        if not self.stopped:
+            logging.info("Получен сигнал остановки, завершаются выполняемые задачи")
+        self.stopped = True
+
+    def run(self, duration=None):
+        """Цикл обновления; duration - ограничение времени работы в секундах (по умолчанию - до остановки)"""
+        os.makedirs(OUTPUT_DIR, exist_ok=True)
+        deadline = time.time() + duration if duration else None
+        self.load_universe()
+        self.last_snapshot = time.time()
+        futures = {}  # Выполняемая задача -> (вид, ключ)
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            try:
+                while not self.stopped and (deadline is None or time.time() < deadline):
+                    now = time.time()
+                    wake_at = [self.last_snapshot + self.snapshot_seconds, now + MAX_WAIT]
+                    if deadline is not None:
+                        wake_at.append(deadline)
+                    # Из готовых задач всех видов запускается самая давно ожидающая
+                    while len(futures) < self.workers:
+                        ready = [(entry[0], kind, entry[1]) for kind, entry in
+                                 ((kind, self.peek(kind)) for kind in TASK_KINDS) if entry is not None]
+                        if not ready:
+                            break
+                        start_at, kind, key = min(ready, key=lambda item: item[0])
+                        if start_at > now:
+                            wake_at.append(start_at)
+                            break
+                        self.take(kind, key, now)
+                        futures[self.submit(executor, kind, key)] = (kind, key)
+
+                    timeout = max(0.0, min(wake_at) - time.time())
+                    if futures:
+                        done, _ = wait(futures, timeout=timeout, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            self.finish(*futures.pop(future), future)
+                    else:
+                        time.sleep(timeout)
+                    if time.time() >= self.last_snapshot + self.snapshot_seconds:
+                        self.checkpoint()
+            finally:
+                # Результаты начатых задач сохраняются перед выходом
+                for future in list(futures):
+                    self.finish(*futures.pop(future), future)
+                self.checkpoint()
+
+    def close(self):
+        """Освобождение загрузчиков, архива и базы"""
+        self.bonds_filter.close()
+        self.rating_fetcher.close()
+        if self.scheduler is not None:
+            self.scheduler.log_stats()
+        if self.archive is not None:
+            self.archive.close()
+        self.store.close()
+
+
+if __name__ == "__main__":
+    # Настройка логирования: запись в консоль и файл (JSON) выполняется в отдельном потоке
+    setup_logging('refresh_daemon.log')
+    parser = argparse.ArgumentParser(description="Постоянное обновление списка, страниц облигаций и рейтингов "
+                                                 "по срокам с приоритетами вместо периодического полного сбора")
+    parser.add_argument('--listing-hours', type=float, default=DEFAULT_INTERVALS[LISTING] / 3600,
+                        help="Интервал обновления каждой страницы списка облигаций finam, часов")
+    parser.add_argument('--detail-hours', type=float, default=DEFAULT_INTERVALS[DETAIL] / 3600,
+                        help="Интервал обновления страницы облигации finam (отбор, купон, график платежей), часов")
+    parser.add_argument('--rating-hours', type=float, default=DEFAULT_INTERVALS[RATING] / 3600,
+                        help="Интервал обновления рейтинга smart-lab, часов")
+    parser.add_argument('--near-maturity-days', type=int, default=NEAR_MATURITY_DAYS,
+                        help=f"Облигации, до погашения которых осталось не больше стольких дней, обновляются "
+                             f"в {NEAR_MATURITY_FACTOR:g} раза чаще")
+    parser.add_argument('--rating-change-days', type=int, default=RATING_CHANGE_DAYS,
+                        help=f"Облигации, рейтинг которых изменился за столько дней, обновляются "
+                             f"в {RATING_CHANGE_FACTOR:g} раза чаще")
+    parser.add_argument('--snapshot-minutes', type=float, default=SNAPSHOT_SECONDS / 60,
+                        help="Как часто перезаписывать bonds_with_ratings.csv и bonds_transformed.csv, минут")
+    parser.add_argument('--workers', type=int, default=2, help="Одновременно выполняемых задач")
+    parser.add_argument('--rps', type=float, default=2.0, help="Максимальное количество запросов в секунду к finam")
+    parser.add_argument('--rating-rps', type=float, default=1.0,
+                        help="Максимальное количество запросов в секунду к smart-lab")
+    parser.add_argument('--adaptive', action='store_true',
+                        help="Подстраивать частоту и число одновременных запросов к finam и smart-lab под задержку "
+                             "и ошибки сайтов")
+    parser.add_argument('--archive', action='store_true',
+                        help="Сохранять загруженные страницы в архив (output/archive)")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="Не использовать кэш страниц (без него неизменившиеся страницы загружаются целиком)")
+    parser.add_argument('--prices',
+                        help="CSV с чистыми ценами облигаций (колонки ISIN и Цена в %% от номинала) для расчета "
+                             "доходности")
+    parser.add_argument('--parser', choices=list(PARSER_BACKENDS), default='lxml',
+                        help="Библиотека разбора HTML: lxml, selectolax или bs4 (BeautifulSoup)")
+    parser.add_argument('--rules', default=DEFAULT_RULES_FILE, help="Файл с критериями отбора облигаций (JSON)")
+    parser.add_argument('--duration', type=float,
+                        help="Остановиться через столько секунд (по умолчанию - работать до SIGTERM или Ctrl+C)")
+    parser.add_argument('--metrics',
+                        help="Файл отчета с метриками (обновляется вместе с CSV): *.json или текстовый формат "
+                             "Prometheus")
+    parser.add_argument('--log-level', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
+                        help="Уровень логирования (по умолчанию - из переменной BONDS_LOG_LEVEL)")
+    args = parser.parse_args()
+    if args.log_level:
+        set_log_level(args.log_level)
+
+    daemon = RefreshDaemon(intervals={LISTING: args.listing_hours * 3600, DETAIL: args.detail_hours * 3600,
+                                      RATING: args.rating_hours * 3600},
+                           workers=args.workers, requests_per_second=args.rps, rating_requests_per_second=args.rating_rps,
+                           use_cache=not args.no_cache, adaptive=args.adaptive, archive=args.archive,
+                           parser=args.parser, rules=ScreeningRules.load(args.rules),
+                           prices=load_prices(args.prices) if args.prices else None,
+                           near_maturity_days=args.near_maturity_days, rating_change_days=args.rating_change_days,
+                           snapshot_seconds=args.snapshot_minutes * 60, metrics_file=args.metrics)
+    signal.signal(signal.SIGTERM, daemon.stop)
+    signal.signal(signal.SIGINT, daemon.stop)
+    logging.info("Запуск демона обновления данных облигаций")
+    try:
+        daemon.run(args.duration)
+    finally:
+        daemon.close()
+    logging.info("Демон обновления остановлен")
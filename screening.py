@@ -0,0 +1,156 @@
+import os
+import json
+import logging
+from datetime import date
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+import pandas as pd
+from metrics import METRICS
+
+DEFAULT_RULES_FILE = "./screening_rules.json"
+
+# Критерии отбора по умолчанию (совпадают с screening_rules.json)
+DEFAULT_RULES = {
+    # Параметры поиска finam, которые не выражаются правилами списка
+    'query': {
+        'status': '4',
+        'currencyId': '1',
+        'couponRateFrom': '10',
+        'couponRateTo': '100'
+    },
+    # Правила по колонкам bonds_data.csv: проверяются до загрузки страниц облигаций
+    'listing': [
+        {'rule': 'placement_from', 'value': '2018-01-01'},
+        {'rule': 'maturity_from', 'value': '2027-04-30'}
+    ],
+    # Правила по данным страницы облигации в порядке проверки: первое нарушенное правило отбраковывает облигацию
+    'detail': [
+        {'rule': 'no_offer'},
+        {'rule': 'min_coupon_rate', 'value': 5.0}
+    ]
+}
+
+# Правила списка: колонка bonds_data.csv, сравнение и параметр поиска finam
+LISTING_RULES = {
+    'placement_from': ('placement_date', '>=', 'placementFrom'),
+    'placement_to': ('placement_date', '<=', 'placementTo'),
+    'maturity_from': ('maturity_date', '>=', 'paymentFrom'),
+    'maturity_to': ('maturity_date', '<=', 'paymentTo'),
+    'min_years_to_maturity': ('maturity_date', '>=', 'paymentFrom')
+}
+
+# Правила страницы облигации: проверяемое поле и функция (значение поля, параметр правила) -> причина отказа
+DETAIL_RULES = {
+    'no_offer': ('has_offer', lambda has_offer, _: 'offer' if has_offer else None),
+    'require_isin': ('isin', lambda isin, _: None if isin else 'no_isin'),
+    'min_coupon_rate': ('coupon_rate', lambda rate, limit: 'no_coupon' if rate is None else
+                        ('low_coupon' if rate < limit else None)),
+    'max_coupon_rate': ('coupon_rate', lambda rate, limit: 'no_coupon' if rate is None else
+                        ('high_coupon' if rate > limit else None))
+}
+
+# Поля, которые известны после загрузки страницы облигации без вкладки 'Платежи'
+PAGE_FIELDS = ('isin', 'has_offer')
+
+
+class ScreeningRules:
+    """Критерии отбора облигаций: параметры поиска, правила списка и правила страницы облигации"""
+
+    def __init__(self, config=None):
+        config = config or {}
+        self.query = dict(config.get('query', DEFAULT_RULES['query']))
+        self.listing = list(config.get('listing', DEFAULT_RULES['listing']))
+        self.detail = list(config.get('detail', DEFAULT_RULES['detail']))
+
+        for rule in self.listing:
+            if rule['rule'] not in LISTING_RULES:
+                raise ValueError(f"Неизвестное правило списка: {rule['rule']}. Доступны: {', '.join(LISTING_RULES)}")
+        for rule in self.detail:
+            if rule['rule'] not in DETAIL_RULES:
+                raise ValueError(f"Неизвестное правило облигации: {rule['rule']}. Доступны: {', '.join(DETAIL_RULES)}")
+
+    @classmethod
+    def load(cls, path=DEFAULT_RULES_FILE):
+        """Чтение правил из JSON-файла; если файла нет, используются правила по умолчанию"""
+        if not path or not os.path.exists(path):
+            logging.info("Файл правил отбора не найден, используются правила по умолчанию")
+            return cls(DEFAULT_RULES)
+        with open(path, 'r', encoding='utf-8') as rules_file:
+            config = json.load(rules_file)
+        logging.info(f"Правила отбора загружены из файла {path}")
+        return cls(config)
+
+    def listing_bounds(self, today=None):
+        """Границы дат по правилам списка: список (колонка, сравнение, параметр поиска, дата)"""
+        today = today or date.today()
+        bounds = []
+        for rule in self.listing:
+            if rule.get('value') is None:
+                continue
+            column, operator, param = LISTING_RULES[rule['rule']]
+            if rule['rule'] == 'min_years_to_maturity':
+                bound = pd.Timestamp(today) + pd.DateOffset(years=rule['value'])
+            else:
+                bound = pd.Timestamp(rule['value'])
+            bounds.append((column, operator, param, bound))
+        return bounds
+
+    def search_params(self, today=None):
+        """Параметры поиска finam: отбор по датам выполняется еще на стороне сайта"""
+        params = dict(self.query)
+        for _, operator, param, bound in self.listing_bounds(today):
+            # При нескольких правилах для одного параметра берется самое строгое
+            current = params.get(param)
+            if current:
+                current_bound = pd.Timestamp(pd.to_datetime(current, format='%d/%m/%Y'))
+                bound = max(bound, current_bound) if operator == '>=' else min(bound, current_bound)
+            params[param] = f"{bound.day}/{bound.month}/{bound.year}"
+        return params
+
+    def apply_to_url(self, url, today=None):
+        """Подстановка параметров поиска в адрес страницы списка облигаций"""
+        parts = urlsplit(url)
+        params = self.search_params(today)
+        # Параметры дат задаются только правилами: если правила нет, отбор по этой дате на сайте не выполняется
+        managed = {param for _, _, param in LISTING_RULES.values()}
+        query = []
+        for key, value in parse_qsl(parts.query, keep_blank_values=True):
+            query.append((key, params.pop(key, '' if key in managed else value)))
+        query.extend(params.items())
+        return urlunsplit(parts._replace(query=urlencode(query)))
+
+    def prefilter(self, bonds, today=None):
+        """Отбор облигаций по правилам списка (векторно по всем строкам) до загрузки их страниц"""
+        if not bonds:
+            return bonds
+        df = pd.DataFrame(bonds)
+        mask = pd.Series(True, index=df.index)
+        for column, operator, _, bound in self.listing_bounds(today):
+            dates = pd.to_datetime(df[column], errors='coerce')
+            # Строки с нераспознанной датой не отбраковываются здесь, их проверят правила страницы облигации
+            mask &= dates.isna() | ((dates >= bound) if operator == '>=' else (dates <= bound))
+
+        rejected = int((~mask).sum())
+        if rejected:
+            METRICS.inc('bonds_screened', rejected, stage='listing', result='rejected')
+            logging.info(f"По правилам списка отбраковано {rejected} из {len(bonds)} облигаций без загрузки страниц")
+        return [bond_data for bond_data, keep in zip(bonds, mask.tolist()) if keep]
+
+    def check(self, details, fields=None):
+        """Первая причина отказа по правилам страницы облигации или None.
+        fields ограничивает проверку правилами по уже известным полям"""
+        for rule in self.detail:
+            field, check = DETAIL_RULES[rule['rule']]
+            if fields is not None and field not in fields:
+                continue
+            reason = check(details.get(field), rule.get('value'))
+            if reason:
+                return reason
+        return None
+
+    def check_page(self, details):
+        """Проверка правил, для которых не нужна вкладка 'Платежи'"""
+        return self.check(details, PAGE_FIELDS)
+
+    def get_value(self, rule_name):
+        """Параметр правила страницы облигации (например, минимальная ставка купона)"""
+        return next((rule.get('value') for rule in self.detail if rule['rule'] == rule_name), None)
@@ -27,19 +27,46 @@ RATING_ORDER = {
 def get_rating_value(rating):
     return RATING_ORDER.get(rating, 100)
 
-# Чтение данных из файла
-with open('output/bonds_with_ratings.csv', 'r', encoding='utf-8-sig') as f:
-    reader = csv.reader(f, delimiter=';')
-    header = next(reader)
-    rows = list(reader)
-
-# Сортировка по рейтингу
-sorted_rows = sorted(rows, key=lambda x: get_rating_value(x[5]))
-
-# Запись отсортированных данных обратно в файл
-with open('output/bonds_with_ratings.csv', 'w', encoding='utf-8-sig', newline='') as f:
-    writer = csv.writer(f, delimiter=';')
-    writer.writerow(header)
-    writer.writerows(sorted_rows)
-
-print("Файл успешно отсортирован по рейтингу") 
\ No newline at end of file
+def sort_rows(rows, rating_index):
+    """Сортировка строк облигаций по рейтингу (колонка 'Рейтинг' с номером rating_index)"""
+    return sorted(rows, key=lambda x: get_rating_value(x[rating_index]))
+
+def sort_bonds_file(file_path='output/bonds_with_ratings.csv'):
+    # Чтение данных из файла
+    with open(file_path, 'r', encoding='utf-8-sig') as f:
+        reader = csv.reader(f, delimiter=';')
+        header = next(reader)
+        rows = list(reader)
+
+    # Сортировка по рейтингу
+    sorted_rows = sort_rows(rows, header.index('Рейтинг'))
+
+    # Запись отсортированных данных обратно в файл
+    with open(file_path, 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.writer(f, delimiter=';')
+        writer.writerow(header)
+        writer.writerows(sorted_rows)
+
+    print("Файл успешно отсортирован по рейтингу")
+
+def export_sorted(file_path='output/bonds_with_ratings.csv'):
+    """Выгрузка облигаций с рейтингом из базы: база отдает их уже отсортированными по рейтингу"""
+    # bonds_store использует get_rating_value, поэтому импортируется здесь
+    from bonds_store import BondsStore
+    from records import RATING_COLUMNS
+    
+    store = BondsStore()
+    try:
+        rows = store.rated()
+    finally:
+        store.close()
+    
+    with open(file_path, 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.writer(f, delimiter=';')
+        writer.writerow(RATING_COLUMNS)
+        writer.writerows(rows)
+
+    print(f"Выгружено {len(rows)} облигаций в порядке рейтинга в файл {file_path}")
+
+if __name__ == '__main__':
+    export_sorted()
@@ -0,0 +1,113 @@
+import os
+import json
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+
+# Окно свежести по умолчанию (в часах)
+DETAIL_MAX_AGE_HOURS = 7 * 24
+RATING_MAX_AGE_HOURS = 24
+
+
+def fingerprint(*values):
+    """Отпечаток набора значений для обнаружения изменений"""
+    payload = json.dumps([str(value) for value in values], ensure_ascii=False)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+class PipelineState:
+    """Хранилище состояния пайплайна для инкрементальных запусков (SQLite)"""
+
+    def __init__(self, path="./output/pipeline_state.sqlite"):
+        self.path = path
+        self.lock = threading.Lock()
+
+        state_dir = os.path.dirname(path)
+        if state_dir and not os.path.exists(state_dir):
+            os.makedirs(state_dir)
+
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS details (
+                bond_link TEXT PRIMARY KEY,
+                listing_fingerprint TEXT NOT NULL,
+                content_fingerprint TEXT NOT NULL,
+                fetched_at REAL NOT NULL,
+                details TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS ratings (
+                isin TEXT PRIMARY KEY,
+                content_fingerprint TEXT NOT NULL,
+                fetched_at REAL NOT NULL,
+                rating TEXT NOT NULL,
+                color TEXT NOT NULL
+            );
+        """)
+        self.connection.commit()
+
+    def get_detail(self, bond_link, listing_fingerprint, max_age_hours=DETAIL_MAX_AGE_HOURS):
+        """Сохраненные данные страницы облигации, если строка списка не менялась и данные свежие.
+        Возвращает словарь данных или None, если страницу нужно загрузить заново"""
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT listing_fingerprint, fetched_at, details FROM details WHERE bond_link = ?",
+                (bond_link,)
+            ).fetchone()
+        if row is None:
+            return None
+        stored_fingerprint, fetched_at, details = row
+        if stored_fingerprint != listing_fingerprint or time.time() - fetched_at > max_age_hours * 3600:
+            return None
+        return json.loads(details)
+
+    def save_detail(self, bond_link, listing_fingerprint, details):
+        """Сохранение данных, извлеченных со страницы облигации"""
+        content_fingerprint = fingerprint(*[details[key] for key in sorted(details)])
+        with self.lock:
+            previous = self.connection.execute(
+                "SELECT content_fingerprint FROM details WHERE bond_link = ?", (bond_link,)
+            ).fetchone()
+            if previous and previous[0] != content_fingerprint:
+                logging.info(f"Изменились данные облигации {bond_link}")
+            self.connection.execute(
+                "INSERT OR REPLACE INTO details "
+                "(bond_link, listing_fingerprint, content_fingerprint, fetched_at, details) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (bond_link, listing_fingerprint, content_fingerprint, time.time(),
+                 json.dumps(details, ensure_ascii=False))
+            )
+            self.connection.commit()
+
+    def get_rating(self, isin, max_age_hours=RATING_MAX_AGE_HOURS):
+        """Сохраненный рейтинг, если он свежий. Возвращает (рейтинг, цвет) или None"""
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT fetched_at, rating, color FROM ratings WHERE isin = ?", (isin,)
+            ).fetchone()
+        if row is None or time.time() - row[0] > max_age_hours * 3600:
+            return None
+        return row[1], row[2]
+
+    def save_rating(self, isin, rating, color):
+        """Сохранение рейтинга облигации"""
+        content_fingerprint = fingerprint(rating, color)
+        with self.lock:
+            previous = self.connection.execute(
+                "SELECT content_fingerprint, rating FROM ratings WHERE isin = ?", (isin,)
+            ).fetchone()
+            if previous and previous[0] != content_fingerprint:
+                logging.info(f"Изменился рейтинг облигации {isin}: {previous[1]} -> {rating}")
+            self.connection.execute(
+                "INSERT OR REPLACE INTO ratings (isin, content_fingerprint, fetched_at, rating, color) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (isin, content_fingerprint, time.time(), rating, color)
+            )
+            self.connection.commit()
+
+    def close(self):
+        """Закрытие базы состояния"""
+        with self.lock:
+            self.connection.close()
@@ -0,0 +1,81 @@
+# Потоковая обработка этапов: записи читаются, обрабатываются и сохраняются пачками,
+# поэтому память не растет с размером списка облигаций
+import os
+import csv
+from collections import deque
+from itertools import islice
+
+READ_BATCH = 500  # Облигаций в одном запросе к базе и в одной проверке правил списка
+FLUSH_EVERY = 100  # Через сколько записей результаты сохраняются в базу и сбрасываются в CSV
+
+
+def batched(items, size):
+    """Списки по size элементов из любого итерируемого источника"""
+    items = iter(items)
+    while True:
+        batch = list(islice(items, size))
+        if not batch:
+            return
+        yield batch
+
+
+def bounded_map(executor, function, items, window):
+    """Как executor.map, но в работе не больше window задач: источник читается по мере обработки,
+    и результаты не накапливаются, если потребитель отстает. Результаты отдаются в порядке источника"""
+    items = iter(items)
+    futures = deque(executor.submit(function, item) for item in islice(items, window))
+    for item in items:
+        result = futures.popleft().result()
+        futures.append(executor.submit(function, item))
+        yield result
+    while futures:
+        yield futures.popleft().result()
+
+
+def iter_csv(path, encoding='utf-8-sig'):
+    """Строки CSV-файла этапа (разделитель ';') в виде словарей по мере чтения"""
+    with open(path, 'r', encoding=encoding, newline='') as infile:
+        yield from csv.DictReader(infile, delimiter=';')
+
+
+def write_atomic(path, write):
+    """Замена файла целиком: write(temp_path) записывает новое содержимое во временный файл рядом с path,
+    который затем переименовывается в path. Читатели видят либо старый, либо новый файл, но не его часть"""
+    temp_path = f"{path}.tmp"
+    try:
+        write(temp_path)
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+class CsvWriter:
+    """Запись CSV-файла этапа по строкам со сбросом на диск каждые flush_every строк"""
+
+    def __init__(self, path, columns, encoding='utf-8', flush_every=FLUSH_EVERY):
+        self.path = path
+        self.flush_every = flush_every
+        self.count = 0
+        self.file = open(path, 'w', encoding=encoding, newline='')
+        self.writer = csv.writer(self.file, delimiter=';')
+        self.writer.writerow(columns)
+
+    def writerow(self, row):
+        self.writer.writerow(row)
+        self.count += 1
+        if self.count % self.flush_every == 0:
+            self.file.flush()
+
+    def writerows(self, rows):
+        for row in rows:
+            self.writerow(row)
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
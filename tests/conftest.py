@@ -0,0 +1,19 @@
+import os
+import sys
+
+import pytest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(TESTS_DIR)
+FIXTURES_DIR = os.path.join(TESTS_DIR, 'fixtures')
+RULES_FILE = os.path.join(REPO_DIR, 'screening_rules.json')
+# Модули пайплайна и заглушка сайтов из benchmarks/ импортируются как в скриптах и бенчмарках
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.join(REPO_DIR, 'benchmarks'))
+
+
+@pytest.fixture
+def work_dir(tmp_path, monkeypatch):
+    """Временный рабочий каталог: база, очередь, кэш и CSV пишутся в его output/"""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
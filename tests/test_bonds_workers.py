@@ -0,0 +1,70 @@
+import socket
+import sqlite3
+import time
+from functools import partial
+
+from conftest import RULES_FILE
+from corpus import synthetic_corpus
+from stub_server import StubServer, StubFetcher
+import bonds_workers
+from bonds_store import BondsStore
+from screening import ScreeningRules
+from work_queue import WorkQueue, DONE, LEASED
+
+BONDS = 24
+PROCESSES = 3
+THREADS = 2
+VISIBILITY_TIMEOUT = 0.5  # Меньше времени обработки пачки: без продления аренды пачки выдавались бы повторно
+
+
+def leased_by(queue_path, owner):
+    """Задания очереди отбора, арендованные обработчиком owner"""
+    connection = sqlite3.connect(queue_path)
+    try:
+        rows = connection.execute("SELECT key FROM jobs WHERE queue = ? AND status = ? AND lease_owner = ?",
+                                  (bonds_workers.FILTER_QUEUE, LEASED, owner)).fetchall()
+    finally:
+        connection.close()
+    return {key for key, in rows}
+
+
+def test_killed_worker_jobs_are_processed_once(work_dir):
+    stub = StubServer(synthetic_corpus(1, BONDS, seed=1), latency_ms=400).start()
+    options = {
+        'queue_path': './output/work_queue.sqlite', 'visibility_timeout': VISIBILITY_TIMEOUT, 'max_attempts': 5,
+        'log_level': 'ERROR', 'backend': 'http', 'threads': THREADS, 'rps': 0.0, 'use_cache': False,
+        'incremental': False, 'parser': 'lxml', 'rules_file': RULES_FILE
+    }
+    listing = [{'bond_name': f"Облигация {i}", 'placement_date': '2025-03-01', 'maturity_date': '2030-03-01',
+                'bond_link': f"https://bonds.finam.ru/issue/bonds{i}/default.asp"} for i in range(BONDS)]
+    store = BondsStore()
+    store.replace_listing(listing)
+    queue = WorkQueue(options['queue_path'], VISIBILITY_TIMEOUT)
+    try:
+        bonds_workers.enqueue_filter(queue, store, ScreeningRules.load(RULES_FILE))
+        workers = bonds_workers.start_workers(bonds_workers.FILTER_QUEUE, options, PROCESSES,
+                                              partial(StubFetcher, stub.url, requests_per_second=0))
+        # Первый обработчик завершается аварийно посреди пачки: его задания арендованы и не выполнены
+        victim = f"{socket.gethostname()}-{workers[0].pid}"
+        deadline = time.monotonic() + 60
+        lost = set()
+        while not lost and time.monotonic() < deadline:
+            lost = leased_by(options['queue_path'], victim)
+            time.sleep(0.05)
+        workers[0].kill()
+        assert lost, "обработчик не получил заданий"
+
+        assert bonds_workers.wait_workers(workers) == 1
+        jobs = {key: (status, attempts) for key, status, attempts in queue.connection.execute(
+            "SELECT key, status, attempts FROM jobs WHERE queue = ?", (bonds_workers.FILTER_QUEUE,))}
+    finally:
+        queue.close()
+        store.close()
+        stub.stop()
+
+    assert len(jobs) == len(listing)
+    assert all(status == DONE for status, _ in jobs.values())
+    # Задания упавшего обработчика выданы еще раз; остальные выполнены с первой попытки, несмотря на то что
+    # пачка обрабатывается дольше visibility_timeout
+    assert all(attempts == 1 for key, (_, attempts) in jobs.items() if key not in lost)
+    assert all(attempts <= 2 for key, (_, attempts) in jobs.items() if key in lost)
@@ -0,0 +1,94 @@
+import time
+
+import pytest
+
+from corpus import synthetic_corpus, SMART_LAB_HOST
+from stub_server import StubServer, StubFetcher
+from scheduler_benchmark import fetch_all
+from fetchers import FetchError, HostRateLimiter
+from host_scheduler import AdaptiveScheduler, MIN_DECREASE_INTERVAL
+
+BONDS = 40
+URLS = [f"https://{SMART_LAB_HOST}/q/bonds/RU000A1{i:05d}/" for i in range(BONDS)]
+BUDGET = {'rate': 40.0, 'max_rate': 40.0, 'rate_step': 10.0, 'concurrency': 4, 'max_concurrency': 4}
+
+
+def create_scheduler():
+    return AdaptiveScheduler({SMART_LAB_HOST: BUDGET}, robots=False)
+
+
+@pytest.mark.parametrize('status, counter', [(429, 'throttled'), (503, 'throttled'), (500, 'errors')])
+def test_backs_off_on_errors_and_recovers(status, counter):
+    stub = StubServer(synthetic_corpus(1, BONDS, seed=1), latency_ms=1, error_status=status).start()
+    scheduler = create_scheduler()
+    fetcher = StubFetcher(stub.url, rate_limiter=scheduler)
+    try:
+        for url in URLS[:4]:
+            fetcher.fetch(url)
+        assert scheduler.stats()[SMART_LAB_HOST]['concurrency'] == 4
+
+        # Сайт отвечает ошибками: бюджет уменьшается вдвое один раз, а не на каждый ответ
+        stub.error_rate = 1.0
+        for url in URLS[4:7]:
+            with pytest.raises(FetchError):
+                fetcher.fetch(url)
+        stats = scheduler.stats()[SMART_LAB_HOST]
+        assert stats[counter] == 3
+        assert stats['decreases'] == 1
+        assert (stats['concurrency'], stats['rate']) == (2, 20.0)
+
+        # Сайт снова здоров: аддитивное увеличение возвращает исходный бюджет
+        stub.error_rate = 0.0
+        time.sleep(MIN_DECREASE_INTERVAL)
+        for url in URLS[7:]:
+            fetcher.fetch(url)
+        stats = scheduler.stats()[SMART_LAB_HOST]
+        assert (stats['concurrency'], stats['rate']) == (4, 40.0)
+        assert stats['increases'] >= 2
+    finally:
+        fetcher.close()
+        stub.stop()
+
+
+def test_retry_after_pauses_host():
+    # capacity=0: каждый запрос считается перегрузкой и получает 429 с Retry-After
+    stub = StubServer(synthetic_corpus(1, BONDS, seed=1), latency_ms=1, capacity=0, retry_after=1).start()
+    scheduler = create_scheduler()
+    fetcher = StubFetcher(stub.url, rate_limiter=scheduler)
+    try:
+        with pytest.raises(FetchError) as error:
+            fetcher.fetch(URLS[0])
+        assert (error.value.status, error.value.retry_after) == (429, 1.0)
+
+        stub.capacity = None
+        start = time.perf_counter()
+        fetcher.fetch(URLS[1])
+        # Следующий запрос к сайту ждет окончания паузы из Retry-After
+        assert time.perf_counter() - start >= 0.9
+    finally:
+        fetcher.close()
+        stub.stop()
+
+
+def test_fewer_overloads_than_unlimited_rate():
+    def run(rate_limiter, max_retries):
+        # Заглушка выдерживает два запроса без задержки, больше четырех одновременных - ответ 429
+        stub = StubServer(synthetic_corpus(1, BONDS, seed=1), latency_ms=20, capacity=2, overload_ms=40,
+                          retry_after=0).start()
+        fetcher = StubFetcher(stub.url, pool_size=8, rate_limiter=rate_limiter)
+        try:
+            fetched, failed, _ = fetch_all(fetcher, URLS, threads=8, max_retries=max_retries)
+        finally:
+            fetcher.close()
+            stub.stop()
+        return fetched, failed, stub.stats['overloaded']
+
+    # Без планировщика повторы ждут экспоненциальную паузу, поэтому их меньше: сравнение не в пользу планировщика
+    unlimited = run(HostRateLimiter(0), max_retries=2)
+    # Планировщик начинает с двух одновременных запросов и сам находит предел сайта
+    adaptive = run(AdaptiveScheduler({SMART_LAB_HOST: dict(BUDGET, concurrency=2, max_concurrency=8,
+                                                           max_rate=100.0)}, robots=False), max_retries=10)
+
+    assert unlimited[1] > 0
+    assert adaptive[:2] == (BONDS, 0)
+    assert adaptive[2] < unlimited[2] / 2
@@ -0,0 +1,66 @@
+import time
+
+from corpus import synthetic_corpus
+from stub_server import StubServer, StubFetcher
+from html_parsers import create_parser
+from rating_engine import AsyncRatingEngine
+
+BONDS = 24
+LATENCY_MS = 100.0
+ISINS = [f"RU000A1{i:05d}" for i in range(BONDS)]
+
+
+def rate_all(stub, concurrency, requests_per_second=0, **engine_options):
+    """Рейтинги всех ISIN корпуса через заглушку. Возвращает (длительность, результаты, движок)"""
+    fetcher = StubFetcher(stub.url, pool_size=concurrency, requests_per_second=requests_per_second)
+    engine = AsyncRatingEngine(fetcher, create_parser('lxml').parse_rating, concurrency=concurrency,
+                               **engine_options)
+    try:
+        start = time.perf_counter()
+        results = engine.run(ISINS)
+        return time.perf_counter() - start, results, engine
+    finally:
+        fetcher.close()
+
+
+def test_throughput_scales_with_concurrency():
+    stub = StubServer(synthetic_corpus(1, BONDS, seed=1), LATENCY_MS).start()
+    try:
+        serial, expected, _ = rate_all(stub, 1)
+        assert stub.stats['max_in_flight']['smart-lab.ru'] == 1
+        parallel, results, _ = rate_all(stub, 8)
+        assert stub.stats['max_in_flight']['smart-lab.ru'] <= 8
+    finally:
+        stub.stop()
+
+    assert results == expected
+    assert ("Ошибка", "Ошибка") not in results
+    # Одновременно выполняется до 8 запросов: в идеале в 8 раз быстрее, с запасом на разбор страниц
+    assert serial >= BONDS * LATENCY_MS / 1000
+    assert parallel < serial / 3
+
+
+def test_rate_limit_caps_throughput():
+    stub = StubServer(synthetic_corpus(1, BONDS, seed=1), latency_ms=1).start()
+    try:
+        elapsed, results, _ = rate_all(stub, 8, requests_per_second=20)
+    finally:
+        stub.stop()
+
+    assert ("Ошибка", "Ошибка") not in results
+    # Token bucket пропускает первый запрос сразу, остальные - с интервалом 1/20 с
+    assert elapsed >= (BONDS - 1) / 20 * 0.9
+
+
+def test_transient_errors_are_retried():
+    stub = StubServer(synthetic_corpus(1, BONDS, seed=1), latency_ms=1, error_rate=0.3, error_status=503).start()
+    try:
+        _, results, engine = rate_all(stub, 4, max_retries=8, backoff_base=0.01, max_backoff=0.05)
+    finally:
+        stub.stop()
+
+    # Ответы 503 повторяются, а не записываются в результат как "Ошибка"
+    assert stub.stats['errors'] > 0
+    assert engine.stats['retries'] == stub.stats['errors']
+    assert engine.stats['failed'] == 0
+    assert ("Ошибка", "Ошибка") not in results
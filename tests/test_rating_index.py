@@ -0,0 +1,66 @@
+import os
+
+import pytest
+
+from conftest import FIXTURES_DIR
+from corpus import page_key, rating_page
+from stub_server import StubServer, StubFetcher
+from html_parsers import create_parser, PARSER_BACKENDS
+from rating_engine import AsyncRatingEngine, RatingIndex, RATING_LIST_URL, RATING_URL
+
+# Рейтинги, которые должны быть извлечены из сохраненных страниц списка облигаций smart-lab
+EXPECTED_PAGES = {
+    'smartlab_bonds_page1.html': {
+        'RU000A105A95': ('AA-', "Зеленый"),  # Цвет из оформления ячейки
+        'RU000A106LL5': ('BBB+', "Желтый"),  # Цвет по шкале рейтинга
+        'RU000A104YT6': ('BB-', "Красный"),
+        'RU000A103QZ4': ('A+', "Желтый")  # Запись 'A+(RU)'
+    },
+    'smartlab_bonds_page2.html': {
+        'RU000A1008J4': ('B+', "Красный"),
+        'RU000A101QM3': ('AAA', "Зеленый"),
+        'RU000A105104': ('A', "Желтый")
+    }
+}
+# Облигации из списка без рейтинга: их рейтинг берется со страницы облигации
+UNRATED = ['RU000A107ZX1', 'SU26238RMFS4']
+
+
+def read_fixture(name):
+    with open(os.path.join(FIXTURES_DIR, name), 'r', encoding='utf-8') as fixture:
+        return fixture.read()
+
+
+@pytest.mark.parametrize('backend', list(PARSER_BACKENDS))
+@pytest.mark.parametrize('name', list(EXPECTED_PAGES))
+def test_parse_rating_list_fixture(backend, name):
+    listing = create_parser(backend).parse_rating_list(read_fixture(name))
+
+    assert listing['ratings'] == EXPECTED_PAGES[name]
+    assert listing['max_page'] == 2
+
+
+def test_index_fetches_only_missing_ratings():
+    pages = {page_key(RATING_LIST_URL.format(page=number)): ('rating_list', read_fixture(name))
+             for number, name in enumerate(EXPECTED_PAGES, 1)}
+    for isin in UNRATED:
+        pages[page_key(RATING_URL.format(isin=isin))] = ('rating', rating_page('ruBBB', 'yellow'))
+    stub = StubServer(pages).start()
+    fetcher = StubFetcher(stub.url, requests_per_second=0)
+    try:
+        parser = create_parser('lxml')
+        index = RatingIndex(fetcher, parser.parse_rating_list).load()
+        engine = AsyncRatingEngine(fetcher, parser.parse_rating)
+        rated = [isin for expected in EXPECTED_PAGES.values() for isin in expected]
+        results = engine.run(rated + UNRATED, lookup=index.get)
+    finally:
+        fetcher.close()
+        stub.stop()
+
+    expected = {isin: rating for ratings in EXPECTED_PAGES.values() for isin, rating in ratings.items()}
+    assert dict(zip(rated, results)) == expected
+    assert results[len(rated):] == [('ruBBB', "Желтый")] * len(UNRATED)
+    # Две страницы списка и по странице на каждую облигацию без рейтинга в списке вместо страницы на каждую
+    assert index.stats == {'pages': 2, 'hits': len(rated)}
+    assert stub.stats['served'] == 2 + len(UNRATED)
+    assert stub.stats['not_found'] == 0
@@ -0,0 +1,204 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+
+DEFAULT_QUEUE_PATH = "./output/work_queue.sqlite"
+VISIBILITY_TIMEOUT = 300.0  # Через сколько секунд задание обработчика, который не ответил, выдается снова
+MAX_ATTEMPTS = 5
+RETRY_DELAY = 30.0  # Пауза перед повтором задания, завершившегося ошибкой
+
+# Состояния заданий
+PENDING = 'pending'
+LEASED = 'leased'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class WorkQueue:
+    """Очередь заданий в SQLite для нескольких процессов-обработчиков: задание выдается в аренду
+    на время visibility_timeout и, если обработчик не завершил его (например, упал), выдается снова.
+    Результат принимается только от текущего арендатора, поэтому задание не обрабатывается дважды"""
+
+    def __init__(self, path=DEFAULT_QUEUE_PATH, visibility_timeout=VISIBILITY_TIMEOUT, max_attempts=MAX_ATTEMPTS):
+        self.path = path
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self.lock = threading.Lock()
+
+        queue_dir = os.path.dirname(path)
+        if queue_dir and not os.path.exists(queue_dir):
+            os.makedirs(queue_dir)
+
+        # Транзакции открываются явно (BEGIN IMMEDIATE), чтобы выдача заданий была атомарной между процессами
+        self.connection = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                queue TEXT NOT NULL,
+                key TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                available_at REAL NOT NULL DEFAULT 0,
+                lease_owner TEXT,
+                lease_expires REAL,
+                result TEXT,
+                error TEXT,
+                updated_at REAL,
+                PRIMARY KEY (queue, key)
+            );
+            CREATE INDEX IF NOT EXISTS jobs_status ON jobs (queue, status, position);
+        """)
+
+    @contextmanager
+    def transaction(self):
+        """Транзакция с блокировкой записи: другие процессы ждут ее завершения"""
+        with self.lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.connection
+                self.connection.execute("COMMIT")
+            except Exception:
+                self.connection.execute("ROLLBACK")
+                raise
+
+    def enqueue(self, queue, items, results=None):
+        """Новый запуск очереди: items - список (ключ, данные) в порядке обработки.
+        results - уже известные результаты (ключ -> результат), такие задания сразу считаются выполненными"""
+        results = results or {}
+        now = time.time()
+        rows = [(queue, key, position, json.dumps(payload, ensure_ascii=False),
+                 DONE if key in results else PENDING,
+                 json.dumps(results[key], ensure_ascii=False) if key in results else None, now)
+                for position, (key, payload) in enumerate(items)]
+        with self.transaction() as connection:
+            connection.execute("DELETE FROM jobs WHERE queue = ?", (queue,))
+            connection.executemany(
+                "INSERT OR IGNORE INTO jobs (queue, key, position, payload, status, result, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+        logging.info(f"В очередь '{queue}' добавлено {len(rows)} заданий, из них уже выполнено: {len(results)}")
+
+    def lease(self, queue, owner, count=1):
+        """Выдача до count заданий в аренду обработчику owner: ожидающие задания и задания с истекшей арендой.
+        Возвращает список (ключ, данные, номер попытки)"""
+        now = time.time()
+        with self.transaction() as connection:
+            # Задание, аренда которого истекала max_attempts раз, больше не выдается
+            connection.execute(
+                "UPDATE jobs SET status = ?, error = 'Истекла аренда задания', lease_owner = NULL, "
+                "updated_at = ? WHERE queue = ? AND status = ? AND lease_expires <= ? AND attempts >= ?",
+                (FAILED, now, queue, LEASED, now, self.max_attempts)
+            )
+            rows = connection.execute(
+                "SELECT key, payload, attempts FROM jobs WHERE queue = ? AND "
+                "((status = ? AND available_at <= ?) OR (status = ? AND lease_expires <= ?)) "
+                "ORDER BY position LIMIT ?",
+                (queue, PENDING, now, LEASED, now, count)
+            ).fetchall()
+            connection.executemany(
+                "UPDATE jobs SET status = ?, lease_owner = ?, lease_expires = ?, attempts = attempts + 1, "
+                "updated_at = ? WHERE queue = ? AND key = ?",
+                [(LEASED, owner, now + self.visibility_timeout, now, queue, key) for key, _, _ in rows]
+            )
+        return [(key, json.loads(payload), attempts + 1) for key, payload, attempts in rows]
+
+    def extend(self, queue, owner, keys):
+        """Продление аренды заданий, обработка которых еще идет (выполненные задания не затрагиваются)"""
+        expires = time.time() + self.visibility_timeout
+        with self.transaction() as connection:
+            connection.executemany(
+                "UPDATE jobs SET lease_expires = ? WHERE queue = ? AND key = ? AND status = ? AND lease_owner = ?",
+                [(expires, queue, key, LEASED, owner) for key in keys]
+            )
+
+    @contextmanager
+    def keep_leased(self, queue, owner, keys):
+        """Пока выполняется блок, аренда заданий keys продлевается в фоновом потоке каждую треть
+        visibility_timeout: долгая пачка не выдается другому обработчику, а задания упавшего процесса
+        выдаются снова после истечения аренды"""
+        stopped = threading.Event()
+
+        def renew():
+            while not stopped.wait(self.visibility_timeout / 3):
+                try:
+                    self.extend(queue, owner, keys)
+                except sqlite3.Error as e:
+                    logging.warning(f"Не удалось продлить аренду заданий очереди '{queue}': {str(e)}")
+
+        thread = threading.Thread(target=renew, name=f"lease-{queue}", daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stopped.set()
+            thread.join()
+
+    def complete(self, queue, owner, key, result):
+        """Сохранение результата задания. False, если аренда уже передана другому обработчику"""
+        with self.transaction() as connection:
+            updated = connection.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = NULL, lease_owner = NULL, lease_expires = NULL, "
+                "updated_at = ? WHERE queue = ? AND key = ? AND status = ? AND lease_owner = ?",
+                (DONE, json.dumps(result, ensure_ascii=False), time.time(), queue, key, LEASED, owner)
+            ).rowcount
+        if not updated:
+            logging.warning(f"Результат задания {key} очереди '{queue}' отброшен: аренда передана другому обработчику")
+        return bool(updated)
+
+    def fail(self, queue, owner, key, error, delay=RETRY_DELAY):
+        """Ошибка обработки задания: повтор через delay секунд или отказ после max_attempts попыток"""
+        now = time.time()
+        with self.transaction() as connection:
+            connection.execute(
+                "UPDATE jobs SET status = CASE WHEN attempts >= ? THEN ? ELSE ? END, error = ?, available_at = ?, "
+                "lease_owner = NULL, lease_expires = NULL, updated_at = ? "
+                "WHERE queue = ? AND key = ? AND status = ? AND lease_owner = ?",
+                (self.max_attempts, FAILED, PENDING, str(error), now + delay, now, queue, key, LEASED, owner)
+            )
+
+    def retry_failed(self, queue):
+        """Возврат заданий, завершившихся отказом, в очередь с новым счетчиком попыток"""
+        with self.transaction() as connection:
+            updated = connection.execute(
+                "UPDATE jobs SET status = ?, attempts = 0, available_at = 0, updated_at = ? "
+                "WHERE queue = ? AND status = ?",
+                (PENDING, time.time(), queue, FAILED)
+            ).rowcount
+        logging.info(f"В очередь '{queue}' возвращено {updated} заданий")
+        return updated
+
+    def counts(self, queue):
+        """Количество заданий в каждом состоянии"""
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT status, COUNT(*) FROM jobs WHERE queue = ? GROUP BY status", (queue,)
+            ).fetchall()
+        counts = {PENDING: 0, LEASED: 0, DONE: 0, FAILED: 0}
+        counts.update(dict(rows))
+        return counts
+
+    def unfinished(self, queue):
+        """Количество заданий, которые еще могут быть выполнены"""
+        counts = self.counts(queue)
+        return counts[PENDING] + counts[LEASED]
+
+    def results(self, queue):
+        """Все задания очереди в порядке добавления: (ключ, данные, результат или None, состояние, ошибка)"""
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT key, payload, result, status, error FROM jobs WHERE queue = ? ORDER BY position", (queue,)
+            ).fetchall()
+        return [(key, json.loads(payload), json.loads(result) if result is not None else None, status, error)
+                for key, payload, result, status, error in rows]
+
+    def close(self):
+        """Закрытие очереди"""
+        with self.lock:
+            self.connection.close()